@@ -0,0 +1,195 @@
+/*
+   Copyright 2021 Patrick Lumban Tobing (Nagoya University)
+   Apache 2.0  (http://www.apache.org/licenses/LICENSE-2.0)
+
+   In-memory interface of the real-time engine for the Python bindings (src/utils/mwdlp_clib.py),
+   compiled with the engine sources into lib/libmwdlp10cycvae.so by "make shared".
+   The processing follows test_cycvae_mwdlp.c without the wav/text file I/O.
+*/
+
+#include <math.h>
+#include <stdio.h>
+#include <stdlib.h>
+
+#include "mwdlp10net_cycvae.h"
+#include "freq.h"
+#include "nnet.h"
+#include "nnet_data.h"
+#include "nnet_cv_data.h"
+#include "mwdlp10net_cycvae_private.h"
+
+
+#define MWDLP10NET_PY_N_INFO 13
+
+/* Fill the compile-time configuration of the dumped model, in order:
+   [0] FEATURES_DIM, [1] MAX_N_OUTPUT, [2] FRAME_SHIFT, [3] SAMPLING_FREQUENCY, [4] NO_DLPC,
+   [5] FEATURE_N_SPK, [6] FEATURE_SPK_DIM, [7] FEATURE_N_WEIGHT_EMBED_SPK, [8] FEATURE_CONV_VC_DELAY,
+   [9] SQRT_QUANTIZE, [10] N_MBANDS, [11] N_SAMPLE_BANDS, [12] RIGHT_SAMPLES */
+int mwdlp10net_py_get_info(int *info)
+{
+    info[0] = FEATURES_DIM;
+    info[1] = MAX_N_OUTPUT;
+    info[2] = FRAME_SHIFT;
+    info[3] = SAMPLING_FREQUENCY;
+    info[4] = NO_DLPC;
+    info[5] = FEATURE_N_SPK;
+    info[6] = FEATURE_SPK_DIM;
+    info[7] = FEATURE_N_WEIGHT_EMBED_SPK;
+    info[8] = FEATURE_CONV_VC_DELAY;
+    info[9] = SQRT_QUANTIZE;
+    info[10] = N_MBANDS;
+    info[11] = N_SAMPLE_BANDS;
+    info[12] = RIGHT_SAMPLES;
+    return MWDLP10NET_PY_N_INFO;
+}
+
+
+/* Number of frames of a waveform, including the frame of the reflected trailing samples */
+long mwdlp10net_py_get_n_frames(long num_samples)
+{
+    long num_frame;
+
+    if (num_samples < RIGHT_SAMPLES) return 0;
+    num_frame = 1 + (num_samples - RIGHT_SAMPLES) / FRAME_SHIFT;
+    if ((num_samples - RIGHT_SAMPLES) % FRAME_SHIFT > 0) num_frame += 1;
+    return num_frame;
+}
+
+
+/* Extract log(1+10000*melsp) of a waveform in [-1,1) into melsp (n_frames x FEATURES_DIM),
+   returns the number of extracted frames */
+long mwdlp10net_py_melsp_extract(const float *x, long num_samples, float *melsp)
+{
+    DSPState *dsp;
+    float data_in_channel;
+    float x_buffer[FRAME_SHIFT];
+    short first_buffer_flag = 0;
+    short waveform_buffer_flag = 0;
+    long num_reflected_right_edge_samples;
+    long i, j, k, l, m;
+
+    if (num_samples < RIGHT_SAMPLES) return 0;
+    num_reflected_right_edge_samples = (num_samples - RIGHT_SAMPLES) % FRAME_SHIFT;
+    if (num_reflected_right_edge_samples > 0)
+        num_reflected_right_edge_samples = FRAME_SHIFT - num_reflected_right_edge_samples;
+
+    dsp = dspstate_create();
+    for (i = 0, j = 0, k = 0; i < num_samples; i++) {
+        data_in_channel = x[i];
+
+        // high-pass filter to remove DC component of recording device
+        shift_apply_hpassfilt(dsp, &data_in_channel);
+
+        if (first_buffer_flag) { //first frame has been processed, now taking every FRAME_SHIFT amount of samples
+            x_buffer[j] = data_in_channel;
+            j += 1;
+            if (j >= FRAME_SHIFT) {
+                shift_apply_window(dsp, x_buffer);
+                waveform_buffer_flag = 1;
+                j = 0;
+            }
+        } else { //take RIGHT_SAMPLES amount of samples as the first samples
+            dsp->samples_win[LEFT_SAMPLES_1+i] = data_in_channel;
+            if (i <= LEFT_SAMPLES_2) {
+                dsp->samples_win[LEFT_SAMPLES_2-i] = data_in_channel;
+            }
+            if (i >= RIGHT_SAMPLES_1) {
+                apply_window(dsp);
+                first_buffer_flag = 1;
+                waveform_buffer_flag = 1;
+            }
+        }
+
+        if (waveform_buffer_flag) {
+            mel_spec_extract(dsp, &melsp[k*FEATURES_DIM]);
+            k += 1;
+            waveform_buffer_flag = 0;
+        }
+    }
+
+    if (j > 0) {
+        //set additional reflected samples for trailing remainder samples on the right edge,
+        //mirrored around the last sample and folded at the first one if the remainder is shorter than the reflection
+        for (i = 0, l = j-1; i < num_reflected_right_edge_samples; i++, j++) {
+            m = i % (2*(l+1));
+            x_buffer[j] = x_buffer[m <= l ? l-m : m-(l+1)];
+        }
+        shift_apply_window(dsp, x_buffer);
+        mel_spec_extract(dsp, &melsp[k*FEATURES_DIM]);
+        k += 1;
+    }
+    dspstate_destroy(dsp);
+
+    return k;
+}
+
+
+/* Speaker code of a speaker index (1-based) through the 1-hot --> 2-dim --> N-dim transform */
+void mwdlp10cyclevaenet_py_spk_code_point(int spk_idx, float *spk_code_aux, float *spk_code_coeff)
+{
+    float one_hot_code[FEATURE_N_SPK] = {0};
+
+    RNN_COPY(spk_code_aux, (&embed_spk)->embedding_weights, FEATURE_SPK_DIM);
+    one_hot_code[spk_idx-1] = 1;
+    compute_spkidtr(&fc_in_spk_code, &fc_in_spk_code_transform, &fc_out_spk_code_transform, spk_code_aux,
+        spk_code_coeff, one_hot_code);
+}
+
+
+/* Speaker code of an interpolated 2-dim speaker coordinate */
+void mwdlp10cyclevaenet_py_spk_code_coord(float x_coord, float y_coord, float *spk_code_aux, float *spk_code_coeff)
+{
+    float spk_coord[2];
+
+    spk_coord[0] = x_coord;
+    spk_coord[1] = y_coord;
+    RNN_COPY(spk_code_aux, (&embed_spk)->embedding_weights, FEATURE_SPK_DIM);
+    compute_spkidtr_coord(&fc_out_spk_code_transform, spk_code_aux, spk_code_coeff, spk_coord);
+}
+
+
+/* Per-frame analysis-synthesis */
+void mwdlp10net_py_synthesize(MWDLP10NetState *st, float *features, short *output, int *n_output,
+    int flag_last_frame)
+{
+    if (!NO_DLPC) mwdlp10net_synthesize(st, features, output, n_output, flag_last_frame);
+    else mwdlp10net_synthesize_nodlpc(st, features, output, n_output, flag_last_frame);
+}
+
+
+/* Per-frame conversion-synthesis */
+void mwdlp10cyclevaenet_py_synthesize(MWDLP10CycleVAEMelspExcitSpkNetState *st, float *features,
+    float *spk_code_aux, short *output, int *n_output, int flag_last_frame)
+{
+    if (!NO_DLPC) cyclevae_melsp_excit_spk_convert_mwdlp10net_synthesize(st, features, spk_code_aux, output,
+                        n_output, flag_last_frame);
+    else cyclevae_melsp_excit_spk_convert_mwdlp10net_synthesize_nodlpc(st, features, spk_code_aux, output,
+                        n_output, flag_last_frame);
+}
+
+
+/* Deterministic decoding if argmax_flag (argmax of output logits, mean of melsp),
+   otherwise random sampling with the seed */
+void mwdlp10net_py_set_sampling(int argmax_flag, unsigned int seed)
+{
+    mwdlp_argmax_flag = argmax_flag;
+    srand(seed);
+}
+
+
+/* Log the output logits of every band sample into buffer (size x SQRT_QUANTIZE),
+   in order of the coarse then the fine logits of each band, NULL to stop logging.
+   The buffer is global, i.e., shared by all network states of the process. */
+void mwdlp10net_py_set_pdf_log(float *buffer, long size)
+{
+    mwdlp_pdf_log = buffer;
+    mwdlp_pdf_log_size = buffer != NULL ? size : 0;
+    mwdlp_pdf_log_count = 0;
+}
+
+
+/* Number of logged output logits */
+long mwdlp10net_py_get_pdf_log_count(void)
+{
+    return mwdlp_pdf_log_count;
+}
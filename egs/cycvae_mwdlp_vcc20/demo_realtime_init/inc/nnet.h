@@ -156,6 +156,11 @@ void compute_conv1d_linear_dec_excit(const Conv1DLayer *layer, float *output, fl
 void compute_conv1d_linear_dec_melsp(const Conv1DLayer *layer, float *output, float *mem, const float *input);
 void compute_conv1d_linear_frame_in(const Conv1DLayer *layer, float *output, float *mem, const float *input);
 
+extern int mwdlp_argmax_flag;
+extern float *mwdlp_pdf_log;
+extern long mwdlp_pdf_log_size;
+extern long mwdlp_pdf_log_count;
+
 //PLT_Sep20
 int sample_from_pdf_mwdlp(const float *pdf, int N);
 
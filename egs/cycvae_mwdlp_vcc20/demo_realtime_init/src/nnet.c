@@ -423,10 +423,25 @@ void compute_conv1d_linear_frame_in(const Conv1DLayer* layer, float* output, flo
     RNN_COPY(mem, &tmp[FEATURE_RED_DIM], FEATURE_CONV_STATE_SIZE); //set state size for next frame
 }
 
+//deterministic decoding and logging of output logits, set by the Python bindings for the parity tests
+int mwdlp_argmax_flag = 0;
+float *mwdlp_pdf_log = NULL;
+long mwdlp_pdf_log_size = 0;
+long mwdlp_pdf_log_count = 0;
+
 //PLT_Sep20
 int sample_from_pdf_mwdlp(const float *pdf, int N)
 {
-    int i;
+    int i, j;
+    if (mwdlp_pdf_log != NULL && mwdlp_pdf_log_count < mwdlp_pdf_log_size) {
+        RNN_COPY(&mwdlp_pdf_log[mwdlp_pdf_log_count*N], pdf, N);
+        mwdlp_pdf_log_count++;
+    }
+    if (mwdlp_argmax_flag) {
+        for (i=1,j=0;i<N;i++)
+            if (pdf[i] > pdf[j]) j = i;
+        return j;
+    }
     float r;
     float tmp[SQRT_QUANTIZE], cdf[SQRT_QUANTIZE], sum, norm;
     for (i=0;i<N;i++)
@@ -611,6 +626,7 @@ void compute_sparse_gru_dec_melsp(const SparseFrameGRULayer *gru, float *state,
 //PLT_Apr21
 void compute_sampling_gauss(float *mu, const float *std, int dim)
 {
+    if (mwdlp_argmax_flag) return; //mean
     //float r;
     float u1, u2 = 0, mag = 0;
     for (int i=0;i<dim;i++) {
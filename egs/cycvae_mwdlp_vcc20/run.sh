@@ -89,6 +89,22 @@ n_jobs=40
 #n_jobs=50
 n_jobs=60
 
+## cache of the feature extraction analyses keyed by waveform content and settings, empty to disable
+feat_cache=exp/feature_cache
+
+## metadata index of the utterance lengths and speech ranges per set, data/<set>/${feat_index}, empty to disable
+feat_index=feats_index.h5
+
+## analysis-synthesis wavs of feature extraction, only diagnostic: all, none, or number of sampled files per speaker
+## the others can be synthesized on demand from the hdf5 features with resyn_feature.py
+#resyn=all
+#resyn=none
+resyn=5
+
+## pqmf synthesis check of the band wavs, only diagnostic: number of sampled files per speaker, all if negative
+#n_verify_pqmf=-1
+n_verify_pqmf=5
+
 #######################################
 #          TRAINING SETTING           #
 #######################################
@@ -338,6 +354,11 @@ decode_batch_size=10
 #decode_batch_size=15
 #decode_batch_size=17
 
+## restore noise shaping [de-emphasis] in the same pass as the decoding steps 8, b, e, h,
+## so that steps 9, c, f, j are not needed
+deemph_decode=true
+#deemph_decode=false
+
 
 # parse options
 . parse_options.sh
@@ -606,6 +627,7 @@ if [ `echo ${stage} | grep "init"` ];then
                             --fftl ${fftl} \
                             --highpass_cutoff ${highpass_cutoff} \
                             --init true \
+                            ${feat_cache:+--cache_dir ${feat_cache}} \
                             --n_jobs ${n_jobs}
         
                     # check the number of feature files
@@ -647,9 +669,11 @@ if [ `echo ${stage} | grep "init"` ];then
         #for spk in ${spks_open[@]};do
             echo $spk
             cat data/${trn}/feats_init.scp | grep \/${spk}\/ > data/${trn}/feats_init_spk-${spk}.scp
-            ${train_cmd} exp/init_spk_stat/init_stat_${data_name}_spk-${spk}.log \
+            ${train_cmd} --num-threads ${n_jobs} \
+                exp/init_spk_stat/init_stat_${data_name}_spk-${spk}.log \
                 spk_stat.py \
                     --expdir ${expdir} \
+                    --n_jobs ${n_jobs} \
                     --feats data/${trn}/feats_init_spk-${spk}.scp
         done
         echo "spk histograms are successfully calculated"
@@ -794,6 +818,9 @@ if [ `echo ${stage} | grep 1` ];then
                                 --mcep_alpha ${mcep_alpha} \
                                 --fftl ${fftl} \
                                 --highpass_cutoff ${highpass_cutoff} \
+                                --resyn ${resyn} \
+                                ${feat_cache:+--cache_dir ${feat_cache}} \
+                                ${feat_index:+--index data/${set}/${feat_index}} \
                                 --n_jobs ${n_jobs}
         
                         # check the number of feature files
@@ -977,6 +1004,8 @@ if [ `echo ${stage} | grep 3` ];then
                             --writesyndir wav_ns_pqmf_${n_bands}_rec/${set}/${spk} \
                             --fs ${fs} \
                             --n_bands ${n_bands} \
+                            --n_verify ${n_verify_pqmf} \
+                            ${feat_index:+--index data/${set}/${feat_index}} \
                             --n_jobs ${n_jobs}
 
                     # update job counts
@@ -1133,6 +1162,7 @@ if [ `echo ${stage} | grep 4` ];then
                     --batch_size ${batch_size} \
                     --n_half_cyc ${n_half_cyc} \
                     --n_workers ${n_workers} \
+                    ${feat_index:+--feat_index data/${trn}/${feat_index}@data/${dev}/${feat_index}} \
                     --pad_len ${pad_len} \
                     --spkidtr_dim ${spkidtr_dim} \
                     --emb_spk_dim ${emb_spk_dim} \
@@ -1185,6 +1215,7 @@ if [ `echo ${stage} | grep 4` ];then
                     --batch_size ${batch_size} \
                     --n_half_cyc ${n_half_cyc} \
                     --n_workers ${n_workers} \
+                    ${feat_index:+--feat_index data/${trn}/${feat_index}@data/${dev}/${feat_index}} \
                     --pad_len ${pad_len} \
                     --spkidtr_dim ${spkidtr_dim} \
                     --emb_spk_dim ${emb_spk_dim} \
@@ -1267,6 +1298,7 @@ if [ `echo ${stage} | grep 5` ];then
                     --kernel_size_wave ${kernel_size_wave} \
                     --dilation_size_wave ${dilation_size_wave} \
                     --n_workers ${n_workers} \
+                    ${feat_index:+--feat_index data/${trn}/${feat_index}@data/${dev}/${feat_index}} \
                     --pad_len ${pad_len} \
                     --t_start ${t_start} \
                     --t_end ${t_end} \
@@ -1305,6 +1337,7 @@ if [ `echo ${stage} | grep 5` ];then
                     --kernel_size_wave ${kernel_size_wave} \
                     --dilation_size_wave ${dilation_size_wave} \
                     --n_workers ${n_workers} \
+                    ${feat_index:+--feat_index data/${trn}/${feat_index}@data/${dev}/${feat_index}} \
                     --pad_len ${pad_len} \
                     --t_start ${t_start} \
                     --t_end ${t_end} \
@@ -1441,6 +1474,7 @@ if [ `echo ${stage} | grep 6` ];then
                     --feats data/${trn}/feats.scp \
                     --waveforms data/${trn}/wav_ns.scp \
                     --spk_list ${spk_list} \
+                    ${feat_index:+--index data/${trn}/${feat_index}} \
                     --expdir ${expdir_ft} \
                     --n_jobs ${n_jobs}
         fi
@@ -1513,6 +1547,7 @@ if [ `echo ${stage} | grep 6` ];then
                     --causal_conv_dec ${causal_conv_dec} \
                     --n_half_cyc ${n_half_cyc} \
                     --n_workers ${n_workers} \
+                    ${feat_index:+--feat_index data/${trn}/${feat_index}@data/${dev}/${feat_index}} \
                     --pad_len ${pad_len} \
                     --spkidtr_dim ${spkidtr_dim} \
                     --emb_spk_dim ${emb_spk_dim} \
@@ -1573,6 +1608,7 @@ if [ `echo ${stage} | grep 6` ];then
                     --causal_conv_dec ${causal_conv_dec} \
                     --n_half_cyc ${n_half_cyc} \
                     --n_workers ${n_workers} \
+                    ${feat_index:+--feat_index data/${trn}/${feat_index}@data/${dev}/${feat_index}} \
                     --pad_len ${pad_len} \
                     --spkidtr_dim ${spkidtr_dim} \
                     --emb_spk_dim ${emb_spk_dim} \
@@ -1694,6 +1730,7 @@ if [ `echo ${stage} | grep 7` ];then
                     --feats data/${trn}/feats.scp \
                     --waveforms data/${trn}/wav_ns.scp \
                     --spk_list ${spk_list} \
+                    ${feat_index:+--index data/${trn}/${feat_index}} \
                     --expdir ${expdir_sp} \
                     --n_jobs ${n_jobs}
         fi
@@ -1766,6 +1803,7 @@ if [ `echo ${stage} | grep 7` ];then
                     --causal_conv_dec ${causal_conv_dec} \
                     --n_half_cyc ${n_half_cyc} \
                     --n_workers ${n_workers} \
+                    ${feat_index:+--feat_index data/${trn}/${feat_index}@data/${dev}/${feat_index}} \
                     --pad_len ${pad_len} \
                     --spkidtr_dim ${spkidtr_dim} \
                     --emb_spk_dim ${emb_spk_dim} \
@@ -1825,6 +1863,7 @@ if [ `echo ${stage} | grep 7` ];then
                     --causal_conv_dec ${causal_conv_dec} \
                     --n_half_cyc ${n_half_cyc} \
                     --n_workers ${n_workers} \
+                    ${feat_index:+--feat_index data/${trn}/${feat_index}@data/${dev}/${feat_index}} \
                     --pad_len ${pad_len} \
                     --spkidtr_dim ${spkidtr_dim} \
                     --emb_spk_dim ${emb_spk_dim} \
@@ -1885,6 +1924,10 @@ if [ `echo ${stage} | grep 8` ];then
 
     # decode
     if [ $mdl_name_wave == "wavernn_dualgru_compact_lpc_mband_10bit_cf_stft_emb" ]; then
+        restore_opts=""
+        if [ "${deemph_decode}" == "true" ]; then
+            restore_opts="--outdir_restored ${outdir}_restored/${spk_src} --alpha ${alpha}"
+        fi
         echo ""
         echo "now synthesizing ${spk_src}, log here:  ${expdir_wave}/log/decode_dev_${min_idx_wave}_${spk_src}.log"
         #${cuda_cmd} ${expdir_wave}/log/decode_tst_${min_idx_wave}_${spk_src}.log \
@@ -1896,10 +1939,16 @@ if [ `echo ${stage} | grep 8` ];then
                 --config ${config} \
                 --fs ${fs} \
                 --batch_size ${decode_batch_size} \
+                ${restore_opts} \
+                ${feat_index:+--feat_index data/${dev}/${feat_index}} \
                 --n_gpus ${n_gpus} \
                 --GPU_device_str ${GPU_device_str}
         echo ""
-        echo "synthesizing ${spk_src} is finished, pre-emphasized synthesized waveform here: $outdir/${spk_src}"
+        if [ "${deemph_decode}" == "true" ]; then
+            echo "synthesizing ${spk_src} is finished, de-emphasized synthesized waveform here: ${outdir}_restored/${spk_src}"
+        else
+            echo "synthesizing ${spk_src} is finished, pre-emphasized synthesized waveform here: $outdir/${spk_src}"
+        fi
         echo ""
     fi
 fi
@@ -1907,7 +1956,7 @@ fi
 
 
 # STAGE 9 {{{
-if [ `echo ${stage} | grep 9` ];then
+if [ `echo ${stage} | grep 9` ] && [ "${deemph_decode}" != "true" ];then
     echo "###########################################################"
     echo "#             RESTORE NOISE SHAPING STEP                  #"
     echo "###########################################################"
@@ -2061,6 +2110,10 @@ if [ `echo ${stage} | grep b` ];then
 
     # decode
     if [ $mdl_name_wave == "wavernn_dualgru_compact_lpc_mband_10bit_cf_stft_emb" ]; then
+        restore_opts=""
+        if [ "${deemph_decode}" == "true" ]; then
+            restore_opts="--outdir_restored ${outdir}_restored --alpha ${alpha}"
+        fi
         echo ""
         echo "now synthesizing ${spk_src}-${spk_trg}..., log here: ${expdir_wave}/log/decode_dev_${min_idx_cycvae}-${min_idx_wave}_${spk_src}-${spk_trg}.log"
         #${cuda_cmd} ${expdir_wave}/log/decode_tst_${min_idx_cycvae}-${min_idx_wave}_${spk_src}-${spk_trg}.log \
@@ -2072,11 +2125,16 @@ if [ `echo ${stage} | grep b` ];then
                 --config ${config} \
                 --fs ${fs} \
                 --batch_size ${decode_batch_size} \
+                ${restore_opts} \
                 --n_gpus ${n_gpus} \
                 --string_path ${string_path_cv} \
                 --GPU_device_str ${GPU_device_str}
         echo ""
-        echo "synthesizing ${spk_src}-${spk_trg} is finished, pre-emphasized synthesized waveform here: $outdir"
+        if [ "${deemph_decode}" == "true" ]; then
+            echo "synthesizing ${spk_src}-${spk_trg} is finished, de-emphasized synthesized waveform here: ${outdir}_restored"
+        else
+            echo "synthesizing ${spk_src}-${spk_trg} is finished, pre-emphasized synthesized waveform here: $outdir"
+        fi
         echo ""
     fi
 fi
@@ -2084,7 +2142,7 @@ fi
 
 
 # STAGE c {{{
-if [ `echo ${stage} | grep c` ];then
+if [ `echo ${stage} | grep c` ] && [ "${deemph_decode}" != "true" ];then
     echo "###########################################################"
     echo "#             RESTORE NOISE SHAPING STEP                  #"
     echo "###########################################################"
@@ -2228,6 +2286,10 @@ if [ `echo ${stage} | grep e` ];then
 
     # decode
     if [ $mdl_name_wave == "wavernn_dualgru_compact_lpc_mband_10bit_cf_stft_emb" ]; then
+        restore_opts=""
+        if [ "${deemph_decode}" == "true" ]; then
+            restore_opts="--outdir_restored ${outdir}_restored --alpha ${alpha}"
+        fi
         echo ""
         echo "now synthesizing ${spk_src}-${spk_trg}..., log here: ${expdir_wave}/log/decode_dev_${min_idx_cycvae}-${min_idx_wave}-${min_idx_ft}_${spk_src}-${spk_trg}.log"
         #${cuda_cmd} ${expdir_wave}/log/decode_tst_${min_idx_cycvae}-${min_idx_wave}-${min_idx_ft}_${spk_src}-${spk_trg}.log \
@@ -2239,11 +2301,16 @@ if [ `echo ${stage} | grep e` ];then
                 --config ${config} \
                 --fs ${fs} \
                 --batch_size ${decode_batch_size} \
+                ${restore_opts} \
                 --n_gpus ${n_gpus} \
                 --string_path ${string_path_ft} \
                 --GPU_device_str ${GPU_device_str}
         echo ""
-        echo "synthesizing ${spk_src}-${spk_trg} is finished, pre-emphasized synthesized waveform here: $outdir"
+        if [ "${deemph_decode}" == "true" ]; then
+            echo "synthesizing ${spk_src}-${spk_trg} is finished, de-emphasized synthesized waveform here: ${outdir}_restored"
+        else
+            echo "synthesizing ${spk_src}-${spk_trg} is finished, pre-emphasized synthesized waveform here: $outdir"
+        fi
         echo ""
     fi
 fi
@@ -2251,7 +2318,7 @@ fi
 
 
 # STAGE f {{{
-if [ `echo ${stage} | grep f` ];then
+if [ `echo ${stage} | grep f` ] && [ "${deemph_decode}" != "true" ];then
     echo "###########################################################"
     echo "#             RESTORE NOISE SHAPING STEP                  #"
     echo "###########################################################"
@@ -2412,6 +2479,10 @@ if [ `echo ${stage} | grep h` ];then
 
     # decode
     if [ $mdl_name_wave == "wavernn_dualgru_compact_lpc_mband_10bit_cf_stft_emb" ]; then
+        restore_opts=""
+        if [ "${deemph_decode}" == "true" ]; then
+            restore_opts="--outdir_restored ${outdir}_restored --alpha ${alpha}"
+        fi
         echo ""
         echo "now synthesizing ${spk_src}-${spk_trg}..., log here: ${expdir_wave}/log/decode_dev_${min_idx_cycvae}-${min_idx_wave}-${min_idx_ft}-${min_idx_sp}_${spk_src}-${spk_trg}.log"
         #${cuda_cmd} ${expdir_wave}/log/decode_tst_${min_idx_cycvae}-${min_idx_wave}-${min_idx_ft}-${min_idx_sp}_${spk_src}-${spk_trg}.log \
@@ -2423,11 +2494,16 @@ if [ `echo ${stage} | grep h` ];then
                 --config ${config} \
                 --fs ${fs} \
                 --batch_size ${decode_batch_size} \
+                ${restore_opts} \
                 --n_gpus ${n_gpus} \
                 --string_path ${string_path_sp} \
                 --GPU_device_str ${GPU_device_str}
         echo ""
-        echo "synthesizing ${spk_src}-${spk_trg} is finished, pre-emphasized synthesized waveform here: $outdir"
+        if [ "${deemph_decode}" == "true" ]; then
+            echo "synthesizing ${spk_src}-${spk_trg} is finished, de-emphasized synthesized waveform here: ${outdir}_restored"
+        else
+            echo "synthesizing ${spk_src}-${spk_trg} is finished, pre-emphasized synthesized waveform here: $outdir"
+        fi
         echo ""
     fi
 fi
@@ -2435,7 +2511,7 @@ fi
 
 
 # STAGE j {{{
-if [ `echo ${stage} | grep j` ];then
+if [ `echo ${stage} | grep j` ] && [ "${deemph_decode}" != "true" ];then
     echo "###########################################################"
     echo "#             RESTORE NOISE SHAPING STEP                  #"
     echo "###########################################################"
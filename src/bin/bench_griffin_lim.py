@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright 2021 Patrick Lumban Tobing (Nagoya University)
+#  Apache 2.0  (http://www.apache.org/licenses/LICENSE-2.0)
+
+from __future__ import division
+
+import argparse
+import json
+import logging
+import os
+import time
+
+import numpy as np
+import torch
+
+import librosa
+
+from griffin_lim import GriffinLim
+
+
+def spectral_convergence(wav, magsp, fftl, hop_length, win_length, pad_mode):
+    """FUNCTION TO COMPUTE THE SPECTRAL CONVERGENCE OF A RECONSTRUCTED WAVEFORM TO THE TARGET MAGNITUDE SPECTRA
+
+    Args:
+        wav (ndarray): reconstructed waveform
+        magsp (ndarray): target magnitude spectra (fftl//2+1 x T)
+        fftl (int): FFT length
+        hop_length (int): frame shift in samples
+        win_length (int): window length in samples
+        pad_mode (str): padding mode of the centered frames
+
+    Return:
+        (float): spectral convergence
+    """
+    rec = np.abs(librosa.stft(wav, n_fft=fftl, hop_length=hop_length, win_length=win_length, window='hann',
+                    pad_mode=pad_mode))
+    return np.linalg.norm(rec - magsp) / np.linalg.norm(magsp)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--fs", default=24000,
+                        type=int, help="sampling rate")
+    parser.add_argument("--fftl", default=2048,
+                        type=int, help="FFT length")
+    parser.add_argument("--shiftms", default=5,
+                        type=float, help="frame shift in msec")
+    parser.add_argument("--winms", default=27.5,
+                        type=float, help="window length in msec")
+    parser.add_argument("--n_iter", default=32,
+                        type=int, help="number of Griffin-Lim iterations")
+    parser.add_argument("--pad_mode", default=None,
+                        type=str, help="padding mode of the forward STFT, that of librosa if not set")
+    parser.add_argument("--seconds", default="1.0-2.5-4.0",
+                        type=str, help="lengths of the signals in one batch in seconds separated by -")
+    parser.add_argument("--outdir", default=None,
+                        type=str, help="directory to save the report")
+    parser.add_argument("--seed", default=1,
+                        type=int, help="seed number")
+    parser.add_argument("--verbose", default=1,
+                        type=int, help="log level")
+    args = parser.parse_args()
+
+    # set log level
+    if args.verbose > 0:
+        logging.basicConfig(level=logging.INFO,
+                            format='%(asctime)s (%(module)s:%(lineno)d) %(levelname)s: %(message)s',
+                            datefmt='%m/%d/%Y %I:%M:%S')
+    else:
+        logging.basicConfig(level=logging.WARN,
+                            format='%(asctime)s (%(module)s:%(lineno)d) %(levelname)s: %(message)s',
+                            datefmt='%m/%d/%Y %I:%M:%S')
+        logging.warn("logging is disabled.")
+
+    # fix seed
+    np.random.seed(args.seed)
+    torch.manual_seed(args.seed)
+
+    griffin_lim = GriffinLim(fs=args.fs, fftl=args.fftl, shiftms=args.shiftms, winms=args.winms,
+                    n_iter=args.n_iter, init="ones", pad_mode=args.pad_mode)
+    args.pad_mode = griffin_lim.pad_mode
+    hop_length = griffin_lim.hop_length
+    win_length = griffin_lim.win_length
+
+    # harmonic signals with noise, as the target magnitude spectra
+    magsp_list = []
+    for sec in [float(x) for x in args.seconds.split('-')]:
+        t = np.arange(int(sec*args.fs)) / args.fs
+        f0 = 100 + 100*np.random.rand()
+        x = sum([np.sin(2*np.pi*k*f0*t + 2*np.pi*np.random.rand()) / k for k in range(1, 20)]) * 0.1 \
+                + 0.01*np.random.randn(len(t))
+        magsp_list.append(np.abs(librosa.stft(x.astype(np.float32), n_fft=args.fftl, hop_length=hop_length,
+                            win_length=win_length, window='hann', pad_mode=args.pad_mode)))
+
+    # librosa, one utterance at a time
+    start = time.time()
+    wav_ref_list = [librosa.griffinlim(magsp, n_iter=args.n_iter, hop_length=hop_length, win_length=win_length,
+                        window='hann', pad_mode=args.pad_mode, init=None) for magsp in magsp_list]
+    t_ref = time.time() - start
+
+    # torch, one padded batch
+    lengths = [magsp.shape[1] for magsp in magsp_list]
+    batch_magsp = np.zeros((len(magsp_list), max(lengths), args.fftl//2+1), dtype=np.float32)
+    for i, magsp in enumerate(magsp_list):
+        batch_magsp[i,:lengths[i]] = magsp.T
+    start = time.time()
+    with torch.no_grad():
+        wav, n_samples_list = griffin_lim(torch.from_numpy(batch_magsp), lengths=lengths)
+    t_torch = time.time() - start
+    wav = wav.numpy()
+
+    report = []
+    for i, magsp in enumerate(magsp_list):
+        wav_ref = wav_ref_list[i]
+        wav_torch = wav[i,:n_samples_list[i]]
+        err = np.abs(wav_torch - wav_ref)
+        edge = args.fftl // 2
+        sc_ref = spectral_convergence(wav_ref, magsp, args.fftl, hop_length, win_length, args.pad_mode)
+        sc_torch = spectral_convergence(wav_torch, magsp, args.fftl, hop_length, win_length, args.pad_mode)
+        logging.info("%d frames: max. abs. deviation %.3e (%.3e without %d edge samples), mean %.3e, "
+                        "spectral convergence librosa %.4f torch %.4f" % (lengths[i], np.max(err),
+                        np.max(err[edge:-edge]), edge, np.mean(err), sc_ref, sc_torch))
+        report.append({"n_frames": lengths[i], "max_dev": float(np.max(err)),
+                        "max_dev_inner": float(np.max(err[edge:-edge])), "mean_dev": float(np.mean(err)),
+                        "sc_librosa": float(sc_ref), "sc_torch": float(sc_torch)})
+    logging.info("time librosa %.3f sec., torch batch %.3f sec." % (t_ref, t_torch))
+
+    if args.outdir is not None:
+        if not os.path.exists(args.outdir):
+            os.makedirs(args.outdir)
+        with open(os.path.join(args.outdir, "bench_griffin_lim.json"), "w") as f:
+            json.dump({"pad_mode": args.pad_mode, "n_iter": args.n_iter, "time_librosa": t_ref,
+                        "time_torch": t_torch, "utterances": report}, f, indent=4)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright 2021 Patrick Lumban Tobing (Nagoya University)
+#  Apache 2.0  (http://www.apache.org/licenses/LICENSE-2.0)
+
+from __future__ import division
+
+import argparse
+import json
+import logging
+import os
+import time
+
+import numpy as np
+import soundfile as sf
+import librosa
+
+from utils import find_files
+from utils import read_txt
+from melsp_engine import MelSpEngine
+
+
+def melsp_librosa(x, n_mels, n_fft, shiftms, winms, fs):
+    """FUNCTION TO COMPUTE THE MEL AND MAGNITUDE SPECTROGRAMS PER FILE AS melsp OF feature_extract.py"""
+    hop_length = int((fs/1000)*shiftms)
+    win_length = int((fs/1000)*winms)
+    stft = librosa.core.stft(x, n_fft=n_fft, hop_length=hop_length,
+        win_length=win_length, window='hann')
+    magspec = np.abs(stft)
+    melfb = librosa.filters.mel(fs, n_fft, n_mels=n_mels)
+
+    return np.dot(melfb, magspec).T, magspec.T
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--waveforms", default=None,
+                        type=str, help="directory or list of wav files, random signals if not set")
+    parser.add_argument("--n_rand", default=1000,
+                        type=int, help="number of random signals, about the size of the vcc20 training set")
+    parser.add_argument("--max_files", default=-1,
+                        type=int, help="maximum number of wav files, all if negative")
+    parser.add_argument("--fs", default=24000,
+                        type=int, help="sampling rate")
+    parser.add_argument("--fftl", default=2048,
+                        type=int, help="FFT length")
+    parser.add_argument("--shiftms", default=5,
+                        type=float, help="frame shift in ms")
+    parser.add_argument("--winms", default=27.5,
+                        type=float, help="window length in ms")
+    parser.add_argument("--mel_dim", default=80,
+                        type=int, help="number of mel bins")
+    parser.add_argument("--batch_sizes", default="1-4-16-64",
+                        type=str, help="numbers of wav files of one batched STFT, separated by -")
+    parser.add_argument("--outdir", default=None,
+                        type=str, help="directory to save the report")
+    parser.add_argument("--seed", default=1,
+                        type=int, help="seed number")
+    parser.add_argument("--verbose", default=1,
+                        type=int, help="log level")
+    args = parser.parse_args()
+
+    # set log level
+    if args.verbose > 0:
+        logging.basicConfig(level=logging.INFO,
+                            format='%(asctime)s (%(module)s:%(lineno)d) %(levelname)s: %(message)s',
+                            datefmt='%m/%d/%Y %I:%M:%S')
+    else:
+        logging.basicConfig(level=logging.WARN,
+                            format='%(asctime)s (%(module)s:%(lineno)d) %(levelname)s: %(message)s',
+                            datefmt='%m/%d/%Y %I:%M:%S')
+        logging.warn("logging is disabled.")
+
+    # waveforms
+    if args.waveforms is not None:
+        if os.path.isdir(args.waveforms):
+            file_list = sorted(find_files(args.waveforms, "*.wav"))
+        else:
+            file_list = read_txt(args.waveforms)
+        if args.max_files > 0:
+            file_list = file_list[:args.max_files]
+        x_list = []
+        for wav_file in file_list:
+            x, fs = sf.read(wav_file)
+            assert fs == args.fs, "sampling rate of %s is %d" % (wav_file, fs)
+            x_list.append(x)
+    else:
+        random_state = np.random.RandomState(args.seed)
+        x_list = [0.1*random_state.randn(int(random_state.uniform(1.5, 6.0)*args.fs)) for _ in range(args.n_rand)]
+    n_sec = sum([len(x) for x in x_list]) / args.fs
+    logging.info("%d files, %.1f sec." % (len(x_list), n_sec))
+
+    # per-file librosa as in feature_extract.py
+    start = time.time()
+    ref_list = [melsp_librosa(x, args.mel_dim, args.fftl, args.shiftms, args.winms, args.fs) for x in x_list]
+    time_ref = time.time() - start
+    n_frames = sum([magspec.shape[0] for _, magspec in ref_list])
+    logging.info("librosa: %.3f sec., %.1f files/sec., %.1f frames/sec." % (time_ref, len(x_list)/time_ref,
+                    n_frames/time_ref))
+
+    report = {"n_files": len(x_list), "n_sec": n_sec, "n_frames": int(n_frames), "time_librosa": time_ref,
+                "batch": []}
+    for batch_size in [int(x) for x in args.batch_sizes.split('-')]:
+        start = time.time()
+        engine = MelSpEngine(args.fs, args.fftl, args.shiftms, args.winms, args.mel_dim)
+        out_list = []
+        for i in range(0, len(x_list), batch_size):
+            out_list += engine(x_list[i:i+batch_size])
+        time_engine = time.time() - start
+        assert all([magspec.shape == ref_magspec.shape for (_, magspec), (_, ref_magspec) in zip(out_list, ref_list)])
+        dev_mag = max([np.max(np.abs(magspec - ref_magspec)) / max(np.max(np.abs(ref_magspec)), 1e-10) \
+                        for (_, magspec), (_, ref_magspec) in zip(out_list, ref_list)])
+        dev_mel = max([np.max(np.abs(melmagsp - ref_melmagsp)) / max(np.max(np.abs(ref_melmagsp)), 1e-10) \
+                        for (melmagsp, _), (ref_melmagsp, _) in zip(out_list, ref_list)])
+        logging.info("batch %d: %.3f sec., %.1f files/sec., speed-up %.2fx, max. rel. deviation magsp %.3e melsp %.3e" \
+                        % (batch_size, time_engine, len(x_list)/time_engine, time_ref/time_engine, dev_mag, dev_mel))
+        report["batch"].append({"batch_size": batch_size, "time": time_engine, "speedup": time_ref/time_engine,
+                                "dev_magsp": float(dev_mag), "dev_melsp": float(dev_mel)})
+
+    if args.outdir is not None:
+        if not os.path.exists(args.outdir):
+            os.makedirs(args.outdir)
+        with open(os.path.join(args.outdir, "bench_melsp_engine.json"), "w") as f:
+            json.dump(report, f, indent=4)
+
+
+if __name__ == "__main__":
+    main()
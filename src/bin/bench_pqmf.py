@@ -0,0 +1,164 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright 2021 Patrick Lumban Tobing (Nagoya University)
+#  Apache 2.0  (http://www.apache.org/licenses/LICENSE-2.0)
+
+from __future__ import division
+
+import argparse
+import json
+import logging
+import os
+import time
+
+import numpy as np
+import torch
+
+from pqmf import PQMF
+from pqmf_poly import PolyphasePQMF
+
+
+def time_call(func, x, n_iter, device):
+    """FUNCTION TO MEASURE THE AVERAGE TIME OF A CALL
+
+    Args:
+        func (function): function to call with x
+        x (Tensor): input
+        n_iter (int): number of timed calls
+        device (torch.device): device, synchronized for cuda
+
+    Return:
+        (float): average time per call in seconds
+    """
+    func(x)
+    if device.type == "cuda":
+        torch.cuda.synchronize()
+    start = time.time()
+    for i in range(n_iter):
+        func(x)
+    if device.type == "cuda":
+        torch.cuda.synchronize()
+    return (time.time() - start) / n_iter
+
+
+def stream(func, x, chunk_sizes):
+    """FUNCTION TO PROCESS A SIGNAL CHUNK BY CHUNK WITH A STREAMING FUNCTION
+
+    Args:
+        func (function): streaming function with (x, state, flush) arguments
+        x (Tensor): input (B x C x T)
+        chunk_sizes (list): sizes of the chunks, the rest is the last chunk
+
+    Return:
+        (Tensor): output of all chunks
+    """
+    outs = []
+    state = None
+    start = 0
+    for size in chunk_sizes:
+        if start + size >= x.shape[-1]:
+            break
+        out, state = func(x[...,start:start+size], state)
+        outs.append(out)
+        start += size
+    out, state = func(x[...,start:], state, flush=True)
+    outs.append(out)
+    return torch.cat(outs, -1)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--bands", default="2-4-5-6-10-12",
+                        type=str, help="numbers of subbands separated by -")
+    parser.add_argument("--fs", default=24000,
+                        type=int, help="sampling rate")
+    parser.add_argument("--seconds", default=4.0,
+                        type=float, help="length of the signals in seconds")
+    parser.add_argument("--batch_size", default=8,
+                        type=int, help="number of signals")
+    parser.add_argument("--n_iter", default=10,
+                        type=int, help="number of timed calls")
+    parser.add_argument("--n_threads", default=1,
+                        type=int, help="number of cpu threads")
+    parser.add_argument("--GPU_device", default=None,
+                        type=int, help="selection of GPU device, cpu if not set or negative")
+    parser.add_argument("--outdir", default=None,
+                        type=str, help="directory to save the report")
+    parser.add_argument("--seed", default=1,
+                        type=int, help="seed number")
+    parser.add_argument("--verbose", default=1,
+                        type=int, help="log level")
+    args = parser.parse_args()
+
+    if args.GPU_device is not None and args.GPU_device >= 0:
+        os.environ["CUDA_DEVICE_ORDER"]     = "PCI_BUS_ID"
+        os.environ["CUDA_VISIBLE_DEVICES"]  = str(args.GPU_device)
+
+    # set log level
+    if args.verbose > 0:
+        logging.basicConfig(level=logging.INFO,
+                            format='%(asctime)s (%(module)s:%(lineno)d) %(levelname)s: %(message)s',
+                            datefmt='%m/%d/%Y %I:%M:%S')
+    else:
+        logging.basicConfig(level=logging.WARN,
+                            format='%(asctime)s (%(module)s:%(lineno)d) %(levelname)s: %(message)s',
+                            datefmt='%m/%d/%Y %I:%M:%S')
+        logging.warn("logging is disabled.")
+
+    # fix seed
+    os.environ['PYTHONHASHSEED'] = str(args.seed)
+    np.random.seed(args.seed)
+    torch.manual_seed(args.seed)
+    torch.set_num_threads(args.n_threads)
+
+    if args.GPU_device is not None and args.GPU_device >= 0 and torch.cuda.is_available():
+        device = torch.device("cuda")
+    else:
+        device = torch.device("cpu")
+    logging.info(device)
+
+    report = []
+    with torch.no_grad():
+        for n_bands in [int(x) for x in args.bands.split('-')]:
+            pqmf = PQMF(n_bands).to(device)
+            pqmf_poly = PolyphasePQMF(pqmf=pqmf).to(device)
+            T = int(args.seconds * args.fs) // n_bands * n_bands
+            x = torch.empty(args.batch_size, 1, T, device=device).uniform_(-0.5, 0.5)
+
+            # deviations of full-signal and chunk-by-chunk processing from PQMF
+            x_bands = pqmf.analysis(x)
+            dev_ana = (pqmf_poly.analysis(x) - x_bands).abs().max().item()
+            chunk_sizes = np.random.randint(1, 4*args.fs//100, size=T).tolist()
+            dev_ana_stream = (stream(pqmf_poly.analysis_stream, x, chunk_sizes) - x_bands).abs().max().item()
+            x_syn = pqmf.synthesis(x_bands)
+            dev_syn = (pqmf_poly.synthesis(x_bands) - x_syn).abs().max().item()
+            chunk_sizes = np.random.randint(1, 4*args.fs//100//n_bands, size=T).tolist()
+            dev_syn_stream = (stream(pqmf_poly.synthesis_stream, x_bands, chunk_sizes) - x_syn).abs().max().item()
+
+            # throughput
+            t_ana = time_call(pqmf.analysis, x, args.n_iter, device)
+            t_ana_poly = time_call(pqmf_poly.analysis, x, args.n_iter, device)
+            t_syn = time_call(pqmf.synthesis, x_bands, args.n_iter, device)
+            t_syn_poly = time_call(pqmf_poly.synthesis, x_bands, args.n_iter, device)
+            n_sec = args.batch_size * T / args.fs
+            logging.info("%d bands, %d taps: max. abs. deviation analysis %.3e (stream %.3e), synthesis %.3e (stream %.3e)" \
+                            % (n_bands, pqmf.taps, dev_ana, dev_ana_stream, dev_syn, dev_syn_stream))
+            logging.info("%d bands: analysis %.1f -> %.1f sec./sec. (%.2fx), synthesis %.1f -> %.1f sec./sec. (%.2fx)" \
+                            % (n_bands, n_sec/t_ana, n_sec/t_ana_poly, t_ana/t_ana_poly, n_sec/t_syn,
+                                n_sec/t_syn_poly, t_syn/t_syn_poly))
+            report.append({"n_bands": n_bands, "taps": pqmf.taps, "dev_analysis": dev_ana,
+                            "dev_analysis_stream": dev_ana_stream, "dev_synthesis": dev_syn,
+                            "dev_synthesis_stream": dev_syn_stream, "time_analysis": t_ana,
+                            "time_analysis_poly": t_ana_poly, "time_synthesis": t_syn, "time_synthesis_poly": t_syn_poly})
+
+    if args.outdir is not None:
+        if not os.path.exists(args.outdir):
+            os.makedirs(args.outdir)
+        with open(os.path.join(args.outdir, "bench_pqmf.json"), "w") as f:
+            json.dump({"device": device.type, "batch_size": args.batch_size, "seconds": args.seconds,
+                        "bands": report}, f, indent=4)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright 2021 Patrick Lumban Tobing (Nagoya University)
+#  Apache 2.0  (http://www.apache.org/licenses/LICENSE-2.0)
+
+from __future__ import division
+
+import argparse
+import json
+import logging
+import os
+import time
+
+import numpy as np
+import torch
+from torch import nn
+
+from vcneuvoco import GRU_WAVE_DECODER_DUALGRU_COMPACT_MBAND_CF
+from sparsify import block_mask, block_scores
+from sparse_gru import BlockSparseGRU
+
+
+def time_steps(gru, x, n_steps, n_warmup=10):
+    """FUNCTION TO MEASURE THE AVERAGE TIME OF SINGLE-STEP GRU CALLS AS IN GENERATION
+
+    Args:
+        gru (nn.Module): GRU with batch-first interface
+        x (Tensor): input (B x T x C), the first n_steps frames are fed one by one
+        n_steps (int): number of timed steps
+        n_warmup (int): number of untimed steps
+
+    Return:
+        (float): average time per step in seconds
+    """
+    with torch.no_grad():
+        h = None
+        for t in range(n_warmup):
+            _, h = gru(x[:,t:t+1], h)
+        h = None
+        start = time.time()
+        for t in range(n_steps):
+            _, h = gru(x[:,t:t+1], h)
+        return (time.time() - start) / n_steps
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--checkpoint", default=None,
+                        type=str, help="model file, random GRU sparsified with --densities if None")
+    parser.add_argument("--config", default=None,
+                        type=str, help="configure file")
+    parser.add_argument("--hidden_units", default=1184,
+                        type=int, help="number of hidden units of random GRU")
+    parser.add_argument("--in_dim", default=384,
+                        type=int, help="number of input dimensions of random GRU")
+    parser.add_argument("--densities", default="0.05-0.05-0.2",
+                        type=str, help="density of reset, update, new hidden gate matrices of random GRU")
+    parser.add_argument("--batch_size", default=1,
+                        type=int, help="batch size")
+    parser.add_argument("--n_frames", default=50,
+                        type=int, help="number of frames of the batch validation")
+    parser.add_argument("--n_steps", default=500,
+                        type=int, help="number of timed single steps")
+    parser.add_argument("--n_threads", default=1,
+                        type=int, help="number of cpu threads")
+    parser.add_argument("--outdir", default=None,
+                        type=str, help="directory to save the report")
+    parser.add_argument("--seed", default=1,
+                        type=int, help="seed number")
+    parser.add_argument("--verbose", default=1,
+                        type=int, help="log level")
+    args = parser.parse_args()
+
+    # set log level
+    if args.verbose > 0:
+        logging.basicConfig(level=logging.INFO,
+                            format='%(asctime)s (%(module)s:%(lineno)d) %(levelname)s: %(message)s',
+                            datefmt='%m/%d/%Y %I:%M:%S')
+    else:
+        logging.basicConfig(level=logging.WARN,
+                            format='%(asctime)s (%(module)s:%(lineno)d) %(levelname)s: %(message)s',
+                            datefmt='%m/%d/%Y %I:%M:%S')
+        logging.warn("logging is disabled.")
+
+    # fix seed
+    os.environ['PYTHONHASHSEED'] = str(args.seed)
+    np.random.seed(args.seed)
+    torch.manual_seed(args.seed)
+    torch.set_num_threads(args.n_threads)
+
+    with torch.no_grad():
+        if args.checkpoint is not None:
+            # trained and sparsified wave decoder GRU
+            config = torch.load(args.config)
+            logging.info(config)
+            model_waveform = GRU_WAVE_DECODER_DUALGRU_COMPACT_MBAND_CF(
+                feat_dim=config.mcep_dim+config.excit_dim,
+                upsampling_factor=config.upsampling_factor,
+                hidden_units=config.hidden_units_wave,
+                hidden_units_2=config.hidden_units_wave_2,
+                kernel_size=config.kernel_size_wave,
+                dilation_size=config.dilation_size_wave,
+                n_quantize=config.n_quantize,
+                causal_conv=config.causal_conv_wave,
+                right_size=config.right_size,
+                n_bands=config.n_bands,
+                pad_first=True,
+                mid_dim=config.mid_dim,
+                emb_flag=True,
+                lpc=config.lpc)
+            model_waveform.load_state_dict(torch.load(args.checkpoint, map_location="cpu")["model_waveform"])
+            gru = model_waveform.gru
+        else:
+            # random GRU sparsified with the final densities of the schedule
+            densities = [float(x) for x in args.densities.split('-')]
+            gru = nn.GRU(args.in_dim, args.hidden_units, 1, batch_first=True)
+            gru.weight_hh_l0.data.mul_(block_mask(block_scores(gru.weight_hh_l0.data), densities))
+        gru.eval()
+        sparse_gru = BlockSparseGRU.from_gru(gru)
+        logging.info("hidden units %d, block density %.4lf" % (gru.hidden_size, sparse_gru.density))
+
+        # validation of batch and single-step calls against nn.GRU
+        x = torch.randn(args.batch_size, max(args.n_frames, args.n_steps+10), gru.input_size)
+        h_0 = torch.randn(1, args.batch_size, gru.hidden_size)
+        out_ref, h_ref = gru(x[:,:args.n_frames], h_0)
+        out, h = sparse_gru(x[:,:args.n_frames], h_0)
+        dev_batch = max((out - out_ref).abs().max().item(), (h - h_ref).abs().max().item())
+        h_ref, h = h_0, h_0
+        dev_step = 0
+        for t in range(args.n_frames):
+            out_ref, h_ref = gru(x[:,t:t+1], h_ref)
+            out, h = sparse_gru(x[:,t:t+1], h)
+            dev_step = max(dev_step, (out - out_ref).abs().max().item())
+        logging.info("max. abs. deviation: batch %.3e, single-step %.3e" % (dev_batch, dev_step))
+
+        # single-step timing as in generation
+        t_dense = time_steps(gru, x, args.n_steps)
+        t_sparse = time_steps(sparse_gru, x, args.n_steps)
+        logging.info("time per step: dense %.3lf ms, sparse %.3lf ms, speed-up %.2lfx" % \
+            (t_dense*1000, t_sparse*1000, t_dense/t_sparse))
+
+    if args.outdir is not None:
+        if not os.path.exists(args.outdir):
+            os.makedirs(args.outdir)
+        report = {"hidden_units": gru.hidden_size, "density": sparse_gru.density, "batch_size": args.batch_size,
+                    "n_threads": args.n_threads, "dev_batch": dev_batch, "dev_step": dev_step,
+                    "ms_dense": t_dense*1000, "ms_sparse": t_sparse*1000}
+        with open(os.path.join(args.outdir, "bench_sparse_gru.json"), "w") as f:
+            json.dump(report, f, indent=4)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright 2021 Patrick Lumban Tobing (Nagoya University)
+#  Apache 2.0  (http://www.apache.org/licenses/LICENSE-2.0)
+
+from __future__ import division
+
+from multiprocessing.pool import ThreadPool
+import argparse
+import logging
+import os
+import sys
+import time
+
+import numpy as np
+import soundfile as sf
+
+from utils import find_files
+from utils import read_txt
+from mwdlp_clib import MWDLPCLib
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--waveforms", required=True,
+                        type=str, help="list or directory of wav files")
+    parser.add_argument("--lib", required=True,
+                        type=str, help="shared library built by make shared in a demo_realtime directory")
+    parser.add_argument("--outdir", required=True,
+                        type=str, help="directory to save generated samples")
+    parser.add_argument("--spk_idx", default=None,
+                        type=int, help="1-based target speaker index, analysis-synthesis if not set")
+    parser.add_argument("--spk_coord", default=None,
+                        type=str, help="interpolated target speaker coordinate x_y, used instead of --spk_idx")
+    parser.add_argument("--n_jobs", default=1,
+                        type=int, help="number of decoding threads")
+    parser.add_argument("--verbose", default=1,
+                        type=int, help="log level")
+    args = parser.parse_args()
+
+    # check directory existence
+    if not os.path.exists(args.outdir):
+        os.makedirs(args.outdir)
+
+    # set log level
+    if args.verbose > 0:
+        logging.basicConfig(level=logging.INFO,
+                            format='%(asctime)s (%(module)s:%(lineno)d) %(levelname)s: %(message)s',
+                            datefmt='%m/%d/%Y %I:%M:%S',
+                            filename=args.outdir + "/decode.log")
+        logging.getLogger().addHandler(logging.StreamHandler())
+    else:
+        logging.basicConfig(level=logging.WARN,
+                            format='%(asctime)s (%(module)s:%(lineno)d) %(levelname)s: %(message)s',
+                            datefmt='%m/%d/%Y %I:%M:%S',
+                            filename=args.outdir + "/decode.log")
+        logging.getLogger().addHandler(logging.StreamHandler())
+        logging.warn("logging is disabled.")
+
+    # get file list
+    if os.path.isdir(args.waveforms):
+        wav_list = sorted(find_files(args.waveforms, "*.wav"))
+    elif os.path.isfile(args.waveforms):
+        wav_list = read_txt(args.waveforms)
+    else:
+        logging.error("--waveforms should be directory or list.")
+        sys.exit(1)
+
+    clib = MWDLPCLib(args.lib)
+    logging.info("fs %d, frame shift %d, melsp dim %d, n_spk %d" % (clib.fs, clib.frame_shift,
+        clib.features_dim, clib.n_spk))
+    spk_coord = None
+    if args.spk_coord is not None:
+        spk_coord = [float(x) for x in args.spk_coord.split('_')]
+
+    def decode(wav_file):
+        x, fs = sf.read(wav_file, dtype="int16")
+        if fs != clib.fs:
+            logging.error("%s: sampling rate %d is not %d" % (wav_file, fs, clib.fs))
+            return 0, 0
+        start = time.time()
+        y = clib.decode(x, spk_idx=args.spk_idx, spk_coord=spk_coord)
+        elapsed = time.time() - start
+        sf.write(os.path.join(args.outdir, os.path.basename(wav_file)), y, clib.fs, "PCM_16")
+        logging.info("%s: %d samples, %.2f sec., RTF %.3f" % (wav_file, len(y), elapsed,
+            elapsed / max(len(y) / clib.fs, 1e-9)))
+        return len(y), elapsed
+
+    start = time.time()
+    if args.n_jobs > 1:
+        pool = ThreadPool(args.n_jobs)
+        results = pool.map(decode, wav_list)
+        pool.close()
+        pool.join()
+    else:
+        results = [decode(wav_file) for wav_file in wav_list]
+    total_samples = np.sum([res[0] for res in results])
+    logging.info("%d files, %.2f sec. of audio, %.2f sec. total, %.2f sec. in C calls" % (len(results),
+        total_samples / clib.fs, time.time() - start, np.sum([res[1] for res in results])))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,307 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright 2021 Patrick Lumban Tobing (Nagoya University)
+#  Apache 2.0  (http://www.apache.org/licenses/LICENSE-2.0)
+
+from __future__ import division
+
+from distutils.util import strtobool
+import argparse
+import logging
+import os
+import sys
+import time
+
+import numpy as np
+import torch
+import torch.nn.functional as F
+
+from utils import find_files
+from utils import read_hdf5
+from utils import read_txt
+from vcneuvoco import GRU_VAE_ENCODER, GRU_SPEC_DECODER, SPKID_TRANSFORM_LAYER
+from vcneuvoco import GRU_WAVE_DECODER_DUALGRU_COMPACT_MBAND_CF
+from freeze import freeze_model
+from pqmf import PQMF
+from wav_output import write_wav
+
+
+def grid_coords(spk_coords, n_interp):
+    """FUNCTION TO COMPUTE THE INTERPOLATION GRID OVER THE MIN-MAX RANGE OF THE SPEAKER COORDINATES AS IN run_realtime.sh
+
+    Args:
+        spk_coords (ndarray): speaker-space coordinates of the training speakers (n_spk x 2)
+        n_interp (int): number of interpolation intervals per axis
+
+    Return:
+        (ndarray): grid coordinates ((n_interp+1)^2 x 2), x-major order
+    """
+    x_coords = np.linspace(spk_coords[:,0].min(), spk_coords[:,0].max(), n_interp+1)
+    y_coords = np.linspace(spk_coords[:,1].min(), spk_coords[:,1].max(), n_interp+1)
+    return np.array([[x, y] for x in x_coords for y in y_coords])
+
+
+def parse_spk_weights(spk_weights, spk_list):
+    """FUNCTION TO PARSE THE WEIGHTED SPEAKER TARGETS
+
+    Args:
+        spk_weights (str): targets separated by @, each as spk:weight pairs separated by comma, e.g., SF1:0.5,TM1:0.5
+        spk_list (list): training speakers
+
+    Return:
+        (ndarray): speaker weights (n_targets x n_spk)
+        (list): output name suffixes
+    """
+    weights = []
+    names = []
+    for target in spk_weights.split('@'):
+        weight = np.zeros(len(spk_list))
+        for pair in target.split(','):
+            spk, value = pair.split(':')
+            weight[spk_list.index(spk)] = float(value)
+        weights.append(weight)
+        names.append(target.replace(':', '-').replace(',', '_'))
+    return np.array(weights), names
+
+
+def encode_melsp(melsp, model_encoder_melsp, model_encoder_excit, model_decoder_melsp):
+    """FUNCTION TO COMPUTE THE LATENTS OF A MEL-SPECTROGRAM, PADDED AS IN THE STREAMING C ENGINE
+
+    Args:
+        melsp (Tensor): log(1+10000*melsp) (T x mel_dim)
+
+    Return:
+        (Tensor): latents padded by the decoder left size (1 x T' x lat_dim_e+lat_dim)
+    """
+    x = F.pad(melsp.unsqueeze(0).transpose(1,2), (model_encoder_melsp.pad_left,
+            model_encoder_melsp.pad_right+model_decoder_melsp.pad_right), "replicate").transpose(1,2)
+    _, _, lat_melsp, _ = model_encoder_melsp(x, sampling=False)
+    _, _, lat_excit, _ = model_encoder_excit(x, sampling=False)
+    lat = torch.cat((lat_excit, lat_melsp), 2)
+    return F.pad(lat.transpose(1,2), (model_decoder_melsp.pad_left, 0), "replicate").transpose(1,2)
+
+
+def decode_melsp_grid(lat, spk_code, model_decoder_melsp):
+    """FUNCTION TO DECODE THE LATENTS OF AN UTTERANCE WITH A BATCH OF SPEAKER CODES
+
+    Args:
+        lat (Tensor): latents (1 x T x lat_dim_e+lat_dim)
+        spk_code (Tensor): speaker codes (B x spk_dim)
+
+    Return:
+        (Tensor): converted melsp (B x T x mel_dim)
+    """
+    B = spk_code.shape[0]
+    _, melsp_cv, _ = model_decoder_melsp(lat.expand(B, -1, -1),
+                        y=spk_code.unsqueeze(1).expand(-1, lat.shape[1], -1), sampling=False)
+    return melsp_cv
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--feats", required=True,
+                        type=str, help="list or directory of source feat files")
+    parser.add_argument("--model", required=True,
+                        type=str, help="model file of the fine-tuned cyclevae and mwdlp")
+    parser.add_argument("--config", required=True,
+                        type=str, help="configure file")
+    parser.add_argument("--outdir", required=True,
+                        type=str, help="directory to save generated samples")
+    parser.add_argument("--fs", default=24000,
+                        type=int, help="sampling rate")
+    parser.add_argument("--string_path", default="/log_1pmelmagsp",
+                        type=str, help="path of the melsp in the hdf5 files")
+    parser.add_argument("--n_interp", default=4,
+                        type=int, help="number of interpolation intervals per axis of the speaker-space grid")
+    parser.add_argument("--coords", default=None,
+                        type=str, help="speaker coordinates x_y separated by @, used instead of the grid")
+    parser.add_argument("--spk_weights", default=None,
+                        type=str, help="weighted speaker targets spk:w,spk:w separated by @, used instead of the grid")
+    parser.add_argument("--batch_size", default=16,
+                        type=int, help="number of speaker targets generated in a batch")
+    parser.add_argument("--alpha", default=0.85,
+                        type=float, help="coefficient of pre-emphasis of the training waveforms, if not in config")
+    parser.add_argument("--out_gain", default=1.0,
+                        type=float, help="gain of the restored samples")
+    parser.add_argument("--freeze", default=True,
+                        type=strtobool, help="flag to fold normalization layers for inference")
+    parser.add_argument("--n_threads", default=1,
+                        type=int, help="number of cpu threads")
+    parser.add_argument("--seed", default=1,
+                        type=int, help="seed number")
+    parser.add_argument("--GPU_device", default=None,
+                        type=int, help="selection of GPU device, cpu if not set or negative")
+    parser.add_argument("--verbose", default=1,
+                        type=int, help="log level")
+    args = parser.parse_args()
+
+    if args.GPU_device is not None and args.GPU_device >= 0:
+        os.environ["CUDA_DEVICE_ORDER"]     = "PCI_BUS_ID"
+        os.environ["CUDA_VISIBLE_DEVICES"]  = str(args.GPU_device)
+
+    # check directory existence
+    if not os.path.exists(args.outdir):
+        os.makedirs(args.outdir)
+
+    # set log level
+    if args.verbose > 0:
+        logging.basicConfig(level=logging.INFO,
+                            format='%(asctime)s (%(module)s:%(lineno)d) %(levelname)s: %(message)s',
+                            datefmt='%m/%d/%Y %I:%M:%S',
+                            filename=args.outdir + "/decode.log")
+        logging.getLogger().addHandler(logging.StreamHandler())
+    else:
+        logging.basicConfig(level=logging.WARN,
+                            format='%(asctime)s (%(module)s:%(lineno)d) %(levelname)s: %(message)s',
+                            datefmt='%m/%d/%Y %I:%M:%S',
+                            filename=args.outdir + "/decode.log")
+        logging.getLogger().addHandler(logging.StreamHandler())
+        logging.warn("logging is disabled.")
+
+    # fix seed
+    os.environ['PYTHONHASHSEED'] = str(args.seed)
+    np.random.seed(args.seed)
+    torch.manual_seed(args.seed)
+    torch.set_num_threads(args.n_threads)
+
+    # load config
+    config = torch.load(args.config)
+    logging.info(config)
+    # de-emphasis of the generated pre-emphasized samples, as the noise shaping restore of the decoding stages
+    alpha = config.alpha if hasattr(config, "alpha") else args.alpha
+
+    # get file list
+    if os.path.isdir(args.feats):
+        feat_list = sorted(find_files(args.feats, "*.h5"))
+    elif os.path.isfile(args.feats):
+        feat_list = read_txt(args.feats)
+    else:
+        logging.error("--feats should be directory or list.")
+        sys.exit(1)
+
+    spk_list = config.spk_list.split('@')
+    n_spk = len(spk_list)
+
+    if args.GPU_device is not None and args.GPU_device >= 0 and torch.cuda.is_available():
+        device = torch.device("cuda")
+        torch.backends.cudnn.benchmark = True
+    else:
+        device = torch.device("cpu")
+    logging.info(device)
+
+    with torch.no_grad():
+        checkpoint = torch.load(args.model, map_location=device)
+        model_encoder_melsp = GRU_VAE_ENCODER(
+            in_dim=config.mel_dim,
+            n_spk=n_spk,
+            lat_dim=config.lat_dim,
+            hidden_layers=config.hidden_layers_enc,
+            hidden_units=config.hidden_units_enc,
+            kernel_size=config.kernel_size_enc,
+            dilation_size=config.dilation_size_enc,
+            causal_conv=config.causal_conv_enc,
+            pad_first=True,
+            right_size=config.right_size_enc)
+        model_decoder_melsp = GRU_SPEC_DECODER(
+            feat_dim=config.lat_dim+config.lat_dim_e,
+            out_dim=config.mel_dim,
+            n_spk=(config.emb_spk_dim//config.n_weight_emb)*config.n_weight_emb,
+            hidden_layers=config.hidden_layers_dec,
+            hidden_units=config.hidden_units_dec,
+            kernel_size=config.kernel_size_dec,
+            dilation_size=config.dilation_size_dec,
+            causal_conv=config.causal_conv_dec,
+            pad_first=True,
+            right_size=config.right_size_dec,
+            pdf_gauss=True,
+            red_dim_upd=config.mel_dim)
+        model_encoder_excit = GRU_VAE_ENCODER(
+            in_dim=config.mel_dim,
+            n_spk=n_spk,
+            lat_dim=config.lat_dim_e,
+            hidden_layers=config.hidden_layers_enc,
+            hidden_units=config.hidden_units_enc,
+            kernel_size=config.kernel_size_enc,
+            dilation_size=config.dilation_size_enc,
+            causal_conv=config.causal_conv_enc,
+            pad_first=True,
+            right_size=config.right_size_enc)
+        model_spkidtr = SPKID_TRANSFORM_LAYER(
+            n_spk=n_spk,
+            emb_dim=config.emb_spk_dim,
+            n_weight_emb=config.n_weight_emb,
+            conv_emb_flag=True,
+            spkidtr_dim=config.spkidtr_dim)
+        model_waveform = GRU_WAVE_DECODER_DUALGRU_COMPACT_MBAND_CF(
+            feat_dim=config.mel_dim,
+            upsampling_factor=config.upsampling_factor,
+            hidden_units=config.hidden_units_wave,
+            hidden_units_2=config.hidden_units_wave_2,
+            kernel_size=config.kernel_size_wave,
+            dilation_size=config.dilation_size_wave,
+            n_quantize=config.n_quantize,
+            causal_conv=config.causal_conv_wave,
+            right_size=config.right_size_wave if hasattr(config, "right_size_wave") else config.right_size,
+            n_bands=config.n_bands,
+            pad_first=True,
+            mid_dim=config.mid_dim,
+            emb_flag=True,
+            lpc=config.lpc)
+        for name, model in [("model_encoder_melsp", model_encoder_melsp), ("model_decoder_melsp", model_decoder_melsp),
+                            ("model_encoder_excit", model_encoder_excit), ("model_spkidtr", model_spkidtr),
+                            ("model_waveform", model_waveform)]:
+            logging.info(model)
+            model.load_state_dict(checkpoint[name])
+            model.to(device)
+            model.remove_weight_norm()
+            if args.freeze:
+                freeze_model(model)
+            model.eval()
+            for param in model.parameters():
+                param.requires_grad = False
+        pqmf = PQMF(config.n_bands).to(device)
+
+        # speaker codes of all targets, computed once
+        if args.spk_weights is not None:
+            weights, names = parse_spk_weights(args.spk_weights, spk_list)
+            spk_code = model_spkidtr.forward_weight(torch.FloatTensor(weights).to(device).unsqueeze(1))[1][:,0]
+        else:
+            if args.coords is not None:
+                coords = np.array([[float(x) for x in coord.split('_')] for coord in args.coords.split('@')])
+            else:
+                spk_coords = model_spkidtr.spk_coord(torch.eye(n_spk, device=device).unsqueeze(0))[0].cpu().numpy()
+                for i in range(n_spk):
+                    logging.info("%d %s %lf %lf" % (i+1, spk_list[i], spk_coords[i,0], spk_coords[i,1]))
+                coords = grid_coords(spk_coords, args.n_interp)
+            names = ["%lf_%lf" % (coord[0], coord[1]) for coord in coords]
+            spk_code = model_spkidtr.forward_coord(torch.FloatTensor(coords).to(device).unsqueeze(1))[1][:,0]
+        n_trg = spk_code.shape[0]
+        logging.info("%d speaker targets" % (n_trg))
+
+        total_dur = 0
+        start_all = time.time()
+        for feat_file in feat_list:
+            logging.info(feat_file)
+            melsp = torch.FloatTensor(read_hdf5(feat_file, args.string_path)).to(device)
+            name = os.path.basename(feat_file).replace(".h5", "")
+            # encode once, then decode and synthesize the speaker targets in batches
+            lat = encode_melsp(melsp, model_encoder_melsp, model_encoder_excit, model_decoder_melsp)
+            for i in range(0, n_trg, args.batch_size):
+                start = time.time()
+                melsp_cv = decode_melsp_grid(lat, spk_code[i:i+args.batch_size], model_decoder_melsp)
+                wav = pqmf.synthesis(model_waveform.generate(melsp_cv))[:,0].cpu().data.numpy()
+                for j in range(wav.shape[0]):
+                    # restore the noise shaping of the pre-emphasized training domain, i.e., de-emphasis
+                    wavpath = os.path.join(args.outdir, name+"_"+names[i+j]+".wav")
+                    n_clip = write_wav(wavpath, wav[j], args.fs, alpha=alpha, gain=args.out_gain)
+                    logging.info("wrote %s, %d samples clipped." % (wavpath, n_clip))
+                total_dur += wav.shape[0]*wav.shape[1] / args.fs
+                logging.info("%s: %d targets in %.2f sec." % (name, wav.shape[0], time.time() - start))
+        elapsed = time.time() - start_all
+        logging.info("%d files x %d targets, %.2f sec. of audio in %.2f sec., RTF %.3f" % (len(feat_list), n_trg,
+            total_dur, elapsed, elapsed / max(total_dur, 1e-9)))
+
+
+if __name__ == "__main__":
+    main()
@@ -31,6 +31,8 @@ import soundfile as sf
 
 from vcneuvoco import GRU_VAE_ENCODER, GRU_SPEC_DECODER
 from vcneuvoco import SPKID_TRANSFORM_LAYER
+from freeze import freeze_model
+from griffin_lim import GriffinLim, mel_pinv
 from dtw_c import dtw_c as dtw
 
 #import pysptk as ps
@@ -82,6 +84,14 @@ def main():
                         type=float, help="frame shift")
     parser.add_argument("--fftl", default=FFTL,
                         type=int, help="FFT length")
+    parser.add_argument("--gl_torch", default=True,
+                        type=strtobool, help="flag to use batched torch Griffin-Lim instead of librosa")
+    parser.add_argument("--gl_iter", default=32,
+                        type=int, help="number of Griffin-Lim iterations")
+    parser.add_argument("--gl_momentum", default=0.99,
+                        type=float, help="momentum of fast Griffin-Lim (0 for original Griffin-Lim)")
+    parser.add_argument("--freeze", default=True,
+                        type=strtobool, help="flag to fold normalization layers for inference")
     parser.add_argument("--GPU_device", default=None,
                         type=int, help="selection of GPU device")
     parser.add_argument("--GPU_device_str", default=None,
@@ -235,6 +245,11 @@ def main():
                 model_decoder_melsp.remove_weight_norm()
                 model_encoder_excit.remove_weight_norm()
                 model_spkidtr.remove_weight_norm()
+                if args.freeze:
+                    freeze_model(model_encoder_melsp)
+                    freeze_model(model_decoder_melsp)
+                    freeze_model(model_encoder_excit)
+                    freeze_model(model_spkidtr)
                 for param in model_encoder_melsp.parameters():
                     param.requires_grad = False
                 for param in model_decoder_melsp.parameters():
@@ -254,7 +269,11 @@ def main():
             outpad_rights[1] = outpad_rights[0]-model_decoder_melsp.pad_right
             outpad_lefts[2] = outpad_lefts[1]-model_encoder_melsp.pad_left
             outpad_rights[2] = outpad_rights[1]-model_encoder_melsp.pad_right
-            melfb_t = np.linalg.pinv(librosa.filters.mel(args.fs, args.fftl, n_mels=config.mel_dim))
+            melfb_t = mel_pinv(args.fs, args.fftl, config.mel_dim)
+            if args.gl_torch:
+                griffin_lim = GriffinLim(fs=args.fs, fftl=args.fftl, shiftms=args.shiftms, winms=args.winms,
+                                    n_mels=config.mel_dim, n_iter=args.gl_iter, momentum=args.gl_momentum)
+                griffin_lim.cuda()
             temp = 0.675
             logging.info(f'temp: {temp}')
             for feat_file in feat_list:
@@ -421,16 +440,25 @@ def main():
                 lsd_cvlist_cyc.append(lsd_mean_cyc)
                 lsdstd_cvlist_cyc.append(lsd_std_cyc)
             
-                logging.info("synth anasyn")
-                magsp = np.matmul(melfb_t, melsp_rest.T)
-                logging.info(magsp.shape)
                 hop_length = int((args.fs/1000)*args.shiftms)
                 win_length = int((args.fs/1000)*args.winms)
-                wav = np.clip(librosa.core.griffinlim(magsp, hop_length=hop_length,
-                            win_length=win_length, window='hann'), -1, 0.999969482421875)
-                wavpath = os.path.join(args.outdir,os.path.basename(feat_file).replace(".h5","_anasyn.wav"))
-                logging.info(wavpath)
-                sf.write(wavpath, wav, args.fs, 'PCM_16')
+                gl_melsp_list = [melsp_rest, melsp_src_rest, melsp_cv_rest]
+                gl_suffix_list = ["_anasyn.wav", "_rec.wav", "_cv.wav"]
+                if args.gl_torch:
+                    logging.info("synth gf batch anasyn/rec/cv")
+                    with torch.no_grad():
+                        wav_list = griffin_lim.melsp_to_wav(torch.FloatTensor(np.stack(gl_melsp_list)).cuda())
+                else:
+                    wav_list = []
+                    for melsp_gl in gl_melsp_list:
+                        magsp = np.matmul(melfb_t, melsp_gl.T)
+                        logging.info(magsp.shape)
+                        wav_list.append(np.clip(librosa.core.griffinlim(magsp, hop_length=hop_length,
+                                    win_length=win_length, window='hann'), -1, 0.999969482421875))
+                for wav, suffix in zip(wav_list, gl_suffix_list):
+                    wavpath = os.path.join(args.outdir, os.path.basename(feat_file).replace(".h5", suffix))
+                    logging.info(wavpath)
+                    sf.write(wavpath, wav, args.fs, 'PCM_16')
 
                 #if trg_exist:
                 #    logging.info("synth anasyn_trg")
@@ -439,24 +467,6 @@ def main():
                 #    sf.write(wavpath, wav, fs, 'PCM_16')
                 #    logging.info(wavpath)
 
-                logging.info("synth gf rec")
-                recmagsp = np.matmul(melfb_t, melsp_src_rest.T)
-                logging.info(recmagsp.shape)
-                wav = np.clip(librosa.core.griffinlim(recmagsp, hop_length=hop_length,
-                            win_length=win_length, window='hann'), -1, 0.999969482421875)
-                wavpath = os.path.join(args.outdir, os.path.basename(feat_file).replace(".h5", "_rec.wav"))
-                logging.info(wavpath)
-                sf.write(wavpath, wav, args.fs, 'PCM_16')
-
-                logging.info("synth gf cv")
-                cvmagsp = np.matmul(melfb_t, melsp_cv_rest.T)
-                logging.info(cvmagsp.shape)
-                wav = np.clip(librosa.core.griffinlim(cvmagsp, hop_length=hop_length,
-                            win_length=win_length, window='hann'), -1, 0.999969482421875)
-                wavpath = os.path.join(args.outdir, os.path.basename(feat_file).replace(".h5", "_cv.wav"))
-                logging.info(wavpath)
-                sf.write(wavpath, wav, args.fs, 'PCM_16')
-
                 logging.info('write to h5')
                 outh5dir = os.path.join(os.path.dirname(os.path.dirname(feat_file)), spk_src+"-"+args.spk_trg)
                 if not os.path.exists(outh5dir):
@@ -31,6 +31,8 @@ import soundfile as sf
 
 from vcneuvoco import GRU_VAE_ENCODER, GRU_SPEC_DECODER
 from vcneuvoco import GRU_EXCIT_DECODER, SPKID_TRANSFORM_LAYER
+from freeze import freeze_model
+from griffin_lim import GriffinLim, mel_pinv
 from feature_extract import convert_f0
 from dtw_c import dtw_c as dtw
 
@@ -83,6 +85,18 @@ def main():
                         type=float, help="frame shift")
     parser.add_argument("--fftl", default=FFTL,
                         type=int, help="FFT length")
+    parser.add_argument("--inline_eval", default=True,
+                        type=strtobool, help="flag to compute DTW-based target metrics while decoding")
+    parser.add_argument("--write_lat", default=False,
+                        type=strtobool, help="flag to write source/target latents for offline evaluation")
+    parser.add_argument("--gl_torch", default=True,
+                        type=strtobool, help="flag to use batched torch Griffin-Lim instead of librosa")
+    parser.add_argument("--gl_iter", default=32,
+                        type=int, help="number of Griffin-Lim iterations")
+    parser.add_argument("--gl_momentum", default=0.99,
+                        type=float, help="momentum of fast Griffin-Lim (0 for original Griffin-Lim)")
+    parser.add_argument("--freeze", default=True,
+                        type=strtobool, help="flag to fold normalization layers for inference")
     parser.add_argument("--GPU_device", default=None,
                         type=int, help="selection of GPU device")
     parser.add_argument("--GPU_device_str", default=None,
@@ -268,6 +282,12 @@ def main():
                 model_encoder_excit.remove_weight_norm()
                 model_decoder_excit.remove_weight_norm()
                 model_spkidtr.remove_weight_norm()
+                if args.freeze:
+                    freeze_model(model_encoder_melsp)
+                    freeze_model(model_decoder_melsp)
+                    freeze_model(model_encoder_excit)
+                    freeze_model(model_decoder_excit)
+                    freeze_model(model_spkidtr)
                 for param in model_encoder_melsp.parameters():
                     param.requires_grad = False
                 for param in model_decoder_melsp.parameters():
@@ -320,7 +340,11 @@ def main():
             outpad_rights[3] = outpad_rights[2]-model_encoder_melsp.pad_right
             outpad_lefts[4] = outpad_lefts[3]-model_decoder_excit.pad_left
             outpad_rights[4] = outpad_rights[3]-model_decoder_excit.pad_right
-            melfb_t = np.linalg.pinv(librosa.filters.mel(args.fs, args.fftl, n_mels=config.mel_dim))
+            melfb_t = mel_pinv(args.fs, args.fftl, config.mel_dim)
+            if args.gl_torch:
+                griffin_lim = GriffinLim(fs=args.fs, fftl=args.fftl, shiftms=args.shiftms, winms=args.winms,
+                                    n_mels=config.mel_dim, n_iter=args.gl_iter, momentum=args.gl_momentum)
+                griffin_lim.cuda()
             temp = 0.675
             logging.info(f'temp: {temp}')
             for feat_file in feat_list:
@@ -740,7 +764,7 @@ def main():
                 lsd_cvlist_src.append(lsd_mean)
                 lsdstd_cvlist_src.append(lsd_std)
 
-                if trg_exist:
+                if trg_exist and args.inline_eval:
                     melsp_trg_rest = (np.exp(melsp_trg)-1)/10000
 
                     spcidx_trg = np.array(read_hdf5(file_trg, "/spcidx_range")[0])
@@ -801,16 +825,29 @@ def main():
                 logging.info('cv cap')
                 logging.info(cvcodeap[10:15])
 
-                logging.info("synth anasyn")
-                magsp = np.matmul(melfb_t, melsp_rest.T)
-                logging.info(magsp.shape)
                 hop_length = int((args.fs/1000)*args.shiftms)
                 win_length = int((args.fs/1000)*args.winms)
-                wav = np.clip(librosa.core.griffinlim(magsp, hop_length=hop_length,
-                            win_length=win_length, window='hann'), -1, 0.999969482421875)
-                wavpath = os.path.join(args.outdir,os.path.basename(feat_file).replace(".h5","_anasyn.wav"))
-                logging.info(wavpath)
-                sf.write(wavpath, wav, args.fs, 'PCM_16')
+                if args.n_interp == 0:
+                    gl_melsp_list = [melsp_rest, melsp_src_rest, melsp_cv_rest]
+                    gl_suffix_list = ["_anasyn.wav", "_rec.wav", "_cv.wav"]
+                else:
+                    gl_melsp_list = [melsp_rest]
+                    gl_suffix_list = ["_anasyn.wav"]
+                if args.gl_torch:
+                    logging.info("synth gf batch anasyn/rec/cv")
+                    with torch.no_grad():
+                        wav_list = griffin_lim.melsp_to_wav(torch.FloatTensor(np.stack(gl_melsp_list)).cuda())
+                else:
+                    wav_list = []
+                    for melsp_gl in gl_melsp_list:
+                        magsp = np.matmul(melfb_t, melsp_gl.T)
+                        logging.info(magsp.shape)
+                        wav_list.append(np.clip(librosa.core.griffinlim(magsp, hop_length=hop_length,
+                                    win_length=win_length, window='hann'), -1, 0.999969482421875))
+                for wav, suffix in zip(wav_list, gl_suffix_list):
+                    wavpath = os.path.join(args.outdir, os.path.basename(feat_file).replace(".h5", suffix))
+                    logging.info(wavpath)
+                    sf.write(wavpath, wav, args.fs, 'PCM_16')
 
                 #if trg_exist:
                 #    logging.info("synth anasyn_trg")
@@ -819,25 +856,7 @@ def main():
                 #    sf.write(wavpath, wav, fs, 'PCM_16')
                 #    logging.info(wavpath)
 
-                if args.n_interp == 0:
-                    logging.info("synth gf rec")
-                    recmagsp = np.matmul(melfb_t, melsp_src_rest.T)
-                    logging.info(recmagsp.shape)
-                    wav = np.clip(librosa.core.griffinlim(recmagsp, hop_length=hop_length,
-                                win_length=win_length, window='hann'), -1, 0.999969482421875)
-                    wavpath = os.path.join(args.outdir, os.path.basename(feat_file).replace(".h5", "_rec.wav"))
-                    logging.info(wavpath)
-                    sf.write(wavpath, wav, args.fs, 'PCM_16')
-
-                    logging.info("synth gf cv")
-                    cvmagsp = np.matmul(melfb_t, melsp_cv_rest.T)
-                    logging.info(cvmagsp.shape)
-                    wav = np.clip(librosa.core.griffinlim(cvmagsp, hop_length=hop_length,
-                                win_length=win_length, window='hann'), -1, 0.999969482421875)
-                    wavpath = os.path.join(args.outdir, os.path.basename(feat_file).replace(".h5", "_cv.wav"))
-                    logging.info(wavpath)
-                    sf.write(wavpath, wav, args.fs, 'PCM_16')
-
+                #if args.n_interp == 0:
                     #logging.info("synth gf cv GV")
                     #datamean = np.mean(melsp_cv_rest, axis=0)
                     #cvmelsp_gv =  args.gv_coeff*(np.sqrt(gv_mean_trg/cvgv_mean) * \
@@ -999,10 +1018,12 @@ def main():
                 logging.info(feat_cv.shape)
                 write_hdf5(feat_file, write_path, feat_cv)
 
-                #logging.info('write lat to h5')
-                #logging.info(feat_file + ' ' + args.string_path+'_lat')
-                #logging.info(feat_lat.shape)
-                #write_hdf5(feat_file, args.string_path+'_lat', feat_lat)
+                if args.write_lat and trg_exist:
+                    # latents for offline evaluation with eval_cv_feats.py
+                    logging.info('write lat to h5')
+                    logging.info(feat_file + ' ' + args.string_path+'_lat')
+                    write_hdf5(feat_file, args.string_path+'_lat', lat_src[0].cpu().data.numpy())
+                    write_hdf5(feat_file, args.string_path+'_lat_trg', lat_trg[0].cpu().data.numpy())
 
                 count += 1
                 #if count >= 3:
@@ -24,7 +24,10 @@ import matplotlib.pyplot as plt
 
 from utils import find_files
 from utils import read_txt, read_hdf5, shape_hdf5
+from wav_output import write_wav
+from feat_index import load_index
 from vcneuvoco import GRU_WAVE_DECODER_DUALGRU_COMPACT_MBAND_CF
+from freeze import freeze_model
 #from vcneuvoco_ import GRU_WAVE_DECODER_DUALGRU_COMPACT_MBAND_CF
 
 import torch.nn.functional as F
@@ -71,13 +74,15 @@ def pad_list(batch_list, pad_value=0.0):
     return batch_pad
 
 
-def decode_generator(feat_list, upsampling_factor=120, string_path='/feat_mceplf0cap', batch_size=1, excit_dim=0, n_enc=None):
+def decode_generator(feat_list, upsampling_factor=120, string_path='/feat_mceplf0cap', batch_size=1, excit_dim=0, n_enc=None,
+        index=None):
     """DECODE BATCH GENERATOR
 
     Args:
         wav_list (str): list including wav files
         batch_size (int): batch size in decoding
         upsampling_factor (int): upsampling factor
+        index (FeatIndex): metadata index to get the number of frames without reading the files
 
     Return:
         (object): generator instance
@@ -86,7 +91,10 @@ def decode_generator(feat_list, upsampling_factor=120, string_path='/feat_mceplf
         if n_enc is not None:
             shape_list = [shape_hdf5(f, string_path+"_sum")[0] for f in feat_list]
         else:
-            shape_list = [shape_hdf5(f, string_path)[0] for f in feat_list]
+            # the features of the extracted files have the frames of the index
+            shape_list = index.n_frames(feat_list, column="n_feat_frame") if index is not None \
+                            else [None]*len(feat_list)
+            shape_list = [shape_hdf5(f, string_path)[0] if n is None else n for f, n in zip(feat_list, shape_list)]
         idx = np.argsort(shape_list)
         feat_list = [feat_list[i] for i in idx]
 
@@ -162,6 +170,16 @@ def main():
                         type=int, help="sampling rate")
     parser.add_argument("--batch_size", default=1,
                         type=int, help="number of batch size in decoding")
+    parser.add_argument("--outdir_restored", default=None,
+                        type=str, help="directory to save de-emphasized samples, i.e., noise shaping restored")
+    parser.add_argument("--alpha", default=0.85,
+                        type=float, help="coefficient of pre-emphasis for the restored samples")
+    parser.add_argument("--out_gain", default=1.0,
+                        type=float, help="gain of the restored samples")
+    parser.add_argument("--write_ns", default=False,
+                        type=strtobool, help="flag to also save the pre-emphasized samples if outdir_restored is set")
+    parser.add_argument("--feat_index", default=None,
+                        type=str, help="metadata index of the features to sort by length without reading the files")
     parser.add_argument("--n_gpus", default=1,
                         type=int, help="number of gpus")
     parser.add_argument("--wlat_res_flag", default=False,
@@ -173,6 +191,10 @@ def main():
                         type=int, help="log interval")
     parser.add_argument("--seed", default=1,
                         type=int, help="seed number")
+    parser.add_argument("--freeze", default=True,
+                        type=strtobool, help="flag to fold normalization layers for inference")
+    parser.add_argument("--batch_shrink", default=False,
+                        type=strtobool, help="flag to drop finished utterances from the batch and write them immediately")
     parser.add_argument("--GPU_device", default=None,
                         type=int, help="selection of GPU device")
     parser.add_argument("--GPU_device_str", default=None,
@@ -194,6 +216,8 @@ def main():
     # check directory existence
     if not os.path.exists(args.outdir):
         os.makedirs(args.outdir)
+    if args.outdir_restored is not None and not os.path.exists(args.outdir_restored):
+        os.makedirs(args.outdir_restored)
 
     # set log level
     if args.verbose > 0:
@@ -238,6 +262,18 @@ def main():
     feat_lists = np.array_split(feat_list, args.n_gpus)
     feat_lists = [f_list.tolist() for f_list in feat_lists]
 
+    # define output function, de-emphasis of the restored wav in the same pass as the decoding
+    def write_output(feat_id, samples):
+        if args.outdir_restored is None or args.write_ns:
+            wav = np.clip(samples, -1, 0.999969482421875)
+            outpath = os.path.join(args.outdir, feat_id+".wav")
+            sf.write(outpath, wav, args.fs, "PCM_16")
+            logging.info("wrote %s." % (outpath))
+        if args.outdir_restored is not None:
+            outpath = os.path.join(args.outdir_restored, feat_id+".wav")
+            n_clip = write_wav(outpath, samples, args.fs, alpha=args.alpha, gain=args.out_gain)
+            logging.info("wrote %s, %d samples clipped." % (outpath, n_clip))
+
     # define gpu decode function
     def gpu_decode(feat_list, gpu):
         with torch.cuda.device(gpu):
@@ -261,6 +297,8 @@ def main():
                 model_waveform.cuda()
                 model_waveform.load_state_dict(torch.load(args.checkpoint)["model_waveform"])
                 model_waveform.remove_weight_norm()
+                if args.freeze:
+                    freeze_model(model_waveform)
                 model_waveform.eval()
                 for param in model_waveform.parameters():
                     param.requires_grad = False
@@ -278,7 +316,8 @@ def main():
                     upsampling_factor=config.upsampling_factor,
                     excit_dim=config.excit_dim,
                     n_enc=args.n_enc,
-                    string_path=string_path)
+                    string_path=string_path,
+                    index=load_index(args.feat_index))
 
                 # decode
                 time_sample = []
@@ -292,6 +331,20 @@ def main():
                     start = time.time()
                     logging.info(batch_feat.shape)
 
+                    if args.batch_shrink:
+                        def flush(idx, samples):
+                            samples = pqmf.synthesis(samples.unsqueeze(0))[0,0].cpu().data.numpy()
+                            write_output(feat_ids[idx], samples[:n_samples_list[idx]])
+
+                        model_waveform.generate_shrink(batch_feat,
+                            [n // config.upsampling_factor for n in n_samples_list],
+                                intervals=args.intervals, flush=flush)
+                        time_sample.append(time.time()-start)
+                        n_samples.append(max(n_samples_list))
+                        n_samples_t.append(sum(n_samples_list))
+                        count += 1
+                        continue
+
                     #batch_feat = F.pad(batch_feat.transpose(1,2), (model_waveform.pad_left,model_waveform.pad_right), "replicate").transpose(1,2)
                     samples = model_waveform.generate(batch_feat)
                     logging.info(samples.shape) # B x n_bands x T//n_bands
@@ -306,10 +359,7 @@ def main():
 
                     for feat_id, samples, samples_len in zip(feat_ids, samples_list, n_samples_list):
                         #wav = np.clip(samples[:samples_len], -1, 1)
-                        wav = np.clip(samples[:samples_len], -1, 0.999969482421875)
-                        outpath = os.path.join(args.outdir, feat_id+".wav")
-                        sf.write(outpath, wav, args.fs, "PCM_16")
-                        logging.info("wrote %s." % (outpath))
+                        write_output(feat_id, samples[:samples_len])
                     #break
 
                     #figname = os.path.join(args.outdir, feat_id+"_wav.png")
@@ -0,0 +1,249 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright 2021 Patrick Lumban Tobing (Nagoya University)
+#  Apache 2.0  (http://www.apache.org/licenses/LICENSE-2.0)
+
+from __future__ import division
+
+import argparse
+import csv
+import json
+import logging
+import multiprocessing as mp
+import os
+import re
+import sys
+from functools import partial
+
+import numpy as np
+
+from utils import check_hdf5
+from utils import find_files
+from utils import read_hdf5
+from utils import read_txt
+
+from objective_eval import calc_lat_dist, calc_lsd, calc_lsd_trg, calc_mcd
+from objective_eval import dtw_align, melsp_restore, melsp_to_melcep
+
+
+MCD_DIM = 25
+INLINE_TOL = 1e-5 # the inline log has 6 decimals
+
+
+def eval_utt(feat_file, spk_trg=None, string_path=None, mcd_dim=MCD_DIM):
+    """FUNCTION TO EVALUATE ONE CONVERTED UTTERANCE
+
+    lsd_cv, lat_dist_rmse, and lat_dist_cosim follow the inline evaluation of
+    decode_gru-cycle-melspxlf0capspkvae-gauss-smpl.py, the *_melcep_cv metrics are computed
+    on a symmetric DTW path of the mel-cepstra, and lsd_cvsrc is of the converted and source
+    mel-spectrograms on the same time axis.
+
+    Args:
+        feat_file (str): source feature hdf5 file
+        spk_trg (str): target speaker
+        string_path (str): dataset path of the converted mel-spectrogram
+        mcd_dim (int): number of mel-cepstrum coefficients for MCD
+
+    Return:
+        (dict): per-utterance results
+    """
+    spk_src = os.path.basename(os.path.dirname(feat_file))
+    basename = os.path.basename(feat_file)
+    data_dir = os.path.dirname(os.path.dirname(feat_file))
+    cv_file = os.path.join(data_dir, spk_src+"-"+spk_trg, basename)
+    trg_file = os.path.join(data_dir, spk_trg, basename)
+
+    res = {"file": basename, "spk_src": spk_src, "spk_trg": spk_trg}
+    if not check_hdf5(cv_file, string_path):
+        logging.info("no converted features: %s %s" % (cv_file, string_path))
+        return res
+
+    # the inline evaluation takes the converted features in float64
+    melsp_src = melsp_restore(read_hdf5(feat_file, "/log_1pmelmagsp"))
+    melsp_cv = melsp_restore(np.array(read_hdf5(cv_file, string_path), dtype=np.float64))
+    spcidx_src = np.array(read_hdf5(feat_file, "/spcidx_range")[0])
+    res["n_frames"] = melsp_cv.shape[0]
+    res["n_spc_frames"] = spcidx_src.shape[0]
+
+    # global variance of the converted utterance for GV-distance aggregation
+    res["gv_cv"] = np.var(melsp_cv, axis=0)
+
+    # distance to source, same time axis
+    lsd_arr = calc_lsd(melsp_cv[spcidx_src], melsp_src[spcidx_src])
+    res["lsd_cvsrc"] = np.mean(lsd_arr)
+    res["lsdstd_cvsrc"] = np.std(lsd_arr)
+
+    if os.path.exists(trg_file):
+        melsp_trg = melsp_restore(read_hdf5(trg_file, "/log_1pmelmagsp"))
+        spcidx_trg = np.array(read_hdf5(trg_file, "/spcidx_range")[0])
+
+        lsd_arr = calc_lsd_trg(melsp_cv, melsp_src, melsp_trg, spcidx_src, spcidx_trg)
+        res["lsd_cv"] = np.mean(lsd_arr)
+        res["lsdstd_cv"] = np.std(lsd_arr)
+
+        melsp_cv_spc = melsp_cv[spcidx_src]
+        melsp_trg_spc = melsp_trg[spcidx_trg]
+        melcep_cv = melsp_to_melcep(melsp_cv_spc, dim=mcd_dim)
+        melcep_trg = melsp_to_melcep(melsp_trg_spc, dim=mcd_dim)
+        path_cv, path_trg = dtw_align(melcep_cv, melcep_trg)
+        res["n_path_melcep"] = path_cv.shape[0]
+
+        lsd_arr = calc_lsd(melsp_cv_spc[path_cv], melsp_trg_spc[path_trg])
+        res["lsd_melcep_cv"] = np.mean(lsd_arr)
+        res["lsdstd_melcep_cv"] = np.std(lsd_arr)
+        mcd_arr = calc_mcd(melcep_cv[path_cv], melcep_trg[path_trg])
+        res["mcd_melcep_cv"] = np.mean(mcd_arr)
+        res["mcdstd_melcep_cv"] = np.std(mcd_arr)
+
+        if check_hdf5(cv_file, string_path+"_lat") and check_hdf5(cv_file, string_path+"_lat_trg"):
+            lat_src = np.array(read_hdf5(cv_file, string_path+"_lat"), dtype=np.float64)[spcidx_src]
+            lat_trg = np.array(read_hdf5(cv_file, string_path+"_lat_trg"), dtype=np.float64)[spcidx_trg]
+            res["lat_dist_rmse"], res["lat_dist_cosim"] = calc_lat_dist(lat_src, lat_trg)
+
+    logging.info(" ".join(["%s=%s" % (key, val) for key, val in res.items() if key != "gv_cv"]))
+
+    return res
+
+
+def check_inline_log(log_file, results, tol=INLINE_TOL):
+    """FUNCTION TO CHECK THE PER-UTTERANCE RESULTS AGAINST THE LOG OF THE INLINE EVALUATION
+
+    The decoding processes share the log file, so the values are compared as sorted lists,
+    i.e., the log should be of the decoding of the same utterances only.
+
+    Args:
+        log_file (str): decode.log of decode_gru-cycle-melspxlf0capspkvae-gauss-smpl.py
+        results (list): per-utterance results of eval_utt
+        tol (float): tolerance of the absolute difference
+
+    Return:
+        (dict): maximum absolute difference of each metric, None if the numbers of values differ
+    """
+    # inline log lines: "lsd_trg: <lsd_cv> dB +- <lsdstd_cv>", "lat_dist: <lat_dist_rmse> <lat_dist_cosim>"
+    patterns = [(re.compile(r"lsd_trg: ([-+.0-9eE]+) dB \+- ([-+.0-9eE]+)"), ("lsd_cv", "lsdstd_cv")),
+                (re.compile(r"lat_dist: ([-+.0-9eE]+) ([-+.0-9eE]+)"), ("lat_dist_rmse", "lat_dist_cosim"))]
+    inline = dict([(key, []) for _, keys in patterns for key in keys])
+    with open(log_file, "r") as f:
+        for line in f:
+            for pattern, keys in patterns:
+                match = pattern.search(line)
+                if match is not None:
+                    for k, key in enumerate(keys):
+                        inline[key].append(float(match.group(k+1)))
+
+    diffs = {}
+    for key in inline:
+        vals_inline = np.sort(np.array(inline[key]))
+        vals = np.sort(np.array([res[key] for res in results if key in res]))
+        if len(vals) != len(vals_inline):
+            logging.warn("%s: %d utterances in the inline log, %d evaluated" % (key, len(vals_inline), len(vals)))
+            diffs[key] = None
+        elif len(vals) > 0:
+            diffs[key] = float(np.max(np.abs(vals - vals_inline)))
+            if diffs[key] > tol:
+                logging.warn("%s: max. abs. difference to the inline log %.3e > %.3e" % (key, diffs[key], tol))
+            else:
+                logging.info("%s: max. abs. difference to the inline log %.3e" % (key, diffs[key]))
+
+    return diffs
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--feats", required=True,
+                        type=str, help="list or directory of source eval feat files")
+    parser.add_argument("--spk_trg", required=True,
+                        type=str, help="speaker target")
+    parser.add_argument("--string_path", required=True,
+                        type=str, help="dataset path of converted features in hdf5")
+    parser.add_argument("--outdir", required=True,
+                        type=str, help="directory to save evaluation reports")
+    parser.add_argument("--stats_trg", default=None,
+                        type=str, help="stats file of target speaker for GV distance")
+    parser.add_argument("--mcd_dim", default=MCD_DIM,
+                        type=int, help="number of mel-cepstrum coefficients for MCD")
+    parser.add_argument("--inline_log", default=None,
+                        type=str, help="decode log of the same utterances with inline evaluation and --write_lat true to check against")
+    parser.add_argument("--n_jobs", default=10,
+                        type=int, help="number of parallel jobs")
+    parser.add_argument("--verbose", default=1,
+                        type=int, help="log level")
+    args = parser.parse_args()
+
+    # check directory existence
+    if not os.path.exists(args.outdir):
+        os.makedirs(args.outdir)
+
+    # set log level
+    if args.verbose > 0:
+        logging.basicConfig(level=logging.INFO,
+                            format='%(asctime)s (%(module)s:%(lineno)d) %(levelname)s: %(message)s',
+                            datefmt='%m/%d/%Y %I:%M:%S',
+                            filename=args.outdir + "/eval.log")
+        logging.getLogger().addHandler(logging.StreamHandler())
+    else:
+        logging.basicConfig(level=logging.WARN,
+                            format='%(asctime)s (%(module)s:%(lineno)d) %(levelname)s: %(message)s',
+                            datefmt='%m/%d/%Y %I:%M:%S',
+                            filename=args.outdir + "/eval.log")
+        logging.getLogger().addHandler(logging.StreamHandler())
+        logging.warn("logging is disabled.")
+
+    # get file list
+    if os.path.isdir(args.feats):
+        feat_list = sorted(find_files(args.feats, "*.h5"))
+    elif os.path.isfile(args.feats):
+        feat_list = read_txt(args.feats)
+    else:
+        logging.error("--feats should be directory or list.")
+        sys.exit(1)
+    logging.info("number of utterances = %d" % (len(feat_list)))
+
+    # evaluate in a process pool, results are returned instead of gathered through managed lists
+    pool = mp.Pool(args.n_jobs)
+    results = pool.map(partial(eval_utt, spk_trg=args.spk_trg, string_path=args.string_path,
+                        mcd_dim=args.mcd_dim), feat_list, chunksize=max(1, len(feat_list)//(args.n_jobs*4)))
+    pool.close()
+    pool.join()
+
+    # per-utterance report
+    keys = ["file", "spk_src", "spk_trg", "n_frames", "n_spc_frames", "n_path_melcep",
+            "lsd_cv", "lsdstd_cv", "lat_dist_rmse", "lat_dist_cosim", "lsd_cvsrc", "lsdstd_cvsrc",
+                "lsd_melcep_cv", "lsdstd_melcep_cv", "mcd_melcep_cv", "mcdstd_melcep_cv"]
+    csv_name = os.path.join(args.outdir, "eval_%s.csv" % (args.spk_trg))
+    with open(csv_name, "w") as f:
+        writer = csv.DictWriter(f, fieldnames=keys, extrasaction="ignore")
+        writer.writeheader()
+        for res in results:
+            writer.writerow(res)
+    logging.info(csv_name)
+
+    # aggregate report
+    summary = {"spk_trg": args.spk_trg, "n_utt": len(results)}
+    for key in keys[6:]:
+        vals = np.array([res[key] for res in results if key in res])
+        if len(vals) > 0:
+            summary[key] = {"mean": float(np.mean(vals)), "std": float(np.std(vals)), "n_utt": len(vals)}
+            logging.info("%s: %.6f (+- %.6f)" % (key, summary[key]["mean"], summary[key]["std"]))
+    gv_list = [res["gv_cv"] for res in results if "gv_cv" in res]
+    if args.stats_trg is not None and len(gv_list) > 0:
+        gv_mean_trg = read_hdf5(args.stats_trg, "/gv_melsp_mean")
+        gv_dist = np.sqrt(np.square(np.log(np.mean(np.array(gv_list), axis=0))-np.log(gv_mean_trg)))
+        summary["gv_dist"] = {"mean": float(np.mean(gv_dist)), "std": float(np.std(gv_dist))}
+        logging.info("gv_dist: %.6f (+- %.6f)" % (summary["gv_dist"]["mean"], summary["gv_dist"]["std"]))
+    if args.inline_log is not None:
+        summary["inline_check"] = check_inline_log(args.inline_log, results)
+    json_name = os.path.join(args.outdir, "eval_%s.json" % (args.spk_trg))
+    with open(json_name, "w") as f:
+        json.dump(summary, f, indent=4)
+    logging.info(json_name)
+    if args.inline_log is not None:
+        for key, diff in summary["inline_check"].items():
+            if diff is None or diff > INLINE_TOL:
+                logging.error("the report does not match the inline evaluation in %s." % (args.inline_log))
+                sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
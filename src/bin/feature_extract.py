@@ -27,6 +27,9 @@ import librosa
 from utils import find_files
 from utils import read_txt
 from utils import write_hdf5, read_hdf5
+from feature_cache import FeatureCache, wav_hash
+from melsp_engine import get_engine
+from feat_index import utt_id, update_index
 
 import torch
 
@@ -262,6 +265,19 @@ def convert_continuos_codeap(codeap):
     return uv, cont_codeap
 
 
+def resyn_type(value):
+    """FUNCTION TO PARSE THE RESYNTHESIS POLICY, all, none, OR A NON-NEGATIVE NUMBER OF FILES"""
+    if value in ["all", "none"]:
+        return value
+    try:
+        n_resyn = int(value)
+    except ValueError:
+        n_resyn = -1
+    if n_resyn < 0:
+        raise argparse.ArgumentTypeError("%s is not all, none, or a non-negative number of files" % (value))
+    return n_resyn
+
+
 def main():
     parser = argparse.ArgumentParser(
         description="making feature file argsurations.")
@@ -321,6 +337,22 @@ def main():
     parser.add_argument(
         "--highpass_cutoff", default=HIGHPASS_CUTOFF,
         type=int, help="Cut off frequency in lowpass filter")
+    parser.add_argument(
+        "--resyn", default="all",
+        type=resyn_type, help="analysis-synthesis wavs of all, none, or a number of randomly sampled files, "
+                        "resyn_feature.py resynthesizes from the hdf5 features on demand")
+    parser.add_argument(
+        "--resyn_seed", default=1,
+        type=int, help="seed number of the sampled files of the analysis-synthesis")
+    parser.add_argument(
+        "--stft_batch", default=16,
+        type=int, help="number of wavfiles of one batched STFT, per-file librosa STFT if 0")
+    parser.add_argument(
+        "--cache_dir", default=None,
+        type=str, help="directory of the analysis cache keyed by waveform content and settings, no cache if not set")
+    parser.add_argument(
+        "--index", default=None,
+        type=str, help="metadata index file of the corpus to add the rows of the extracted files, no index if not set")
     parser.add_argument(
         "--n_jobs", default=10,
         type=int, help="number of parallel jobs")
@@ -359,6 +391,16 @@ def main():
     else:
         file_list = read_txt(args.waveforms)
 
+    # files of the analysis-synthesis wavs
+    if args.resyn == "all":
+        resyn_set = set(file_list)
+    elif args.resyn == "none":
+        resyn_set = set()
+    else:
+        n_resyn = min(args.resyn, len(file_list))
+        resyn_set = set(np.random.RandomState(args.resyn_seed).choice(file_list, n_resyn, replace=False).tolist())
+    logging.info("resynthesis of %d/%d files" % (len(resyn_set), len(file_list)))
+
     # check directory existence
     if (args.wavdir is not None) and (not os.path.exists(args.wavdir)):
         os.makedirs(args.wavdir)
@@ -369,7 +411,43 @@ def main():
     if not os.path.exists(args.hdf5dir):
         os.makedirs(args.hdf5dir)
 
-    def feature_extract(cpu, wav_list, arr, max_frame_list, max_spc_frame_list):
+    def analyze_world(x, fs):
+        """FUNCTION TO ANALYZE THE WORLD FEATURES WITH THE SPEAKER F0 RANGE IF SET"""
+        if args.minf0 != 40 and args.maxf0 != 700:
+            time_axis_range, f0_range, spc_range, ap_range = analyze_range(x, fs=fs,
+                        minf0=args.minf0, maxf0=args.maxf0, fperiod=args.shiftms,
+                            fftl=args.fftl)
+            # ap. estimate for fs less than 16k
+            if fs < 16000:
+                x_up = resample(x, x.shape[0]*(16000//fs))
+                _, _, _, ap_range = analyze_range(x_up, fs=16000,
+                            minf0=args.minf0, maxf0=args.maxf0, fperiod=args.shiftms,
+                                fftl=args.fftl)
+                if len(f0_range) < ap_range.shape[0]:
+                    ap_range = ap_range[:len(f0_range)]
+                elif len(f0_range) > ap_range.shape[0]:
+                    time_axis_range = time_axis_range[:ap_range.shape[0]]
+                    f0_range = f0_range[:ap_range.shape[0]]
+                    spc_range = spc_range[:ap_range.shape[0]]
+        else:
+            logging.info('open spk')
+            time_axis_range, f0_range, spc_range, ap_range = analyze(x, fs=fs,
+                        fperiod=args.shiftms, fftl=args.fftl)
+            # ap. estimate for fs less than 16k
+            if fs < 16000:
+                x_up = resample(x, x.shape[0]*(16000//fs))
+                _, _, _, ap_range = analyze(x_up, fs=16000,
+                            fperiod=args.shiftms, fftl=args.fftl)
+                if len(f0_range) < ap_range.shape[0]:
+                    ap_range = ap_range[:len(f0_range)]
+                elif len(f0_range) > ap_range.shape[0]:
+                    time_axis_range = time_axis_range[:ap_range.shape[0]]
+                    f0_range = f0_range[:ap_range.shape[0]]
+                    spc_range = spc_range[:ap_range.shape[0]]
+
+        return time_axis_range, f0_range, spc_range, ap_range
+
+    def feature_extract(cpu, wav_list, arr, max_frame_list, max_spc_frame_list, index_rows):
         n_wav = len(wav_list)
         n_sample = 0
         n_frame = 0
@@ -383,9 +461,34 @@ def main():
         #melfb_t = np.linalg.pinv(librosa.filters.mel(args.fs, args.fftl, n_mels=args.mel_dim, fmin=50))
         melfb = librosa.filters.mel(args.fs, args.fftl, n_mels=args.mel_dim)
         melfb_t = np.linalg.pinv(melfb)
-        for wav_name in wav_list:
-            # load wavfile and apply low cut filter
-            fs, x = read_wav(wav_name, cutoff=args.highpass_cutoff)
+        cache = FeatureCache(args.cache_dir) if args.cache_dir is not None else None
+        engine = get_engine(args.fs, args.fftl, args.shiftms, args.winms, args.mel_dim) \
+                    if args.stft_batch > 0 else None
+        stft_params = {"fs": args.fs, "highpass_cutoff": args.highpass_cutoff, "shiftms": args.shiftms,
+                        "winms": args.winms, "fftl": args.fftl}
+        batch_wav = {}
+        rows = []
+        for idx, wav_name in enumerate(wav_list):
+            if wav_name not in batch_wav:
+                # load the next wavfiles, apply low cut filter, and compute the magnitude spectrograms
+                # not in the cache in one batched STFT
+                names = wav_list[idx:idx+max(args.stft_batch, 1)]
+                batch_wav = {name: read_wav(name, cutoff=args.highpass_cutoff) for name in names}
+                batch_hash = {name: wav_hash(name) for name in names} if cache is not None else {}
+                batch_magsp = {}
+                if not args.init:
+                    for name in names:
+                        stft = cache.load(batch_hash[name], "stft", stft_params, ["magsp"]) \
+                                    if cache is not None else None
+                        if stft is not None:
+                            batch_magsp[name] = stft["magsp"]
+                    misses = [name for name in names if name not in batch_magsp and batch_wav[name][0] == args.fs]
+                    if engine is not None and len(misses) > 0:
+                        for name, magspec in zip(misses, engine.magsp([batch_wav[name][1] for name in misses])):
+                            batch_magsp[name] = magspec
+                            if cache is not None:
+                                cache.save(batch_hash[name], "stft", stft_params, {"magsp": magspec})
+            fs, x = batch_wav[wav_name]
             n_sample += x.shape[0]
             logging.info("cpu-"+str(cpu+1)+" "+str(len(wav_list))+" "+wav_name+" "+\
                 str(x.shape[0])+" "+str(n_sample)+" "+str(count))
@@ -397,44 +500,36 @@ def main():
                 sys.exit(1)
 
             hdf5name = args.hdf5dir + "/" + os.path.basename(wav_name).replace(".wav", ".h5")
+            hash_ = batch_hash.get(wav_name)
 
             if not args.init:
-                if args.minf0 != 40 and args.maxf0 != 700:
-                    time_axis_range, f0_range, spc_range, ap_range = analyze_range(x, fs=fs,
-                                minf0=args.minf0, maxf0=args.maxf0, fperiod=args.shiftms,
-                                    fftl=args.fftl)
-                    # ap. estimate for fs less than 16k
-                    if fs < 16000:
-                        x_up = resample(x, x.shape[0]*(16000//fs))
-                        _, _, _, ap_range = analyze_range(x_up, fs=16000,
-                                    minf0=args.minf0, maxf0=args.maxf0, fperiod=args.shiftms,
-                                        fftl=args.fftl)
-                        if len(f0_range) < ap_range.shape[0]:
-                            ap_range = ap_range[:len(f0_range)]
-                        elif len(f0_range) > ap_range.shape[0]:
-                            time_axis_range = time_axis_range[:ap_range.shape[0]]
-                            f0_range = f0_range[:ap_range.shape[0]]
-                            spc_range = spc_range[:ap_range.shape[0]]
+                world_params = {"fs": fs, "highpass_cutoff": args.highpass_cutoff, "shiftms": args.shiftms,
+                                "fftl": args.fftl, "f0_range": [args.minf0, args.maxf0] \
+                                    if args.minf0 != 40 and args.maxf0 != 700 else None}
+                world = cache.load(hash_, "world", world_params, ["time_axis", "f0", "sp", "ap"]) \
+                            if cache is not None else None
+                if world is None:
+                    time_axis_range, f0_range, spc_range, ap_range = analyze_world(x, fs)
+                    if cache is not None:
+                        cache.save(hash_, "world", world_params, {"time_axis": time_axis_range, "f0": f0_range,
+                                                                    "sp": spc_range, "ap": ap_range})
                 else:
-                    logging.info('open spk')
-                    time_axis_range, f0_range, spc_range, ap_range = analyze(x, fs=fs,
-                                fperiod=args.shiftms, fftl=args.fftl)
-                    # ap. estimate for fs less than 16k
-                    if fs < 16000:
-                        x_up = resample(x, x.shape[0]*(16000//fs))
-                        _, _, _, ap_range = analyze(x_up, fs=16000,
-                                    fperiod=args.shiftms, fftl=args.fftl)
-                        if len(f0_range) < ap_range.shape[0]:
-                            ap_range = ap_range[:len(f0_range)]
-                        elif len(f0_range) > ap_range.shape[0]:
-                            time_axis_range = time_axis_range[:ap_range.shape[0]]
-                            f0_range = f0_range[:ap_range.shape[0]]
-                            spc_range = spc_range[:ap_range.shape[0]]
+                    time_axis_range, f0_range, spc_range, ap_range = world["time_axis"], world["f0"], \
+                                                                        world["sp"], world["ap"]
+                n_world_frame = len(f0_range)
                 write_hdf5(hdf5name, "/f0_range", f0_range)
                 write_hdf5(hdf5name, "/time_axis", time_axis_range)
 
-                melmagsp, magspec = melsp(x, n_mels=args.mel_dim, n_fft=args.fftl, shiftms=args.shiftms,
-                                winms=args.winms, fs=fs)
+                # mel-spectrogram from the batched or cached magnitude spectrogram, i.e., only the mel-filterbank
+                # is recomputed if only mel_dim changes
+                if wav_name in batch_magsp:
+                    magspec = batch_magsp[wav_name]
+                    melmagsp = np.dot(magspec, melfb.T)
+                else:
+                    melmagsp, magspec = melsp(x, n_mels=args.mel_dim, n_fft=args.fftl, shiftms=args.shiftms,
+                                    winms=args.winms, fs=fs)
+                    if cache is not None:
+                        cache.save(hash_, "stft", stft_params, {"magsp": magspec})
                 assert(melmagsp.shape[0] == magspec.shape[0])
                 if len(f0_range) < melmagsp.shape[0]:
                     logging.info(f"f0 less {len(f0_range)} {melmagsp.shape[0]}")
@@ -466,7 +561,15 @@ def main():
                 cont_f0_lpf_range = \
                     low_pass_filter(cont_f0_range, int(1.0 / (args.shiftms * 0.001)), cutoff=20)
 
-                mcep_range = ps.sp2mc(spc_range, args.mcep_dim, args.mcep_alpha)
+                # mel-cepstrum is frame-wise, so that of the cached untruncated spectra is truncated
+                mcep_params = dict(world_params, mcep_dim=args.mcep_dim, mcep_alpha=args.mcep_alpha)
+                mcep = cache.load(hash_, "mcep", mcep_params, ["mcep"]) if cache is not None else None
+                if mcep is None:
+                    mcep_range = ps.sp2mc(spc_range, args.mcep_dim, args.mcep_alpha)
+                    if cache is not None and len(spc_range) == n_world_frame:
+                        cache.save(hash_, "mcep", mcep_params, {"mcep": mcep_range})
+                else:
+                    mcep_range = mcep["mcep"][:len(spc_range)]
                 npow_range = spc2npow(spc_range)
                 _, spcidx_range = extfrm(mcep_range, npow_range, power_threshold=args.pow)
 
@@ -516,35 +619,56 @@ def main():
                     max_frame = feat_orglf0.shape[0]
                 if max_spc_frame < spcidx_range[0].shape[0]:
                     max_spc_frame = spcidx_range[0].shape[0]
+                rows.append({"utt": utt_id(wav_name), "feat": hdf5name, "wav": wav_name,
+                            "spk": os.path.basename(os.path.dirname(wav_name)), "n_frame": n_world_frame,
+                            "n_feat_frame": feat_orglf0.shape[0],
+                            "n_sample": x.shape[0], "spc_start": spcidx_range[0][0] if len(spcidx_range[0]) > 0 else -1,
+                            "spc_end": spcidx_range[0][-1] if len(spcidx_range[0]) > 0 else -1})
                 if args.highpass_cutoff != 0 and args.wavfiltdir is not None:
                     sf.write(os.path.join(args.wavfiltdir, os.path.basename(wav_name)),
                         x, fs, 'PCM_16')
-                wavpath = os.path.join(args.wavdir, os.path.basename(wav_name))
-                logging.info("cpu-"+str(cpu+1)+" "+wavpath)
-                sp_rec = ps.mc2sp(mcep_range, args.mcep_alpha, args.fftl)
-                wav = np.clip(pw.synthesize(f0_range, sp_rec, ap_range, fs,
-                            frame_period=args.shiftms), -1, 0.999969482421875)
-                logging.info(wavpath)
-                sf.write(wavpath, wav, fs, 'PCM_16')
-
-                recmagsp = np.matmul(melfb_t, melmagsp.T)
-                hop_length = int((args.fs/1000)*args.shiftms)
-                win_length = int((args.fs/1000)*args.winms)
-                wav = np.clip(librosa.core.griffinlim(recmagsp, hop_length=hop_length,
-                            win_length=win_length, window='hann'), -1, 0.999969482421875)
-                wavpath = os.path.join(args.wavgfdir, os.path.basename(wav_name))
-                logging.info(wavpath)
-                sf.write(wavpath, wav, fs, 'PCM_16')
+
+                # diagnostic analysis-synthesis, not used by the training features
+                if wav_name in resyn_set and args.wavdir is not None:
+                    wavpath = os.path.join(args.wavdir, os.path.basename(wav_name))
+                    logging.info("cpu-"+str(cpu+1)+" "+wavpath)
+                    sp_rec = ps.mc2sp(mcep_range, args.mcep_alpha, args.fftl)
+                    wav = np.clip(pw.synthesize(f0_range, sp_rec, ap_range, fs,
+                                frame_period=args.shiftms), -1, 0.999969482421875)
+                    logging.info(wavpath)
+                    sf.write(wavpath, wav, fs, 'PCM_16')
+
+                if wav_name in resyn_set and args.wavgfdir is not None:
+                    recmagsp = np.matmul(melfb_t, melmagsp.T)
+                    hop_length = int((args.fs/1000)*args.shiftms)
+                    win_length = int((args.fs/1000)*args.winms)
+                    wav = np.clip(librosa.core.griffinlim(recmagsp, hop_length=hop_length,
+                                win_length=win_length, window='hann'), -1, 0.999969482421875)
+                    wavpath = os.path.join(args.wavgfdir, os.path.basename(wav_name))
+                    logging.info(wavpath)
+                    sf.write(wavpath, wav, fs, 'PCM_16')
             else:
-                time_axis, f0, spc, ap = analyze(x, fs=fs, fperiod=args.shiftms, fftl=args.fftl)
+                init_params = {"fs": fs, "highpass_cutoff": args.highpass_cutoff, "shiftms": args.shiftms,
+                                "fftl": args.fftl}
+                init = cache.load(hash_, "init", init_params, ["f0", "npow"]) if cache is not None else None
+                if init is None:
+                    time_axis, f0, spc, ap = analyze(x, fs=fs, fperiod=args.shiftms, fftl=args.fftl)
+                    npow = spc2npow(spc)
+                    if cache is not None:
+                        cache.save(hash_, "init", init_params, {"f0": f0, "npow": npow})
+                else:
+                    f0, npow = init["f0"], init["npow"]
                 write_hdf5(hdf5name, "/f0", f0)
-                npow = spc2npow(spc)
                 write_hdf5(hdf5name, "/npow", npow)
                 n_frame += f0.shape[0]
                 if max_frame < f0.shape[0]:
                     max_frame = f0.shape[0]
 
             count += 1
+        if cache is not None:
+            cache.flush()
+            logging.info("cpu-%d cache: %d hits, %d misses" % (cpu+1, cache.n_hit, cache.n_miss))
+        index_rows.extend(rows)
         arr[0] += n_wav
         arr[1] += n_sample
         arr[2] += n_frame
@@ -568,10 +692,11 @@ def main():
         arr = mp.Array('d', 3)
         max_frame_list = manager.list()
         max_spc_frame_list = manager.list()
+        index_rows = manager.list()
         i = 0
         for f in file_lists:
             p = mp.Process(target=feature_extract, args=(i, f, arr, max_frame_list,
-                        max_spc_frame_list))
+                        max_spc_frame_list, index_rows))
             p.start()
             processes.append(p)
             i += 1
@@ -585,6 +710,12 @@ def main():
         logging.info('max_frame: %ld' % (np.max(max_frame_list)))
         logging.info('max_spc_frame: %ld' % (np.max(max_spc_frame_list)))
 
+        # rows of the extracted files in the corpus index, with the other jobs writing to the same file
+        if args.index is not None and len(index_rows) > 0:
+            index = update_index(args.index, list(index_rows))
+            logging.info("%d rows are added to the index %s of %d utterances" % (len(index_rows), args.index,
+                            len(index)))
+
 
 if __name__ == "__main__":
     main()
@@ -1,22 +1,28 @@
 #!/usr/bin/env python
 
+import os
+import sys
+
 import numpy as np
-import librosa
+import torch
 import soundfile as sf
 
-f = open('melsp.txt', 'r')
+from griffin_lim import GriffinLim
 
-lines = f.readlines()
+# input melsp txt files, processed in one padded batch [default: melsp.txt]
+if len(sys.argv) > 1:
+    txt_list = sys.argv[1:]
+else:
+    txt_list = ['melsp.txt']
 
-melmagsp = None
-for line in lines:
-    vals = np.expand_dims(np.array(line.strip().split(' ')).astype(np.float), axis=0)
-    if melmagsp is not None:
-        melmagsp = np.append(melmagsp, vals, axis=0)
-    else:
-        melmagsp = vals
-#    print(vals)
+melmagsp_list = []
+for txt in txt_list:
+    f = open(txt, 'r')
+    lines = f.readlines()
+    f.close()
+    melmagsp = np.array([np.array(line.strip().split(' ')).astype(np.float64) for line in lines])
     print(melmagsp.shape)
+    melmagsp_list.append(melmagsp)
 
 #fs = 22050
 fs = 24000
@@ -28,14 +34,18 @@ shiftms = 5
 #shiftms = 10
 #shiftms = 9.9773242630385487528344671201814
 winms = 27.5
-hop_length = int((fs/1000)*shiftms)
-win_length = int((fs/1000)*winms)
-
-melfb_t = np.linalg.pinv(librosa.filters.mel(fs, fftl, n_mels=mel_dim))
-print(melfb_t.shape)
-recmagsp = np.matmul(melfb_t, melmagsp.T)
-print(recmagsp.shape)
-wav = np.clip(librosa.core.griffinlim(recmagsp, hop_length=hop_length,
-            win_length=win_length, window='hann'), -1, 0.999969482421875)
-print(wav.shape)
-sf.write('melsp_syn.wav', wav, fs, 'PCM_16')
+
+device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+griffin_lim = GriffinLim(fs=fs, fftl=fftl, shiftms=shiftms, winms=winms, n_mels=mel_dim).to(device)
+
+lengths = [melmagsp.shape[0] for melmagsp in melmagsp_list]
+max_length = max(lengths)
+batch_melmagsp = np.zeros((len(melmagsp_list), max_length, mel_dim))
+for i, melmagsp in enumerate(melmagsp_list):
+    batch_melmagsp[i,:lengths[i]] = melmagsp
+with torch.no_grad():
+    wav_list = griffin_lim.melsp_to_wav(torch.FloatTensor(batch_melmagsp).to(device), lengths=lengths)
+
+for txt, wav in zip(txt_list, wav_list):
+    print(wav.shape)
+    sf.write(os.path.splitext(txt)[0]+'_syn.wav', wav, fs, 'PCM_16')
@@ -14,6 +14,8 @@ import logging
 
 import numpy as np
 
+from spk_stats import min_pow_from_histogram
+
 
 def main():
     parser = argparse.ArgumentParser(
@@ -64,39 +66,7 @@ def main():
         in_file = os.path.join(folder,spk+'_npowhistogram.txt')
         logging.info(in_file)
         arr_data = np.loadtxt(in_file)
-    
-        length = arr_data.shape[0]
-        peak_1 = -999999999
-        peak_1_idx = 0
-        global_min = 999999999
-        global_min_idx = length // 2 - 1
-        peak_2 = -999999999
-        peak_2_idx = length-1
-        list_min_global_idx = []
-    
-        for i in range(length // 2 - 2):
-            if arr_data[i][1] > peak_1:
-                peak_1_idx = i
-                peak_1 = arr_data[i][1]
-        for i in range(length-1,(length - length // 3),-1):
-            if arr_data[i][1] > peak_2:
-                peak_2_idx = i
-                peak_2 = arr_data[i][1]
-        for i in range(length):
-            if arr_data[i][1] <= global_min and i > peak_1_idx and i < peak_2_idx:
-                global_min_idx = i
-                if arr_data[i][1] == global_min:
-                    list_min_global_idx.append(arr_data[i][0])
-                else:
-                    list_min_global_idx = []
-                    list_min_global_idx.append(arr_data[i][0])
-                global_min = arr_data[i][1]
-        min_pow = np.mean(list_min_global_idx)
-    
-        logging.info('%d %d %lf' % (peak_1_idx, arr_data[peak_1_idx][0], peak_1))
-        logging.info('%d %d %lf' % (global_min_idx, arr_data[global_min_idx][0], global_min))
-        logging.info('%d %d %lf' % (peak_2_idx, arr_data[peak_2_idx][0], peak_2))
-        logging.info(list_min_global_idx)
+        min_pow = min_pow_from_histogram(arr_data)
         logging.info(min_pow)
         out_file = os.path.join(conf,spk+'.pow')
         logging.info(out_file)
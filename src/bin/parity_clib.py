@@ -0,0 +1,410 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright 2021 Patrick Lumban Tobing (Nagoya University)
+#  Apache 2.0  (http://www.apache.org/licenses/LICENSE-2.0)
+
+from __future__ import division
+
+import argparse
+import json
+import logging
+import os
+import subprocess
+import sys
+import time
+
+import numpy as np
+import soundfile as sf
+import torch
+import torch.nn.functional as F
+from torch.distributions.one_hot_categorical import OneHotCategorical
+
+import vcneuvoco
+from vcneuvoco import GRU_VAE_ENCODER, GRU_SPEC_DECODER, SPKID_TRANSFORM_LAYER
+from vcneuvoco import GRU_WAVE_DECODER_DUALGRU_COMPACT_MBAND_CF
+from vcneuvoco import MIN_CLAMP, MAX_CLAMP
+from pqmf import PQMF
+
+from utils import find_files
+from utils import read_txt
+from mwdlp_clib import MWDLPCLib
+
+
+class GreedyOneHotCategorical(OneHotCategorical):
+    """ONE-HOT CATEGORICAL WITH ARGMAX SAMPLING, LOGGING THE PROBABILITIES OF THE FIRST BATCH
+
+    Replaces vcneuvoco.OneHotCategorical during generation to mirror the deterministic decoding of the C engine.
+    """
+    probs_log = None
+
+    def __init__(self, probs=None, logits=None, validate_args=None):
+        super(GreedyOneHotCategorical, self).__init__(probs=probs, logits=logits, validate_args=validate_args)
+        if GreedyOneHotCategorical.probs_log is not None:
+            GreedyOneHotCategorical.probs_log.append(self.probs[0,0].cpu()) # n_bands x cf_dim
+
+    def sample(self, sample_shape=torch.Size()):
+        return F.one_hot(self.probs.argmax(-1), num_classes=self.probs.shape[-1]).to(self.probs.dtype)
+
+
+def deemphasis(x, alpha):
+    """FUNCTION TO APPLY THE DE-EMPHASIS WITH CLAMPING AS IN THE C ENGINE
+
+    Args:
+        x (ndarray): pqmf synthesis output in [-1,1)
+        alpha (float): pre-emphasis coefficient
+
+    Return:
+        (ndarray): de-emphasized waveform
+    """
+    y = np.clip(x, -1, 0.999969482421875)
+    mem = 0
+    for i in range(len(y)):
+        mem = min(max(y[i] + alpha*mem, -1), 0.999969482421875)
+        y[i] = mem
+    return y
+
+
+def spk_code_torch(model_spkidtr, spk_idx=None, spk_coord=None):
+    """FUNCTION TO COMPUTE THE SPEAKER CODE OF A SPEAKER INDEX OR COORDINATE AS IN THE C ENGINE
+
+    Args:
+        model_spkidtr (SPKID_TRANSFORM_LAYER): speaker transform
+        spk_idx (int): 1-based speaker index
+        spk_coord (list): 2-dim speaker coordinate, used instead of spk_idx if given
+
+    Return:
+        (Tensor): speaker code (1 x 1 x spk_dim)
+    """
+    if spk_coord is None:
+        return model_spkidtr(torch.LongTensor([[spk_idx-1]]))[1]
+    weight_emb = torch.tanh(torch.clamp(model_spkidtr.deconv(torch.FloatTensor(spk_coord).reshape(1,2,1)),
+                    min=MIN_CLAMP, max=MAX_CLAMP)).transpose(1,2) # 1 x 1 x n_weight
+    return torch.cat([model_spkidtr.embed_spk.weight[i].reshape(1,1,-1)*weight_emb[:,:,i:i+1] \
+                        for i in range(model_spkidtr.n_weight_emb)], 2)
+
+
+def convert_melsp(melsp, spk_code, model_encoder_melsp, model_encoder_excit, model_decoder_melsp):
+    """FUNCTION TO CONVERT A MEL-SPECTROGRAM WITH THE MEANS OF LATENTS AND OUTPUTS AS IN THE STREAMING C ENGINE
+
+    The input is replicate-padded by the encoder left size and the encoder+decoder right sizes,
+    and the latents by the decoder left size, i.e., the first/last frames of the streaming input.
+
+    Args:
+        melsp (ndarray): log(1+10000*melsp) (T x mel_dim)
+        spk_code (Tensor): speaker code (1 x 1 x spk_dim)
+
+    Return:
+        (Tensor): converted melsp (1 x T x mel_dim)
+    """
+    x = torch.FloatTensor(melsp).unsqueeze(0)
+    x = F.pad(x.transpose(1,2), (model_encoder_melsp.pad_left,
+            model_encoder_melsp.pad_right+model_decoder_melsp.pad_right), "replicate").transpose(1,2)
+    _, _, lat_melsp, _ = model_encoder_melsp(x, sampling=False)
+    _, _, lat_excit, _ = model_encoder_excit(x, sampling=False)
+    lat = torch.cat((lat_excit, lat_melsp), 2)
+    lat = F.pad(lat.transpose(1,2), (model_decoder_melsp.pad_left, 0), "replicate").transpose(1,2)
+    _, melsp_cv, _ = model_decoder_melsp(lat, y=spk_code.repeat(1,lat.shape[1],1), sampling=False)
+    return melsp_cv
+
+
+def compare_logits(logits_c, probs_py):
+    """FUNCTION TO COMPARE THE OUTPUT LOG-PROBABILITIES OF THE C AND THE PYTHON DECODING
+
+    Args:
+        logits_c (ndarray): C output logits (n_steps x 2 x n_bands x cf_dim)
+        probs_py (ndarray): Python output probabilities (n_steps x 2 x n_bands x cf_dim)
+
+    Return:
+        (dict): number of compared steps, first step of different argmax (-1 if none),
+                max. abs. log-prob. deviation before it, argmax agreement rate
+    """
+    n_steps = min(len(logits_c), len(probs_py))
+    if n_steps == 0:
+        return {"n_steps": 0, "first_mismatch": -1, "max_dev_logprob": 0.0, "argmax_agreement": 1.0}
+    x = np.clip(logits_c[:n_steps].astype(np.float64), MIN_CLAMP, MAX_CLAMP)
+    x = x - x.max(-1, keepdims=True)
+    logp_c = x - np.log(np.exp(x).sum(-1, keepdims=True))
+    logp_py = np.log(np.maximum(probs_py[:n_steps].astype(np.float64), 1e-45))
+    match = (logp_c.argmax(-1) == logp_py.argmax(-1)).reshape(n_steps, -1).all(-1)
+    first_mismatch = int(np.argmin(match)) if not match.all() else -1
+    n_same = first_mismatch if first_mismatch >= 0 else n_steps
+    max_dev = float(np.abs(np.maximum(logp_c[:n_same], -30) - np.maximum(logp_py[:n_same], -30)).max()) \
+                if n_same > 0 else 0.0
+    return {"n_steps": n_steps, "first_mismatch": first_mismatch, "max_dev_logprob": max_dev,
+            "argmax_agreement": float(match.mean())}
+
+
+def compare_wave(y_c, y_py):
+    """FUNCTION TO COMPARE THE C AND THE PYTHON WAVEFORMS
+
+    Args:
+        y_c (ndarray): C int16 waveform
+        y_py (ndarray): Python waveform in [-1,1)
+
+    Return:
+        (dict): lengths, max. abs. deviation in 16-bit steps, SNR [dB] of the Python w.r.t. the C waveform
+    """
+    n = min(len(y_c), len(y_py))
+    ref = y_c[:n].astype(np.float64) / 32768
+    diff = ref - y_py[:n].astype(np.float64)
+    snr = 10*np.log10(np.sum(ref**2) / max(np.sum(diff**2), 1e-20)) if n > 0 else 0.0
+    return {"len_c": len(y_c), "len_py": len(y_py), "max_dev": float(np.abs(diff).max()*32768) if n > 0 else 0.0,
+            "snr": float(snr)}
+
+
+def mel_lsd(melsp_ref, melsp):
+    """FUNCTION TO COMPUTE THE LOG-SPECTRAL DISTANCE [dB] BETWEEN log(1+10000*melsp) FEATURES"""
+    n = min(len(melsp_ref), len(melsp))
+    if n == 0:
+        return 0.0
+    ref = np.maximum(np.expm1(melsp_ref[:n]) / 10000, 1e-10)
+    est = np.maximum(np.expm1(melsp[:n]) / 10000, 1e-10)
+    return float(np.mean(np.sqrt(np.mean((20*np.log10(ref/est))**2, -1))))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--waveforms", required=True,
+                        type=str, help="list or directory of wav files")
+    parser.add_argument("--config", required=True,
+                        type=str, help="configure file of the dumped model")
+    parser.add_argument("--model", required=True,
+                        type=str, help="model file of the dumped model")
+    parser.add_argument("--lib", required=True,
+                        type=str, help="shared library built by make shared in a demo_realtime directory")
+    parser.add_argument("--demo_dir", default=None,
+                        type=str, help="demo_realtime directory to compile the shared library with make shared")
+    parser.add_argument("--outdir", required=True,
+                        type=str, help="directory to save the report and generated samples")
+    parser.add_argument("--spk_idx", default=None,
+                        type=int, help="1-based target speaker index, analysis-synthesis if not set")
+    parser.add_argument("--spk_coord", default=None,
+                        type=str, help="interpolated target speaker coordinate x_y, used instead of --spk_idx")
+    parser.add_argument("--n_files", default=None,
+                        type=int, help="maximum number of tested files")
+    parser.add_argument("--alpha", default=0.85,
+                        type=float, help="pre-emphasis coefficient, PREEMPH of the C engine")
+    parser.add_argument("--n_threads", default=1,
+                        type=int, help="number of cpu threads of the Python path")
+    parser.add_argument("--seed", default=1,
+                        type=int, help="seed number")
+    parser.add_argument("--verbose", default=1,
+                        type=int, help="log level")
+    args = parser.parse_args()
+
+    # check directory existence
+    if not os.path.exists(args.outdir):
+        os.makedirs(args.outdir)
+
+    # set log level
+    if args.verbose > 0:
+        logging.basicConfig(level=logging.INFO,
+                            format='%(asctime)s (%(module)s:%(lineno)d) %(levelname)s: %(message)s',
+                            datefmt='%m/%d/%Y %I:%M:%S',
+                            filename=args.outdir + "/parity.log")
+        logging.getLogger().addHandler(logging.StreamHandler())
+    else:
+        logging.basicConfig(level=logging.WARN,
+                            format='%(asctime)s (%(module)s:%(lineno)d) %(levelname)s: %(message)s',
+                            datefmt='%m/%d/%Y %I:%M:%S',
+                            filename=args.outdir + "/parity.log")
+        logging.getLogger().addHandler(logging.StreamHandler())
+        logging.warn("logging is disabled.")
+
+    # fix seed
+    os.environ['PYTHONHASHSEED'] = str(args.seed)
+    np.random.seed(args.seed)
+    torch.manual_seed(args.seed)
+    torch.set_num_threads(args.n_threads)
+
+    # get file list
+    if os.path.isdir(args.waveforms):
+        wav_list = sorted(find_files(args.waveforms, "*.wav"))
+    elif os.path.isfile(args.waveforms):
+        wav_list = read_txt(args.waveforms)
+    else:
+        logging.error("--waveforms should be directory or list.")
+        sys.exit(1)
+    if args.n_files is not None:
+        wav_list = wav_list[:args.n_files]
+
+    # compile and load the C engine with deterministic decoding
+    if args.demo_dir is not None:
+        subprocess.check_call(["make", "-C", args.demo_dir, "shared"])
+    clib = MWDLPCLib(args.lib)
+    clib.set_sampling(argmax=True, seed=args.seed)
+    cv_flag = args.spk_idx is not None or args.spk_coord is not None
+    assert not cv_flag or clib.cv_flag, "library is built without conversion"
+    spk_coord = None
+    if args.spk_coord is not None:
+        spk_coord = [float(x) for x in args.spk_coord.split('_')]
+
+    # Python models as dumped to the C engine
+    config = torch.load(args.config)
+    logging.info(config)
+    device = torch.device("cpu")
+    checkpoint = torch.load(args.model, map_location=device)
+    model_waveform = GRU_WAVE_DECODER_DUALGRU_COMPACT_MBAND_CF(
+        feat_dim=clib.features_dim,
+        upsampling_factor=config.upsampling_factor,
+        hidden_units=config.hidden_units_wave,
+        hidden_units_2=config.hidden_units_wave_2,
+        kernel_size=config.kernel_size_wave,
+        dilation_size=config.dilation_size_wave,
+        n_quantize=config.n_quantize,
+        causal_conv=config.causal_conv_wave,
+        right_size=config.right_size_wave if hasattr(config, "right_size_wave") else config.right_size,
+        n_bands=config.n_bands,
+        pad_first=True,
+        mid_dim=config.mid_dim,
+        emb_flag=True,
+        lpc=config.lpc)
+    model_waveform.load_state_dict(checkpoint["model_waveform"])
+    model_waveform.remove_weight_norm()
+    model_waveform.eval()
+    pqmf = PQMF(config.n_bands)
+    if cv_flag:
+        n_spk = len(config.spk_list.split('@'))
+        model_encoder_melsp = GRU_VAE_ENCODER(
+            in_dim=config.mel_dim,
+            n_spk=n_spk,
+            lat_dim=config.lat_dim,
+            hidden_layers=config.hidden_layers_enc,
+            hidden_units=config.hidden_units_enc,
+            kernel_size=config.kernel_size_enc,
+            dilation_size=config.dilation_size_enc,
+            causal_conv=config.causal_conv_enc,
+            pad_first=True,
+            right_size=config.right_size_enc)
+        model_decoder_melsp = GRU_SPEC_DECODER(
+            feat_dim=config.lat_dim+config.lat_dim_e,
+            out_dim=config.mel_dim,
+            n_spk=(config.emb_spk_dim//config.n_weight_emb)*config.n_weight_emb,
+            hidden_layers=config.hidden_layers_dec,
+            hidden_units=config.hidden_units_dec,
+            kernel_size=config.kernel_size_dec,
+            dilation_size=config.dilation_size_dec,
+            causal_conv=config.causal_conv_dec,
+            pad_first=True,
+            right_size=config.right_size_dec,
+            pdf_gauss=True,
+            red_dim_upd=config.mel_dim)
+        model_encoder_excit = GRU_VAE_ENCODER(
+            in_dim=config.mel_dim,
+            n_spk=n_spk,
+            lat_dim=config.lat_dim_e,
+            hidden_layers=config.hidden_layers_enc,
+            hidden_units=config.hidden_units_enc,
+            kernel_size=config.kernel_size_enc,
+            dilation_size=config.dilation_size_enc,
+            causal_conv=config.causal_conv_enc,
+            pad_first=True,
+            right_size=config.right_size_enc)
+        model_spkidtr = SPKID_TRANSFORM_LAYER(
+            n_spk=n_spk,
+            emb_dim=config.emb_spk_dim,
+            n_weight_emb=config.n_weight_emb,
+            conv_emb_flag=True,
+            spkidtr_dim=config.spkidtr_dim)
+        for name, model in [("model_encoder_melsp", model_encoder_melsp), ("model_decoder_melsp", model_decoder_melsp),
+                            ("model_encoder_excit", model_encoder_excit), ("model_spkidtr", model_spkidtr)]:
+            model.load_state_dict(checkpoint[name])
+            model.remove_weight_norm()
+            model.eval()
+        conv_vc_delay = model_encoder_melsp.pad_right + model_decoder_melsp.pad_right
+        if conv_vc_delay != clib.conv_vc_delay:
+            logging.warn("conversion delay of the model %d and of the library %d differ, " \
+                "e.g., the library is not dumped from this model" % (conv_vc_delay, clib.conv_vc_delay))
+
+    results = []
+    with torch.no_grad():
+        if cv_flag:
+            spk_code_c = clib.spk_code(spk_idx=args.spk_idx, spk_coord=spk_coord)[0]
+            spk_code = spk_code_torch(model_spkidtr, spk_idx=args.spk_idx, spk_coord=spk_coord)
+            dev_spk_code = float(np.abs(spk_code[0,0].numpy() - spk_code_c).max())
+            logging.info("speaker code max. abs. deviation %.3e" % (dev_spk_code))
+        for wav_file in wav_list:
+            x, fs = sf.read(wav_file, dtype="int16")
+            if fs != clib.fs:
+                logging.error("%s: sampling rate %d is not %d" % (wav_file, fs, clib.fs))
+                continue
+            res = {"file": wav_file}
+
+            # C path, the C analysis output is the shared input of both paths
+            melsp = clib.melsp_extract(x)
+            n_steps_max = (len(melsp)+clib.conv_vc_delay+model_waveform.pad_left+model_waveform.pad_right+2) \
+                            * clib.upsampling_factor
+            clib.start_pdf_log(n_steps_max*2*clib.n_bands)
+            start = time.time()
+            if cv_flag:
+                y_c, melsp_cv_c = clib.convert_synthesize(melsp, spk_code_c, return_melsp=True)
+            else:
+                y_c = clib.synthesize(melsp)
+            time_c = time.time() - start
+            logits_c = clib.stop_pdf_log()
+
+            # Python path with deterministic decoding
+            GreedyOneHotCategorical.probs_log = []
+            vcneuvoco.OneHotCategorical = GreedyOneHotCategorical
+            try:
+                start = time.time()
+                if cv_flag:
+                    feat = convert_melsp(melsp, spk_code, model_encoder_melsp, model_encoder_excit,
+                                model_decoder_melsp)
+                else:
+                    feat = torch.FloatTensor(melsp).unsqueeze(0)
+                samples = model_waveform.generate(feat)
+                y_py = deemphasis(pqmf.synthesis(samples)[0,0].numpy(), args.alpha)
+                time_py = time.time() - start
+            finally:
+                vcneuvoco.OneHotCategorical = OneHotCategorical
+            probs_py = torch.stack(GreedyOneHotCategorical.probs_log).numpy()
+            GreedyOneHotCategorical.probs_log = None
+            probs_py = probs_py[:len(probs_py)//2*2].reshape(-1, 2, clib.n_bands, clib.cf_dim)
+
+            # comparison of intermediate outputs and waveforms
+            if cv_flag:
+                melsp_cv = feat[0].numpy()
+                n = min(len(melsp_cv), len(melsp_cv_c))
+                diff = np.abs(melsp_cv[:n] - melsp_cv_c[:n])
+                res["melsp_cv"] = {"n_frames_c": len(melsp_cv_c), "n_frames_py": len(melsp_cv),
+                    "max_dev": float(diff.max()) if n > 0 else 0.0,
+                    "rmse": float(np.sqrt(np.mean(diff**2))) if n > 0 else 0.0,
+                    "first_frame_dev_1e-3": int(np.argmax(diff.max(-1) > 1e-3)) \
+                        if n > 0 and (diff.max(-1) > 1e-3).any() else -1}
+            res["logits"] = compare_logits(logits_c, probs_py)
+            res["wave"] = compare_wave(y_c, y_py)
+            res["wave"]["mel_lsd"] = mel_lsd(clib.melsp_extract(y_c), clib.melsp_extract(y_py.astype(np.float32)))
+            dur = len(x) / clib.fs
+            res["rtf_c"] = time_c / dur
+            res["rtf_py"] = time_py / dur
+            sf.write(os.path.join(args.outdir, os.path.basename(wav_file).replace(".wav", "_c.wav")), y_c,
+                clib.fs, "PCM_16")
+            sf.write(os.path.join(args.outdir, os.path.basename(wav_file).replace(".wav", "_py.wav")), y_py,
+                clib.fs, "PCM_16")
+            logging.info("%s: logits first mismatch %d/%d max. dev. %.3e, wave SNR %.2f dB LSD %.3f dB, " \
+                "RTF C %.3f Python %.3f" % (wav_file, res["logits"]["first_mismatch"], res["logits"]["n_steps"],
+                    res["logits"]["max_dev_logprob"], res["wave"]["snr"], res["wave"]["mel_lsd"],
+                        res["rtf_c"], res["rtf_py"]))
+            if cv_flag:
+                logging.info("%s: converted melsp max. abs. deviation %.3e RMSE %.3e" % (wav_file,
+                    res["melsp_cv"]["max_dev"], res["melsp_cv"]["rmse"]))
+            results.append(res)
+
+    summary = {"n_files": len(results),
+                "rtf_c": float(np.mean([res["rtf_c"] for res in results])) if len(results) > 0 else 0.0,
+                "rtf_py": float(np.mean([res["rtf_py"] for res in results])) if len(results) > 0 else 0.0,
+                "snr": float(np.mean([res["wave"]["snr"] for res in results])) if len(results) > 0 else 0.0,
+                "mel_lsd": float(np.mean([res["wave"]["mel_lsd"] for res in results])) if len(results) > 0 else 0.0,
+                "max_dev_logprob": max([res["logits"]["max_dev_logprob"] for res in results] + [0.0])}
+    if cv_flag:
+        summary["dev_spk_code"] = dev_spk_code
+        summary["max_dev_melsp_cv"] = max([res["melsp_cv"]["max_dev"] for res in results] + [0.0])
+    logging.info(summary)
+    with open(os.path.join(args.outdir, "parity_clib.json"), "w") as f:
+        json.dump({"summary": summary, "files": results}, f, indent=4)
+
+
+if __name__ == "__main__":
+    main()
@@ -8,8 +8,9 @@ from __future__ import division
 from __future__ import print_function
 
 import argparse
+from concurrent.futures import ThreadPoolExecutor
 from distutils.util import strtobool
-import multiprocessing as mp
+import logging
 import os
 import sys
 
@@ -20,9 +21,12 @@ from scipy.signal import lfilter
 import torch
 
 from pqmf import PQMF
+from pqmf_poly import PolyphasePQMF
 
 from utils import find_files
 from utils import read_txt
+from utils import background
+from feat_index import utt_id, update_index
 
 ##FS = 16000
 #FS = 22050
@@ -39,6 +43,58 @@ def deemphasis(x, alpha=ALPHA):
     return lfilter(b, a, x)
 
 
+def band_wavpath(writedir, wav_name, i, n_bands):
+    """FUNCTION TO GET THE FILENAME OF THE i-TH BAND WAV"""
+    name = os.path.basename(wav_name).split(".")[0]
+    if n_bands < 10 or i == n_bands - 1:
+        return os.path.join(writedir, name+"_B-"+str(i+1)+".wav")
+    return os.path.join(writedir, name+"_B-0"+str(i+1)+".wav")
+
+
+def length_batches(file_list, batch_size, fs):
+    """FUNCTION TO GROUP THE FILES INTO BATCHES OF SIMILAR LENGTHS
+
+    Args:
+        file_list (list): wav filenames
+        batch_size (int): number of files in a batch
+        fs (int): sampling frequency of the files
+
+    Return:
+        (list): lists of filenames sorted by length
+    """
+    lengths = []
+    for wav_name in file_list:
+        info = sf.info(wav_name)
+        ## check sampling frequency
+        if not info.samplerate == fs:
+            print("ERROR: sampling frequency is not matched.")
+            sys.exit(1)
+        lengths.append(info.frames)
+    sorted_list = [file_list[i] for i in np.argsort(lengths, kind="stable")]
+    return [sorted_list[i:i+batch_size] for i in range(0, len(sorted_list), batch_size)]
+
+
+@background()
+def load_batches(batches):
+    """GENERATOR OF THE ZERO-PADDED BATCHES OF WAVS, LOADED IN BACKGROUND
+
+    Return:
+        (list): filenames
+        (ndarray): zero-padded waveforms (B x T_max)
+        (list): lengths
+    """
+    for wav_list in batches:
+        x_list = []
+        for wav_name in wav_list:
+            x, _ = sf.read(wav_name)
+            x_list.append(x)
+        lengths = [len(x) for x in x_list]
+        x_batch = np.zeros((len(x_list), max(lengths)), dtype=np.float32)
+        for i, x in enumerate(x_list):
+            x_batch[i,:lengths[i]] = x
+        yield wav_list, x_batch, lengths
+
+
 def main():
     parser = argparse.ArgumentParser(
         description="making feature file argsurations.")
@@ -61,14 +117,47 @@ def main():
     parser.add_argument(
         "--alpha", default=ALPHA,
         type=float, help="coefficient of pre-emphasis")
+    parser.add_argument(
+        "--batch_size", default=16,
+        type=int, help="number of wavfiles of one batched analysis, grouped by length")
+    parser.add_argument(
+        "--n_verify", default=-1,
+        type=int, help="number of randomly sampled files of the synthesis check, all if negative")
+    parser.add_argument(
+        "--verify_seed", default=1,
+        type=int, help="seed number of the sampled files of the synthesis check")
+    parser.add_argument(
+        "--polyphase", default=True,
+        type=strtobool, help="flag to use the polyphase implementation of PQMF")
+    parser.add_argument(
+        "--GPU_device", default=None,
+        type=int, help="selection of GPU device, cpu if not set or negative")
+    parser.add_argument(
+        "--index", default=None,
+        type=str, help="metadata index file of the corpus to mark the files with band wavs, no index if not set")
     parser.add_argument(
         "--verbose", default=1,
         type=int, help="log message level")
     parser.add_argument(
         '--n_jobs', default=1,
-        type=int, help="number of parallel jobs")
+        type=int, help="number of cpu threads and of background writers")
     args = parser.parse_args()
 
+    if args.GPU_device is not None and args.GPU_device >= 0:
+        os.environ["CUDA_DEVICE_ORDER"]     = "PCI_BUS_ID"
+        os.environ["CUDA_VISIBLE_DEVICES"]  = str(args.GPU_device)
+
+    # set log level
+    if args.verbose > 0:
+        logging.basicConfig(level=logging.INFO,
+                            format='%(asctime)s (%(module)s:%(lineno)d) %(levelname)s: %(message)s',
+                            datefmt='%m/%d/%Y %I:%M:%S')
+    else:
+        logging.basicConfig(level=logging.WARN,
+                            format='%(asctime)s (%(module)s:%(lineno)d) %(levelname)s: %(message)s',
+                            datefmt='%m/%d/%Y %I:%M:%S')
+        logging.warn("logging is disabled.")
+
     # read list
     if os.path.isdir(args.waveforms):
         file_list = sorted(find_files(args.waveforms, "*.wav"))
@@ -81,56 +170,71 @@ def main():
     if not os.path.exists(args.writesyndir):
         os.makedirs(args.writesyndir)
 
-    def noise_shaping(wav_list):
-        pqmf = PQMF(args.n_bands)
-        print(f'{pqmf.subbands} {pqmf.A} {pqmf.taps} {pqmf.cutoff_ratio} {pqmf.beta}')
-        #fs_band = args.fs // args.n_bands
-        #print(f'{pqmf.subbands} {pqmf.A} {pqmf.taps} {pqmf.cutoff_ratio} {pqmf.beta} {fs_band}')
-        for wav_name in wav_list:
-            x, fs = sf.read(wav_name)
-
-            ## check sampling frequency
-            if not fs == args.fs:
-                print("ERROR: sampling frequency is not matched.")
-                sys.exit(1)
-
-            x_bands_ana = pqmf.analysis(torch.FloatTensor(x).unsqueeze(0).unsqueeze(0))
-            print(x_bands_ana.shape)
-            x_bands_syn = pqmf.synthesis(x_bands_ana)
-            print(x_bands_syn.shape)
-            for i in range(args.n_bands):
-                wav = np.clip(x_bands_ana[0,i].data.numpy(), -1, 0.999969482421875)
-                if args.n_bands < 10:
-                    wavpath = os.path.join(args.writedir, os.path.basename(wav_name).split(".")[0]+"_B-"+str(i+1)+".wav")
-                else:
-                    if i < args.n_bands - 1:
-                        wavpath = os.path.join(args.writedir, os.path.basename(wav_name).split(".")[0]+"_B-0"+str(i+1)+".wav")
-                    else:
-                        wavpath = os.path.join(args.writedir, os.path.basename(wav_name).split(".")[0]+"_B-"+str(i+1)+".wav")
-                print(wavpath)
-                sf.write(wavpath, wav, fs, 'PCM_16')
-                #sf.write(wavpath, wav, fs_band, 'PCM_16')
-            wav = np.clip(x_bands_syn[0,0].data.numpy(), -1, 0.999969482421875)
-            wav = deemphasis(wav, alpha=args.alpha)
-            wavpath = os.path.join(args.writesyndir, os.path.basename(wav_name))
-            print(wavpath)
-            sf.write(wavpath, wav, fs, 'PCM_16')
-
-
-    # divie list
-    file_lists = np.array_split(file_list, args.n_jobs)
-    file_lists = [f_list.tolist() for f_list in file_lists]
-
-    # multi processing
-    processes = []
-    for f in file_lists:
-        p = mp.Process(target=noise_shaping, args=(f,))
-        p.start()
-        processes.append(p)
+    # files of the synthesis check
+    if args.n_verify < 0:
+        verify_set = set(file_list)
+    else:
+        n_verify = min(args.n_verify, len(file_list))
+        verify_set = set(np.random.RandomState(args.verify_seed).choice(file_list, n_verify, replace=False).tolist())
+    logging.info("synthesis check of %d/%d files" % (len(verify_set), len(file_list)))
 
-    # wait for all process
-    for p in processes:
-        p.join()
+    if args.GPU_device is not None and args.GPU_device >= 0 and torch.cuda.is_available():
+        device = torch.device("cuda")
+    else:
+        device = torch.device("cpu")
+    torch.set_num_threads(args.n_jobs)
+    pqmf = PQMF(args.n_bands)
+    logging.info(f'{pqmf.subbands} {pqmf.A} {pqmf.taps} {pqmf.cutoff_ratio} {pqmf.beta}')
+    if args.polyphase:
+        pqmf = PolyphasePQMF(pqmf=pqmf)
+    pqmf.to(device)
+
+    def write_wavs(wav_name, x_bands, x_syn):
+        for i in range(args.n_bands):
+            wav = np.clip(x_bands[i], -1, 0.999969482421875)
+            sf.write(band_wavpath(args.writedir, wav_name, i, args.n_bands), wav, args.fs, 'PCM_16')
+        if x_syn is not None:
+            wav = np.clip(x_syn, -1, 0.999969482421875)
+            wav = deemphasis(wav, alpha=args.alpha)
+            sf.write(os.path.join(args.writesyndir, os.path.basename(wav_name)), wav, args.fs, 'PCM_16')
+        return wav_name
+
+    # batched analysis on the device, reading and writing in background
+    n_done = 0
+    with ThreadPoolExecutor(max_workers=max(args.n_jobs, 1)) as executor:
+        futures = []
+        with torch.no_grad():
+            for wav_list, x_batch, lengths in load_batches(length_batches(file_list, args.batch_size, args.fs)):
+                x_bands = pqmf.analysis(torch.from_numpy(x_batch).unsqueeze(1).to(device)) # B x n_bands x T//n_bands
+                n_frames = [length // args.n_bands for length in lengths]
+                idx_syn = [i for i, wav_name in enumerate(wav_list) if wav_name in verify_set]
+                x_syn = None
+                if len(idx_syn) > 0:
+                    # band samples beyond each length are zeroed as if synthesized alone
+                    mask = (torch.arange(x_bands.shape[-1], device=device).unsqueeze(0) \
+                                < torch.LongTensor([n_frames[i] for i in idx_syn]).to(device).unsqueeze(1)).float()
+                    x_syn = pqmf.synthesis(x_bands[idx_syn] * mask.unsqueeze(1))[:,0].cpu().numpy()
+                    for j, i in enumerate(idx_syn):
+                        T = n_frames[i] * args.n_bands
+                        err = np.abs(x_syn[j,:T] - x_batch[i,:T])
+                        logging.info("%s: reconstruction max. abs. error %.3e, mean %.3e" % (wav_list[i],
+                                        np.max(err) if T > 0 else 0, np.mean(err) if T > 0 else 0))
+                x_bands = x_bands.cpu().numpy()
+                for i, wav_name in enumerate(wav_list):
+                    syn = x_syn[idx_syn.index(i),:n_frames[i]*args.n_bands] if i in idx_syn else None
+                    futures.append(executor.submit(write_wavs, wav_name, x_bands[i,:,:n_frames[i]], syn))
+                # collect the finished writes, raising the errors
+                while len(futures) > 0 and (futures[0].done() or len(futures) > 4*args.batch_size):
+                    logging.info("wrote %s" % (futures.pop(0).result()))
+                    n_done += 1
+        for future in futures:
+            logging.info("wrote %s" % (future.result()))
+            n_done += 1
+    logging.info("%d/%d files are processed." % (n_done, len(file_list)))
+
+    # band wavs availability in the corpus index
+    if args.index is not None:
+        update_index(args.index, [{"utt": utt_id(wav_name), "pqmf_bands": args.n_bands} for wav_name in file_list])
 
 
 if __name__ == "__main__":
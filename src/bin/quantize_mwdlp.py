@@ -0,0 +1,229 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright 2021 Patrick Lumban Tobing (Nagoya University)
+#  Apache 2.0  (http://www.apache.org/licenses/LICENSE-2.0)
+
+from __future__ import division
+
+from distutils.util import strtobool
+import argparse
+import csv
+import json
+import logging
+import os
+import sys
+import time
+
+import numpy as np
+import soundfile as sf
+import torch
+
+import librosa
+
+from utils import find_files
+from utils import read_txt, read_hdf5
+from vcneuvoco import GRU_WAVE_DECODER_DUALGRU_COMPACT_MBAND_CF
+from freeze import freeze_model
+from quantize import quantize_model
+from objective_eval import calc_lsd, calc_mcd, melsp_to_melcep
+
+from pqmf import PQMF
+
+
+def calc_melsp(x, fs=24000, fftl=2048, shiftms=5, winms=27.5, n_mels=80):
+    """FUNCTION TO COMPUTE MEL-SPECTROGRAM OF A WAVEFORM
+
+    Args:
+        x (ndarray): waveform
+        fs (int): sampling rate
+        fftl (int): FFT length
+        shiftms (float): frame shift in msec
+        winms (float): window length in msec
+        n_mels (int): number of mel-filterbank channels
+
+    Return:
+        (ndarray): linear mel-spectrogram (T x n_mels)
+    """
+    stft = librosa.core.stft(x, n_fft=fftl, hop_length=int((fs/1000)*shiftms),
+        win_length=int((fs/1000)*winms), window='hann')
+    return np.dot(librosa.filters.mel(fs, fftl, n_mels=n_mels), np.abs(stft)).T
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    # decode setting
+    parser.add_argument("--feats", required=True,
+                        type=str, help="list or directory of feat files")
+    parser.add_argument("--checkpoint", required=True,
+                        type=str, help="model file")
+    parser.add_argument("--config", required=True,
+                        type=str, help="configure file")
+    parser.add_argument("--outdir", required=True,
+                        type=str, help="directory to save generated samples and reports")
+    parser.add_argument("--fs", default=24000,
+                        type=int, help="sampling rate")
+    parser.add_argument("--fftl", default=2048,
+                        type=int, help="FFT length of the report mel-spectrogram")
+    parser.add_argument("--shiftms", default=5,
+                        type=float, help="frame shift of the report mel-spectrogram")
+    parser.add_argument("--winms", default=27.5,
+                        type=float, help="window length of the report mel-spectrogram")
+    parser.add_argument("--mel_dim", default=80,
+                        type=int, help="number of mel-filterbank channels of the report mel-spectrogram")
+    parser.add_argument("--mcd_dim", default=25,
+                        type=int, help="number of mel-cepstrum coefficients for MCD")
+    # quantization setting
+    parser.add_argument("--dtype", default="qint8",
+                        type=str, help="quantized weight type, qint8 or float16")
+    parser.add_argument("--n_calib", default=0,
+                        type=int, help="number of utterances for static calibration, dynamic only if 0")
+    parser.add_argument("--calib_frames", default=40,
+                        type=int, help="number of frames of each calibration utterance")
+    parser.add_argument("--tol", default=0.05,
+                        type=float, help="tolerance of the relative output error of a quantized layer")
+    parser.add_argument("--n_threads", default=1,
+                        type=int, help="number of cpu threads")
+    parser.add_argument("--write_wav", default=True,
+                        type=strtobool, help="flag to write float32 and quantized waveforms")
+    # other setting
+    parser.add_argument("--string_path", default=None,
+                        type=str, help="dataset path of input features")
+    parser.add_argument("--seed", default=1,
+                        type=int, help="seed number")
+    parser.add_argument("--verbose", default=1,
+                        type=int, help="log level")
+    args = parser.parse_args()
+
+    # check directory existence
+    if not os.path.exists(args.outdir):
+        os.makedirs(args.outdir)
+
+    # set log level
+    if args.verbose > 0:
+        logging.basicConfig(level=logging.INFO,
+                            format='%(asctime)s (%(module)s:%(lineno)d) %(levelname)s: %(message)s',
+                            datefmt='%m/%d/%Y %I:%M:%S',
+                            filename=args.outdir + "/quantize.log")
+        logging.getLogger().addHandler(logging.StreamHandler())
+    else:
+        logging.basicConfig(level=logging.WARN,
+                            format='%(asctime)s (%(module)s:%(lineno)d) %(levelname)s: %(message)s',
+                            datefmt='%m/%d/%Y %I:%M:%S',
+                            filename=args.outdir + "/quantize.log")
+        logging.getLogger().addHandler(logging.StreamHandler())
+        logging.warn("logging is disabled.")
+
+    # fix seed
+    os.environ['PYTHONHASHSEED'] = str(args.seed)
+    np.random.seed(args.seed)
+    torch.manual_seed(args.seed)
+    torch.set_num_threads(args.n_threads)
+
+    # load config
+    config = torch.load(args.config)
+    logging.info(config)
+    if args.string_path is None:
+        string_path = config.string_path
+    else:
+        string_path = args.string_path
+
+    # get file list
+    if os.path.isdir(args.feats):
+        feat_list = sorted(find_files(args.feats, "*.h5"))
+    elif os.path.isfile(args.feats):
+        feat_list = read_txt(args.feats)
+    else:
+        logging.error("--feats should be directory or list.")
+        sys.exit(1)
+
+    def load_feat(featfile):
+        if config.excit_dim > 0:
+            feat = np.c_[read_hdf5(featfile, '/feat_mceplf0cap')[:,:config.excit_dim], read_hdf5(featfile, string_path)]
+        else:
+            feat = read_hdf5(featfile, string_path)
+        return torch.FloatTensor(feat).unsqueeze(0)
+
+    # float32 model on cpu
+    with torch.no_grad():
+        model_waveform = GRU_WAVE_DECODER_DUALGRU_COMPACT_MBAND_CF(
+            feat_dim=config.mcep_dim+config.excit_dim,
+            upsampling_factor=config.upsampling_factor,
+            hidden_units=config.hidden_units_wave,
+            hidden_units_2=config.hidden_units_wave_2,
+            kernel_size=config.kernel_size_wave,
+            dilation_size=config.dilation_size_wave,
+            n_quantize=config.n_quantize,
+            causal_conv=config.causal_conv_wave,
+            right_size=config.right_size,
+            n_bands=config.n_bands,
+            pad_first=True,
+            mid_dim=config.mid_dim,
+            emb_flag=True,
+            lpc=config.lpc)
+        model_waveform.load_state_dict(torch.load(args.checkpoint, map_location="cpu")["model_waveform"])
+        model_waveform.remove_weight_norm()
+        freeze_model(model_waveform)
+        for param in model_waveform.parameters():
+            param.requires_grad = False
+
+        # quantized model, optionally calibrated on the first frames of a few utterances
+        if args.n_calib > 0:
+            calib_inputs = [(load_feat(featfile)[:,:args.calib_frames],) for featfile in feat_list[:args.n_calib]]
+            model_waveform_q, errors = quantize_model(model_waveform, dtype=getattr(torch, args.dtype),
+                calib_inputs=calib_inputs, calib_run=lambda model, x: model.generate(*x), tol=args.tol)
+        else:
+            model_waveform_q, errors = quantize_model(model_waveform, dtype=getattr(torch, args.dtype))
+
+        pqmf = PQMF(config.n_bands)
+        results = []
+        for featfile in feat_list:
+            feat_id = os.path.basename(featfile).replace(".h5", "")
+            feat = load_feat(featfile)
+            n_samples = feat.shape[1]*config.upsampling_factor
+            res = {"file": feat_id}
+            wav_dict = {}
+            for key, model in zip(["fp32", "int8"], [model_waveform, model_waveform_q]):
+                torch.manual_seed(args.seed)
+                start = time.time()
+                samples = pqmf.synthesis(model.generate(feat))[0,0].data.numpy()
+                res["rtf_"+key] = (time.time() - start) / (n_samples / args.fs)
+                wav_dict[key] = np.clip(samples[:n_samples], -1, 0.999969482421875)
+                if args.write_wav:
+                    sf.write(os.path.join(args.outdir, feat_id+"_"+key+".wav"), wav_dict[key], args.fs, "PCM_16")
+
+            # distortion of the quantized output against the float32 output, same time axis
+            melsp_fp32 = calc_melsp(wav_dict["fp32"], fs=args.fs, fftl=args.fftl, shiftms=args.shiftms,
+                            winms=args.winms, n_mels=args.mel_dim)
+            melsp_int8 = calc_melsp(wav_dict["int8"], fs=args.fs, fftl=args.fftl, shiftms=args.shiftms,
+                            winms=args.winms, n_mels=args.mel_dim)
+            lsd_arr = calc_lsd(melsp_int8, melsp_fp32)
+            mcd_arr = calc_mcd(melsp_to_melcep(melsp_int8, dim=args.mcd_dim), melsp_to_melcep(melsp_fp32, dim=args.mcd_dim))
+            res["lsd"] = np.mean(lsd_arr)
+            res["mcd"] = np.mean(mcd_arr)
+            logging.info(" ".join(["%s=%s" % (key, val) for key, val in res.items()]))
+            results.append(res)
+
+    # per-utterance and aggregate reports
+    keys = ["file", "rtf_fp32", "rtf_int8", "lsd", "mcd"]
+    csv_name = os.path.join(args.outdir, "quantize_report.csv")
+    with open(csv_name, "w") as f:
+        writer = csv.DictWriter(f, fieldnames=keys)
+        writer.writeheader()
+        for res in results:
+            writer.writerow(res)
+    logging.info(csv_name)
+    summary = {"dtype": args.dtype, "n_calib": args.n_calib, "n_threads": args.n_threads, "n_utt": len(results),
+                "layer_rel_err": errors}
+    for key in keys[1:]:
+        vals = np.array([res[key] for res in results])
+        summary[key] = {"mean": float(np.mean(vals)), "std": float(np.std(vals))}
+        logging.info("%s: %.6f (+- %.6f)" % (key, summary[key]["mean"], summary[key]["std"]))
+    json_name = os.path.join(args.outdir, "quantize_report.json")
+    with open(json_name, "w") as f:
+        json.dump(summary, f, indent=4)
+    logging.info(json_name)
+
+
+if __name__ == "__main__":
+    main()
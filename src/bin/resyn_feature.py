@@ -0,0 +1,163 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright 2021 Patrick Lumban Tobing (Nagoya University)
+#  Apache 2.0  (http://www.apache.org/licenses/LICENSE-2.0)
+
+from __future__ import division
+from __future__ import print_function
+
+import argparse
+import multiprocessing as mp
+import os
+
+import logging
+import numpy as np
+import soundfile as sf
+import librosa
+
+from utils import find_files
+from utils import read_txt
+from utils import read_hdf5
+
+import pysptk as ps
+import pyworld as pw
+
+
+FS = 24000
+SHIFTMS = 5
+WINMS = 27.5
+MEL_DIM = 80
+MCEP_DIM = 49
+MCEP_ALPHA = 0.466 #24k
+FFTL = 2048
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="analysis-synthesis of the stored features of feature_extract.py on demand.")
+
+    parser.add_argument("--expdir", required=True,
+        type=str, help="directory to save the log")
+    parser.add_argument(
+        "--feats", required=True,
+        type=str, help="directory or list of hdf5 feature files")
+    parser.add_argument(
+        "--wavdir", default=None,
+        help="directory to save of analysis-synthesis WORLD wav file")
+    parser.add_argument(
+        "--wavgfdir", default=None,
+        help="directory to save of analysis-synthesis Griffin-Lim wav file")
+    parser.add_argument(
+        "--fs", default=FS,
+        type=int, help="Sampling frequency")
+    parser.add_argument(
+        "--shiftms", default=SHIFTMS,
+        type=float, help="Frame shift in msec for WORLD extract.")
+    parser.add_argument(
+        "--winms", default=WINMS,
+        type=float, help="Frame shift in msec for Mel-Spectrogram extract.")
+    parser.add_argument(
+        "--mcep_dim", default=MCEP_DIM,
+        type=int, help="Dimension of mel-cepstrum")
+    parser.add_argument(
+        "--mel_dim", default=MEL_DIM,
+        type=int, help="Dimension of mel-spectrogram")
+    parser.add_argument(
+        "--mcep_alpha", default=MCEP_ALPHA,
+        type=float, help="Alpha of mel cepstrum")
+    parser.add_argument(
+        "--fftl", default=FFTL,
+        type=int, help="FFT length")
+    parser.add_argument(
+        "--n_jobs", default=10,
+        type=int, help="number of parallel jobs")
+    parser.add_argument(
+        "--verbose", default=1,
+        type=int, help="log message level")
+
+    args = parser.parse_args()
+
+    # check directory existence
+    if not os.path.exists(args.expdir):
+        os.makedirs(args.expdir)
+    if (args.wavdir is not None) and (not os.path.exists(args.wavdir)):
+        os.makedirs(args.wavdir)
+    if (args.wavgfdir is not None) and (not os.path.exists(args.wavgfdir)):
+        os.makedirs(args.wavgfdir)
+
+    # set log level
+    if args.verbose > 0:
+        logging.basicConfig(level=logging.INFO,
+                            format='%(asctime)s (%(module)s:%(lineno)d) %(levelname)s: %(message)s',
+                            datefmt='%m/%d/%Y %I:%M:%S',
+                            filename=args.expdir + "/resyn_feature.log")
+        logging.getLogger().addHandler(logging.StreamHandler())
+    else:
+        logging.basicConfig(level=logging.WARN,
+                            format='%(asctime)s (%(module)s:%(lineno)d) %(levelname)s: %(message)s',
+                            datefmt='%m/%d/%Y %I:%M:%S',
+                            filename=args.expdir + "/resyn_feature.log")
+        logging.getLogger().addHandler(logging.StreamHandler())
+        logging.warn("logging is disabled.")
+
+    # read list
+    if os.path.isdir(args.feats):
+        feat_list = sorted(find_files(args.feats, "*.h5"))
+    else:
+        feat_list = read_txt(args.feats)
+    logging.info("number of files: %d" % (len(feat_list)))
+
+    def resyn_feature(cpu, feat_list):
+        """FUNCTION TO RESYNTHESIZE THE WAVS AS IN feature_extract.py FROM THE STORED FEATURES
+
+        WORLD uses the coded mel-cepstrum as in feature_extract.py, and the aperiodicity decoded from the coded one,
+        as the full aperiodicity is not stored.
+        Griffin-Lim uses the pseudo-inverse of the mel-filterbank on the stored log mel-spectrogram.
+        """
+        melfb_t = np.linalg.pinv(librosa.filters.mel(args.fs, args.fftl, n_mels=args.mel_dim))
+        hop_length = int((args.fs/1000)*args.shiftms)
+        win_length = int((args.fs/1000)*args.winms)
+        ap_fs = args.fs if args.fs >= 16000 else 16000
+        for feat_file in feat_list:
+            name = os.path.basename(feat_file).replace(".h5", ".wav")
+            if args.wavdir is not None:
+                feat_org_lf0 = read_hdf5(feat_file, "/feat_org_lf0")
+                n_frame = feat_org_lf0.shape[0]
+                f0 = read_hdf5(feat_file, "/f0_range")[:n_frame]
+                codeap = np.ascontiguousarray(feat_org_lf0[:,2:-(args.mcep_dim+1)])
+                mcep = np.ascontiguousarray(feat_org_lf0[:,-(args.mcep_dim+1):])
+                sp_rec = ps.mc2sp(mcep, args.mcep_alpha, args.fftl)
+                ap = pw.decode_aperiodicity(codeap, ap_fs, args.fftl)
+                wav = np.clip(pw.synthesize(f0, sp_rec, ap, args.fs, frame_period=args.shiftms),
+                            -1, 0.999969482421875)
+                wavpath = os.path.join(args.wavdir, name)
+                logging.info("cpu-"+str(cpu+1)+" "+wavpath)
+                sf.write(wavpath, wav, args.fs, 'PCM_16')
+            if args.wavgfdir is not None:
+                melmagsp = (np.exp(read_hdf5(feat_file, "/log_1pmelmagsp"))-1)/10000
+                recmagsp = np.matmul(melfb_t, melmagsp.T)
+                wav = np.clip(librosa.core.griffinlim(recmagsp, hop_length=hop_length,
+                            win_length=win_length, window='hann'), -1, 0.999969482421875)
+                wavpath = os.path.join(args.wavgfdir, name)
+                logging.info("cpu-"+str(cpu+1)+" "+wavpath)
+                sf.write(wavpath, wav, args.fs, 'PCM_16')
+
+    # divide list
+    feat_lists = np.array_split(feat_list, args.n_jobs)
+    feat_lists = [f_list.tolist() for f_list in feat_lists]
+
+    # multi processing
+    processes = []
+    for i, f in enumerate(feat_lists):
+        p = mp.Process(target=resyn_feature, args=(i, f,))
+        p.start()
+        processes.append(p)
+
+    # wait for all process
+    for p in processes:
+        p.join()
+
+
+if __name__ == "__main__":
+    main()
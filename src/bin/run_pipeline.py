@@ -0,0 +1,281 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright 2021 Patrick Lumban Tobing (Nagoya University)
+#  Apache 2.0  (http://www.apache.org/licenses/LICENSE-2.0)
+
+from __future__ import division
+
+from distutils.util import strtobool
+import argparse
+import logging
+import os
+import sys
+
+import yaml
+
+from utils import find_files
+from utils import read_txt
+from pipeline import Pipeline, Task, write_if_changed
+
+
+SPKS = "SEF1@SEF2@SEM1@SEM2@TFM1@TGM1@TMM1@TEF1@TEM1@TEF2@TEM2@TFF1@TGF1@TMF1"
+
+# fs: (fftl, mcep_alpha, n_bands, khz suffix), as in run.sh
+FS_SETTINGS = {8000: (1024, 0.312, 2, "8kHz"), 16000: (1024, 0.41000000000000003, 4, "16kHz"),
+                22050: (2048, 0.455, 5, "22kHz"), 24000: (2048, 0.466, 6, "24kHz"),
+                44100: (4096, 0.544, 10, "44kHz"), 48000: (4096, 0.554, 12, "48kHz")}
+
+# prerequisite stages of the stages delegated to run.sh
+RUN_SH_STAGES = [("4", ["2"]), ("5", ["2", "3"]), ("6", ["4", "5"]), ("7", ["6"]), ("8", ["5"]), ("9", ["8"]),
+                    ("a", ["4"]), ("b", ["a", "5"]), ("c", ["b"]), ("d", ["6"]), ("e", ["d"]), ("f", ["e"]),
+                    ("g", ["7"]), ("h", ["g"]), ("j", ["h"])]
+
+
+def spk_files(files, spk):
+    """FUNCTION TO GET THE FILES OF A SPEAKER, I.E., IN A /spk/ DIRECTORY"""
+    return [f for f in files if "/"+spk+"/" in f]
+
+
+def write_spk_scp(path, directory, spks):
+    """FUNCTION TO WRITE THE SORTED WAV OR HDF5 FILES OF A DIRECTORY GROUPED BY SPEAKER AS IN run.sh"""
+    ext = "*.h5" if directory.startswith("hdf5") else "*.wav"
+    files = sorted(find_files(directory, ext)) if os.path.isdir(directory) else []
+    lines = []
+    for spk in spks:
+        lines += spk_files(files, spk)
+    if write_if_changed(path, lines):
+        logging.info("%s: %d files" % (path, len(lines)))
+
+
+def band_files(writedir, wav_file, n_bands):
+    """FUNCTION TO GET THE BAND WAV FILES WRITTEN BY proc_wav_pqmf.py"""
+    name = os.path.basename(wav_file).split(".")[0]
+    if n_bands < 10:
+        return [os.path.join(writedir, name+"_B-"+str(i+1)+".wav") for i in range(n_bands)]
+    return [os.path.join(writedir, name+"_B-0"+str(i+1)+".wav") for i in range(n_bands-1)] \
+                + [os.path.join(writedir, name+"_B-"+str(n_bands)+".wav")]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--egs_dir", default=".",
+                        type=str, help="recipe directory with run.sh, conf, and data, after sourcing its path.sh")
+    parser.add_argument("--stage", default="123",
+                        type=str, help="target stages of run.sh, prerequisite stages are included if not up to date")
+    parser.add_argument("--spks", default=SPKS,
+                        type=str, help="speakers separated by @")
+    parser.add_argument("--resyn", default="5",
+                        type=str, help="analysis-synthesis policy of feature_extract.py as in run.sh")
+    parser.add_argument("--feat_cache", default="exp/feature_cache",
+                        type=str, help="cache directory of feature_extract.py as in run.sh, empty to disable")
+    parser.add_argument("--feat_index", default="feats_index.h5",
+                        type=str, help="metadata index filename in data/<set> as in run.sh, empty to disable")
+    parser.add_argument("--n_verify_pqmf", default=5,
+                        type=int, help="number of sampled files of the pqmf synthesis check as in run.sh, all if negative")
+    parser.add_argument("--n_jobs", default=10,
+                        type=int, help="number of parallel jobs of each task")
+    parser.add_argument("--n_parallel", default=4,
+                        type=int, help="number of tasks running in parallel")
+    parser.add_argument("--content_hash", default=False,
+                        type=strtobool, help="flag to fingerprint the files by content instead of size and mtime")
+    parser.add_argument("--state_dir", default="exp/pipeline",
+                        type=str, help="directory of the task states, relative to egs_dir")
+    parser.add_argument("--dry_run", default=False,
+                        type=strtobool, help="flag to only report the tasks and files to process")
+    parser.add_argument("--verbose", default=1,
+                        type=int, help="log level")
+    args = parser.parse_args()
+
+    os.chdir(args.egs_dir)
+    if not os.path.exists(args.state_dir):
+        os.makedirs(args.state_dir)
+
+    # set log level
+    if args.verbose > 0:
+        logging.basicConfig(level=logging.INFO,
+                            format='%(asctime)s (%(module)s:%(lineno)d) %(levelname)s: %(message)s',
+                            datefmt='%m/%d/%Y %I:%M:%S',
+                            filename=args.state_dir + "/run_pipeline.log")
+        logging.getLogger().addHandler(logging.StreamHandler())
+    else:
+        logging.basicConfig(level=logging.WARN,
+                            format='%(asctime)s (%(module)s:%(lineno)d) %(levelname)s: %(message)s',
+                            datefmt='%m/%d/%Y %I:%M:%S',
+                            filename=args.state_dir + "/run_pipeline.log")
+        logging.getLogger().addHandler(logging.StreamHandler())
+        logging.warn("logging is disabled.")
+
+    # settings as in run.sh
+    with open("conf/config.yml") as f:
+        config = yaml.safe_load(f)
+    spkr_conf = {}
+    if os.path.exists("conf/spkr.yml"):
+        with open("conf/spkr.yml") as f:
+            spkr_conf = yaml.safe_load(f) or {}
+    fs = int(config["fs"])
+    if fs not in FS_SETTINGS:
+        logging.error("sampling rate %d not available" % (fs))
+        sys.exit(1)
+    fftl, mcep_alpha, n_bands, khz = FS_SETTINGS[fs]
+    shiftms = config["shiftms"]
+    data_name = "vcc20_%sms_%s" % (shiftms, khz)
+    if fs in [22050, 44100]:
+        shiftms = {5: 4.9886621315192743764172335600907, 10: 9.9773242630385487528344671201814}[int(shiftms)]
+    powmcep_dim = int(config["mcep_dim"]) + 1
+    sets = ["tr_"+data_name, "dv_"+data_name, "ts_"+data_name]
+    trn, dev = sets[:2]
+    spks = args.spks.split('@')
+    logging.info("%s: %s" % (data_name, spks))
+
+    pipeline = Pipeline(args.state_dir, content=args.content_hash, n_parallel=args.n_parallel,
+                    dry_run=args.dry_run)
+    stage_tasks = {}
+
+    def add(task):
+        stage_tasks.setdefault(task.stage, []).append(task.name)
+        return pipeline.add(task)
+
+    # stage 1: feature extraction per set and speaker, file by file
+    for set_ in sets:
+        if not os.path.exists("data/%s/wav.scp" % (set_)):
+            continue
+        wav_list = read_txt("data/%s/wav.scp" % (set_))
+        expdir = "exp/feature_extract/" + set_
+        deps = []
+        for spk in spks:
+            wavs = spk_files(wav_list, spk)
+            if len(wavs) == 0:
+                continue
+            if spk not in spkr_conf:
+                logging.warn("%s is not in conf/spkr.yml, please run stage init of run.sh first" % (spk))
+                continue
+            hdf5dir = "hdf5/%s/%s" % (set_, spk)
+            add(Task("feature_extract/%s/%s" % (set_, spk), stage="1",
+                cmd=["feature_extract.py", "--expdir", expdir, "--waveforms", "{scp}",
+                    "--wavdir", "wav_anasyn/%s/%s" % (set_, spk), "--wavgfdir", "wav_anasyn_gf/%s/%s" % (set_, spk),
+                    "--wavfiltdir", "wav_filtered/%s/%s" % (set_, spk), "--hdf5dir", hdf5dir,
+                    "--fs", str(fs), "--shiftms", str(shiftms), "--winms", str(config["winms"]),
+                    "--minf0", str(spkr_conf[spk]["minf0"]), "--maxf0", str(spkr_conf[spk]["maxf0"]),
+                    "--pow", str(spkr_conf[spk]["npow"]), "--mel_dim", str(config["mel_dim"]),
+                    "--mcep_dim", str(config["mcep_dim"]), "--mcep_alpha", str(mcep_alpha), "--fftl", str(fftl),
+                    "--highpass_cutoff", str(config["highpass_cutoff"]), "--resyn", args.resyn] \
+                    + (["--cache_dir", args.feat_cache] if args.feat_cache != "" else []) \
+                    + (["--index", "data/%s/%s" % (set_, args.feat_index)] if args.feat_index != "" else []) \
+                    + ["--n_jobs", str(args.n_jobs)],
+                file_map=[(wav, [os.path.join(hdf5dir, os.path.basename(wav).replace(".wav", ".h5"))]) \
+                            for wav in wavs],
+                scp=os.path.join(expdir, "wav_%s.scp" % (spk)),
+                log=os.path.join(expdir, "feature_extract_%s.log" % (spk)),
+                log_partial=os.path.join(expdir, "feature_extract_%s_incr.log" % (spk))))
+            deps.append("feature_extract/%s/%s" % (set_, spk))
+
+        def make_feats_scp(task, set_=set_):
+            write_spk_scp("data/%s/feats.scp" % (set_), "hdf5/"+set_, spks)
+            write_spk_scp("data/%s/wav_filtered.scp" % (set_), "wav_filtered/"+set_, spks)
+        add(Task("feats_scp/"+set_, stage="1", func=make_feats_scp, deps=deps,
+            inputs=["hdf5/"+set_], outputs=["data/%s/feats.scp" % (set_), "data/%s/wav_filtered.scp" % (set_)]))
+
+    # stage 2: speaker and joint statistics
+    feats_scp_tasks = [name for name in stage_tasks.get("1", []) if name.startswith("feats_scp/")]
+    for spk in spks:
+        spk_scps = ["data/%s/feats_spk-%s.scp" % (set_, spk) for set_ in sets if os.path.exists("data/%s/wav.scp" % (set_))]
+
+        def make_spk_scp(task, spk=spk):
+            for spk_scp in task.outputs:
+                set_ = spk_scp.split('/')[1]
+                lines = spk_files(read_txt("data/%s/feats.scp" % (set_)), spk) \
+                            if os.path.exists("data/%s/feats.scp" % (set_)) else []
+                write_if_changed(spk_scp, lines)
+        add(Task("feats_spk_scp/"+spk, stage="2", func=make_spk_scp, deps=feats_scp_tasks,
+            inputs=["data/%s/feats.scp" % (set_) for set_ in sets if os.path.exists("data/%s/wav.scp" % (set_))],
+            outputs=spk_scps))
+        add(Task("calc_stats/"+spk, stage="2",
+            cmd=["calc_stats.py", "--expdir", "exp/calculate_statistics",
+                "--feats", "data/%s/feats_spk-%s.scp" % (trn, spk), "--mcep_dim", str(powmcep_dim),
+                "--n_jobs", str(args.n_jobs), "--stats", "data/%s/stats_spk-%s.h5" % (trn, spk)],
+            deps=["feats_spk_scp/"+spk], inputs=["data/%s/feats_spk-%s.scp" % (trn, spk), "hdf5/%s/%s" % (trn, spk)],
+            outputs=["data/%s/stats_spk-%s.h5" % (trn, spk)],
+            log="exp/calculate_statistics/calc_stats_%s_spk-%s.log" % (trn, spk)))
+    add(Task("calc_stats/jnt", stage="2",
+        cmd=["calc_stats.py", "--expdir", "exp/calculate_statistics", "--feats", "data/%s/feats.scp" % (trn),
+            "--mcep_dim", str(powmcep_dim), "--n_jobs", str(args.n_jobs), "--stats", "data/%s/stats_jnt.h5" % (trn)],
+        deps=feats_scp_tasks, inputs=["data/%s/feats.scp" % (trn), "hdf5/"+trn],
+        outputs=["data/%s/stats_jnt.h5" % (trn)], log="exp/calculate_statistics/calc_stats_%s.log" % (trn)))
+
+    # stage 3: noise shaping and pqmf per set and speaker, file by file
+    for set_ in [trn, dev]:
+        if "feats_scp/"+set_ not in pipeline.tasks:
+            continue
+        deps = []
+        for spk in spks:
+            writedir = "wav_ns/%s/%s" % (set_, spk)
+
+            def ns_map(set_=set_, spk=spk, writedir=writedir):
+                return [(wav, [os.path.join(writedir, os.path.basename(wav))]) \
+                            for wav in spk_files(read_txt("data/%s/wav_filtered.scp" % (set_)), spk)]
+            add(Task("noise_shaping/%s/%s" % (set_, spk), stage="3",
+                cmd=["noise_shaping_emph.py", "--waveforms", "{scp}", "--writedir", writedir, "--fs", str(fs),
+                    "--alpha", str(config["alpha"]), "--n_jobs", str(args.n_jobs)],
+                deps=["feats_scp/"+set_], file_map=ns_map,
+                scp="exp/noise_shaping/%s/wav_filtered.%s.%s.scp" % (set_, set_, spk),
+                log="exp/noise_shaping/%s/noise_shaping_emph_apply.%s.%s.log" % (set_, set_, spk)))
+            deps.append("noise_shaping/%s/%s" % (set_, spk))
+
+        def make_ns_scp(task, set_=set_):
+            write_spk_scp("data/%s/wav_ns.scp" % (set_), "wav_ns/"+set_, spks)
+        add(Task("wav_ns_scp/"+set_, stage="3", func=make_ns_scp, deps=deps, inputs=["wav_ns/"+set_],
+            outputs=["data/%s/wav_ns.scp" % (set_)]))
+
+        deps = []
+        for spk in spks:
+            writedir = "wav_ns_pqmf_%d/%s/%s" % (n_bands, set_, spk)
+            writesyndir = "wav_ns_pqmf_%d_rec/%s/%s" % (n_bands, set_, spk)
+
+            def pqmf_map(set_=set_, spk=spk, writedir=writedir, writesyndir=writesyndir):
+                # the synthesized wavs are only written for the sampled files of the check
+                return [(wav, band_files(writedir, wav, n_bands) \
+                            + ([os.path.join(writesyndir, os.path.basename(wav))] if args.n_verify_pqmf < 0 else [])) \
+                            for wav in spk_files(read_txt("data/%s/wav_ns.scp" % (set_)), spk)]
+            add(Task("pqmf/%s/%s" % (set_, spk), stage="3",
+                cmd=["proc_wav_pqmf.py", "--waveforms", "{scp}", "--writedir", writedir, "--writesyndir", writesyndir,
+                    "--fs", str(fs), "--n_bands", str(n_bands), "--n_verify", str(args.n_verify_pqmf)] \
+                    + (["--index", "data/%s/%s" % (set_, args.feat_index)] if args.feat_index != "" else []) \
+                    + ["--n_jobs", str(args.n_jobs)],
+                deps=["wav_ns_scp/"+set_], file_map=pqmf_map,
+                scp="exp/pqmf/%s/wav_ns.%s.%s.scp" % (set_, set_, spk),
+                log="exp/pqmf/%s/noise_shaping_emph_pqmf_%d_apply.%s.%s.log" % (set_, n_bands, set_, spk)))
+            deps.append("pqmf/%s/%s" % (set_, spk))
+
+        def make_pqmf_scp(task, set_=set_):
+            write_spk_scp("data/%s/wav_ns_pqmf_%d.scp" % (set_, n_bands), "wav_ns_pqmf_%d/%s" % (n_bands, set_), spks)
+        add(Task("wav_ns_pqmf_scp/"+set_, stage="3", func=make_pqmf_scp, deps=deps,
+            inputs=["wav_ns_pqmf_%d/%s" % (n_bands, set_)], outputs=["data/%s/wav_ns_pqmf_%d.scp" % (set_, n_bands)]))
+
+    # stages of training, decoding, and synthesis, delegated to run.sh, rerun if their prerequisites changed
+    for stage, prev_stages in RUN_SH_STAGES:
+        deps = []
+        for prev_stage in prev_stages:
+            if prev_stage in ["1", "2", "3"]:
+                deps += [name for name in stage_tasks.get(prev_stage, []) if not "/" in name \
+                            or name.split("/")[0] in ["calc_stats", "feats_spk_scp", "wav_ns_pqmf_scp"]]
+            else:
+                deps.append("run.sh/"+prev_stage)
+        add(Task("run.sh/"+stage, stage=stage, cmd=["bash", "run.sh", "--stage", stage], deps=deps,
+            inputs=["conf/config.yml"], log=os.path.join(args.state_dir, "log", "run_stage_%s.log" % (stage))))
+
+    results = pipeline.run(stages=list(args.stage))
+    n_failed = 0
+    for name, result in results.items():
+        if result in ["failed", "blocked"]:
+            logging.error("%s: %s" % (name, result))
+            n_failed += 1
+    logging.info("%d tasks: %d run, %d up to date, %d failed or blocked" % (len(results),
+        sum([result == "done" for result in results.values()]), sum([result == "skipped" for result in results.values()]),
+        n_failed))
+    if n_failed > 0:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright 2021 Patrick Lumban Tobing (Nagoya University)
+#  Apache 2.0  (http://www.apache.org/licenses/LICENSE-2.0)
+
+from __future__ import division
+
+from distutils.util import strtobool
+import argparse
+import json
+import logging
+import os
+import sys
+
+import numpy as np
+import soundfile as sf
+import torch
+
+from utils import find_files
+from utils import read_txt, read_hdf5
+from vcneuvoco import GRU_WAVE_DECODER_DUALGRU_COMPACT_MBAND_CF
+from freeze import freeze_model
+from mwdlp_server import MWDLPStreamScheduler
+
+from pqmf import PQMF
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    # decode setting
+    parser.add_argument("--feats", required=True,
+                        type=str, help="list or directory of feature files")
+    parser.add_argument("--checkpoint", required=True,
+                        type=str, help="model file")
+    parser.add_argument("--config", required=True,
+                        type=str, help="configure file")
+    parser.add_argument("--outdir", required=True,
+                        type=str, help="directory to save generated samples")
+    parser.add_argument("--fs", default=22050,
+                        type=int, help="sampling rate")
+    parser.add_argument("--capacity", default=16,
+                        type=int, help="number of concurrent decoding streams")
+    parser.add_argument("--string_path", default=None,
+                        type=str, help="path of the features in the hdf5 files")
+    parser.add_argument("--freeze", default=True,
+                        type=strtobool, help="flag to fold normalization layers for inference")
+    parser.add_argument("--n_threads", default=1,
+                        type=int, help="number of cpu threads")
+    parser.add_argument("--seed", default=1,
+                        type=int, help="seed number")
+    parser.add_argument("--GPU_device", default=None,
+                        type=int, help="selection of GPU device, cpu if not set or negative")
+    parser.add_argument("--verbose", default=1,
+                        type=int, help="log level")
+    args = parser.parse_args()
+
+    if args.GPU_device is not None and args.GPU_device >= 0:
+        os.environ["CUDA_DEVICE_ORDER"]     = "PCI_BUS_ID"
+        os.environ["CUDA_VISIBLE_DEVICES"]  = str(args.GPU_device)
+
+    # check directory existence
+    if not os.path.exists(args.outdir):
+        os.makedirs(args.outdir)
+
+    # set log level
+    if args.verbose > 0:
+        logging.basicConfig(level=logging.INFO,
+                            format='%(asctime)s (%(module)s:%(lineno)d) %(levelname)s: %(message)s',
+                            datefmt='%m/%d/%Y %I:%M:%S',
+                            filename=args.outdir + "/decode.log")
+        logging.getLogger().addHandler(logging.StreamHandler())
+    else:
+        logging.basicConfig(level=logging.WARN,
+                            format='%(asctime)s (%(module)s:%(lineno)d) %(levelname)s: %(message)s',
+                            datefmt='%m/%d/%Y %I:%M:%S',
+                            filename=args.outdir + "/decode.log")
+        logging.getLogger().addHandler(logging.StreamHandler())
+        logging.warn("logging is disabled.")
+
+    # fix seed
+    os.environ['PYTHONHASHSEED'] = str(args.seed)
+    np.random.seed(args.seed)
+    torch.manual_seed(args.seed)
+    torch.set_num_threads(args.n_threads)
+
+    # load config
+    config = torch.load(args.config)
+    logging.info(config)
+
+    # get file list
+    if os.path.isdir(args.feats):
+        feat_list = sorted(find_files(args.feats, "*.h5"))
+    elif os.path.isfile(args.feats):
+        feat_list = read_txt(args.feats)
+    else:
+        logging.error("--feats should be directory or list.")
+        sys.exit(1)
+
+    if args.GPU_device is not None and args.GPU_device >= 0 and torch.cuda.is_available():
+        device = torch.device("cuda")
+        torch.backends.cudnn.benchmark = True
+    else:
+        device = torch.device("cpu")
+    logging.info(device)
+
+    with torch.no_grad():
+        model_waveform = GRU_WAVE_DECODER_DUALGRU_COMPACT_MBAND_CF(
+            feat_dim=config.mcep_dim+config.excit_dim,
+            upsampling_factor=config.upsampling_factor,
+            hidden_units=config.hidden_units_wave,
+            hidden_units_2=config.hidden_units_wave_2,
+            kernel_size=config.kernel_size_wave,
+            dilation_size=config.dilation_size_wave,
+            n_quantize=config.n_quantize,
+            causal_conv=config.causal_conv_wave,
+            right_size=config.right_size,
+            n_bands=config.n_bands,
+            pad_first=True,
+            mid_dim=config.mid_dim,
+            emb_flag=True,
+            lpc=config.lpc)
+        logging.info(model_waveform)
+        model_waveform.load_state_dict(torch.load(args.checkpoint, map_location=device)["model_waveform"])
+        model_waveform.to(device)
+        model_waveform.remove_weight_norm()
+        if args.freeze:
+            freeze_model(model_waveform)
+        model_waveform.eval()
+        for param in model_waveform.parameters():
+            param.requires_grad = False
+        pqmf = PQMF(config.n_bands).to(device)
+
+        if args.string_path is None:
+            string_path = config.string_path
+        else:
+            string_path = args.string_path
+        logging.info(string_path)
+
+        # queue all utterances, the scheduler admits them into free slots between frames
+        scheduler = MWDLPStreamScheduler(model_waveform, capacity=args.capacity, pqmf=pqmf)
+        for featfile in feat_list:
+            if 'mel' in string_path and config.excit_dim > 0:
+                feat = np.c_[read_hdf5(featfile, '/feat_mceplf0cap')[:,:config.excit_dim],
+                            read_hdf5(featfile, string_path)]
+            else:
+                feat = read_hdf5(featfile, string_path)
+            scheduler.submit(os.path.basename(featfile).replace(".h5", ""), feat)
+        logging.info("%d utterances queued, capacity %d" % (len(feat_list), args.capacity))
+
+        def write(utt_id, samples):
+            wav = np.clip(samples.cpu().data.numpy(), -1, 0.999969482421875)
+            outpath = os.path.join(args.outdir, utt_id+".wav")
+            sf.write(outpath, wav, args.fs, "PCM_16")
+            logging.info("wrote %s." % (outpath))
+
+        scheduler.run(callback=write)
+
+    metrics = scheduler.metrics()
+    metrics["rtf"] = metrics["elapsed"] / (metrics["n_samples"] / args.fs) if metrics["n_samples"] > 0 else 0.0
+    logging.info("%d utterances, %.2f sec. audio in %.2f sec., %.3f kHz/s, RTF %.3f, occupancy %.3f" % (
+        metrics["n_utts"], metrics["n_samples"] / args.fs, metrics["elapsed"],
+        metrics["samples_per_sec"] / 1000, metrics["rtf"], metrics["occupancy"]))
+    if metrics["n_utts"] > 0:
+        logging.info("latency mean %.3f p95 %.3f sec., first frame mean %.3f p95 %.3f sec." % (
+            metrics["latency_mean"], metrics["latency_p95"], metrics["first_frame_mean"], metrics["first_frame_p95"]))
+    with open(os.path.join(args.outdir, "server_metrics.json"), "w") as f:
+        json.dump(metrics, f, indent=4)
+
+
+if __name__ == "__main__":
+    main()
@@ -21,6 +21,7 @@ from functools import reduce
 from utils import find_files
 from utils import shape_hdf5
 from utils import read_txt
+from feat_index import load_index
 
 import numpy as np
 
@@ -37,6 +38,8 @@ def main():
                         type=str, help="wav list")
     parser.add_argument("--spk_list", required=True,
                         type=str, help="wav list")
+    parser.add_argument("--index", default=None,
+                        type=str, help="metadata index of the corpus, the feature files not in it are read")
     parser.add_argument(
         "--n_jobs", default=10,
         type=int, help="number of parallel jobs")
@@ -109,27 +112,52 @@ def main():
             l.release()
     #    logging.info(spk_dict)
 
+    spk_list = args.spk_list.split('@')
+    n_spk = len(spk_list)
+    logging.info(spk_list)
+
+    # number of frames from the index, only the other files are read
+    index = load_index(args.index)
+    index_spk_dict = {}
+    for spk in spk_list:
+        index_spk_dict[spk] = {}
+    if index is not None:
+        miss_feat_list = []
+        miss_wav_list = []
+        for feat, wav in zip(feat_list, wav_list):
+            n_frame = index.n_frame(feat)
+            if n_frame is not None:
+                index_spk_dict[os.path.basename(os.path.dirname(feat))][feat+"@"+wav] = n_frame
+            else:
+                miss_feat_list.append(feat)
+                miss_wav_list.append(wav)
+        logging.info("%d/%d files are in the index %s" % (len(feat_list)-len(miss_feat_list), len(feat_list),
+                        args.index))
+        feat_list = miss_feat_list
+        wav_list = miss_wav_list
+
     # divide list
-    wav_lists = np.array_split(wav_list, args.n_jobs)
+    n_jobs = max(min(args.n_jobs, len(feat_list)), 1)
+    wav_lists = np.array_split(wav_list, n_jobs)
     wav_lists = [f_list.tolist() for f_list in wav_lists]
-    feat_lists = np.array_split(feat_list, args.n_jobs)
+    feat_lists = np.array_split(feat_list, n_jobs)
     feat_lists = [f_list.tolist() for f_list in feat_lists]
 
     for i in range(len(feat_lists)):
         logging.info("%d %d" % (i+1, len(feat_lists[i])))
 
-    spk_list = args.spk_list.split('@')
-    n_spk = len(spk_list)
-    logging.info(spk_list)
-
     # multi processing
     with mp.Manager() as manager:
         processes = []
         spk_dict = manager.dict()
         for spk in spk_list:
             spk_dict[spk] = manager.list()
+            if bool(index_spk_dict[spk]):
+                spk_dict[spk].append(index_spk_dict[spk])
         lock = mp.Lock()
         for i, (feat_list, wav_list) in enumerate(zip(feat_lists, wav_lists)):
+            if len(feat_list) == 0:
+                continue
             p = mp.Process(target=get_max_frame, args=(lock, feat_list, wav_list, i+1, spk_list, spk_dict,))
             p.start()
             processes.append(p)
@@ -6,8 +6,11 @@
 #  Apache 2.0  (http://www.apache.org/licenses/LICENSE-2.0)
 
 import argparse
+from distutils.util import strtobool
+import multiprocessing as mp
 import os
 from pathlib import Path
+import sys
 import logging
 
 import matplotlib
@@ -16,6 +19,7 @@ from utils import check_hdf5
 from utils import read_hdf5
 from utils import read_txt
 from utils import write_hdf5
+from spk_stats import SpkStatAccumulator
 
 matplotlib.use('Agg')
 import matplotlib.pyplot as plt
@@ -29,6 +33,15 @@ def main():
         help="name of the list of hdf5 files")
     parser.add_argument("--expdir", required=True,
         type=str, help="directory to save the log")
+    parser.add_argument(
+        "--state", default=None,
+        type=str, help="filename of the statistics state, <expdir>/<spk>_stat.h5 if not set")
+    parser.add_argument(
+        "--incremental", default=True,
+        type=strtobool, help="flag to add only the new utterances to an up-to-date state")
+    parser.add_argument(
+        "--n_jobs", default=1,
+        type=int, help="number of parallel jobs")
     parser.add_argument(
         "--verbose", default=1,
         type=int, help="log message level")
@@ -59,30 +72,62 @@ def main():
     filenames = read_txt(args.feats)
     logging.info("number of training utterances = %d" % len(filenames))
 
-    npows = np.empty((0))
-    f0s = np.empty((0))
-    # process over all of data
-    for filename in filenames:
-        logging.info(filename)
-        f0 = read_hdf5(filename, "/f0")
-        npow = read_hdf5(filename, "/npow")
-        nonzero_indices = np.nonzero(f0)
-        logging.info(f0[nonzero_indices].shape)
-        logging.info(f0s.shape)
-        f0s = np.concatenate([f0s,f0[nonzero_indices]])
-        logging.info(f0s.shape)
-        logging.info(npows.shape)
-        npows = np.concatenate([npows,npow])
-        logging.info(npows.shape)
-
     spkr = os.path.basename(args.feats).split('.')[0].split('-')[-1]
 
+    # previous state, updated with the new utterances only if the added ones are unchanged
+    state_path = args.state if args.state is not None else os.path.join(args.expdir, spkr + '_stat.h5')
+    acc = None
+    if args.incremental and os.path.exists(state_path):
+        acc = SpkStatAccumulator.load(state_path)
+        if acc.is_current(filenames):
+            logging.info("%d utterances are in the state %s" % (len(acc.files), state_path))
+        else:
+            logging.info("state %s is outdated, recomputing" % (state_path))
+            acc = None
+    if acc is None:
+        acc = SpkStatAccumulator()
+    new_filenames = [filename for filename in filenames if filename not in acc.files]
+    logging.info("number of utterances to add = %d" % len(new_filenames))
+
+    def calc_stat(filenames, acc_list):
+        acc = SpkStatAccumulator()
+        for filename in filenames:
+            logging.info(filename)
+            acc.add(read_hdf5(filename, "/f0"), read_hdf5(filename, "/npow"), filename=filename)
+        acc_list.append(acc)
+
+    # process over the new utterances in parallel, merging the partial statistics
+    if len(new_filenames) > 0:
+        with mp.Manager() as manager:
+            acc_list = manager.list()
+            processes = []
+            for file_list in np.array_split(new_filenames, min(args.n_jobs, len(new_filenames))):
+                p = mp.Process(target=calc_stat, args=(file_list.tolist(), acc_list,))
+                p.start()
+                processes.append(p)
+            for p in processes:
+                p.join()
+            # a failed job, e.g., of an unreadable feature file, would leave out its utterances
+            n_failed = sum([p.exitcode != 0 for p in processes])
+            for acc_part in acc_list:
+                acc.merge(acc_part)
+        missing = [filename for filename in new_filenames if filename not in acc.files]
+        if n_failed > 0 or len(missing) > 0:
+            logging.error("%d jobs failed, statistics of %d utterances are missing, e.g., %s, the state is not saved" \
+                            % (n_failed, len(missing), missing[0] if len(missing) > 0 else "none"))
+            sys.exit(1)
+        acc.save(state_path)
+    logging.info("f0: %d frames, mean %.3f, std %.3f, min %.3f, max %.3f" % (acc.f0_moments.count,
+                    acc.f0_moments.mean, acc.f0_moments.std, acc.f0_moments.min, acc.f0_moments.max))
+    logging.info("npow: %d frames, mean %.3f, std %.3f, min %.3f, max %.3f" % (acc.npow_moments.count,
+                    acc.npow_moments.mean, acc.npow_moments.std, acc.npow_moments.min, acc.npow_moments.max))
+
     plt.rcParams["figure.figsize"] = (20,11.25) #1920x1080
 
     # create a histogram to visualize F0 range of the speaker
     f0histogrampath = os.path.join(args.expdir, spkr + '_f0histogram.png')
-    f0hist, f0bins, _ = plt.hist(f0s, bins=500, range=(50, 550),
-        density=True, histtype="stepfilled")
+    f0hist, f0bins = acc.f0_histogram()
+    plt.hist(f0bins[:-1], bins=f0bins, weights=f0hist, histtype="stepfilled")
     # plot with matplotlib
     plt.xlabel('Fundamental frequency [Hz]')
     plt.ylabel("Probability")
@@ -101,8 +146,8 @@ def main():
 
     # create a histogram to visualize npow range of the speaker
     npowhistogrampath = os.path.join(args.expdir, spkr + '_npowhistogram.png')
-    npowhist, npowbins, _ = plt.hist(npows, bins=120, range=(-50, 10),
-        density=True, histtype="stepfilled")
+    npowhist, npowbins = acc.npow_histogram()
+    plt.hist(npowbins[:-1], bins=npowbins, weights=npowhist, histtype="stepfilled")
     # plot with matplotlib
     plt.xlabel('Frame power [dB]')
     plt.ylabel("Probability")
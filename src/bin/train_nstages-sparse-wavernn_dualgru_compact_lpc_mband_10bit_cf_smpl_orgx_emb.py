@@ -36,12 +36,15 @@ from utils import read_hdf5
 from utils import read_txt
 from vcneuvoco import GRU_WAVE_DECODER_DUALGRU_COMPACT_MBAND_CF, encode_mu_law
 from vcneuvoco import decode_mu_law_torch, MultiResolutionSTFTLoss
+from vcneuvoco import autocast_forward
+from sparsify import BlockSparsifier
 #from vcneuvoco_ import GRU_WAVE_DECODER_DUALGRU_COMPACT_MBAND_CF, encode_mu_law
 #from vcneuvoco_ import decode_mu_law_torch, MultiResolutionSTFTLoss
 #from radam import RAdam
 import torch_optimizer as optim
 
 from dataset import FeatureDatasetNeuVoco, padding
+from feat_index import load_index
 
 #import warnings
 #warnings.filterwarnings('ignore')
@@ -193,49 +196,14 @@ def write_to_tensorboard(writer, steps, loss):
         writer.add_scalar(key, value, steps)
 
 
+block_sparsifier = BlockSparsifier()
+
+
 ## Based on lpcnet.py [https://github.com/mozilla/LPCNet/blob/master/src/lpcnet.py]
 ## Modified to accomodate PyTorch model and n-stages of sparsification
 def sparsify(model_waveform, iter_idx, t_start, t_end, interval, densities, densities_p=None):
-    if iter_idx < t_start or ((iter_idx-t_start) % interval != 0 and iter_idx < t_end):
-        pass
-    else:
-        logging.info('sparsify: %ld %ld %ld %ld' % (iter_idx, t_start, t_end, interval))
-        p = model_waveform.gru.weight_hh_l0 #recurrent
-        nb = p.shape[0] // p.shape[1]
-        N = p.shape[0] // nb
-        N_16 = N // 16
-        ones = torch.diag(torch.ones(N, device=p.device))
-        if densities_p is not None:
-            for k in range(nb):
-                density = densities[k]
-                if iter_idx < t_end:
-                    r = 1 - (iter_idx-t_start)/(t_end - t_start)
-                    density = densities_p[k] - (densities_p[k]-densities[k])*(1 - r)**5
-                logging.info('%ld: %lf %lf %lf' % (k+1, densities_p[k], densities[k], density))
-                #recurrent weight
-                A = p[k*N:(k+1)*N, :]
-                #horizontal block structure (16) in input part, in real-time simultaneously computed for each 16 output using 2 registers (256x2 bits)
-                L = (A - torch.diag(torch.diag(A))).transpose(1, 0).reshape(N, N_16, 16)
-                S = torch.sum(L*L, -1)
-                SS, _ = torch.sort(S.reshape(-1))
-                thresh = SS[round(N*N_16*(1-density))]
-                mask = torch.clamp(torch.repeat_interleave((S>=thresh).float(), 16, dim=1) + ones, max=1).transpose(1,0)
-                p[k*N:(k+1)*N, :] = p[k*N:(k+1)*N, :]*mask # outputxinput
-        else:
-            for k in range(nb):
-                density = densities[k]
-                if iter_idx < t_end:
-                    r = 1 - (iter_idx-t_start)/(t_end - t_start)
-                    density = 1 - (1-densities[k])*(1 - r)**5
-                logging.info('%ld: 1 %lf %lf' % (k+1, densities[k], density))
-                #recurrent weight
-                A = p[k*N:(k+1)*N, :]
-                L = (A - torch.diag(torch.diag(A))).transpose(1, 0).reshape(N, N_16, 16)
-                S = torch.sum(L*L, -1)
-                SS, _ = torch.sort(S.reshape(-1))
-                thresh = SS[round(N*N_16*(1-density))]
-                mask = torch.clamp(torch.repeat_interleave((S>=thresh).float(), 16, dim=1) + ones, max=1).transpose(1,0)
-                p[k*N:(k+1)*N, :] = p[k*N:(k+1)*N, :]*mask
+    #horizontal block structure (16) in input part, in real-time simultaneously computed for each 16 output using 2 registers (256x2 bits)
+    block_sparsifier(model_waveform.gru.weight_hh_l0, iter_idx, t_start, t_end, interval, densities, densities_p=densities_p)
 
 
 def main():
@@ -283,6 +251,8 @@ def main():
                         type=float, help="dropout probability")
     parser.add_argument("--n_workers", default=2,
                         type=int, help="batch size (if set 0, utterance batch will be used)")
+    parser.add_argument("--feat_index", default=None,
+                        type=str, help="metadata index of the features, i.e., of the sets separated by @")
     parser.add_argument("--n_quantize", default=1024,
                         type=int, help="batch size (if set 0, utterance batch will be used)")
     parser.add_argument("--causal_conv_wave", default=False,
@@ -320,6 +290,8 @@ def main():
                         type=str, help="model path to restart training")
     parser.add_argument("--string_path", default=None,
                         type=str, help="model path to restart training")
+    parser.add_argument("--amp", default=False,
+                        type=strtobool, help="flag to use mixed precision training (no-op without cuda)")
     parser.add_argument("--GPU_device", default=None,
                         type=int, help="selection of GPU device")
     parser.add_argument("--verbose", default=1,
@@ -513,6 +485,14 @@ def main():
     #module_list += list(model_waveform.logits_sgns_c.parameters()) + list(model_waveform.logits_mags_c.parameters())
     #module_list += list(model_waveform.logits_sgns_f.parameters()) + list(model_waveform.logits_mags_f.parameters())
 
+    # mixed precision: model forwards under autocast, losses in float32, loss scaling for the optimizer
+    use_amp = args.amp and torch.cuda.is_available()
+    if args.amp and not use_amp:
+        logging.info("cuda is not available, mixed precision is disabled.")
+    if use_amp:
+        autocast_forward(model_waveform)
+    scaler = torch.cuda.amp.GradScaler(enabled=use_amp)
+
     # model = ...
     optimizer = optim.RAdam(
         module_list,
@@ -568,9 +548,10 @@ def main():
     assert len(wav_list) == len(feat_list)
     batch_size_utt = 8
     logging.info("number of training_data -- batch_size = %d -- %d" % (len(feat_list), batch_size_utt))
+    feat_index = load_index(args.feat_index)
     dataset = FeatureDatasetNeuVoco(wav_list, feat_list, pad_wav_transform, pad_feat_transform, args.upsampling_factor, 
                     args.string_path, wav_transform=wav_transform, n_bands=args.n_bands, with_excit=with_excit, cf_dim=args.cf_dim, spcidx=True,
-                        pad_left=model_waveform.pad_left, pad_right=model_waveform.pad_right, worgx_band_flag=True, worgx_flag=True, pad_wav_org_transform=pad_wav_org_transform)
+                        pad_left=model_waveform.pad_left, pad_right=model_waveform.pad_right, worgx_band_flag=True, worgx_flag=True, pad_wav_org_transform=pad_wav_org_transform, index=feat_index)
     dataloader = DataLoader(dataset, batch_size=batch_size_utt, shuffle=True, num_workers=args.n_workers)
     #generator = data_generator(dataloader, device, args.batch_size, args.upsampling_factor, limit_count=1, n_bands=args.n_bands)
     #generator = data_generator(dataloader, device, args.batch_size, args.upsampling_factor, limit_count=5, n_bands=args.n_bands)
@@ -604,7 +585,7 @@ def main():
     logging.info("number of evaluation_data -- batch_size_eval = %d -- %d" % (n_eval_data, batch_size_utt_eval))
     dataset_eval = FeatureDatasetNeuVoco(wav_list_eval, feat_list_eval, pad_wav_transform, pad_feat_transform, args.upsampling_factor, 
                     args.string_path, wav_transform=wav_transform, n_bands=args.n_bands, with_excit=with_excit, cf_dim=args.cf_dim, spcidx=True,
-                        pad_left=model_waveform.pad_left, pad_right=model_waveform.pad_right, worgx_band_flag=True, worgx_flag=True, pad_wav_org_transform=pad_wav_org_transform)
+                        pad_left=model_waveform.pad_left, pad_right=model_waveform.pad_right, worgx_band_flag=True, worgx_flag=True, pad_wav_org_transform=pad_wav_org_transform, index=feat_index)
     dataloader_eval = DataLoader(dataset_eval, batch_size=batch_size_utt_eval, shuffle=False, num_workers=args.n_workers)
     #generator_eval = data_generator(dataloader_eval, device, args.batch_size, args.upsampling_factor, limit_count=1, n_bands=args.n_bands)
     generator_eval = data_generator(dataloader_eval, device, args.batch_size, args.upsampling_factor, limit_count=None, n_bands=args.n_bands)
@@ -1447,7 +1428,8 @@ def main():
                 batch_x_output_fb = torch.index_select(batch_x_output_fb,0,idx_select_full)
             elif batch_loss > 0:
                 optimizer.zero_grad()
-                batch_loss.backward()
+                scaler.scale(batch_loss).backward()
+                scaler.unscale_(optimizer)
                 flag = False
                 for name, param in model_waveform.named_parameters():
                     if param.requires_grad:
@@ -1457,9 +1439,11 @@ def main():
                 if flag:
                     logging.info("explode grad")
                     optimizer.zero_grad()
+                    scaler.update()
                     continue
                 torch.nn.utils.clip_grad_norm_(model_waveform.parameters(), 10)
-                optimizer.step()
+                scaler.step(optimizer)
+                scaler.update()
 
                 with torch.no_grad():
                     if idx_stage < args.n_stage-1 and iter_idx + 1 == t_starts[idx_stage+1]:
@@ -1573,7 +1557,8 @@ def main():
         #logging.info(model_waveform.logits_f.weight[:,0])
 
         optimizer.zero_grad()
-        batch_loss.backward()
+        scaler.scale(batch_loss).backward()
+        scaler.unscale_(optimizer)
         flag = False
         for name, param in model_waveform.named_parameters():
             if param.requires_grad:
@@ -1583,9 +1568,11 @@ def main():
         if flag:
             logging.info("explode grad")
             optimizer.zero_grad()
+            scaler.update()
             continue
         torch.nn.utils.clip_grad_norm_(model_waveform.parameters(), 10)
-        optimizer.step()
+        scaler.step(optimizer)
+        scaler.update()
 
         #logging.info(model_waveform.logits_c.weight[:,0])
         #logging.info(model_waveform.logits_f.weight[:,0])
@@ -40,10 +40,13 @@ from vcneuvoco import SPKID_TRANSFORM_LAYER, GRU_SPK
 from vcneuvoco import GRU_WAVE_DECODER_DUALGRU_COMPACT_MBAND_CF, encode_mu_law
 from vcneuvoco import kl_laplace_laplace, kl_categorical_categorical_logits, GaussLoss
 from vcneuvoco import decode_mu_law_torch, MultiResolutionSTFTLoss
+from vcneuvoco import autocast_forward
+from sparsify import BlockSparsifier
 
 import torch_optimizer as optim
 
 from dataset import FeatureDatasetCycMceplf0WavVAE, FeatureDatasetEvalCycMceplf0WavVAE, padding
+from feat_index import load_index
 
 import librosa
 from dtw_c import dtw_c as dtw
@@ -368,49 +371,14 @@ def write_to_tensorboard(writer, steps, loss):
         writer.add_scalar(key, value, steps)
 
 
+block_sparsifier = BlockSparsifier()
+
+
 ## Based on lpcnet.py [https://github.com/mozilla/LPCNet/blob/master/src/lpcnet.py]
 ## Modified to accomodate PyTorch model and n-stages of sparsification
 def sparsify(model, iter_idx, t_start, t_end, interval, densities, densities_p=None):
-    if iter_idx < t_start or ((iter_idx-t_start) % interval != 0 and iter_idx < t_end):
-        pass
-    else:
-        logging.info('sparsify: %ld %ld %ld %ld' % (iter_idx, t_start, t_end, interval))
-        p = model.gru.weight_hh_l0 #recurrent
-        nb = p.shape[0] // p.shape[1]
-        N = p.shape[0] // nb
-        N_16 = N // 16
-        ones = torch.diag(torch.ones(N, device=p.device))
-        if densities_p is not None:
-            for k in range(nb):
-                density = densities[k]
-                if iter_idx < t_end:
-                    r = 1 - (iter_idx-t_start)/(t_end - t_start)
-                    density = densities_p[k] - (densities_p[k]-densities[k])*(1 - r)**5
-                logging.info('%ld: %lf %lf %lf' % (k+1, densities_p[k], densities[k], density))
-                #recurrent weight
-                A = p[k*N:(k+1)*N, :]
-                #horizontal block structure (16) in input part, in real-time simultaneously computed for each 16 output using 2 registers (256x2 bits)
-                L = (A - torch.diag(torch.diag(A))).transpose(1, 0).reshape(N, N_16, 16)
-                S = torch.sum(L*L, -1)
-                SS, _ = torch.sort(S.reshape(-1))
-                thresh = SS[round(N*N_16*(1-density))]
-                mask = torch.clamp(torch.repeat_interleave((S>=thresh).float(), 16, dim=1) + ones, max=1).transpose(1,0)
-                p[k*N:(k+1)*N, :] = p[k*N:(k+1)*N, :]*mask # outputxinput
-        else:
-            for k in range(nb):
-                density = densities[k]
-                if iter_idx < t_end:
-                    r = 1 - (iter_idx-t_start)/(t_end - t_start)
-                    density = 1 - (1-densities[k])*(1 - r)**5
-                logging.info('%ld: 1 %lf %lf' % (k+1, densities[k], density))
-                #recurrent weight
-                A = p[k*N:(k+1)*N, :]
-                L = (A - torch.diag(torch.diag(A))).transpose(1, 0).reshape(N, N_16, 16)
-                S = torch.sum(L*L, -1)
-                SS, _ = torch.sort(S.reshape(-1))
-                thresh = SS[round(N*N_16*(1-density))]
-                mask = torch.clamp(torch.repeat_interleave((S>=thresh).float(), 16, dim=1) + ones, max=1).transpose(1,0)
-                p[k*N:(k+1)*N, :] = p[k*N:(k+1)*N, :]*mask
+    #horizontal block structure (16) in input part, in real-time simultaneously computed for each 16 output using 2 registers (256x2 bits)
+    block_sparsifier(model.gru.weight_hh_l0, iter_idx, t_start, t_end, interval, densities, densities_p=densities_p)
 
 
 def main():
@@ -486,6 +454,8 @@ def main():
                         type=float, help="dropout probability")
     parser.add_argument("--n_workers", default=2,
                         type=int, help="batch size (if set 0, utterance batch will be used)")
+    parser.add_argument("--feat_index", default=None,
+                        type=str, help="metadata index of the features, i.e., of the sets separated by @")
     parser.add_argument("--n_half_cyc", default=2,
                         type=int, help="batch size (if set 0, utterance batch will be used)")
     parser.add_argument("--causal_conv_enc", default=False,
@@ -537,6 +507,8 @@ def main():
                         type=str, help="model path to restart training")
     #parser.add_argument("--string_path", default=None,
     #                    type=str, help="model path to restart training")
+    parser.add_argument("--amp", default=False,
+                        type=strtobool, help="flag to use mixed precision training (no-op without cuda)")
     parser.add_argument("--GPU_device", default=None,
                         type=int, help="selection of GPU device")
     parser.add_argument("--verbose", default=1,
@@ -886,6 +858,21 @@ def main():
     module_list += list(model_classifier.conv_feat_aux.parameters())
     module_list += list(model_classifier.gru.parameters()) + list(model_classifier.out.parameters())
 
+    # mixed precision: model forwards under autocast, losses in float32, loss scaling for the optimizer
+    use_amp = args.amp and torch.cuda.is_available()
+    if args.amp and not use_amp:
+        logging.info("cuda is not available, mixed precision is disabled.")
+    if use_amp:
+        autocast_forward(model_encoder_melsp_fix)
+        autocast_forward(model_encoder_melsp)
+        autocast_forward(model_decoder_melsp)
+        autocast_forward(model_encoder_excit_fix)
+        autocast_forward(model_encoder_excit)
+        autocast_forward(model_spkidtr)
+        autocast_forward(model_classifier)
+        autocast_forward(model_waveform)
+    scaler = torch.cuda.amp.GradScaler(enabled=use_amp)
+
     # model = ...
     optimizer = optim.RAdam(
         module_list,
@@ -954,10 +941,11 @@ def main():
     else:
         batch_size_utt = 1
     logging.info("number of training_data -- batch_size = %d -- %d " % (n_data, batch_size_utt))
+    feat_index = load_index(args.feat_index)
     dataset = FeatureDatasetCycMceplf0WavVAE(feat_list, pad_feat_transform, spk_list, stats_list,
                 args.n_half_cyc, args.string_path, magsp=True, worgx_flag=True,
                     wav_list=wav_list, pad_wav_transform=pad_wav_transform, wav_transform=wav_transform, pad_wav_org_transform=pad_wav_org_transform,
-                        cf_dim=args.cf_dim, upsampling_factor=args.upsampling_factor, n_bands=args.n_bands)
+                        cf_dim=args.cf_dim, upsampling_factor=args.upsampling_factor, n_bands=args.n_bands, index=feat_index)
     dataloader = DataLoader(dataset, batch_size=batch_size_utt, shuffle=True, num_workers=args.n_workers)
     #generator = train_generator(dataloader, device, args.batch_size, n_cv, args.upsampling_factor, limit_count=1, n_bands=args.n_bands)
     #generator = train_generator(dataloader, device, args.batch_size, n_cv, args.upsampling_factor, limit_count=20, n_bands=args.n_bands)
@@ -4097,7 +4085,8 @@ def main():
                         batch_sc_cv[i//2] = torch.index_select(batch_sc_cv[i//2],0,idx_select_full)
             else:
                 optimizer.zero_grad()
-                batch_loss.backward()
+                scaler.scale(batch_loss).backward()
+                scaler.unscale_(optimizer)
                 flag = False
                 explode_model = ""
                 for name, param in model_encoder_melsp.named_parameters():
@@ -4134,6 +4123,7 @@ def main():
                 if flag:
                     logging.info("explode grad %s" % (explode_model))
                     optimizer.zero_grad()
+                    scaler.update()
                     text_log = "batch loss_select %lf " % (batch_loss.item())
                     logging.info("%s (%.3f sec)" % (text_log, time.time() - start))
                     continue
@@ -4141,7 +4131,8 @@ def main():
                 torch.nn.utils.clip_grad_norm_(model_encoder_excit.parameters(), 10)
                 torch.nn.utils.clip_grad_norm_(model_decoder_melsp.parameters(), 10)
                 torch.nn.utils.clip_grad_norm_(model_spkidtr.parameters(), 10)
-                optimizer.step()
+                scaler.step(optimizer)
+                scaler.update()
 
                 with torch.no_grad():
                     if idx_stage < args.n_stage-1 and iter_idx + 1 == t_starts[idx_stage+1]:
@@ -4473,7 +4464,8 @@ def main():
         logging.info(model_spkidtr.embed_spk.weight[:4][:,:4])
 
         optimizer.zero_grad()
-        batch_loss.backward()
+        scaler.scale(batch_loss).backward()
+        scaler.unscale_(optimizer)
         flag = False
         explode_model = ""
         for name, param in model_encoder_melsp.named_parameters():
@@ -4510,6 +4502,7 @@ def main():
         if flag:
             logging.info("explode grad %s" % (explode_model))
             optimizer.zero_grad()
+            scaler.update()
             text_log = "batch loss [%d] %d %d %d %d %.3f %.3f " % (c_idx+1, x_ss, x_bs, f_ss, f_bs, batch_loss_sc_feat_in.item(), batch_loss_sc_feat_magsp_in.item())
             for i in range(args.n_half_cyc):
                 if i == 0:
@@ -4546,7 +4539,8 @@ def main():
         torch.nn.utils.clip_grad_norm_(model_encoder_excit.parameters(), 10)
         torch.nn.utils.clip_grad_norm_(model_decoder_melsp.parameters(), 10)
         torch.nn.utils.clip_grad_norm_(model_spkidtr.parameters(), 10)
-        optimizer.step()
+        scaler.step(optimizer)
+        scaler.update()
 
         logging.info(model_spkidtr.embed_spk.weight[:4][:,:4])
 
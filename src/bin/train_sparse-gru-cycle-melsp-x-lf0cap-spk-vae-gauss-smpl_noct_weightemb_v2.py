@@ -34,10 +34,13 @@ from utils import read_txt
 from vcneuvoco import GRU_VAE_ENCODER, GRU_SPEC_DECODER, GRU_LAT_FEAT_CLASSIFIER
 from vcneuvoco import GRU_EXCIT_DECODER, SPKID_TRANSFORM_LAYER
 from vcneuvoco import kl_laplace, kl_categorical_categorical_logits, GaussLoss
+from vcneuvoco import autocast_forward
+from sparsify import BlockSparsifier
 
 import torch_optimizer as optim
 
 from dataset import FeatureDatasetCycMceplf0WavVAE, FeatureDatasetEvalCycMceplf0WavVAE, padding
+from feat_index import load_index
 
 from dtw_c import dtw_c as dtw
 
@@ -303,49 +306,14 @@ def write_to_tensorboard(writer, steps, loss):
         writer.add_scalar(key, value, steps)
 
 
+block_sparsifier = BlockSparsifier()
+
+
 ## Based on lpcnet.py [https://github.com/mozilla/LPCNet/blob/master/src/lpcnet.py]
 ## Modified to accomodate PyTorch model and n-stages of sparsification
 def sparsify(model, iter_idx, t_start, t_end, interval, densities, densities_p=None):
-    if iter_idx < t_start or ((iter_idx-t_start) % interval != 0 and iter_idx < t_end):
-        pass
-    else:
-        logging.info('sparsify: %ld %ld %ld %ld' % (iter_idx, t_start, t_end, interval))
-        p = model.gru.weight_hh_l0 #recurrent
-        nb = p.shape[0] // p.shape[1]
-        N = p.shape[0] // nb
-        N_16 = N // 16
-        ones = torch.diag(torch.ones(N, device=p.device))
-        if densities_p is not None:
-            for k in range(nb):
-                density = densities[k]
-                if iter_idx < t_end:
-                    r = 1 - (iter_idx-t_start)/(t_end - t_start)
-                    density = densities_p[k] - (densities_p[k]-densities[k])*(1 - r)**5
-                logging.info('%ld: %lf %lf %lf' % (k+1, densities_p[k], densities[k], density))
-                #recurrent weight
-                A = p[k*N:(k+1)*N, :]
-                #horizontal block structure (16) in input part, in real-time simultaneously computed for each 16 output using 2 registers (256x2 bits)
-                L = (A - torch.diag(torch.diag(A))).transpose(1, 0).reshape(N, N_16, 16)
-                S = torch.sum(L*L, -1)
-                SS, _ = torch.sort(S.reshape(-1))
-                thresh = SS[round(N*N_16*(1-density))]
-                mask = torch.clamp(torch.repeat_interleave((S>=thresh).float(), 16, dim=1) + ones, max=1).transpose(1,0)
-                p[k*N:(k+1)*N, :] = p[k*N:(k+1)*N, :]*mask # outputxinput
-        else:
-            for k in range(nb):
-                density = densities[k]
-                if iter_idx < t_end:
-                    r = 1 - (iter_idx-t_start)/(t_end - t_start)
-                    density = 1 - (1-densities[k])*(1 - r)**5
-                logging.info('%ld: 1 %lf %lf' % (k+1, densities[k], density))
-                #recurrent weight
-                A = p[k*N:(k+1)*N, :]
-                L = (A - torch.diag(torch.diag(A))).transpose(1, 0).reshape(N, N_16, 16)
-                S = torch.sum(L*L, -1)
-                SS, _ = torch.sort(S.reshape(-1))
-                thresh = SS[round(N*N_16*(1-density))]
-                mask = torch.clamp(torch.repeat_interleave((S>=thresh).float(), 16, dim=1) + ones, max=1).transpose(1,0)
-                p[k*N:(k+1)*N, :] = p[k*N:(k+1)*N, :]*mask
+    #horizontal block structure (16) in input part, in real-time simultaneously computed for each 16 output using 2 registers (256x2 bits)
+    block_sparsifier(model.gru.weight_hh_l0, iter_idx, t_start, t_end, interval, densities, densities_p=densities_p)
 
 
 def main():
@@ -415,6 +383,8 @@ def main():
                         type=float, help="dropout probability")
     parser.add_argument("--n_workers", default=2,
                         type=int, help="batch size (if set 0, utterance batch will be used)")
+    parser.add_argument("--feat_index", default=None,
+                        type=str, help="metadata index of the features, i.e., of the sets separated by @")
     parser.add_argument("--n_half_cyc", default=2,
                         type=int, help="batch size (if set 0, utterance batch will be used)")
     parser.add_argument("--causal_conv_enc", default=False,
@@ -454,6 +424,8 @@ def main():
                         type=str, help="model path to restart training")
     #parser.add_argument("--string_path", default=None,
     #                    type=str, help="model path to restart training")
+    parser.add_argument("--amp", default=False,
+                        type=strtobool, help="flag to use mixed precision training (no-op without cuda)")
     parser.add_argument("--GPU_device", default=None,
                         type=int, help="selection of GPU device")
     parser.add_argument("--verbose", default=1,
@@ -726,6 +698,19 @@ def main():
     module_list += list(model_classifier.conv_lat.parameters()) + list(model_classifier.conv_feat.parameters())
     module_list += list(model_classifier.gru.parameters()) + list(model_classifier.out.parameters())
 
+    # mixed precision: model forwards under autocast, losses in float32, loss scaling for the optimizer
+    use_amp = args.amp and torch.cuda.is_available()
+    if args.amp and not use_amp:
+        logging.info("cuda is not available, mixed precision is disabled.")
+    if use_amp:
+        autocast_forward(model_encoder_melsp)
+        autocast_forward(model_decoder_melsp)
+        autocast_forward(model_encoder_excit)
+        autocast_forward(model_decoder_excit)
+        autocast_forward(model_classifier)
+        autocast_forward(model_spkidtr)
+    scaler = torch.cuda.amp.GradScaler(enabled=use_amp)
+
     # model = ...
     optimizer = optim.RAdam(
         module_list,
@@ -774,8 +759,9 @@ def main():
     else:
         batch_size_utt = 1
     logging.info("number of training_data -- batch_size = %d -- %d " % (n_data, batch_size_utt))
+    feat_index = load_index(args.feat_index)
     dataset = FeatureDatasetCycMceplf0WavVAE(feat_list, pad_feat_transform, spk_list, stats_list,
-                    args.n_half_cyc, args.string_path, excit_dim=args.full_excit_dim)
+                    args.n_half_cyc, args.string_path, excit_dim=args.full_excit_dim, index=feat_index)
     dataloader = DataLoader(dataset, batch_size=batch_size_utt, shuffle=True, num_workers=args.n_workers)
     #generator = train_generator(dataloader, device, args.batch_size, n_cv, limit_count=1)
     #generator = train_generator(dataloader, device, args.batch_size, n_cv, limit_count=20)
@@ -3049,8 +3035,9 @@ def main():
                             qy_logits_e[i+1] = torch.index_select(qy_logits_e[i+1],0,idx_select_full)
             else:
                 optimizer.zero_grad()
-                batch_loss.backward()
-                optimizer.step()
+                scaler.scale(batch_loss).backward()
+                scaler.step(optimizer)
+                scaler.update()
 
                 with torch.no_grad():
                     if idx_stage < args.n_stage-1 and iter_idx + 1 == t_starts[idx_stage+1]:
@@ -3298,8 +3285,9 @@ def main():
         logging.info(model_spkidtr.embed_spk.weight[:4][:,:4])
 
         optimizer.zero_grad()
-        batch_loss.backward()
-        optimizer.step()
+        scaler.scale(batch_loss).backward()
+        scaler.step(optimizer)
+        scaler.update()
 
         logging.info(model_spkidtr.embed_spk.weight[:4][:,:4])
 
@@ -0,0 +1,145 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright 2021 Patrick Lumban Tobing (Nagoya University)
+#  Apache 2.0  (http://www.apache.org/licenses/LICENSE-2.0)
+
+from __future__ import division
+
+from distutils.util import strtobool
+import argparse
+import json
+import logging
+import os
+import time
+
+import numpy as np
+import torch
+
+from vcneuvoco import DSWNV
+from dswnv_ring import DSWNVRingGenerator
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--outdir", required=True,
+                        type=str, help="directory to save the verification results")
+    parser.add_argument("--checkpoint", default=None,
+                        type=str, help="model file with model_waveform, random initialization if not set")
+    parser.add_argument("--n_quantize", default=256,
+                        type=int, help="number of quantization levels")
+    parser.add_argument("--n_aux", default=54,
+                        type=int, help="dimension of auxiliary features")
+    parser.add_argument("--hid_chn", default=192,
+                        type=int, help="number of hidden channels")
+    parser.add_argument("--skip_chn", default=256,
+                        type=int, help="number of skip channels")
+    parser.add_argument("--dilation_depth", default=3,
+                        type=int, help="depth of dilation")
+    parser.add_argument("--dilation_repeat", default=3,
+                        type=int, help="number of repeats of dilation")
+    parser.add_argument("--kernel_size", default=6,
+                        type=int, help="kernel size of dilated causal convolution")
+    parser.add_argument("--upsampling_factor", default=110,
+                        type=int, help="upsampling factor of auxiliary features")
+    parser.add_argument("--audio_in_flag", default=False,
+                        type=strtobool, help="flag to use audio input in the conditioning")
+    parser.add_argument("--wav_conv_flag", default=False,
+                        type=strtobool, help="flag to use convolution of the one-hot audio input")
+    parser.add_argument("--batch_size", default=2,
+                        type=int, help="number of utterances")
+    parser.add_argument("--n_frames", default=20,
+                        type=int, help="number of frames of the longest utterance")
+    parser.add_argument("--n_threads", default=1,
+                        type=int, help="number of cpu threads")
+    parser.add_argument("--seed", default=1,
+                        type=int, help="seed number")
+    parser.add_argument("--GPU_device", default=None,
+                        type=int, help="selection of GPU device, cpu if not set or negative")
+    parser.add_argument("--verbose", default=1,
+                        type=int, help="log level")
+    args = parser.parse_args()
+
+    if args.GPU_device is not None and args.GPU_device >= 0:
+        os.environ["CUDA_DEVICE_ORDER"]     = "PCI_BUS_ID"
+        os.environ["CUDA_VISIBLE_DEVICES"]  = str(args.GPU_device)
+
+    # check directory existence
+    if not os.path.exists(args.outdir):
+        os.makedirs(args.outdir)
+
+    # set log level
+    if args.verbose > 0:
+        logging.basicConfig(level=logging.INFO,
+                            format='%(asctime)s (%(module)s:%(lineno)d) %(levelname)s: %(message)s',
+                            datefmt='%m/%d/%Y %I:%M:%S',
+                            filename=args.outdir + "/verify.log")
+        logging.getLogger().addHandler(logging.StreamHandler())
+    else:
+        logging.basicConfig(level=logging.WARN,
+                            format='%(asctime)s (%(module)s:%(lineno)d) %(levelname)s: %(message)s',
+                            datefmt='%m/%d/%Y %I:%M:%S',
+                            filename=args.outdir + "/verify.log")
+        logging.getLogger().addHandler(logging.StreamHandler())
+        logging.warn("logging is disabled.")
+
+    os.environ['PYTHONHASHSEED'] = str(args.seed)
+    np.random.seed(args.seed)
+    torch.manual_seed(args.seed)
+    torch.set_num_threads(args.n_threads)
+
+    if args.GPU_device is not None and args.GPU_device >= 0 and torch.cuda.is_available():
+        device = torch.device("cuda")
+    else:
+        device = torch.device("cpu")
+    logging.info(device)
+
+    with torch.no_grad():
+        model = DSWNV(n_quantize=args.n_quantize, n_aux=args.n_aux, hid_chn=args.hid_chn, skip_chn=args.skip_chn,
+                    dilation_depth=args.dilation_depth, dilation_repeat=args.dilation_repeat,
+                    kernel_size=args.kernel_size, upsampling_factor=args.upsampling_factor,
+                    audio_in_flag=args.audio_in_flag, wav_conv_flag=args.wav_conv_flag)
+        if args.checkpoint is not None:
+            model.load_state_dict(torch.load(args.checkpoint, map_location=device)["model_waveform"])
+        model.to(device)
+        model.remove_weight_norm()
+        model.eval()
+        for param in model.parameters():
+            param.requires_grad = False
+        engine = DSWNVRingGenerator(model)
+
+        # utterances of different lengths, generation starts from the middle quantization level as in training
+        B = args.batch_size
+        aux = torch.randn(B, args.n_frames, args.n_aux, device=device)
+        n_frames_list = [max(args.n_frames - 3*b, 1) for b in range(B)]
+        n_samples_list = [n*args.upsampling_factor for n in n_frames_list]
+        audio = torch.empty(B, 1, device=device).fill_(args.n_quantize // 2).long()
+
+        torch.manual_seed(args.seed)
+        start = time.time()
+        ref = model.batch_fast_generate(audio, aux, n_samples_list)
+        time_ref = time.time() - start
+        logging.info("batch_fast_generate: %.3f sec." % (time_ref))
+
+        torch.manual_seed(args.seed)
+        start = time.time()
+        out = engine.generate(audio, aux, n_samples_list)
+        time_ring = time.time() - start
+        logging.info("ring buffer: %.3f sec." % (time_ring))
+
+    # samples are identical as long as no floating-point difference flips a draw, after which the streams diverge
+    results = {"batch_size": B, "n_samples": int(sum(n_samples_list)), "time_ref": time_ref, "time_ring": time_ring,
+                "speedup": time_ref / time_ring if time_ring > 0 else 0.0, "utts": []}
+    for b in range(B):
+        mismatch = np.nonzero(ref[b] != out[b])[0]
+        first = int(mismatch[0]) if len(mismatch) > 0 else -1
+        match_rate = float(np.mean(ref[b] == out[b])) if len(ref[b]) > 0 else 1.0
+        logging.info("utt %d: %d samples, first mismatch %d, match rate %.6f" % (b, len(ref[b]), first, match_rate))
+        results["utts"].append({"n_samples": int(len(ref[b])), "first_mismatch": first, "match_rate": match_rate})
+    logging.info("speed-up %.2fx" % (results["speedup"]))
+    with open(os.path.join(args.outdir, "verify_dswnv_generate.json"), "w") as f:
+        json.dump(results, f, indent=4)
+
+
+if __name__ == "__main__":
+    main()
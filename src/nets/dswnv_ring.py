@@ -0,0 +1,232 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2021 Patrick Lumban Tobing (Nagoya University)
+#  Apache 2.0  (http://www.apache.org/licenses/LICENSE-2.0)
+
+"""Ring-buffer fast generation of DSWNV."""
+
+import logging
+import time
+
+import torch
+import torch.nn.functional as F
+
+
+def ring_taps(size, kernel_size, dilation, device):
+    """Ring indices of the dilated-convolution taps for every write position.
+
+    Args:
+        size (int): Ring size, i.e., (kernel_size-1)*dilation+1.
+        kernel_size (int): Kernel size.
+        dilation (int): Dilation.
+        device (torch.device): Device.
+
+    Returns:
+        Tensor: Ring indices (size, kernel_size), row r gives the taps, oldest first, when the current input is at r.
+
+    """
+    r = torch.arange(size).unsqueeze(1)
+    k = torch.arange(kernel_size).unsqueeze(0)
+    return ((r - (kernel_size-1-k)*dilation) % size).to(device)
+
+
+class DSWNVRingGenerator(object):
+    """Fast generation engine of DSWNV with ring buffers of the dilated-convolution inputs.
+
+    Each dilated layer keeps its last (kernel_size-1)*dilation+1 inputs in a fixed-size ring buffer,
+    so that one generation step costs one GEMV per layer regardless of the utterance length (fast WaveNet).
+    The input convolution over the previous samples is a sum of embedding lookups of the one-hot input,
+    the conditioning projections of all layers are computed once per frame,
+    the skip projections of all layers are stacked into one GEMV, and samples are written into a preallocated output.
+    The sampling follows OneHotCategorical of batch_fast_generate, so both give the same samples with the same seed,
+    apart from rare flips due to the different floating-point summation order.
+
+    """
+
+    def __init__(self, model):
+        """Initialize generation engine.
+
+        Args:
+            model (DSWNV): Model in eval mode, with weight normalization removed.
+
+        """
+        self.model = model
+        device = next(model.parameters()).device
+        self.device = device
+        K = model.kernel_size
+        H = model.n_hidch
+        self.n_layers = len(model.dil_facts)
+        with torch.no_grad():
+            # input causal convolution of the previous samples, as embeddings of the one-hot input if no wav_conv
+            w_causal = model.causal.conv.weight # H x C_in x K
+            self.b_causal = model.causal.conv.bias
+            if model.wav_conv_flag:
+                self.w_wav = model.wav_conv.weight[:,:,0].t().contiguous() # n_quantize x H
+                self.b_wav = model.wav_conv.bias
+                self.w_causal = w_causal.reshape(H, -1)
+            else:
+                self.w_causal = w_causal.permute(2,1,0).contiguous() # K x n_quantize x H
+            self.k_range = torch.arange(K, device=device)
+            self.causal_taps = ring_taps(K, K, model.causal.dilation, device)
+
+            # conditioning projections of all layers
+            w_in = torch.cat([m.weight[:,:,0] for m in model.in_x], 0) # L*2H x in_tot_dim
+            self.w_in_aux = w_in[:,:model.in_aux_dim].contiguous()
+            if model.audio_in_flag:
+                self.w_in_audio = w_in[:,model.in_aux_dim:].t().contiguous() # n_quantize x L*2H
+            self.b_in = torch.cat([m.bias for m in model.in_x], 0)
+
+            # dilated convolutions and their rings
+            self.w_dil = [m.conv.weight.reshape(2*H, -1) for m in model.dil_h] # 2H x H*K
+            self.b_dil = [m.conv.bias for m in model.dil_h]
+            self.ring_sizes = [model.padding[l]+1 for l in range(self.n_layers)]
+            self.dil_taps = [ring_taps(self.ring_sizes[l], K, model.dil_h[l].dilation, device) \
+                                for l in range(self.n_layers)]
+
+            # stacked skip projections
+            self.w_skip = torch.cat([m.weight[:,:,0] for m in model.out_skip], 1) # S x L*H
+            self.b_skip = sum([m.bias for m in model.out_skip])
+            self.w_out_1 = model.out_1.weight[:,:,0]
+            self.b_out_1 = model.out_1.bias
+            self.w_out_2 = model.out_2.weight[:,:,0]
+            self.b_out_2 = model.out_2.bias
+
+    def reset(self, aux, audio):
+        """Compute the conditioning and fill the rings with the initial samples as in batch_fast_generate.
+
+        Args:
+            aux (Tensor): Auxiliary features (B x T_frm x n_aux).
+            audio (Tensor): Initial sample indices (B x T_init), the last one is the input of the first step.
+
+        """
+        model = self.model
+        K = model.kernel_size
+        with torch.no_grad():
+            aux = F.pad(aux.transpose(1,2), (model.pad_left,model.pad_right), "replicate").transpose(1,2)
+            x = model.upsampling(model.conv_s_c(model.conv(model.scale_in(aux.transpose(1,2))))) # B x C x T
+            n_pad = model.receptive_field
+            audio = F.pad(audio, (n_pad, 0), "constant", model.n_quantize // 2)
+            self.x = F.pad(x, (n_pad, 0), "replicate")
+            B = audio.shape[0]
+            P = audio.shape[1] - 1 # position of the first step
+            self.p = P
+            self.cache_start = None
+
+            # histories of the initial positions before P
+            onehot = F.one_hot(audio, num_classes=model.n_quantize).float().transpose(1,2)
+            if not model.audio_in_flag:
+                x_ = self.x[:,:,:audio.shape[1]]
+            else:
+                x_ = torch.cat((self.x[:,:,:audio.shape[1]],onehot),1)
+            if model.wav_conv_flag:
+                emb = model.wav_conv(onehot)
+                h = F.softsign(model.causal(emb))
+                self.causal_ring = torch.zeros(B, model.n_hidch, K, device=self.device)
+                for q in range(max(P-K+1,0), P):
+                    self.causal_ring[:,:,q%K] = emb[:,:,q]
+            else:
+                h = F.softsign(model.causal(onehot))
+                self.causal_ring = torch.empty(B, K, device=self.device).fill_(model.n_quantize // 2).long()
+                for q in range(max(P-K+1,0), P):
+                    self.causal_ring[:,q%K] = audio[:,q]
+            self.rings = []
+            for l in range(self.n_layers):
+                S = self.ring_sizes[l]
+                ring = torch.zeros(B, model.n_hidch, S, device=self.device)
+                for q in range(max(P-S+1,0), P):
+                    ring[:,:,q%S] = h[:,:,q]
+                self.rings.append(ring)
+                _, h = model._dcrnn_forward(x_, h, model.in_x[l], model.dil_h[l], model.out_skip[l])
+
+    def step(self, s):
+        """Compute the output logits of the next sample.
+
+        Args:
+            s (Tensor): Sample indices at the current position (B).
+
+        Returns:
+            Tensor: Logits of the next sample (B x n_quantize).
+
+        """
+        model = self.model
+        K = model.kernel_size
+        H = model.n_hidch
+        p = self.p
+        B = s.shape[0]
+
+        # input causal convolution
+        r = p % K
+        if model.wav_conv_flag:
+            self.causal_ring[:,:,r] = self.w_wav[s] + self.b_wav
+            taps = self.causal_ring.index_select(2, self.causal_taps[r]) # B x H x K
+            h = F.softsign(F.linear(taps.reshape(B,-1), self.w_causal, self.b_causal))
+        else:
+            self.causal_ring[:,r] = s
+            taps = self.causal_ring.index_select(1, self.causal_taps[r]) # B x K
+            h = F.softsign(self.w_causal[self.k_range,taps].sum(1) + self.b_causal)
+
+        # conditioning projections of all layers, computed once per frame
+        if self.cache_start is None or p - self.cache_start >= model.upsampling_factor:
+            self.cache_start = p
+            self.in_cache = torch.matmul(self.w_in_aux, self.x[:,:,p:p+model.upsampling_factor]) \
+                                + self.b_in.unsqueeze(-1) # B x L*2H x upsampling_factor
+        x_in = self.in_cache[:,:,p-self.cache_start]
+        if model.audio_in_flag:
+            x_in = x_in + self.w_in_audio[s]
+
+        # dilated layers
+        hs = []
+        for l in range(self.n_layers):
+            ring = self.rings[l]
+            r = p % self.ring_sizes[l]
+            ring[:,:,r] = h
+            taps = ring.index_select(2, self.dil_taps[l][r]) # B x H x K
+            x_h_ = x_in[:,l*2*H:(l+1)*2*H] * F.linear(taps.reshape(B,-1), self.w_dil[l], self.b_dil[l])
+            z = torch.sigmoid(x_h_[:,:H])
+            h = (1-z)*torch.tanh(x_h_[:,H:]) + z*h
+            hs.append(h)
+        self.p += 1
+
+        # output
+        skip = F.linear(torch.cat(hs, 1), self.w_skip, self.b_skip)
+        return F.linear(F.relu(F.linear(F.relu(skip), self.w_out_1, self.b_out_1)), self.w_out_2, self.b_out_2)
+
+    def generate(self, audio, aux, n_samples_list, intervals=4410):
+        """Generate waveforms with the same interface as DSWNV.batch_fast_generate.
+
+        Args:
+            audio (Tensor): Initial sample indices (B x T_init).
+            aux (Tensor): Auxiliary features (B x T_frm x n_aux).
+            n_samples_list (list): Number of samples of each utterance.
+            intervals (int): Log interval of generated samples.
+
+        Returns:
+            list: Sample indices of each utterance (ndarray).
+
+        """
+        with torch.no_grad():
+            max_samples = max(n_samples_list)
+            audio = audio.to(self.device)
+            self.reset(aux, audio)
+            B = audio.shape[0]
+            out_samples = torch.empty(B, max_samples, device=self.device).long()
+            s = audio[:,-1]
+            start = time.time()
+            start_all = start
+            for i in range(max_samples):
+                probs = F.softmax(self.step(s), dim=-1)
+                # as OneHotCategorical(probs).sample()
+                s = torch.multinomial(probs / probs.sum(-1, keepdim=True), 1, True)[:,0]
+                out_samples[:,i] = s
+                if (i + 1) % intervals == 0:
+                    logging.info("%d/%d estimated time = %.6f sec (%.6f sec / sample)" % (
+                        (i + 1), max_samples,
+                        (max_samples - i - 1) * ((time.time() - start) / intervals),
+                        (time.time() - start) / intervals))
+                    start = time.time()
+            logging.info("average time / sample = %.6f sec (%ld samples) [%.3f kHz/s]" % (
+                        (time.time() - start_all) / max_samples, max_samples,
+                        max_samples / (1000*(time.time() - start_all))))
+
+            samples = out_samples.cpu().numpy()
+            return [samples[b,:n_s] for b, n_s in enumerate(n_samples_list)]
@@ -0,0 +1,235 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2021 Patrick Lumban Tobing (Nagoya University)
+#  Apache 2.0  (http://www.apache.org/licenses/LICENSE-2.0)
+
+"""Inference-time freezing of CycleVAE and MWDLP modules."""
+
+import copy
+import logging
+
+import numpy as np
+import torch
+from torch import nn
+
+from vcneuvoco import DualFC_, GRU_SPEC_DECODER, MIN_CLAMP, MAX_CLAMP
+
+
+class ChannelAffine(nn.Module):
+    """Channel-wise affine layer replacing a diagonal 1x1 convolution."""
+
+    def __init__(self, weight, bias):
+        """Initialize channel-wise affine layer.
+
+        Args:
+            weight (Tensor): Scale of each channel (C).
+            bias (Tensor): Shift of each channel (C).
+
+        """
+        super(ChannelAffine, self).__init__()
+        self.register_buffer("weight", weight.reshape(1, -1, 1))
+        self.register_buffer("bias", bias.reshape(1, -1, 1))
+
+    def forward(self, x):
+        """Calculate forward propagation.
+
+        Args:
+            x (Tensor): Input tensor (B, C, T).
+
+        Returns:
+            Tensor: Output tensor (B, C, T).
+
+        """
+        return torch.addcmul(self.bias, x, self.weight)
+
+
+def remove_weight_norm(model):
+    """Remove weight normalization from all of the Conv1d layers of a model.
+
+    Args:
+        model (torch.nn.Module): Model instance.
+
+    """
+    def _remove_weight_norm(m):
+        if isinstance(m, nn.Conv1d) and hasattr(m, "weight_g"):
+            torch.nn.utils.remove_weight_norm(m)
+
+    model.apply(_remove_weight_norm)
+
+
+def _first_conv(module):
+    if isinstance(module, nn.Conv1d):
+        return module
+    for m in module.modules():
+        if isinstance(m, nn.Conv1d):
+            return m
+    return None
+
+
+def _max_dev(x, y):
+    """Maximum absolute deviation between (nested) outputs."""
+    if isinstance(x, torch.Tensor):
+        if x.is_floating_point():
+            return (x - y).abs().max().item()
+        return float((x != y).any().item())
+    elif isinstance(x, (list, tuple)):
+        return max([_max_dev(x_, y_) for x_, y_ in zip(x, y)] + [0.0])
+    return 0.0
+
+
+def _scale_in_consumer(model):
+    """Get the Conv1d layer directly consuming the output of scale_in, None if it cannot be folded."""
+    if not hasattr(model, "scale_in") or not isinstance(model.scale_in, nn.Conv1d):
+        return None
+    if getattr(model, "scale_in_flag", True) is False:
+        return None
+    if isinstance(model, GRU_SPEC_DECODER) and model.red_dim_upd is not None:
+        # scale_in is conditionally bypassed depending on the inputs
+        return None
+    if getattr(model, "red_dim", None) is not None and hasattr(model, "in_red"):
+        conv = _first_conv(model.in_red)
+    else:
+        conv = _first_conv(model.conv)
+    if conv is None or conv.padding[0] != 0 or conv.groups != 1 or conv.in_channels < model.scale_in.out_channels:
+        # zero-padding would see un-normalized zeros after folding
+        return None
+    return conv
+
+
+def fold_scale_in(model, n_probe=16):
+    """Fold the scale_in 1x1 convolution into the convolution consuming it.
+
+    The normalized features are always the trailing channels of the consumer input,
+    i.e., z = [y, aux, scale_in(x)], hence the folding:
+        W'[:, -D:, k] = W[:, -D:, k] @ W_s; b' = b + sum_k W[:, -D:, k] @ b_s.
+
+    Args:
+        model (torch.nn.Module): Model instance without weight norm.
+        n_probe (int): Number of frames of the random probe input to check the folding.
+
+    Returns:
+        float: Maximum absolute deviation of the consumer output on the probe input, None if not folded.
+
+    """
+    conv = _scale_in_consumer(model)
+    if conv is None:
+        return None
+    scale_in = model.scale_in
+    D = scale_in.out_channels
+    w_s = scale_in.weight.data[:,:,0] # D x D
+    b_s = scale_in.bias.data if scale_in.bias is not None else torch.zeros(D, device=w_s.device)
+
+    with torch.no_grad():
+        # probe before folding
+        x = torch.randn(1, conv.in_channels, n_probe+(conv.kernel_size[0]-1)*conv.dilation[0], device=w_s.device)
+        y_ref = conv(torch.cat((x[:,:-D], scale_in(x[:,-D:])), 1))
+
+        w = conv.weight.data # C_out x C_in x K
+        w_x = w[:,-D:] # C_out x D x K
+        if conv.bias is None:
+            conv.bias = nn.Parameter(torch.zeros(conv.out_channels, device=w.device))
+        conv.bias.data += torch.einsum('odk,d->o', w_x, b_s)
+        w[:,-D:] = torch.einsum('odk,de->oek', w_x, w_s)
+        model.scale_in = nn.Identity()
+
+        dev = (conv(x) - y_ref).abs().max().item()
+    logging.info("scale_in is folded into %s, max. abs. deviation %.3e" % (conv, dev))
+    return dev
+
+
+def diag_scale_out(model, tol=0):
+    """Replace a diagonal scale_out 1x1 convolution with a channel-wise affine layer.
+
+    scale_out follows a nonlinearity, so it is not folded into the output layer, but as it is
+    initialized and kept as a diagonal denormalization, the matrix product is not needed.
+
+    Args:
+        model (torch.nn.Module): Model instance without weight norm.
+        tol (float): Tolerance of the off-diagonal elements.
+
+    Returns:
+        bool: True if replaced.
+
+    """
+    if not hasattr(model, "scale_out") or not isinstance(model.scale_out, nn.Conv1d):
+        return False
+    w = model.scale_out.weight.data[:,:,0]
+    if w.shape[0] != w.shape[1] or (w - torch.diag(torch.diag(w))).abs().max().item() > tol:
+        return False
+    b = model.scale_out.bias.data if model.scale_out.bias is not None else torch.zeros(w.shape[0], device=w.device)
+    model.scale_out = ChannelAffine(torch.diag(w).clone(), b.clone())
+    logging.info("scale_out is replaced with channel-wise affine layer")
+    return True
+
+
+def fold_dualfc_fact(dualfc):
+    """Fold the positive factor of a DualFC into its first convolution.
+
+    As relu(W x + b) * f = relu(f W x + f b) for f > 0, the factor 0.5*exp(fact) is folded into conv,
+    and the multiplication is skipped in forward. fact is set so that the factor becomes one,
+    to keep the weights consistent for the scripts reading fact directly, e.g., the C dump.
+
+    Args:
+        dualfc (DualFC_): DualFC instance without weight norm.
+
+    Returns:
+        bool: True if folded, False if already folded.
+
+    """
+    if dualfc.fact_folded:
+        return False
+    with torch.no_grad():
+        fact = 0.5*torch.exp(torch.clamp(dualfc.fact.weight.data[0], min=MIN_CLAMP, max=MAX_CLAMP))
+        dualfc.conv.weight.data *= fact.reshape(-1, 1, 1)
+        if dualfc.conv.bias is not None:
+            dualfc.conv.bias.data *= fact
+        dualfc.fact.weight.data.fill_(np.log(2))
+    dualfc.fact_folded = True
+    return True
+
+
+def freeze_model(model, inputs=None, kwargs=None, seed=1):
+    """Freeze a model for inference.
+
+    Weight norm is removed, scale_in is folded into the next convolution, a diagonal scale_out
+    is made channel-wise, and the DualFC factors are folded into their convolution, so that
+    their exp and multiplication are skipped in forward.
+
+    Args:
+        model (torch.nn.Module): Model instance, modified in-place.
+        inputs (tuple): Example inputs of forward to report the model-level deviation.
+        kwargs (dict): Example keyword arguments of forward.
+        seed (int): Random seed to compare forwards with sampling.
+
+    Returns:
+        dict: Deviation report.
+
+    """
+    report = {}
+    if inputs is not None:
+        model_ref = copy.deepcopy(model)
+        remove_weight_norm(model_ref)
+        model_ref.eval()
+    remove_weight_norm(model)
+    model.eval()
+    report["scale_in"] = fold_scale_in(model)
+    report["scale_out"] = diag_scale_out(model)
+    n_dualfc = 0
+    for m in model.modules():
+        if isinstance(m, DualFC_):
+            if fold_dualfc_fact(m):
+                n_dualfc += 1
+    report["dualfc"] = n_dualfc
+    if inputs is not None:
+        if kwargs is None:
+            kwargs = {}
+        with torch.no_grad():
+            torch.manual_seed(seed)
+            out_ref = model_ref(*inputs, **kwargs)
+            torch.manual_seed(seed)
+            out = model(*inputs, **kwargs)
+        report["max_abs_dev"] = _max_dev(out_ref, out)
+        logging.info("frozen %s: max. abs. deviation %.3e" % (model.__class__.__name__, report["max_abs_dev"]))
+    logging.info(report)
+
+    return report
@@ -0,0 +1,279 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2021 Patrick Lumban Tobing (Nagoya University)
+#  Apache 2.0  (http://www.apache.org/licenses/LICENSE-2.0)
+
+"""Continuous-batching scheduler of MWDLP waveform generation streams."""
+
+import collections
+import time
+
+import numpy as np
+import torch
+import torch.nn.functional as F
+
+from vcneuvoco import decode_mu_law_torch
+
+
+class MWDLPStream(object):
+    """Generation stream of an utterance."""
+
+    def __init__(self, utt_id, feat, t_submit):
+        """Initialize stream.
+
+        Args:
+            utt_id (str): Utterance id.
+            feat (Tensor): Input features (T x C).
+            t_submit (float): Submission time.
+
+        """
+        self.utt_id = utt_id
+        self.feat = feat
+        self.n_frames = feat.shape[0]
+        self.cond = None # T x C conditioning after the input convolution
+        self.frame = 0
+        self.x_c = []
+        self.x_f = []
+        self.t_submit = t_submit
+        self.t_admit = None
+        self.t_first = None
+        self.t_finish = None
+
+
+class MWDLPStreamScheduler(object):
+    """Continuous-batching scheduler around GRU_WAVE_DECODER_DUALGRU_COMPACT_MBAND_CF.
+
+    A fixed number of slots holds the GRU states, previous samples, and LPC buffers of the active streams.
+    The scheduler generates one frame (upsampling_factor steps) of every active stream at a time,
+    then frees the slots of finished streams and admits queued utterances into free slots,
+    so that the batch stays full when utterance lengths vary.
+    The device follows the model, i.e., CPU or GPU.
+
+    """
+
+    def __init__(self, model, capacity=16, pqmf=None):
+        """Initialize scheduler.
+
+        Args:
+            model (GRU_WAVE_DECODER_DUALGRU_COMPACT_MBAND_CF): Wave decoder in eval mode.
+            capacity (int): Number of slots, i.e., maximum batch size.
+            pqmf (PQMF): PQMF synthesis of the finished band samples, band samples are returned if None.
+
+        """
+        self.model = model
+        self.capacity = capacity
+        self.pqmf = pqmf
+        self.device = next(model.parameters()).device
+        self.c_pad = (model.n_quantize // 2) // model.cf_dim
+        self.f_pad = (model.n_quantize // 2) % model.cf_dim
+        K = capacity
+        self.h = torch.zeros(1, K, model.gru.hidden_size, device=self.device)
+        self.h_2 = torch.zeros(1, K, model.gru_2.hidden_size, device=self.device)
+        self.h_f = torch.zeros(1, K, model.gru_f.hidden_size, device=self.device)
+        self.x_c_wav = torch.empty(K, 1, model.n_bands, device=self.device).fill_(self.c_pad).long()
+        self.x_f_wav = torch.empty(K, 1, model.n_bands, device=self.device).fill_(self.f_pad).long()
+        if model.lpc > 0:
+            self.x_c_lpc = torch.empty(K, 1, model.n_bands, model.lpc, device=self.device).fill_(self.c_pad).long()
+            self.x_f_lpc = torch.empty(K, 1, model.n_bands, model.lpc, device=self.device).fill_(self.f_pad).long()
+        self.slots = [None]*K
+        self.queue = collections.deque()
+        self.empty_streams = []
+        self.finished_streams = []
+        self.n_slot_frames = 0
+        self.n_active_frames = 0
+        self.t_start = None
+
+    def submit(self, utt_id, feat):
+        """Queue an utterance.
+
+        Args:
+            utt_id (str): Utterance id.
+            feat (ndarray or Tensor): Input features (T x C).
+
+        """
+        feat = torch.as_tensor(np.asarray(feat, dtype=np.float32) if isinstance(feat, np.ndarray) else feat,
+                    device=self.device).float()
+        self.queue.append(MWDLPStream(utt_id, feat, time.time()))
+
+    def n_active(self):
+        """Number of active streams."""
+        return sum([s is not None for s in self.slots])
+
+    def done(self):
+        """Whether all submitted utterances are finished."""
+        return len(self.queue) == 0 and self.n_active() == 0
+
+    def condition(self, feat):
+        """Compute the conditioning of an utterance with replicate padding as in generate.
+
+        Args:
+            feat (Tensor): Input features (T x C).
+
+        Returns:
+            Tensor: Conditioning (T x C').
+
+        """
+        model = self.model
+        c = F.pad(feat.unsqueeze(0).transpose(1,2), (model.pad_left,model.pad_right), "replicate")
+        if model.scale_in_flag:
+            c = model.conv_s_c(model.conv(model.scale_in(c))).transpose(1,2)
+        else:
+            c = model.conv_s_c(model.conv(c)).transpose(1,2)
+        return c[0]
+
+    def admit(self):
+        """Admit queued utterances into free slots and reset their states."""
+        for k in range(self.capacity):
+            if len(self.queue) == 0:
+                break
+            if self.slots[k] is not None:
+                continue
+            stream = self.queue.popleft()
+            if stream.n_frames == 0:
+                stream.t_admit = stream.t_first = stream.t_finish = time.time()
+                self.empty_streams.append(stream)
+                continue
+            stream.cond = self.condition(stream.feat)
+            stream.t_admit = time.time()
+            self.h[:,k] = 0
+            self.h_2[:,k] = 0
+            self.h_f[:,k] = 0
+            self.x_c_wav[k] = self.c_pad
+            self.x_f_wav[k] = self.f_pad
+            if self.model.lpc > 0:
+                self.x_c_lpc[k] = self.c_pad
+                self.x_f_lpc[k] = self.f_pad
+            self.slots[k] = stream
+
+    def finish(self, stream):
+        """Decode the band samples of a finished stream.
+
+        Args:
+            stream (MWDLPStream): Finished stream.
+
+        Returns:
+            Tensor: Waveform (n_frames*upsampling_factor*n_bands) if pqmf is set,
+                otherwise band samples (n_bands x n_frames*upsampling_factor).
+
+        """
+        model = self.model
+        x = (torch.cat(stream.x_c, 0)*model.cf_dim+torch.cat(stream.x_f, 0)).transpose(0,1).float()
+        stream.x_c = stream.x_f = None
+        if model.n_quantize == 65536:
+            x = (x - 32768.0) / 32768.0
+        else:
+            x = decode_mu_law_torch(x, mu=model.n_quantize)
+        if self.pqmf is not None:
+            x = self.pqmf.synthesis(x.unsqueeze(0))[0,0]
+        stream.t_finish = time.time()
+        return x
+
+    def step(self):
+        """Admit queued utterances and generate one frame of every active stream.
+
+        Returns:
+            list: (utt_id, samples) of the streams finished at this step, see finish.
+
+        """
+        if self.t_start is None:
+            self.t_start = time.time()
+        self.admit()
+        results = [(s.utt_id, torch.zeros(0, device=self.device)) for s in self.empty_streams]
+        self.finished_streams.extend(self.empty_streams)
+        self.empty_streams = []
+        active = [k for k in range(self.capacity) if self.slots[k] is not None]
+        if len(active) == 0:
+            return results
+        model = self.model
+        upsampling_factor = model.upsampling_factor
+        B = len(active)
+        self.n_slot_frames += self.capacity
+        self.n_active_frames += B
+
+        # gather the states of the active slots
+        idx = torch.LongTensor(active).to(self.device)
+        c_f = torch.stack([self.slots[k].cond[self.slots[k].frame] for k in active]).unsqueeze(1) # B x 1 x C
+        h = self.h[:,idx]
+        h_2 = self.h_2[:,idx]
+        h_f = self.h_f[:,idx]
+        x_c_wav = self.x_c_wav[idx]
+        x_f_wav = self.x_f_wav[idx]
+        if model.lpc > 0:
+            x_c_lpc = self.x_c_lpc[idx]
+            x_f_lpc = self.x_f_lpc[idx]
+        else:
+            x_c_lpc = x_f_lpc = None
+
+        x_c_out = torch.empty(B, upsampling_factor, model.n_bands, device=self.device).long()
+        x_f_out = torch.empty(B, upsampling_factor, model.n_bands, device=self.device).long()
+        for t in range(upsampling_factor):
+            x_c_wav, x_f_wav, h, h_2, h_f = model.generate_step(c_f, x_c_wav, x_f_wav, h=h, h_2=h_2, h_f=h_f,
+                                                x_c_lpc=x_c_lpc, x_f_lpc=x_f_lpc)
+            x_c_out[:,t] = x_c_wav[:,0]
+            x_f_out[:,t] = x_f_wav[:,0]
+
+        # scatter back the states, and free the slots of the finished streams
+        self.h[:,idx] = h
+        self.h_2[:,idx] = h_2
+        self.h_f[:,idx] = h_f
+        self.x_c_wav[idx] = x_c_wav
+        self.x_f_wav[idx] = x_f_wav
+        if model.lpc > 0:
+            self.x_c_lpc[idx] = x_c_lpc
+            self.x_f_lpc[idx] = x_f_lpc
+        t_frame = time.time()
+        for i, k in enumerate(active):
+            stream = self.slots[k]
+            stream.x_c.append(x_c_out[i])
+            stream.x_f.append(x_f_out[i])
+            stream.frame += 1
+            if stream.t_first is None:
+                stream.t_first = t_frame
+            if stream.frame >= stream.n_frames:
+                results.append((stream.utt_id, self.finish(stream)))
+                self.finished_streams.append(stream)
+                self.slots[k] = None
+        return results
+
+    def run(self, callback=None):
+        """Generate all submitted utterances.
+
+        Args:
+            callback (function): Called as callback(utt_id, samples) for each finished utterance.
+
+        Returns:
+            list: (utt_id, samples) of the finished utterances if callback is None.
+
+        """
+        results = []
+        while not self.done():
+            for utt_id, samples in self.step():
+                if callback is not None:
+                    callback(utt_id, samples)
+                else:
+                    results.append((utt_id, samples))
+        return results
+
+    def metrics(self):
+        """Throughput and latency metrics of the finished streams.
+
+        Returns:
+            dict: Number of utterances and generated samples, elapsed time, samples per second,
+                slot occupancy, and mean/50th/95th percentiles of the queueing time (submit to admit),
+                first-frame latency (submit to first frame), and latency (submit to finish) in seconds.
+
+        """
+        streams = self.finished_streams
+        elapsed = (max([s.t_finish for s in streams]) - self.t_start) if len(streams) > 0 else 0.0
+        n_samples = int(sum([s.n_frames for s in streams])) * self.model.upsampling_factor * self.model.n_bands
+        metrics = {"n_utts": len(streams), "n_samples": n_samples, "elapsed": elapsed,
+                    "samples_per_sec": n_samples / elapsed if elapsed > 0 else 0.0,
+                    "occupancy": self.n_active_frames / self.n_slot_frames if self.n_slot_frames > 0 else 0.0}
+        for name, values in [("queue", [s.t_admit - s.t_submit for s in streams]),
+                                ("first_frame", [s.t_first - s.t_submit for s in streams]),
+                                ("latency", [s.t_finish - s.t_submit for s in streams])]:
+            if len(values) > 0:
+                metrics[name+"_mean"] = float(np.mean(values))
+                metrics[name+"_p50"] = float(np.percentile(values, 50))
+                metrics[name+"_p95"] = float(np.percentile(values, 95))
+        return metrics
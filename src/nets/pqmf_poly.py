@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2021 Patrick Lumban Tobing (Nagoya University)
+#  Apache 2.0  (http://www.apache.org/licenses/LICENSE-2.0)
+
+"""Polyphase PQMF modules with streaming state."""
+
+import torch
+import torch.nn.functional as F
+
+from pqmf import PQMF
+
+
+class PolyphasePQMF(torch.nn.Module):
+    """Polyphase PQMF module.
+
+    This computes the same analysis and synthesis as PQMF, but at the subband rate.
+    The analysis filters are decomposed into n_bands phases, so that the strided full-rate convolution
+    becomes a convolution of the n_bands phase signals with kernels of ceil((taps+1)/n_bands) frames,
+    and the synthesis is the same with the upsampling folded into the filters.
+    This removes the multiply-accumulates of the samples discarded by the downsampling
+    and the zeros inserted by the upsampling, i.e., a factor of n_bands.
+
+    The streaming methods process consecutive chunks with the history kept in a state,
+    and give the same output as the whole signal after the last chunk with flush=True.
+
+    """
+
+    def __init__(self, subbands=4, pqmf=None):
+        """Initialize polyphase PQMF module.
+
+        Args:
+            subbands (int): The number of subbands.
+            pqmf (PQMF): PQMF module whose filters are used, a new one with subbands if None.
+
+        """
+        super(PolyphasePQMF, self).__init__()
+        if pqmf is None:
+            pqmf = PQMF(subbands)
+        self.subbands = N = pqmf.subbands
+        self.taps = pqmf.taps
+        self.pad = P = pqmf.taps // 2
+        L = pqmf.taps + 1
+
+        # analysis: n_bands x (taps+1) --> n_bands x n_phases x Q, W[k,r,q] = h_k[q*N+r]
+        self.n_frames_ana = Q = (L + N - 1) // N
+        h = F.pad(pqmf.analysis_filter.data[:,0].cpu(), (0, Q*N-L))
+        self.register_buffer("analysis_weight", h.reshape(N, Q, N).transpose(1, 2).contiguous())
+
+        # synthesis: n_phases x n_bands x K, W[r,k,i] = N * g_k[(i-pad_left)*N+P-r]
+        self.pad_left = P // N
+        self.pad_right = (P + N - 1) // N
+        self.n_frames_syn = K = self.pad_left + self.pad_right + 1
+        g = pqmf.synthesis_filter.data[0].cpu()
+        idx = (torch.arange(K).unsqueeze(0) - self.pad_left) * N + P - torch.arange(N).unsqueeze(1) # N x K
+        mask = ((idx >= 0) & (idx < L)).float()
+        w = g[:, idx.clamp(0, L-1)] * mask.unsqueeze(0) * N # n_bands x N x K
+        self.register_buffer("synthesis_weight", w.transpose(0, 1).contiguous())
+
+    def _analysis_frames(self, x):
+        """Compute the analysis of a zero-prepended signal whose length is a multiple of subbands.
+
+        Args:
+            x (Tensor): Input tensor (B, 1, M' * subbands).
+
+        Returns:
+            Tensor: Output tensor (B, subbands, M' - Q + 1).
+
+        """
+        B = x.shape[0]
+        N = self.subbands
+        frames = x.reshape(B, -1, N).transpose(1, 2) # B x n_phases x M'
+        return F.conv1d(frames, self.analysis_weight)
+
+    def _synthesis_frames(self, x):
+        """Compute the synthesis of a padded subband signal.
+
+        Args:
+            x (Tensor): Input tensor (B, subbands, M + K - 1).
+
+        Returns:
+            Tensor: Output tensor (B, 1, M * subbands).
+
+        """
+        B = x.shape[0]
+        y = F.conv1d(x, self.synthesis_weight) # B x n_phases x M
+        return y.transpose(1, 2).reshape(B, 1, -1)
+
+    def analysis(self, x):
+        """Analysis with polyphase PQMF.
+
+        Args:
+            x (Tensor): Input tensor (B, 1, T).
+
+        Returns:
+            Tensor: Output tensor (B, subbands, T // subbands).
+
+        """
+        N = self.subbands
+        M = x.shape[-1] // N
+        length = (M + self.n_frames_ana - 1) * N
+        x = F.pad(x, (self.pad, max(length - self.pad - x.shape[-1], 0)))[...,:length]
+        return self._analysis_frames(x)
+
+    def synthesis(self, x):
+        """Synthesis with polyphase PQMF.
+
+        Args:
+            x (Tensor): Input tensor (B, subbands, T // subbands).
+
+        Returns:
+            Tensor: Output tensor (B, 1, T).
+
+        """
+        return self._synthesis_frames(F.pad(x, (self.pad_left, self.pad_right)))
+
+    def analysis_stream(self, x, state=None, flush=False):
+        """Analysis of a chunk of a signal with the state of the previous chunks.
+
+        The outputs are delayed by about taps // 2 samples, i.e., the lookahead of the filters,
+        and the remaining ones are given with flush=True after the last chunk.
+
+        Args:
+            x (Tensor): Input chunk (B, 1, T_chunk).
+            state (tuple): State of the previous chunks, None at the first chunk.
+            flush (bool): Whether this is the last chunk.
+
+        Returns:
+            Tensor: Output chunk (B, subbands, T_out).
+            tuple: State for the next chunk.
+
+        """
+        N = self.subbands
+        if state is None:
+            buf = x.new_zeros(x.shape[0], 1, self.pad)
+            n_in, n_out = 0, 0
+        else:
+            buf, n_in, n_out = state
+        buf = torch.cat((buf, x), 2)
+        n_in += x.shape[-1]
+        if flush:
+            buf = F.pad(buf, (0, self.n_frames_ana * N))
+        n_frames = buf.shape[-1] // N
+        n_new = n_frames - self.n_frames_ana + 1
+        if flush:
+            n_new = min(n_new, n_in // N - n_out)
+        if n_new <= 0:
+            return x.new_zeros(x.shape[0], N, 0), (buf, n_in, n_out)
+        y = self._analysis_frames(buf[...,:(n_new + self.n_frames_ana - 1) * N])
+        return y, (buf[...,n_new*N:], n_in, n_out + n_new)
+
+    def synthesis_stream(self, x, state=None, flush=False):
+        """Synthesis of a chunk of a subband signal with the state of the previous chunks.
+
+        The outputs are delayed by ceil((taps // 2) / subbands) subband samples,
+        and the remaining ones are given with flush=True after the last chunk.
+
+        Args:
+            x (Tensor): Input chunk (B, subbands, T_chunk // subbands).
+            state (Tensor): State of the previous chunks, None at the first chunk.
+            flush (bool): Whether this is the last chunk.
+
+        Returns:
+            Tensor: Output chunk (B, 1, T_out).
+            Tensor: State for the next chunk.
+
+        """
+        if state is None:
+            state = x.new_zeros(x.shape[0], self.subbands, self.pad_left)
+        buf = torch.cat((state, x), 2)
+        if flush:
+            buf = F.pad(buf, (0, self.pad_right))
+        n_new = buf.shape[-1] - self.n_frames_syn + 1
+        if n_new <= 0:
+            return x.new_zeros(x.shape[0], 1, 0), buf
+        return self._synthesis_frames(buf), buf[...,n_new:]
@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2021 Patrick Lumban Tobing (Nagoya University)
+#  Apache 2.0  (http://www.apache.org/licenses/LICENSE-2.0)
+
+"""Int8 quantization of CycleVAE and MWDLP modules for CPU inference."""
+
+import copy
+import logging
+
+import torch
+from torch import nn
+
+from freeze import freeze_model
+
+
+class Conv1x1Linear(nn.Module):
+    """1x1 convolution computed by a linear layer, so that it can be dynamically quantized."""
+
+    def __init__(self, in_channels, out_channels, bias=True):
+        """Initialize 1x1 convolution by linear layer.
+
+        Args:
+            in_channels (int): Number of input channels.
+            out_channels (int): Number of output channels.
+            bias (bool): Flag to use bias.
+
+        """
+        super(Conv1x1Linear, self).__init__()
+        self.linear = nn.Linear(in_channels, out_channels, bias=bias)
+
+    @classmethod
+    def from_conv(cls, conv):
+        """Build from a 1x1 Conv1d without weight norm.
+
+        Args:
+            conv (nn.Conv1d): 1x1 convolution.
+
+        Returns:
+            Conv1x1Linear: Linear layer with the same weights.
+
+        """
+        module = cls(conv.in_channels, conv.out_channels, bias=conv.bias is not None)
+        module.linear.weight.data.copy_(conv.weight.data[:,:,0])
+        if conv.bias is not None:
+            module.linear.bias.data.copy_(conv.bias.data)
+        return module.to(conv.weight.device)
+
+    def forward(self, x):
+        """Calculate forward propagation.
+
+        Args:
+            x (Tensor): Input tensor (B, C_in, T).
+
+        Returns:
+            Tensor: Output tensor (B, C_out, T).
+
+        """
+        return self.linear(x.transpose(1,2)).transpose(1,2)
+
+
+def _is_conv1x1(m):
+    return isinstance(m, nn.Conv1d) and m.kernel_size[0] == 1 and m.groups == 1 \
+        and m.padding[0] == 0 and m.stride[0] == 1 and not hasattr(m, "weight_g")
+
+
+def convert_conv1x1(model):
+    """Replace all 1x1 Conv1d layers (scale, reduction, DualFC, output layers) with linear layers.
+
+    Args:
+        model (torch.nn.Module): Model instance without weight norm, modified in-place.
+
+    Returns:
+        int: Number of replaced layers.
+
+    """
+    count = 0
+    for name, m in list(model.named_children()):
+        if _is_conv1x1(m):
+            setattr(model, name, Conv1x1Linear.from_conv(m))
+            count += 1
+        else:
+            count += convert_conv1x1(m)
+    return count
+
+
+def _record_io(model, module_types, inputs, kwargs=None, run=None, max_records=16):
+    """Record inputs and outputs of the quantizable layers on calibration inputs."""
+    records = {}
+    handles = []
+    for name, m in model.named_modules():
+        if isinstance(m, module_types):
+            records[name] = []
+            def _hook(m, x, y, name=name):
+                if len(records[name]) < max_records:
+                    records[name].append((x, y))
+            handles.append(m.register_forward_hook(_hook))
+    with torch.no_grad():
+        for x in inputs:
+            if run is not None:
+                run(model, x)
+            elif kwargs is not None:
+                model(*x, **kwargs)
+            else:
+                model(*x)
+    for handle in handles:
+        handle.remove()
+    return records
+
+
+def _rel_err(y_ref, y):
+    if isinstance(y_ref, (list, tuple)):
+        y_ref = y_ref[0]
+        y = y[0]
+    return ((y - y_ref).norm() / y_ref.norm().clamp(min=1e-12)).item()
+
+
+def quantize_model(model, dtype=torch.qint8, calib_inputs=None, calib_kwargs=None, calib_run=None, tol=0.05):
+    """Dynamically quantize the GRU and linear layers of a model for CPU inference.
+
+    The model is frozen (see freeze.freeze_model) and its 1x1 convolutions are converted to linear layers
+    first. Convolutions with a kernel size larger than one (input conv. layers) stay in float32.
+
+    With calibration inputs, each quantized layer is compared to its float32 version on the recorded
+    layer inputs, and the layers with a relative output error larger than tol are kept in float32.
+
+    Args:
+        model (torch.nn.Module): Model instance, not modified.
+        dtype (torch.dtype): Quantized weight type, torch.qint8 or torch.float16.
+        calib_inputs (list): Calibration inputs, list of positional argument tuples of forward or calib_run.
+        calib_kwargs (dict): Keyword arguments of forward for calibration.
+        calib_run (function): Function (model, inputs) to run calibration instead of forward, e.g., generate.
+        tol (float): Tolerance of the relative output error of a quantized layer.
+
+    Returns:
+        torch.nn.Module: Quantized model on cpu.
+        dict: Relative output error of each layer if calibrated, otherwise empty.
+
+    """
+    model = copy.deepcopy(model).cpu()
+    freeze_model(model)
+    n_conv = convert_conv1x1(model)
+    logging.info("%d 1x1 conv. layers are converted to linear layers" % (n_conv))
+    model.eval()
+
+    module_types = (nn.GRU, nn.Linear)
+    qconfig_spec = set([nn.GRU, nn.Linear])
+    errors = {}
+    if calib_inputs is not None:
+        records = _record_io(model, module_types, calib_inputs, kwargs=calib_kwargs, run=calib_run)
+        modules = dict(model.named_modules())
+        qconfig_spec = set()
+        for name, io_list in records.items():
+            if len(io_list) == 0:
+                continue
+            m_q = torch.quantization.quantize_dynamic(nn.Sequential(copy.deepcopy(modules[name])),
+                        set([type(modules[name])]), dtype=dtype)[0]
+            with torch.no_grad():
+                errors[name] = max([_rel_err(y, m_q(*x)) for x, y in io_list])
+            if errors[name] <= tol:
+                qconfig_spec.add(name)
+            else:
+                logging.info("%s is kept in float32, rel. error %.3e > %.3e" % (name, errors[name], tol))
+        logging.info(errors)
+
+    model_q = torch.quantization.quantize_dynamic(model, qconfig_spec, dtype=dtype)
+    logging.info(model_q)
+
+    return model_q, errors
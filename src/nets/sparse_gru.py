@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2021 Patrick Lumban Tobing (Nagoya University)
+#  Apache 2.0  (http://www.apache.org/licenses/LICENSE-2.0)
+
+"""Block-sparse GRU for inference with block-sparsified recurrent matrices."""
+
+import torch
+from torch import nn
+
+from sparsify import BLOCK_SIZE, weight_block_mask
+
+
+class BlockSparseGRU(nn.Module):
+    """Single-layer batch-first GRU with a block-CSR recurrent matrix.
+
+    The recurrent matrix is stored as in SparseGRULayer of the C implementation:
+    the diagonal is kept dense, and the off-diagonal non-zero blocks, each spanning block_size
+    outputs of one input, are stored row-wise (per output block) with their input indices.
+    The recurrent GEMV then costs O(B x nnz_blocks x block_size) instead of O(B x 3N x N).
+
+    """
+
+    def __init__(self, input_size, hidden_size, block_size=BLOCK_SIZE):
+        """Initialize block-sparse GRU.
+
+        Args:
+            input_size (int): Number of input dimensions.
+            hidden_size (int): Number of hidden units.
+            block_size (int): Number of outputs in a block.
+
+        """
+        super(BlockSparseGRU, self).__init__()
+        self.input_size = input_size
+        self.hidden_size = hidden_size
+        self.block_size = block_size
+        N = hidden_size
+        self.register_buffer("weight_ih", torch.zeros(3*N, input_size))
+        self.register_buffer("bias_ih", torch.zeros(3*N))
+        self.register_buffer("bias_hh", torch.zeros(3*N))
+        self.register_buffer("diag", torch.zeros(3*N))
+        self.register_buffer("vals", torch.zeros(0, block_size)) # nnz x block_size
+        self.register_buffer("col_idx", torch.zeros(0, dtype=torch.long)) # nnz, input index
+        self.register_buffer("row_idx", torch.zeros(0, dtype=torch.long)) # nnz, output block index
+        self.register_buffer("row_ptr", torch.zeros(3*N//block_size+1, dtype=torch.long)) # CSR row pointer
+
+    @classmethod
+    def from_gru(cls, gru, mask=None, block_size=BLOCK_SIZE):
+        """Build from a trained nn.GRU.
+
+        Args:
+            gru (nn.GRU): Single-layer unidirectional batch-first GRU.
+            mask (Tensor): Mask of weight_hh_l0 (3N, N) from the sparsification schedule,
+                derived from the non-zero blocks if None.
+            block_size (int): Number of outputs in a block.
+
+        Returns:
+            BlockSparseGRU: Block-sparse GRU with the same function.
+
+        """
+        assert gru.num_layers == 1 and not gru.bidirectional and gru.batch_first
+        module = cls(gru.input_size, gru.hidden_size, block_size=block_size)
+        N = gru.hidden_size
+        with torch.no_grad():
+            w_hh = gru.weight_hh_l0.data.cpu()
+            if mask is None:
+                mask = weight_block_mask(w_hh, block_size)
+            w_hh = w_hh*mask.cpu()
+            module.weight_ih.copy_(gru.weight_ih_l0.data)
+            if gru.bias:
+                module.bias_ih.copy_(gru.bias_ih_l0.data)
+                module.bias_hh.copy_(gru.bias_hh_l0.data)
+            W = w_hh.reshape(3, N, N)
+            module.diag.copy_(torch.diagonal(W, dim1=1, dim2=2).reshape(-1))
+            W = W * (1 - torch.eye(N)).unsqueeze(0)
+            # output x input --> output-block x input x block_size
+            blocks = W.reshape(3*N//block_size, block_size, N).transpose(1, 2)
+            keep = mask.cpu().reshape(3, N, N).bool() & ~torch.eye(N, dtype=torch.bool).unsqueeze(0)
+            keep = keep.reshape(3*N//block_size, block_size, N).any(1) # output-block x input
+            row_idx, col_idx = keep.nonzero(as_tuple=True) # sorted row-wise
+            module.vals = blocks[row_idx, col_idx].contiguous()
+            module.col_idx = col_idx
+            module.row_idx = row_idx
+            module.row_ptr = torch.cat((torch.zeros(1, dtype=torch.long), torch.cumsum(keep.sum(1), 0)))
+        return module.to(gru.weight_hh_l0.device)
+
+    @property
+    def density(self):
+        """Density of the stored recurrent blocks."""
+        N = self.hidden_size
+        return self.vals.shape[0] / (3*(N//self.block_size)*N)
+
+    def recurrent(self, h):
+        """Compute the recurrent GEMV W_hh h + b_hh.
+
+        Args:
+            h (Tensor): Hidden state (B, N).
+
+        Returns:
+            Tensor: Recurrent projection (B, 3N).
+
+        """
+        B = h.shape[0]
+        contrib = h[:, self.col_idx].unsqueeze(-1) * self.vals # B x nnz x block_size
+        out = torch.zeros(B, self.row_ptr.shape[0]-1, self.block_size, dtype=h.dtype, device=h.device)
+        out.index_add_(1, self.row_idx, contrib)
+        return out.reshape(B, -1) + self.diag * h.repeat(1, 3) + self.bias_hh
+
+    def forward(self, x, h=None):
+        """Calculate forward propagation with the same interface as batch-first nn.GRU.
+
+        Args:
+            x (Tensor): Input (B, T, input_size).
+            h (Tensor): Initial hidden state (1, B, N), zeros if None.
+
+        Returns:
+            Tensor: Output (B, T, N).
+            Tensor: Last hidden state (1, B, N).
+
+        """
+        B, T = x.shape[0], x.shape[1]
+        N = self.hidden_size
+        if h is None:
+            h = torch.zeros(B, N, dtype=x.dtype, device=x.device)
+        else:
+            h = h[0]
+        # input projection of all time steps at once, only the recurrent part is sequential
+        x_proj = torch.nn.functional.linear(x, self.weight_ih, self.bias_ih) # B x T x 3N
+        out = []
+        for t in range(T):
+            x_r, x_z, x_n = x_proj[:,t].split(N, dim=-1)
+            h_r, h_z, h_n = self.recurrent(h).split(N, dim=-1)
+            r = torch.sigmoid(x_r + h_r)
+            z = torch.sigmoid(x_z + h_z)
+            n = torch.tanh(x_n + r*h_n)
+            h = n + z*(h - n)
+            out.append(h)
+        return torch.stack(out, 1), h.unsqueeze(0)
+
+
+def sparsify_gru_modules(model, block_size=BLOCK_SIZE, masks=None):
+    """Replace the block-sparsified GRUs of a model with block-sparse GRUs.
+
+    Only the GRUs listed in masks are replaced, or those named gru if masks is None,
+    as these are the ones sparsified by the training schedule.
+
+    Args:
+        model (torch.nn.Module): Model instance, modified in-place.
+        block_size (int): Number of outputs in a block.
+        masks (dict): Mask of weight_hh_l0 of each GRU module name, e.g., from BlockSparsifier.export_mask.
+
+    Returns:
+        dict: Density of each replaced GRU.
+
+    """
+    densities = {}
+    for name, m in list(model.named_modules()):
+        if not isinstance(m, nn.GRU):
+            continue
+        if (masks is None and name.split(".")[-1] != "gru") or (masks is not None and name not in masks):
+            continue
+        parent = model
+        for attr in name.split(".")[:-1]:
+            parent = getattr(parent, attr)
+        sparse_gru = BlockSparseGRU.from_gru(m, mask=None if masks is None else masks[name], block_size=block_size)
+        setattr(parent, name.split(".")[-1], sparse_gru)
+        densities[name] = sparse_gru.density
+    return densities
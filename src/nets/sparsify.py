@@ -0,0 +1,174 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2021 Patrick Lumban Tobing (Nagoya University)
+#  Apache 2.0  (http://www.apache.org/licenses/LICENSE-2.0)
+
+"""Block-sparsification of GRU recurrent matrices."""
+
+import logging
+
+import torch
+
+
+BLOCK_SIZE = 16
+
+
+def sparse_density(iter_idx, t_start, t_end, densities, densities_p=None):
+    """Compute per-gate target densities of the sparsification schedule.
+
+    Args:
+        iter_idx (int): Current iteration index.
+        t_start (int): Iteration index to start the schedule.
+        t_end (int): Iteration index to reach the final densities.
+        densities (list): Final density of each gate.
+        densities_p (list): Density of each gate from the previous stage, 1 if None.
+
+    Returns:
+        list: Density of each gate at iter_idx.
+
+    """
+    density_list = []
+    for k in range(len(densities)):
+        density = densities[k]
+        if iter_idx < t_end:
+            r = 1 - (iter_idx-t_start)/(t_end - t_start)
+            if densities_p is not None:
+                density = densities_p[k] - (densities_p[k]-densities[k])*(1 - r)**5
+            else:
+                density = 1 - (1-densities[k])*(1 - r)**5
+        density_list.append(density)
+    return density_list
+
+
+def block_scores(weight, block_size=BLOCK_SIZE):
+    """Compute the squared norm of all off-diagonal blocks in one reduction.
+
+    Blocks are horizontal in the input part, i.e., each block spans block_size outputs of one input,
+    as in real-time these outputs are computed simultaneously.
+
+    Args:
+        weight (Tensor): Recurrent weight of stacked gates (n_gates*N, N), output x input.
+        block_size (int): Number of outputs in a block.
+
+    Returns:
+        Tensor: Block scores (n_gates, N, N//block_size), gate x input x output-block.
+
+    """
+    N = weight.shape[1]
+    nb = weight.shape[0] // N
+    eye = torch.eye(N, device=weight.device, dtype=weight.dtype)
+    W = weight.reshape(nb, N, N) * (1 - eye) # the diagonal is always kept, so it does not count
+    return W.transpose(1, 2).reshape(nb, N, N//block_size, block_size).pow(2).sum(-1)
+
+
+def block_mask(scores, densities, block_size=BLOCK_SIZE):
+    """Threshold block scores to a keep-mask of the recurrent weight.
+
+    The threshold of each gate is the k-th smallest score with k = round(n_blocks*(1-density))+1,
+    i.e., the same element as taken from a full ascending sort, but found with kthvalue.
+
+    Args:
+        scores (Tensor): Block scores (n_gates, N, N//block_size).
+        densities (list): Density of each gate.
+        block_size (int): Number of outputs in a block.
+
+    Returns:
+        Tensor: Float mask of the recurrent weight (n_gates*N, N), diagonal always kept.
+
+    """
+    nb, N, n_blocks = scores.shape[0], scores.shape[1], scores.shape[1]*scores.shape[2]
+    keep = torch.zeros(scores.shape, dtype=torch.bool, device=scores.device)
+    for k in range(nb):
+        idx = round(n_blocks*(1-densities[k]))
+        if idx < n_blocks:
+            thresh = torch.kthvalue(scores[k].reshape(-1), idx+1)[0]
+            keep[k] = scores[k] >= thresh
+    mask = torch.repeat_interleave(keep, block_size, dim=2).transpose(1, 2) # gate x output x input
+    mask = mask | torch.eye(N, dtype=torch.bool, device=scores.device).unsqueeze(0)
+    return mask.reshape(nb*N, N).float()
+
+
+def weight_block_mask(weight, block_size=BLOCK_SIZE, eps=1e-10):
+    """Derive the block mask from the non-zero blocks of an already sparsified weight.
+
+    Args:
+        weight (Tensor): Recurrent weight of stacked gates (n_gates*N, N).
+        block_size (int): Number of outputs in a block.
+        eps (float): Absolute sum below which a block is considered pruned.
+
+    Returns:
+        Tensor: Float mask of the recurrent weight (n_gates*N, N), diagonal always kept.
+
+    """
+    N = weight.shape[1]
+    nb = weight.shape[0] // N
+    eye = torch.eye(N, device=weight.device, dtype=weight.dtype)
+    W = (weight.reshape(nb, N, N) * (1 - eye)).abs()
+    keep = W.transpose(1, 2).reshape(nb, N, N//block_size, block_size).sum(-1) > eps
+    mask = torch.repeat_interleave(keep, block_size, dim=2).transpose(1, 2)
+    mask = mask | torch.eye(N, dtype=torch.bool, device=weight.device).unsqueeze(0)
+    return mask.reshape(nb*N, N).float()
+
+
+class BlockSparsifier(object):
+    """Block-sparsification engine with cached masks.
+
+    Masks are recomputed only when the scheduled density of a weight changes.
+    Otherwise, e.g., after the end of a schedule, the cached mask is re-applied,
+    so that the sparsity pattern is kept fixed instead of re-thresholding every iteration.
+
+    """
+
+    def __init__(self, block_size=BLOCK_SIZE):
+        """Initialize block-sparsification engine.
+
+        Args:
+            block_size (int): Number of outputs in a block.
+
+        """
+        self.block_size = block_size
+        self.masks = {}
+        self.mask_densities = {}
+
+    def __call__(self, weight, iter_idx, t_start, t_end, interval, densities, densities_p=None):
+        """Sparsify a recurrent weight in-place following the density schedule.
+
+        Args:
+            weight (Tensor): Recurrent weight of stacked gates (n_gates*N, N).
+            iter_idx (int): Current iteration index.
+            t_start (int): Iteration index to start the schedule.
+            t_end (int): Iteration index to reach the final densities.
+            interval (int): Interval of iterations to update the densities.
+            densities (list): Final density of each gate.
+            densities_p (list): Density of each gate from the previous stage, 1 if None.
+
+        Returns:
+            Tensor: Applied mask, None if the schedule is not active at iter_idx.
+
+        """
+        if iter_idx < t_start or ((iter_idx-t_start) % interval != 0 and iter_idx < t_end):
+            return None
+        density = sparse_density(iter_idx, t_start, t_end, densities, densities_p=densities_p)
+        key = id(weight)
+        if key not in self.masks or self.mask_densities[key] != density \
+                or self.masks[key].device != weight.device:
+            logging.info('sparsify: %ld %ld %ld %ld %s' % (iter_idx, t_start, t_end, interval,
+                ' '.join(['%lf' % x for x in density])))
+            self.masks[key] = block_mask(block_scores(weight.data, self.block_size), density, self.block_size)
+            self.mask_densities[key] = density
+        weight.data.mul_(self.masks[key])
+        return self.masks[key]
+
+    def export_mask(self, weight):
+        """Get the mask of a weight for inference and export tools.
+
+        Args:
+            weight (Tensor): Recurrent weight of stacked gates (n_gates*N, N).
+
+        Returns:
+            Tensor: Cached mask if available, otherwise derived from the non-zero blocks of weight.
+
+        """
+        if id(weight) in self.masks:
+            return self.masks[id(weight)].detach().cpu()
+        return weight_block_mask(weight.detach(), self.block_size).cpu()
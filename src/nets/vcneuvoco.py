@@ -111,6 +111,52 @@ def decode_mu_law_torch(y, mu=1024):
     return torch.clamp(x, min=-1, max=0.999969482421875)
 
 
+def cast_float(x):
+    """FUNCTION TO CAST FLOATING-POINT TENSORS IN (NESTED) OUTPUTS TO FLOAT32
+
+    Arg:
+        x (Tensor or list or tuple): module outputs
+
+    Return:
+        (Tensor or list or tuple): outputs with float32 floating-point tensors
+    """
+    if isinstance(x, torch.Tensor):
+        if x.is_floating_point():
+            return x.float()
+        return x
+    elif isinstance(x, (list, tuple)):
+        return type(x)(cast_float(y) for y in x)
+    return x
+
+
+def autocast_forward(model, enabled=True):
+    """FUNCTION TO RUN THE FORWARD OF A MODEL UNDER CUDA AUTOCAST (MIXED PRECISION)
+
+    GRU/conv/linear layers inside the forward run in float16, while ops in the autocast float32 list
+    (exp, log, softmax, pow, ...) stay in float32, so the Laplace/Gauss parameters computed inside the models
+    are not affected. The outputs are cast back to float32, so the likelihood, KL, mu-law cross-entropy,
+    and STFT losses outside the forward are computed in float32.
+    It is a no-op if not enabled or cuda is not available.
+
+    Args:
+        model (torch.nn.Module): torch nn module instance
+        enabled (bool): flag to enable autocast
+
+    Return:
+        (torch.nn.Module): the same module instance
+    """
+    if not enabled or not torch.cuda.is_available():
+        return model
+    forward = model.forward
+
+    def forward_autocast(*args, **kwargs):
+        with torch.cuda.amp.autocast():
+            return cast_float(forward(*args, **kwargs))
+
+    model.forward = forward_autocast
+    return model
+
+
 class ConvTranspose2d(nn.ConvTranspose2d):
     """Conv1d module with customized initialization."""
 
@@ -340,6 +386,8 @@ class DualFC_(nn.Module):
         self.conv = nn.Conv1d(self.in_dim, self.mid_out_bands2+self.lpc4bands, 1, bias=self.bias)
         self.fact = EmbeddingZero(1, self.mid_out_bands2+self.lpc4bands)
         self.out = nn.Conv1d(self.lpc2+self.mid_out, self.lpc2+self.out_dim, 1, bias=self.bias)
+        # set by freeze.fold_dualfc_fact once the factors are folded into conv
+        self.fact_folded = False
 
     def forward(self, x):
         """Forward calculation
@@ -355,11 +403,12 @@ class DualFC_(nn.Module):
         if self.n_bands > 1:
             if self.lpc > 0:
                 conv_out = F.relu(self.conv(x)).transpose(1,2) # B x T x n_bands*(K*2+K*2+mid_dim*2)
-                fact_weight = 0.5*torch.exp(torch.clamp(self.fact.weight[0], min=MIN_CLAMP, max=MAX_CLAMP)) # K*2+K*2+mid_dim*2
+                if not self.fact_folded:
+                    conv_out = conv_out*(0.5*torch.exp(torch.clamp(self.fact.weight[0], min=MIN_CLAMP, max=MAX_CLAMP))) # K*2+K*2+mid_dim*2
                 B = x.shape[0]
                 T = x.shape[2]
                 # B x T x n_bands x (K+K+mid_dim)*2 --> B x (K+K+mid_dim) x (T x n_bands) --> B x T x n_bands x (K+K+out_dim)
-                out = torch.clamp(self.out(torch.sum((conv_out*fact_weight).reshape(B,T,self.n_bands,2,-1), 3).reshape(B,T*self.n_bands,-1).transpose(1,2)),
+                out = torch.clamp(self.out(torch.sum(conv_out.reshape(B,T,self.n_bands,2,-1), 3).reshape(B,T*self.n_bands,-1).transpose(1,2)),
                                         min=MIN_CLAMP, max=MAX_CLAMP).transpose(1,2).reshape(B,T,self.n_bands,-1)
                 return torch.tanh(out[:,:,:,:self.lpc]), torch.exp(out[:,:,:,self.lpc:-self.out_dim]), F.tanhshrink(out[:,:,:,-self.out_dim:])
                 # lpc_signs, lpc_mags, logits
@@ -367,20 +416,26 @@ class DualFC_(nn.Module):
                 # B x T x n_bands x mid*2 --> B x (T x n_bands) x mid --> B x mid x (T x n_bands) --> B x T x n_bands x out_dim
                 B = x.shape[0]
                 T = x.shape[2]
-                return F.tanhshrink(torch.clamp(self.out(torch.sum((F.relu(self.conv(x).transpose(1,2))
-                            *(0.5*torch.exp(torch.clamp(self.fact.weight[0], min=MIN_CLAMP, max=MAX_CLAMP)))).reshape(B,T,self.n_bands,2,-1), 3).reshape(B,T*self.n_bands,-1).transpose(1,2)), min=MIN_CLAMP, max=MAX_CLAMP)).transpose(1,2).reshape(B,T,self.n_bands,-1)
+                conv_out = F.relu(self.conv(x).transpose(1,2))
+                if not self.fact_folded:
+                    conv_out = conv_out*(0.5*torch.exp(torch.clamp(self.fact.weight[0], min=MIN_CLAMP, max=MAX_CLAMP)))
+                return F.tanhshrink(torch.clamp(self.out(torch.sum(conv_out.reshape(B,T,self.n_bands,2,-1), 3).reshape(B,T*self.n_bands,-1).transpose(1,2)), min=MIN_CLAMP, max=MAX_CLAMP)).transpose(1,2).reshape(B,T,self.n_bands,-1)
                 # logits
         else:
             if self.lpc > 0:
-                conv = F.relu(self.conv(x)).transpose(1,2)
-                fact_weight = 0.5*torch.exp(torch.clamp(self.fact.weight[0], min=MIN_CLAMP, max=MAX_CLAMP))
+                conv_out = F.relu(self.conv(x)).transpose(1,2)
+                if not self.fact_folded:
+                    conv_out = conv_out*(0.5*torch.exp(torch.clamp(self.fact.weight[0], min=MIN_CLAMP, max=MAX_CLAMP)))
                 # B x T x (K+K+mid_dim)*2 --> B x (K+K+mid_dim) x T --> B x T x (K+K+out_dim)
-                out = torch.clamp(self.out(torch.sum((out*fact_weight).reshape(x.shape[0],x.shape[2],2,-1), 2).transpose(1,2)), min=MIN_CLAMP, max=MAX_CLAMP).transpose(1,2)
-                return torch.tanh(out[:,:,:self.lpc]), torch.exp(out[:,:,self.lpc:-self.out_dim]), F.tanshrink(out[:,:,-self.out_dim:])
+                out = torch.clamp(self.out(torch.sum(conv_out.reshape(x.shape[0],x.shape[2],2,-1), 2).transpose(1,2)), min=MIN_CLAMP, max=MAX_CLAMP).transpose(1,2)
+                return torch.tanh(out[:,:,:self.lpc]), torch.exp(out[:,:,self.lpc:-self.out_dim]), F.tanhshrink(out[:,:,-self.out_dim:])
                 # lpc_signs, lpc_mags, logits
             else:
                 # B x T x mid*2 --> B x T x mid --> B x mid x T --> B x T x out_dim
-                return F.tanhshrink(torch.clamp(self.out(torch.sum((F.relu(self.conv(x).transpose(1,2))*(0.5*torch.exp(torch.clamp(self.fact.weight[0], min=MIN_CLAMP, max=MAX_CLAMP)))).reshape(x.shape[0],x.shape[2],2,-1), 2).transpose(1,2)), min=MIN_CLAMP, max=MAX_CLAMP)).transpose(1,2)
+                conv_out = F.relu(self.conv(x).transpose(1,2))
+                if not self.fact_folded:
+                    conv_out = conv_out*(0.5*torch.exp(torch.clamp(self.fact.weight[0], min=MIN_CLAMP, max=MAX_CLAMP)))
+                return F.tanhshrink(torch.clamp(self.out(torch.sum(conv_out.reshape(x.shape[0],x.shape[2],2,-1), 2).transpose(1,2)), min=MIN_CLAMP, max=MAX_CLAMP)).transpose(1,2)
                 # logits
 
 
@@ -594,7 +649,7 @@ def sampling_laplace_wave(loc, scale):
 
  
 def sampling_normal(mu, var):
-    eps = torch.randn(mu.shape).cuda()
+    eps = torch.randn(mu.shape, device=mu.device)
 
     return mu + torch.sqrt(var) * eps # var
 
@@ -1680,13 +1735,18 @@ class SPKID_TRANSFORM_LAYER(nn.Module):
     def forward(self, x):
         # in: B x T
         # out: B x T x C
+        return self.forward_weight(F.one_hot(x, num_classes=self.n_spk).float())
+
+    def forward_weight(self, x):
+        # in: B x T x n_spk speaker weights, i.e., one-hot for a speaker, or a weighted mixture of speakers
+        # out: B x T x C
         if self.spkidtr_dim is not None:
             if self.n_weight_emb is not None:
                 if self.conv_emb_flag:
-                    weight_emb = torch.tanh(torch.clamp(self.deconv(F.tanhshrink(torch.clamp(self.conv(self.conv_emb(F.one_hot(x, num_classes=self.n_spk).float().transpose(1,2))),
+                    weight_emb = torch.tanh(torch.clamp(self.deconv(F.tanhshrink(torch.clamp(self.conv(self.conv_emb(x.transpose(1,2))),
                                                 min=MIN_CLAMP, max=MAX_CLAMP))), min=MIN_CLAMP, max=MAX_CLAMP)).transpose(1,2) # B x T x n_weight
                 else:
-                    weight_emb = torch.tanh(torch.clamp(self.deconv(F.tanhshrink(torch.clamp(self.conv(F.one_hot(x, num_classes=self.n_spk).float().transpose(1,2)),
+                    weight_emb = torch.tanh(torch.clamp(self.deconv(F.tanhshrink(torch.clamp(self.conv(x.transpose(1,2)),
                                                 min=MIN_CLAMP, max=MAX_CLAMP))), min=MIN_CLAMP, max=MAX_CLAMP)).transpose(1,2) # B x T x n_weight
                 out = self.embed_spk.weight[0].unsqueeze(0).unsqueeze(1)*weight_emb[:,:,:1] # 1 x 1 x emb_dim * B x T x 1
                 for i in range(1,self.n_weight_emb):
@@ -1695,22 +1755,47 @@ class SPKID_TRANSFORM_LAYER(nn.Module):
                 return weight_emb, out
             else:
                 if self.conv_emb_flag:
-                    return self.deconv(F.tanhshrink(torch.clamp(self.conv(self.conv_emb(F.one_hot(x, num_classes=self.n_spk).float().transpose(1,2))), min=MIN_CLAMP, max=MAX_CLAMP))).transpose(1,2)
+                    return self.deconv(F.tanhshrink(torch.clamp(self.conv(self.conv_emb(x.transpose(1,2))), min=MIN_CLAMP, max=MAX_CLAMP))).transpose(1,2)
                 else:
-                    return self.deconv(F.tanhshrink(torch.clamp(self.conv(F.one_hot(x, num_classes=self.n_spk).float().transpose(1,2)), min=MIN_CLAMP, max=MAX_CLAMP))).transpose(1,2)
+                    return self.deconv(F.tanhshrink(torch.clamp(self.conv(x.transpose(1,2)), min=MIN_CLAMP, max=MAX_CLAMP))).transpose(1,2)
         else:
             if self.n_weight_emb is not None:
                 if self.conv_emb_flag:
-                    weight_emb = torch.tanh(torch.clamp(self.conv(self.conv_emb(F.one_hot(x, num_classes=self.n_spk).float().transpose(1,2))), min=MIN_CLAMP, max=MAX_CLAMP)).transpose(1,2) # B x T x n_weight
+                    weight_emb = torch.tanh(torch.clamp(self.conv(self.conv_emb(x.transpose(1,2))), min=MIN_CLAMP, max=MAX_CLAMP)).transpose(1,2) # B x T x n_weight
                 else:
-                    weight_emb = torch.tanh(torch.clamp(self.conv(F.one_hot(x, num_classes=self.n_spk).float().transpose(1,2)), min=MIN_CLAMP, max=MAX_CLAMP)).transpose(1,2) # B x T x n_weight
+                    weight_emb = torch.tanh(torch.clamp(self.conv(x.transpose(1,2)), min=MIN_CLAMP, max=MAX_CLAMP)).transpose(1,2) # B x T x n_weight
                 out = self.embed_spk.weight[0].unsqueeze(0).unsqueeze(1)*weight_emb[:,:,:1] # 1 x 1 x emb_dim * B x T x 1
                 for i in range(1,self.n_weight_emb):
                     out = torch.cat((out, self.embed_spk.weight[i].unsqueeze(0).unsqueeze(1)*weight_emb[:,:,i:i+1]), 2) # 1 x 1 x emb_dim * B x T x 1
                 # B x T x emb_dim*n_weight
                 return weight_emb, out
             else:
-                return self.conv(F.one_hot(x, num_classes=self.n_spk).float().transpose(1,2)).transpose(1,2)
+                return self.conv(x.transpose(1,2)).transpose(1,2)
+
+    def forward_coord(self, z):
+        # in: B x T x spkidtr_dim speaker-space coordinates, e.g., interpolated between speakers
+        # out: B x T x C
+        if self.spkidtr_dim is None:
+            raise ValueError("speaker-space coordinates need a speaker transform layer with spkidtr_dim, but it is None")
+        if self.n_weight_emb is not None:
+            weight_emb = torch.tanh(torch.clamp(self.deconv(z.transpose(1,2)), min=MIN_CLAMP, max=MAX_CLAMP)).transpose(1,2) # B x T x n_weight
+            out = self.embed_spk.weight[0].unsqueeze(0).unsqueeze(1)*weight_emb[:,:,:1] # 1 x 1 x emb_dim * B x T x 1
+            for i in range(1,self.n_weight_emb):
+                out = torch.cat((out, self.embed_spk.weight[i].unsqueeze(0).unsqueeze(1)*weight_emb[:,:,i:i+1]), 2) # 1 x 1 x emb_dim * B x T x 1
+            # B x T x emb_dim*n_weight
+            return weight_emb, out
+        else:
+            return self.deconv(z.transpose(1,2)).transpose(1,2)
+
+    def spk_coord(self, x):
+        # in: B x T x n_spk speaker weights
+        # out: B x T x spkidtr_dim speaker-space coordinates
+        if self.spkidtr_dim is None:
+            raise ValueError("speaker-space coordinates need a speaker transform layer with spkidtr_dim, but it is None")
+        if self.conv_emb_flag:
+            return F.tanhshrink(torch.clamp(self.conv(self.conv_emb(x.transpose(1,2))), min=MIN_CLAMP, max=MAX_CLAMP)).transpose(1,2)
+        else:
+            return F.tanhshrink(torch.clamp(self.conv(x.transpose(1,2)), min=MIN_CLAMP, max=MAX_CLAMP)).transpose(1,2)
 
     def apply_weight_norm(self):
         """Apply weight normalization module from all of the layers."""
@@ -2253,13 +2338,13 @@ class GRU_WAVE_DECODER_DUALGRU_COMPACT_MBAND_CF(nn.Module):
         #c = self.conv_s_c(self.conv(self.scale_in(c.transpose(1,2)))).transpose(1,2)
 
         if self.lpc > 0:
-            x_c_lpc = torch.empty(B,1,self.n_bands,self.lpc).cuda().fill_(c_pad).long() # B x 1 x n_bands x K
-            x_f_lpc = torch.empty(B,1,self.n_bands,self.lpc).cuda().fill_(f_pad).long() # B x 1 x n_bands x K
+            x_c_lpc = torch.empty(B,1,self.n_bands,self.lpc, device=c.device).fill_(c_pad).long() # B x 1 x n_bands x K
+            x_f_lpc = torch.empty(B,1,self.n_bands,self.lpc, device=c.device).fill_(f_pad).long() # B x 1 x n_bands x K
         T = c.shape[1]*upsampling_factor
 
         c_f = c[:,:1]
-        out, h = self.gru(torch.cat((c_f,self.embed_c_wav(torch.empty(B,1,self.n_bands).cuda().fill_(c_pad).long()).reshape(B,1,-1),
-                                        self.embed_f_wav(torch.empty(B,1,self.n_bands).cuda().fill_(f_pad).long()).reshape(B,1,-1)),2))
+        out, h = self.gru(torch.cat((c_f,self.embed_c_wav(torch.empty(B,1,self.n_bands, device=c.device).fill_(c_pad).long()).reshape(B,1,-1),
+                                        self.embed_f_wav(torch.empty(B,1,self.n_bands, device=c.device).fill_(f_pad).long()).reshape(B,1,-1)),2))
         out, h_2 = self.gru_2(torch.cat((c_f,out), 2))
         if self.lpc > 0:
             # coarse part
@@ -2387,6 +2472,165 @@ class GRU_WAVE_DECODER_DUALGRU_COMPACT_MBAND_CF(nn.Module):
         else:
             return decode_mu_law_torch((x_c_out*self.cf_dim+x_f_out).transpose(1,2).float(), mu=self.n_quantize) # B x T x n_bands --> B x n_bands x T
 
+    def generate_step(self, c_f, x_c_wav, x_f_wav, h=None, h_2=None, h_f=None, x_c_lpc=None, x_f_lpc=None):
+        """Generate the band samples of one step from the previous ones.
+
+        Args:
+            c_f (Tensor): Conditioning frame (B x 1 x C) after the input convolution.
+            x_c_wav (Tensor): Previous coarse indices (B x 1 x n_bands), (n_quantize//2)//cf_dim at the first step.
+            x_f_wav (Tensor): Previous fine indices (B x 1 x n_bands), (n_quantize//2)%cf_dim at the first step.
+            h (Tensor): Hidden state of gru, zeros if None.
+            h_2 (Tensor): Hidden state of gru_2, zeros if None.
+            h_f (Tensor): Hidden state of gru_f, zeros if None.
+            x_c_lpc (Tensor): Previous coarse indices (B x 1 x n_bands x lpc) if lpc > 0, updated in-place.
+            x_f_lpc (Tensor): Previous fine indices (B x 1 x n_bands x lpc) if lpc > 0, updated in-place.
+
+        Returns:
+            Tensor: Coarse indices (B x 1 x n_bands).
+            Tensor: Fine indices (B x 1 x n_bands).
+            Tensor: Hidden state of gru.
+            Tensor: Hidden state of gru_2.
+            Tensor: Hidden state of gru_f.
+
+        """
+        B = c_f.shape[0]
+        out, h = self.gru(torch.cat((c_f, self.embed_c_wav(x_c_wav).reshape(B,1,-1),
+                                        self.embed_f_wav(x_f_wav).reshape(B,1,-1)),2), h)
+        out, h_2 = self.gru_2(torch.cat((c_f,out), 2), h_2)
+
+        # coarse part
+        if self.lpc > 0:
+            signs_c, scales_c, logits_c = self.out(out.transpose(1,2)) # B x 1 x n_bands x K or 32
+            if self.emb_flag:
+                logits_c = logits_c + torch.sum(self.logits(x_c_lpc)*(signs_c*scales_c).unsqueeze(-1)\
+                            *self.logits_c(x_c_lpc), 3)
+            else:
+                logits_c = logits_c + torch.sum((signs_c*scales_c).unsqueeze(-1)*self.logits(x_c_lpc), 3)
+        else:
+            logits_c = self.out(out.transpose(1,2))
+        dist = OneHotCategorical(F.softmax(torch.clamp(logits_c, min=MIN_CLAMP, max=MAX_CLAMP), dim=-1))
+        x_c_wav = dist.sample().argmax(dim=-1) # B x 1 x n_bands
+        if self.lpc > 0:
+            x_c_lpc[:,:,:,1:] = x_c_lpc[:,:,:,:-1]
+            x_c_lpc[:,:,:,0] = x_c_wav
+
+        # fine part
+        out, h_f = self.gru_f(torch.cat((c_f, self.embed_c_wav(x_c_wav).reshape(B,1,-1), out), 2), h_f)
+        if self.lpc > 0:
+            signs_f, scales_f, logits_f = self.out_f(out.transpose(1,2)) # B x 1 x n_bands x K or 32
+            if self.emb_flag:
+                logits_f = logits_f + torch.sum(self.logits(x_f_lpc)*(signs_f*scales_f).unsqueeze(-1)\
+                            *self.logits_f(x_f_lpc), 3)
+            else:
+                logits_f = logits_f + torch.sum((signs_f*scales_f).unsqueeze(-1)*self.logits(x_f_lpc), 3)
+        else:
+            logits_f = self.out_f(out.transpose(1,2))
+        dist = OneHotCategorical(F.softmax(torch.clamp(logits_f, min=MIN_CLAMP, max=MAX_CLAMP), dim=-1))
+        x_f_wav = dist.sample().argmax(dim=-1) # B x 1 x n_bands
+        if self.lpc > 0:
+            x_f_lpc[:,:,:,1:] = x_f_lpc[:,:,:,:-1]
+            x_f_lpc[:,:,:,0] = x_f_wav
+
+        return x_c_wav, x_f_wav, h, h_2, h_f
+
+    def generate_shrink(self, c, n_frames, intervals=1000, flush=None):
+        """Generate waveforms of a padded batch, dropping utterances from the batch as they finish.
+
+        Unlike generate, which runs the whole batch over the longest length, the recurrent states,
+        LPC buffers, and conditioning of an utterance are removed from the live batch as soon as its
+        n_frames*upsampling_factor samples are generated, so that the compute is proportional
+        to the total number of samples of the batch.
+
+        Args:
+            c (Tensor): Edge-padded input features (B x T_max x C), e.g., by pad_list.
+            n_frames (list): Number of frames of each utterance.
+            intervals (int): Log interval of generation steps.
+            flush (function): Called as flush(idx, samples) with the batch index and the band samples
+                (n_bands x n_frames[idx]*upsampling_factor) of each utterance as soon as it is finished.
+
+        Returns:
+            list: Band samples (n_bands x n_frames*upsampling_factor) of each utterance in batch order.
+
+        """
+        upsampling_factor = self.upsampling_factor
+
+        c_pad = (self.n_quantize // 2) // self.cf_dim
+        f_pad = (self.n_quantize // 2) % self.cf_dim
+
+        B = c.shape[0]
+        device = c.device
+
+        # Input, frames after n_frames are the edge-padding, i.e., replicate right-padding of each utterance
+        c = F.pad(c.transpose(1,2), (self.pad_left,self.pad_right), "replicate").transpose(1,2)
+        if self.scale_in_flag:
+            c = self.conv_s_c(self.conv(self.scale_in(c.transpose(1,2)))).transpose(1,2)
+        else:
+            c = self.conv_s_c(self.conv(c.transpose(1,2))).transpose(1,2)
+
+        n_steps = torch.LongTensor(list(n_frames)).to(device)*upsampling_factor
+        T = int(n_steps.max().item())
+        x_c_out = torch.empty(B,T,self.n_bands, device=device).long() # B x T x n_bands, indexed by batch index
+        x_f_out = torch.empty(B,T,self.n_bands, device=device).long()
+        x_c_wav = torch.empty(B,1,self.n_bands, device=device).fill_(c_pad).long()
+        x_f_wav = torch.empty(B,1,self.n_bands, device=device).fill_(f_pad).long()
+        if self.lpc > 0:
+            x_c_lpc = torch.empty(B,1,self.n_bands,self.lpc, device=device).fill_(c_pad).long() # B x 1 x n_bands x K
+            x_f_lpc = torch.empty(B,1,self.n_bands,self.lpc, device=device).fill_(f_pad).long() # B x 1 x n_bands x K
+        else:
+            x_c_lpc = x_f_lpc = None
+        h = h_2 = h_f = None
+        live = torch.arange(B, device=device) # batch indices of the live utterances
+        samples = [None]*B
+
+        def finish(indices):
+            for i in indices:
+                x = (x_c_out[i,:n_steps[i]]*self.cf_dim+x_f_out[i,:n_steps[i]]).transpose(0,1).float()
+                if self.n_quantize == 65536:
+                    samples[i] = (x - 32768.0) / 32768.0 # n_bands x T_i
+                else:
+                    samples[i] = decode_mu_law_torch(x, mu=self.n_quantize) # n_bands x T_i
+                if flush is not None:
+                    flush(i, samples[i])
+
+        start = time.time()
+        n_live_steps = 0
+        for t in range(T):
+            # compact the live batch
+            finished = n_steps[live] <= t
+            if finished.any():
+                finish(live[finished].tolist())
+                keep = ~finished
+                live = live[keep]
+                c = c[keep]
+                x_c_wav = x_c_wav[keep]
+                x_f_wav = x_f_wav[keep]
+                if h is not None:
+                    h = h[:,keep]
+                    h_2 = h_2[:,keep]
+                    h_f = h_f[:,keep]
+                if self.lpc > 0:
+                    x_c_lpc = x_c_lpc[keep]
+                    x_f_lpc = x_f_lpc[keep]
+            n_live_steps += live.shape[0]
+
+            idx_t_f = t//upsampling_factor
+            x_c_wav, x_f_wav, h, h_2, h_f = self.generate_step(c[:,idx_t_f:idx_t_f+1], x_c_wav, x_f_wav,
+                                                h=h, h_2=h_2, h_f=h_f, x_c_lpc=x_c_lpc, x_f_lpc=x_f_lpc)
+            x_c_out[live,t] = x_c_wav[:,0]
+            x_f_out[live,t] = x_f_wav[:,0]
+
+            if (t + 1) % intervals == 0:
+                logging.info("%d/%d live batch %d, estimated time = %.6f sec (%.6f sec / step)" % (
+                    (t + 1), T, live.shape[0],
+                    ((T - t - 1) / intervals) * (time.time() - start),
+                    (time.time() - start) / intervals))
+                start = time.time()
+        finish(live.tolist())
+
+        logging.info("live batch steps %ld of %ld padded batch steps" % (n_live_steps, B*T))
+
+        return samples
+
     def apply_weight_norm(self):
         """Apply weight normalization module from all of the layers."""
         def _apply_weight_norm(m):
@@ -2525,11 +2769,11 @@ class GRU_WAVE_DECODER_DUALGRU_COMPACT_MBAND(nn.Module):
         c = F.pad(c.transpose(1,2), (self.pad_left,self.pad_right), "replicate").transpose(1,2)
         c = self.conv_s_c(self.conv(self.scale_in(c.transpose(1,2)))).transpose(1,2)
         if self.lpc > 0:
-            x_lpc = torch.empty(B,1,self.n_bands,self.lpc).cuda().fill_(self.n_quantize // 2).long() # B x 1 x n_bands x K
+            x_lpc = torch.empty(B,1,self.n_bands,self.lpc, device=c.device).fill_(self.n_quantize // 2).long() # B x 1 x n_bands x K
         T = c.shape[1]*upsampling_factor
 
         c_f = c[:,:1]
-        out, h = self.gru(torch.cat((c_f,self.embed_wav(torch.empty(B,1,self.n_bands).cuda().fill_(self.n_quantize//2).long()).reshape(B,1,-1)),2))
+        out, h = self.gru(torch.cat((c_f,self.embed_wav(torch.empty(B,1,self.n_bands, device=c.device).fill_(self.n_quantize//2).long()).reshape(B,1,-1)),2))
         out, h_2 = self.gru_2(torch.cat((c_f,out),2))
         if self.lpc > 0:
             signs, scales, logits = self.out(out.transpose(1,2)) # B x T x C -> B x C x T -> B x T x C
@@ -2670,6 +2914,45 @@ class ModulationSpectrumLoss(nn.Module):
 
         return norm, err
 
+    def forward_lengths(self, x, y, lengths):
+        """ x : B x T x C zero- or garbage-padded batch
+            y : B x T x C
+            lengths : B number of valid frames of each utterance
+            return : B, B [norm, error in log10] of each utterance, as forward(x[b:b+1,:lengths[b]], y[b:b+1,:lengths[b]])
+                for lengths within fftsize, otherwise with the fft size of the next power of 2 instead of truncation """
+        B, T, C = x.shape
+        lengths = torch.as_tensor(lengths, device=x.device).long()
+        # select instead of multiply, as nan or inf padding times 0 is nan
+        mask = (torch.arange(T, device=x.device).unsqueeze(0) < lengths.unsqueeze(1)).unsqueeze(-1).expand(B, T, C)
+        x = torch.where(mask, x, torch.zeros_like(x))
+        y = torch.where(mask, y, torch.zeros_like(y))
+        fftsizes = [self.fftsize if n <= self.fftsize else 2**int(math.ceil(math.log2(n))) for n in lengths.tolist()]
+
+        norm = x.new_zeros(B)
+        err = x.new_zeros(B)
+        for fftsize in sorted(set(fftsizes)):
+            # one batched real fft per bucket, halved along time, bins of the other half weighted by hermitian symmetry
+            idx = torch.LongTensor([b for b in range(B) if fftsizes[b] == fftsize]).to(x.device)
+            T_fft = min(T, fftsize)
+            magsp_x = torch.abs(torch.fft.rfftn(x[idx,:T_fft], s=(C, fftsize), dim=(2,1))) # B' x fftsize//2+1 x C
+            magsp_y = torch.abs(torch.fft.rfftn(y[idx,:T_fft], s=(C, fftsize), dim=(2,1)))
+            weight = x.new_ones(fftsize//2+1)*2
+            weight[0] = 1
+            if fftsize % 2 == 0:
+                weight[-1] = 1
+            weight = weight.reshape(1,-1,1)
+            n_bins = fftsize*C
+
+            diff = magsp_y - magsp_x
+            norm[idx] = (weight*diff**2).sum((1,2)).sqrt() / (weight*magsp_y**2).sum((1,2)).sqrt() \
+                    + (weight*diff.abs()).sum((1,2)) / (weight*magsp_y).sum((1,2))
+            log_diff = torch.log10(torch.clamp(magsp_y, min=1e-13)) - torch.log10(torch.clamp(magsp_x, min=1e-13))
+            err_abs = (weight*log_diff.abs()).sum((1,2)) / n_bins
+            err_rms = ((weight*log_diff**2).sum((1,2)) / n_bins).sqrt()
+            err[idx] = torch.where(lengths[idx] > 1, err_abs + err_rms, err_abs)
+
+        return norm, err
+
 
 class LaplaceWavLoss(nn.Module):
     def __init__(self):
@@ -3042,47 +3325,51 @@ class STFTLoss(torch.nn.Module):
         self.fft_size = fft_size
         self.shift_size = shift_size
         self.win_length = win_length
-        self.window = getattr(torch, window)(win_length).cuda()
+        # window as non-persistent buffer to follow .to(device)/.cuda() without entering the state_dict
+        self.register_buffer("window", getattr(torch, window)(win_length), persistent=False)
+
+    def stft_mag(self, x):
+        """Calculate clamped STFT magnitude.
+
+        Args:
+            x (Tensor): Signal (B, T) or (T).
+
+        Returns:
+            Tensor: STFT magnitude (B, frames, fft_size//2+1) or (frames, fft_size//2+1).
+
+        """
+        # torch.stft --> * x N x T x 2 [N: freq_bins, T: frames, 2: real-imag]
+        x_stft = torch.stft(x, self.fft_size, self.shift_size, self.win_length, self.window, return_complex=False)
+        return torch.clamp(torch.sqrt(x_stft[..., 0]**2 + x_stft[..., 1]**2).transpose(-1, -2), min=1e-16)
 
     def forward(self, x, y):
         """Calculate forward propagation.
 
+        Predicted and groundtruth signals are stacked into one batch, so that one torch.stft call is made,
+        and their magnitudes are shared by the spectral-convergence and log-magnitude terms.
+
         Args:
             x (Tensor): Predicted signal (B, T) or (T).
             y (Tensor): Groundtruth signal (B, T) or (T).
 
         Returns:
-            Tensor: Frobenius-norm STFT magnitude loss (B) or (1)
-            Tensor: L1-norm STFT magnitude loss (B) or (1)
+            Tensor: Frobenius-norm + L1-norm STFT magnitude loss (B) or (1)
+            Tensor: Log-magnitude distance in dB (B) or (1)
 
         """
-        # torch.stft --> * x N x T x 2 [N: freq_bins, T: frames, 2: real-imag]
-        #logging.info(x.shape)
-        #logging.info(y.shape)
-        x_stft = torch.stft(x, self.fft_size, self.shift_size, self.win_length, self.window, return_complex=False)
-        #logging.info(x_stft.shape)
-        y_stft = torch.stft(y, self.fft_size, self.shift_size, self.win_length, self.window, return_complex=False)
-        #logging.info(y_stft.shape)
         if len(x.shape) > 1:
-            x_mag = torch.clamp(torch.sqrt(x_stft[..., 0]**2 + x_stft[..., 1]**2).transpose(2, 1), min=1e-16)
-            y_mag = torch.clamp(torch.sqrt(y_stft[..., 0]**2 + y_stft[..., 1]**2).transpose(2, 1), min=1e-16)
-            #x_mag = torch.clamp(torch.sqrt(x_stft[..., 0]**2 + x_stft[..., 1]**2).transpose(2, 1), min=1.2e-7)
-            #y_mag = torch.clamp(torch.sqrt(y_stft[..., 0]**2 + y_stft[..., 1]**2).transpose(2, 1), min=1.2e-7)
-        #    logging.info("BxT")
-        #    logging.info(x_mag.shape)
-        #    logging.info(y_mag.shape)
+            B = x.shape[0]
+            mag = self.stft_mag(torch.cat((x, y), 0))
+            x_mag = mag[:B]
+            y_mag = mag[B:]
             err = y_mag - x_mag
             fro = torch.norm(err, 'fro', dim=(1,2)) / torch.norm(y_mag, 'fro', dim=(1,2)) # (B)
             l1 = err.abs().sum(-1).sum(-1) / y_mag.sum(-1).sum(-1)
             dB = torch.mean(torch.sqrt(torch.mean((20*(torch.log10(x_mag)-torch.log10(y_mag)))**2, -1)), -1)
         else:
-            x_mag = torch.clamp(torch.sqrt(x_stft[..., 0]**2 + x_stft[..., 1]**2).transpose(1, 0), min=1e-16)
-            y_mag = torch.clamp(torch.sqrt(y_stft[..., 0]**2 + y_stft[..., 1]**2).transpose(1, 0), min=1e-16)
-            #x_mag = torch.clamp(torch.sqrt(x_stft[..., 0]**2 + x_stft[..., 1]**2).transpose(1, 0), min=1.2e-7)
-            #y_mag = torch.clamp(torch.sqrt(y_stft[..., 0]**2 + y_stft[..., 1]**2).transpose(1, 0), min=1.2e-7)
-        #    logging.info("T")
-        #    logging.info(x_mag.shape)
-        #    logging.info(y_mag.shape)
+            mag = self.stft_mag(torch.stack((x, y), 0))
+            x_mag = mag[0]
+            y_mag = mag[1]
             err = y_mag - x_mag
             fro = torch.norm(err, 'fro') / torch.norm(y_mag, 'fro') # (1)
             l1 = err.abs().sum() / y_mag.sum()
@@ -3145,11 +3432,10 @@ class MultiResolutionSTFTLoss(torch.nn.Module):
             Tensor: Multi resolution L1-norm STFT magnitude loss (B) or (1)
 
         """
-        fro_count = 0
-        l1_count = 0
         if len(x.shape) > 1:
             B = x.shape[0]
             if len(x.shape) > 2:
+                # all bands of all utterances in one batch, i.e., one stft call per resolution
                 N = x.shape[1]
                 x = x.reshape(B*N,-1)
                 y = y.reshape(B*N,-1)
@@ -3158,53 +3444,35 @@ class MultiResolutionSTFTLoss(torch.nn.Module):
         else:
             B = 0
             N = 0
+        fro_list = []
+        l1_list = []
         for i in range(self.n_fft_confs):
-            #logging.info(x.shape[-1])
-            #logging.info(self.fft_sizes[i])
-            #logging.info(self.win_lengths[i])
-            #logging.info(self.pad_sizes[i])
             if x.shape[-1] > (self.fft_sizes[i]//2):
-            #if x.shape[-1] > self.pad_sizes[i]:
-            #    logging.info("pad-%d"%(i))
                 fro, l1 = self.stft_losses[i](x, y)
-                if fro_count > 0:
-                    if not torch.isinf(fro.sum()) and not torch.isnan(fro.sum()):
-                        fro_loss = torch.cat((fro_loss, fro.unsqueeze(-1)), -1)
-                        fro_count += 1
-                    else:
-                        logging.info("nan_1")
+                # single device sync for the inf/nan check of both terms
+                finite = torch.isfinite(torch.stack((fro.sum(), l1.sum()))).tolist()
+                if finite[0]:
+                    fro_list.append(fro)
                 else:
-                    if not torch.isinf(fro.sum()) and not torch.isnan(fro.sum()):
-                        fro_loss = fro.unsqueeze(-1)
-                        fro_count += 1
-                    else:
-                        logging.info("nan_2")
-                if l1_count > 0:
-                    if not torch.isinf(l1.sum()) and not torch.isnan(l1.sum()):
-                        l1_loss = torch.cat((l1_loss, l1.unsqueeze(-1)), -1)
-                        l1_count += 1
-                    else:
-                        logging.info("nan_3")
+                    logging.info("nan_fro_%d" % (i))
+                if finite[1]:
+                    l1_list.append(l1)
                 else:
-                    if not torch.isinf(l1.sum()) and not torch.isnan(l1.sum()):
-                        l1_loss = l1.unsqueeze(-1)
-                        l1_count += 1
-                    else:
-                        logging.info("nan_4")
-        if fro_count == 0:
+                    logging.info("nan_l1_%d" % (i))
+        if len(fro_list) == 0:
             if len(x.shape) > 1:
                 fro_loss = torch.zeros_like(x[..., 0])
             else:
                 fro_loss = torch.zeros(1, device=x.device)[0]
         else:
-            fro_loss = torch.mean(fro_loss, -1)
-        if l1_count == 0:
+            fro_loss = torch.mean(torch.stack(fro_list, -1), -1)
+        if len(l1_list) == 0:
             if len(x.shape) > 1:
                 l1_loss = torch.zeros_like(x[..., 0])
             else:
                 l1_loss = torch.zeros(1, device=x.device)[0]
         else:
-            l1_loss = torch.mean(l1_loss, -1)
+            l1_loss = torch.mean(torch.stack(l1_list, -1), -1)
         if N > 0:
             fro_loss = fro_loss.reshape(B,N)
             l1_loss = l1_loss.reshape(B,N)
@@ -9,6 +9,7 @@ import torch
 import os
 import logging
 from utils import read_hdf5, check_hdf5, write_hdf5, shape_hdf5
+from feat_index import read_spcidx
 from torch.utils.data import Dataset
 import soundfile as sf
 
@@ -71,7 +72,7 @@ class FeatureDatasetNeuVoco(Dataset):
                     string_path, pad_wav_f_transform=None, wav_transform=None, wav_transform_in=None, spcidx=False, string_path_ft=None,
                         wav_transform_out=None, with_excit=False, codeap_dim=None, n_bands=1, spk_list=None, cf_dim=None, magsp_flag=False,
                             pad_left=0, pad_right=0, wlat_flag=False, wspk_flag=False, worg_flag=False, worgx_flag=False, worgx_band_flag=False,
-                                wrec_flag=True, wf0_flag=False, worgx_rec_flag=None, pad_wav_org_transform=None):
+                                wrec_flag=True, wf0_flag=False, worgx_rec_flag=None, pad_wav_org_transform=None, index=None):
         self.wav_list = wav_list
         self.feat_list = feat_list
         self.pad_wav_transform = pad_wav_transform
@@ -114,10 +115,12 @@ class FeatureDatasetNeuVoco(Dataset):
         self.n_bands = n_bands
         self.upsampling_factor_bands = self.upsampling_factor // self.n_bands
         self.spk_list = spk_list
+        self.stats = SpkStatRegistry(self.spk_list) if self.spk_list is not None else None
         self.cf_dim = cf_dim
         self.spcidx = spcidx
         self.pad_left = pad_left
         self.pad_right = pad_right
+        self.index = index
 
     def __len__(self):
         return len(self.wav_list)
@@ -128,17 +131,15 @@ class FeatureDatasetNeuVoco(Dataset):
         x_org = None
         x_org_band = None
         
-        if (self.spcidx and not check_hdf5(featfile, '/spcidx_range')) or (self.wlat_flag and self.worg_flag):
+        # the extracted feature files in the index have their speech range in it
+        in_index = self.index is not None and featfile in self.index
+        if (self.spcidx and not in_index and not check_hdf5(featfile, '/spcidx_range')) or (self.wlat_flag and self.worg_flag):
             file_org = os.path.join(os.path.dirname(os.path.dirname(featfile)), os.path.basename(os.path.dirname(featfile)).split("-")[0], os.path.basename(featfile))
         if self.spcidx:
-            if not check_hdf5(featfile, '/spcidx_range'):
-                spcidx = read_hdf5(file_org, '/spcidx_range')[0]
+            if not in_index and not check_hdf5(featfile, '/spcidx_range'):
+                spcidx_file = file_org
             else:
-                spcidx = read_hdf5(featfile, '/spcidx_range')[0]
-            if check_hdf5(featfile, self.string_path_org):
-                frm_len = len(read_hdf5(featfile, '/f0_range'))
-            else:
-                frm_len = shape_hdf5(featfile, self.string_path)[0]
+                spcidx_file = featfile
 
         if self.n_bands > 1:
             wavfile_pqmf_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(wavfile)))+"_pqmf_"+str(self.n_bands), \
@@ -236,6 +237,7 @@ class FeatureDatasetNeuVoco(Dataset):
 
             frm_len = h.shape[0]
             if self.spcidx:
+                spcidx = read_spcidx(spcidx_file, self.index, frm_len)
                 f_ss = spcidx[0]-self.pad_left
                 idx_end = -1
                 spcidx_end = spcidx[idx_end]
@@ -310,7 +312,7 @@ class FeatureDatasetNeuVoco(Dataset):
             if self.spk_list is not None:
                 #featfile_spk = os.path.basename(os.path.dirname(featfile)).split("-")[0]
                 #spk_idx = (torch.ones(h.shape[0])*self.spk_list.index(featfile_spk)).long()
-                idx_spk = self.spk_list.index(os.path.basename(os.path.dirname(featfile)))
+                idx_spk = self.stats.index(os.path.basename(os.path.dirname(featfile)))
                 spk_code = torch.LongTensor(self.pad_feat_transform(np.ones(flen)*idx_spk))
 
             if self.wav_transform_in is not None: # laplace-disc
@@ -424,7 +426,7 @@ class FeatureDatasetNeuVoco(Dataset):
 
             if self.spk_list is not None:
                 featfile_spk = os.path.basename(os.path.dirname(featfile))
-                spk_code = (torch.ones(h.shape[0])*self.spk_list.index(featfile_spk)).long()
+                spk_code = (torch.ones(h.shape[0])*self.stats.index(featfile_spk)).long()
 
             if self.wav_transform_in is not None:
                 x_t = torch.LongTensor(self.pad_wav_transform(x_t))
@@ -451,32 +453,47 @@ class FeatureDatasetNeuVoco(Dataset):
                         return {'x': x, 'feat': h, 'slen': slen, 'flen': flen, 'featfile': featfile}
 
 
-def proc_random_spkcv_statcvexcit(src_idx, spk_list, n_cv, n_frm, n_spk, stat_spk_list, mean_path, scale_path, excit_flag=True):
+class SpkStatRegistry(object):
+    """Speaker ids and normalization statistics of all speakers, loaded once per dataset
+
+    The log-F0 mean and scale of the speakers are kept in contiguous tensors in shared memory indexed by speaker id,
+    so that the DataLoader workers use them without copying or reading the stats files per item.
+    """
+
+    def __init__(self, spk_list, stat_spk_list=None, mean_path=None, scale_path=None):
+        self.spk_list = spk_list
+        self.n_spk = len(spk_list)
+        self.spk_idx = {spk: i for i, spk in enumerate(spk_list)}
+        if stat_spk_list is not None and mean_path is not None:
+            self.mean = torch.from_numpy(np.stack([read_hdf5(stat, mean_path)[1:2] for stat in stat_spk_list])).share_memory_()
+            self.std = torch.from_numpy(np.stack([read_hdf5(stat, scale_path)[1:2] for stat in stat_spk_list])).share_memory_()
+        else:
+            self.mean = None
+            self.std = None
+
+    def index(self, spk):
+        """Get the id of a speaker"""
+        return self.spk_idx[spk]
+
+    def stats(self, idx):
+        """Get the mean and scale of speaker ids, (1) for an id or (n, 1) for an array of ids"""
+        return self.mean.numpy()[idx], self.std.numpy()[idx]
+
+    def sample_pairs(self, src_idx, n):
+        """Sample n uniformly random speaker ids other than src_idx"""
+        pair_idx = np.random.randint(0, self.n_spk-1, size=n)
+        return pair_idx + (pair_idx >= src_idx)
+
+
+def proc_random_spkcv_statcvexcit(src_idx, n_cv, n_frm, registry, excit_flag=True):
+    pair_idx = registry.sample_pairs(src_idx, n_cv)
+    trg_code_list = [np.ones(n_frm, dtype=np.int64)*pair_idx[i] for i in range(n_cv)]
+    pair_spk_list = [registry.spk_list[pair_idx[i]] for i in range(n_cv)]
     if excit_flag:
-        mean_trg_list = [None]*n_cv
-        std_trg_list = [None]*n_cv
-        trg_code_list = [None]*n_cv
-        pair_spk_list = [None]*n_cv
-        for i in range(n_cv):
-            pair_idx = np.random.randint(0,n_spk)
-            while pair_idx == src_idx:
-                pair_idx = np.random.randint(0,n_spk)
-            trg_code_list[i] = np.ones(n_frm, dtype=np.int64)*pair_idx
-            mean_trg_list[i] = read_hdf5(stat_spk_list[pair_idx], mean_path)[1:2]
-            std_trg_list[i] = read_hdf5(stat_spk_list[pair_idx], scale_path)[1:2]
-            pair_spk_list[i] = spk_list[pair_idx]
-
-        return mean_trg_list, std_trg_list, trg_code_list, pair_spk_list
-    else:
-        trg_code_list = [None]*n_cv
-        pair_spk_list = [None]*n_cv
-        for i in range(n_cv):
-            pair_idx = np.random.randint(0,n_spk)
-            while pair_idx == src_idx:
-                pair_idx = np.random.randint(0,n_spk)
-            trg_code_list[i] = np.ones(n_frm, dtype=np.int64)*pair_idx
-            pair_spk_list[i] = spk_list[pair_idx]
+        mean_trg, std_trg = registry.stats(pair_idx)
 
+        return list(mean_trg), list(std_trg), trg_code_list, pair_spk_list
+    else:
         return trg_code_list, pair_spk_list
 
 
@@ -486,7 +503,8 @@ class FeatureDatasetCycMceplf0WavVAE(Dataset):
 
     def __init__(self, feat_list, pad_feat_transform, spk_list, stat_spk_list, n_cyc, string_path, excit_dim=None, cap_exc_dim=None,
             upsampling_factor=None, wav_list=None, pad_wav_transform=None, wav_transform=None, spcidx=True, uvcap_flag=True,
-                n_bands=1, cf_dim=None, pad_left=0, pad_right=0, magsp=False, worgx_flag=False, pad_wav_org_transform=None):
+                n_bands=1, cf_dim=None, pad_left=0, pad_right=0, magsp=False, worgx_flag=False, pad_wav_org_transform=None,
+                    index=None):
         self.wav_list = wav_list
         self.feat_list = feat_list
         self.pad_wav_transform = pad_wav_transform
@@ -525,6 +543,12 @@ class FeatureDatasetCycMceplf0WavVAE(Dataset):
             self.upsampling_factor_bands = self.upsampling_factor // self.n_bands
         self.pad_left = pad_left
         self.pad_right = pad_right
+        self.index = index
+        # statistics are only used for the log-F0 conversion of the excitation features
+        if not self.mel or self.excit_dim is not None:
+            self.stats = SpkStatRegistry(self.spk_list, self.stat_spk_list, self.mean_path, self.scale_path)
+        else:
+            self.stats = SpkStatRegistry(self.spk_list)
 
     def __len__(self):
         return len(self.feat_list)
@@ -543,9 +567,11 @@ class FeatureDatasetCycMceplf0WavVAE(Dataset):
                 feat = read_hdf5(featfile, self.string_path)
             else:
                 feat = np.c_[read_hdf5(featfile, '/feat_mceplf0cap')[:,:2], read_hdf5(featfile, '/feat_mceplf0cap')[:,self.cap_exc_dim:]]
-        frm_len = len(read_hdf5(featfile, '/f0_range'))
+        frm_len = self.index.n_frame(featfile) if self.index is not None else None
+        if frm_len is None:
+            frm_len = len(read_hdf5(featfile, '/f0_range'))
         featfile_spk = os.path.basename(os.path.dirname(featfile))
-        src_idx = self.spk_list.index(featfile_spk)
+        src_idx = self.stats.index(featfile_spk)
 
         if self.wav_list is not None:
             wavfile = self.wav_list[idx]            
@@ -578,7 +604,7 @@ class FeatureDatasetCycMceplf0WavVAE(Dataset):
                 assert(x.shape[0]==feat.shape[0]*self.upsampling_factor_bands)
                 frm_len = feat.shape[0]
                 if self.spcidx:
-                    spcidx = read_hdf5(featfile, '/spcidx_range')[0]
+                    spcidx = read_spcidx(featfile, self.index, frm_len)
                     f_ss = spcidx[0]-self.pad_left
                     idx_end = -1
                     spcidx_end = spcidx[idx_end]
@@ -611,7 +637,7 @@ class FeatureDatasetCycMceplf0WavVAE(Dataset):
                 assert(x.shape[0]==feat.shape[0]*self.upsampling_factor)
                 frm_len = feat.shape[0]
                 if self.spcidx:
-                    spcidx = read_hdf5(featfile, '/spcidx_range')[0]
+                    spcidx = read_spcidx(featfile, self.index, frm_len)
                     f_ss = spcidx[0]-self.pad_left
                     idx_end = -1
                     spcidx_end = spcidx[idx_end]
@@ -635,7 +661,7 @@ class FeatureDatasetCycMceplf0WavVAE(Dataset):
                 x = self.wav_transform(x)
             slen = x.shape[0]
         elif self.spcidx:
-            spcidx = read_hdf5(featfile, '/spcidx_range')[0]
+            spcidx = read_spcidx(featfile, self.index, frm_len)
             f_ss = spcidx[0]-self.pad_left
             spcidx_end = spcidx[-1]
             f_es = spcidx_end+self.pad_right
@@ -652,10 +678,8 @@ class FeatureDatasetCycMceplf0WavVAE(Dataset):
 
         if not self.mel or (self.mel and self.excit_dim is not None):
             mean_trg_list, std_trg_list, trg_code_list, pair_spk_list = \
-                proc_random_spkcv_statcvexcit(src_idx, self.spk_list, self.n_cv, flen, self.n_spk, \
-                    self.stat_spk_list, self.mean_path, self.scale_path)
-            mean_src = read_hdf5(self.stat_spk_list[src_idx], self.mean_path)[1:2]
-            std_src = read_hdf5(self.stat_spk_list[src_idx], self.scale_path)[1:2]
+                proc_random_spkcv_statcvexcit(src_idx, self.n_cv, flen, self.stats)
+            mean_src, std_src = self.stats.stats(src_idx)
 
             cv_src_list = [None]*self.n_cv
             if self.excit_dim is not None:
@@ -673,8 +697,7 @@ class FeatureDatasetCycMceplf0WavVAE(Dataset):
                                         (std_trg_list[i]/std_src)*(feat[:,1:2]-mean_src)+mean_trg_list[i]]))
         else:
             trg_code_list, pair_spk_list = \
-                proc_random_spkcv_statcvexcit(src_idx, self.spk_list, self.n_cv, flen, self.n_spk, \
-                    self.stat_spk_list, self.mean_path, self.scale_path, False)
+                proc_random_spkcv_statcvexcit(src_idx, self.n_cv, flen, self.stats, False)
 
         for i in range(self.n_cv):
             trg_code_list[i] = torch.LongTensor(self.pad_feat_transform(trg_code_list[i]))
@@ -824,6 +847,10 @@ class FeatureDatasetEvalCycMceplf0WavVAE(Dataset):
             else:
                 self.uvcap = False
             self.mel = False
+        if not self.mel or self.excit_dim is not None:
+            self.stats = SpkStatRegistry(self.spk_list, self.stat_spk_list, self.mean_path, self.scale_path)
+        else:
+            self.stats = SpkStatRegistry(self.spk_list)
         #for i in range(self.n_spk_data):
         #    if '.' not in spk_list[i] and spk_list[i].find('p') != 0 and len(self.file_list[i]) > 0:
         #        eval_exist = True
@@ -937,8 +964,8 @@ class FeatureDatasetEvalCycMceplf0WavVAE(Dataset):
                 h_src = np.c_[read_hdf5(featfile_src, '/feat_mceplf0cap')[:,:2], read_hdf5(featfile_src, '/feat_mceplf0cap')[:,self.cap_exc_dim:]]
         spk_src = os.path.basename(os.path.dirname(featfile_src))
         spk_trg = os.path.basename(os.path.dirname(featfile_src_trg))
-        idx_src = self.spk_list.index(spk_src)
-        idx_trg = self.spk_list.index(spk_trg)
+        idx_src = self.stats.index(spk_src)
+        idx_trg = self.stats.index(spk_trg)
 
         spcidx_src = read_hdf5(featfile_src, '/spcidx_range')[0]
         frm_len = len(read_hdf5(featfile_src, '/f0_range'))
@@ -1056,10 +1083,8 @@ class FeatureDatasetEvalCycMceplf0WavVAE(Dataset):
         flen = h_src.shape[0]
 
         if not self.mel or (self.mel and self.excit_dim is not None):
-            mean_src = read_hdf5(self.stat_spk_list[idx_src], self.mean_path)[1:2]
-            std_src = read_hdf5(self.stat_spk_list[idx_src], self.scale_path)[1:2]
-            mean_trg = read_hdf5(self.stat_spk_list[idx_trg], self.mean_path)[1:2]
-            std_trg = read_hdf5(self.stat_spk_list[idx_trg], self.scale_path)[1:2]
+            mean_src, std_src = self.stats.stats(idx_src)
+            mean_trg, std_trg = self.stats.stats(idx_trg)
 
         flen_src = h_src.shape[0]
         flen_spc_src = spcidx_src.shape[0]
@@ -1241,6 +1266,7 @@ class FeatureDatasetVAE(Dataset):
         self.string_path = string_path
         self.magsp = magsp
         self.spk_list = spk_list
+        self.stats = SpkStatRegistry(self.spk_list) if self.spk_list is not None else None
         if "mel" in self.string_path:
             self.mel = True
         else:
@@ -1267,7 +1293,7 @@ class FeatureDatasetVAE(Dataset):
         feat = feat[spcidx_s_e[0]:spcidx_s_e[-1]]
         flen = feat.shape[0]
         if self.spk_list is not None:
-            idx_spk = self.spk_list.index(os.path.basename(os.path.dirname(featfile)))
+            idx_spk = self.stats.index(os.path.basename(os.path.dirname(featfile)))
             spk_code = torch.LongTensor(self.pad_feat_transform(np.ones(flen)*idx_spk))
 
         #mean_trg_list, std_trg_list, trg_code_list, pair_spk_list = \
@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2021 Patrick Lumban Tobing (Nagoya University)
+#  Apache 2.0  (http://www.apache.org/licenses/LICENSE-2.0)
+
+from __future__ import division
+
+import fcntl
+import logging
+import os
+
+import h5py
+import numpy as np
+
+from utils import read_hdf5
+
+
+STR_COLUMNS = ["utt", "feat", "wav", "spk"]
+INT_COLUMNS = ["n_frame", "n_feat_frame", "n_sample", "spc_start", "spc_end", "pqmf_bands"]
+DEFAULTS = {"utt": "", "feat": "", "wav": "", "spk": "", "n_frame": -1, "n_feat_frame": -1, "n_sample": -1,
+            "spc_start": -1, "spc_end": -1, "pqmf_bands": 0}
+
+
+def utt_id(path):
+    """FUNCTION TO GET THE UTTERANCE ID OF A WAV OR FEATURE FILE, i.e., <spk>/<basename without extension>"""
+    return os.path.basename(os.path.dirname(path)) + "/" + os.path.splitext(os.path.basename(path))[0]
+
+
+class FeatIndex(object):
+    """COLUMNAR METADATA INDEX OF THE UTTERANCES OF A CORPUS
+
+    One row per utterance, keyed by utt_id, with the feature and wav files, speaker, number of frames of /f0_range,
+    number of frames of the features, i.e., truncated to the mel-spectrogram, number of samples,
+    first and last speech frames of /spcidx_range, and number of PQMF bands of the written band wavs (0 if none).
+    Unknown values are -1. The columns are stored as the datasets of one hdf5 file,
+    so sorting, batching, and datasets can get the lengths and speech ranges without opening each feature file.
+    """
+
+    def __init__(self):
+        self.columns = {name: np.array([], dtype=bytes) for name in STR_COLUMNS}
+        self.columns.update({name: np.array([], dtype=np.int64) for name in INT_COLUMNS})
+        self._build()
+
+    def _build(self):
+        self.utts = [x.decode("utf-8") for x in self.columns["utt"]]
+        self.feat_row = {x.decode("utf-8"): i for i, x in enumerate(self.columns["feat"]) if len(x) > 0}
+        self.utt_row = {x: i for i, x in enumerate(self.utts)}
+
+    def __len__(self):
+        return len(self.utts)
+
+    def __contains__(self, featfile):
+        return featfile in self.feat_row
+
+    def get(self, featfile):
+        """FUNCTION TO GET THE ROW OF A FEATURE FILE
+
+        Return:
+            (dict): values of the columns, None if not in the index
+        """
+        i = self.feat_row.get(featfile)
+        if i is None:
+            return None
+        row = {name: self.columns[name][i].decode("utf-8") for name in STR_COLUMNS}
+        row.update({name: int(self.columns[name][i]) for name in INT_COLUMNS})
+        return row
+
+    def n_frame(self, featfile, column="n_frame"):
+        """FUNCTION TO GET THE NUMBER OF FRAMES OF /f0_range OF A FEATURE FILE, OR OF THE FEATURES, None IF UNKNOWN"""
+        i = self.feat_row.get(featfile)
+        if i is None or self.columns[column][i] < 0:
+            return None
+        return int(self.columns[column][i])
+
+    def n_frames(self, feat_list, column="n_frame"):
+        """FUNCTION TO GET THE NUMBER OF FRAMES OF A LIST OF FEATURE FILES, None FOR THE UNKNOWN ONES"""
+        return [self.n_frame(featfile, column=column) for featfile in feat_list]
+
+    def spc_range(self, featfile):
+        """FUNCTION TO GET THE FIRST AND LAST SPEECH FRAMES OF A FEATURE FILE, None IF UNKNOWN"""
+        i = self.feat_row.get(featfile)
+        if i is None or self.columns["spc_start"][i] < 0:
+            return None
+        return int(self.columns["spc_start"][i]), int(self.columns["spc_end"][i])
+
+    def update(self, rows):
+        """FUNCTION TO ADD OR UPDATE ROWS
+
+        Args:
+            rows (list): dicts of the values of the columns with utt, the other columns are kept or set to default
+        """
+        row_idx = dict(self.utt_row)
+        for row in rows:
+            if row["utt"] not in row_idx:
+                row_idx[row["utt"]] = len(row_idx)
+        n_new = len(row_idx) - len(self.utts)
+        for name in STR_COLUMNS + INT_COLUMNS:
+            default = DEFAULTS[name].encode("utf-8") if name in STR_COLUMNS else DEFAULTS[name]
+            values = self.columns[name].tolist() + [default]*n_new
+            for row in rows:
+                if name in row:
+                    values[row_idx[row["utt"]]] = row[name].encode("utf-8") if name in STR_COLUMNS else int(row[name])
+            self.columns[name] = np.array(values, dtype=bytes if name in STR_COLUMNS else np.int64)
+        self._build()
+
+    def save(self, path):
+        """FUNCTION TO SAVE THE INDEX TO HDF5, REPLACING THE FILE AT ONCE"""
+        folder_name = os.path.dirname(path)
+        if len(folder_name) > 0 and not os.path.exists(folder_name):
+            os.makedirs(folder_name)
+        tmp_path = path + ".tmp%d" % (os.getpid())
+        with h5py.File(tmp_path, "w") as f:
+            for name, values in self.columns.items():
+                f.create_dataset(name, data=values)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        """FUNCTION TO LOAD AN INDEX, OR THE CONCATENATED INDICES OF PATHS SEPARATED BY @, e.g., OF SEVERAL SETS"""
+        index = cls()
+        for index_path in path.split("@"):
+            with h5py.File(index_path, "r") as f:
+                n_row = len(f["utt"])
+                for name in STR_COLUMNS + INT_COLUMNS:
+                    # n_frame of an index without n_feat_frame is of the features, not of /f0_range, i.e., unknown
+                    if name in f and (name != "n_frame" or "n_feat_frame" in f):
+                        values = f[name][()]
+                    else:
+                        default = DEFAULTS[name].encode("utf-8") if name in STR_COLUMNS else DEFAULTS[name]
+                        values = np.array([default]*n_row, dtype=bytes if name in STR_COLUMNS else np.int64)
+                    index.columns[name] = np.concatenate((index.columns[name], values)) \
+                                            if len(index.columns[name]) > 0 else values
+        index._build()
+        return index
+
+def load_index(path):
+    """FUNCTION TO LOAD THE EXISTING INDICES OF THE PATHS SEPARATED BY @
+
+    Return:
+        (FeatIndex): index, None if path is not set or no index exists, i.e., the feature files are read
+    """
+    if path is None or len(path) == 0:
+        return None
+    paths = [x for x in path.split("@") if os.path.exists(x)]
+    for x in path.split("@"):
+        if not os.path.exists(x):
+            logging.warn("index %s does not exist, its feature files are read" % (x))
+    if len(paths) == 0:
+        return None
+    return FeatIndex.load("@".join(paths))
+
+
+def update_index(path, rows):
+    """FUNCTION TO ADD OR UPDATE ROWS OF THE INDEX FILE, LOCKED AGAINST THE OTHER WRITING JOBS
+
+    Args:
+        path (str): index file, created if not exists
+        rows (list): dicts of the values of the columns with utt
+    """
+    folder_name = os.path.dirname(path)
+    if len(folder_name) > 0 and not os.path.exists(folder_name):
+        os.makedirs(folder_name)
+    with open(path + ".lock", "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            index = FeatIndex.load(path) if os.path.exists(path) else FeatIndex()
+            index.update(rows)
+            index.save(path)
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+    return index
+
+
+def read_spcidx(featfile, index=None, frm_len=None):
+    """FUNCTION TO GET THE SPEECH FRAME INDICES AS USED BY THE DATASETS
+
+    Only the first and last speech frames are taken from the index, if the last one is within frm_len,
+    as the datasets only use these, i.e., the last one below frm_len. Otherwise /spcidx_range is read.
+
+    Args:
+        featfile (str): feature file
+        index (FeatIndex): index, None to read /spcidx_range
+        frm_len (int): number of frames of the loaded features
+
+    Return:
+        (ndarray): speech frame indices
+    """
+    if index is not None:
+        spc = index.spc_range(featfile)
+        if spc is not None and (frm_len is None or spc[1] < frm_len):
+            return np.array(spc)
+    return read_hdf5(featfile, "/spcidx_range")[0]
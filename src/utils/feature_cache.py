@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2021 Patrick Lumban Tobing (Nagoya University)
+#  Apache 2.0  (http://www.apache.org/licenses/LICENSE-2.0)
+
+from __future__ import division
+
+import fcntl
+import hashlib
+import json
+import logging
+import os
+
+import h5py
+import numpy as np
+
+from utils import write_hdf5
+
+
+def wav_hash(wav_file):
+    """FUNCTION TO COMPUTE THE CONTENT HASH OF A WAV FILE
+
+    Args:
+        wav_file (str): wav filename
+
+    Return:
+        (str): md5 of the file content
+    """
+    md5 = hashlib.md5()
+    with open(wav_file, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            md5.update(chunk)
+    return md5.hexdigest()
+
+
+def params_key(params):
+    """FUNCTION TO COMPUTE THE KEY OF A SET OF ANALYSIS PARAMETERS
+
+    Args:
+        params (dict): analysis parameters of a group of datasets
+
+    Return:
+        (str): md5 of the sorted parameters
+    """
+    return hashlib.md5(json.dumps(params, sort_keys=True).encode()).hexdigest()
+
+
+class FeatureCache(object):
+    """CONTENT-ADDRESSED CACHE OF PER-FILE ANALYSIS RESULTS
+
+    The results are stored in an hdf5 file per waveform content hash as datasets "/group/name",
+    a group holding the results of one analysis, e.g., WORLD or STFT, with the key of its parameters.
+    The index of the valid (hash, group, key) entries is kept in a single json file,
+    updated under a file lock so that concurrent jobs can share the cache.
+    The key is also an attribute of the group, removed before its datasets are overwritten
+    and set after they are written, so that an entry of the index not yet updated,
+    e.g., of a killed job, is never taken for the new datasets.
+
+    Args:
+        cache_dir (str): cache directory
+        flush_steps (int): number of new entries after which the index is updated
+    """
+
+    def __init__(self, cache_dir, flush_steps=50):
+        self.cache_dir = cache_dir
+        self.index_file = os.path.join(cache_dir, "index.json")
+        self.flush_steps = flush_steps
+        if not os.path.exists(cache_dir):
+            os.makedirs(cache_dir)
+        self.index = self.read_index()
+        self.updates = {}
+        self.n_hit = 0
+        self.n_miss = 0
+
+    def read_index(self):
+        if not os.path.exists(self.index_file):
+            return {}
+        with open(self.index_file) as f:
+            return json.load(f)
+
+    def hdf5_name(self, hash_):
+        return os.path.join(self.cache_dir, hash_[:2], hash_ + ".h5")
+
+    def load(self, hash_, group, params, names):
+        """FUNCTION TO LOAD THE CACHED DATASETS OF A GROUP
+
+        Args:
+            hash_ (str): waveform content hash
+            group (str): group name
+            params (dict): analysis parameters of the group
+            names (list): dataset names of the group
+
+        Return:
+            (dict): dataset values, None if not cached with the same parameters
+        """
+        key = params_key(params)
+        entry = self.updates.get(hash_, self.index.get(hash_, {}))
+        if entry.get(group) != key:
+            self.n_miss += 1
+            return None
+        try:
+            with h5py.File(self.hdf5_name(hash_), "r") as f:
+                group_key = f[group].attrs.get("params_key")
+                if isinstance(group_key, bytes):
+                    group_key = group_key.decode("utf-8")
+                if group_key != key:
+                    self.n_miss += 1
+                    return None
+                data = {name: f["/"+group+"/"+name][()] for name in names}
+        except (IOError, OSError, KeyError) as e:
+            logging.warn("invalid cache entry %s/%s: %s" % (hash_, group, e))
+            self.n_miss += 1
+            return None
+        self.n_hit += 1
+        return data
+
+    def save(self, hash_, group, params, data):
+        """FUNCTION TO SAVE THE DATASETS OF A GROUP
+
+        Args:
+            hash_ (str): waveform content hash
+            group (str): group name
+            params (dict): analysis parameters of the group
+            data (dict): dataset values
+        """
+        hdf5name = self.hdf5_name(hash_)
+        if os.path.exists(hdf5name):
+            with h5py.File(hdf5name, "a") as f:
+                if group in f and "params_key" in f[group].attrs:
+                    del f[group].attrs["params_key"]
+        for name, value in data.items():
+            write_hdf5(hdf5name, "/"+group+"/"+name, np.array(value))
+        with h5py.File(hdf5name, "a") as f:
+            f[group].attrs["params_key"] = params_key(params)
+        if hash_ not in self.updates:
+            self.updates[hash_] = dict(self.index.get(hash_, {}))
+        self.updates[hash_][group] = params_key(params)
+        if len(self.updates) >= self.flush_steps:
+            self.flush()
+
+    def flush(self):
+        """FUNCTION TO MERGE THE NEW ENTRIES INTO THE INDEX FILE"""
+        if len(self.updates) == 0:
+            return
+        with open(self.index_file + ".lock", "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                index = self.read_index()
+                for hash_, entry in self.updates.items():
+                    index.setdefault(hash_, {}).update(entry)
+                with open(self.index_file + ".tmp", "w") as f:
+                    json.dump(index, f)
+                os.replace(self.index_file + ".tmp", self.index_file)
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+        self.index = index
+        self.updates = {}
@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2021 Patrick Lumban Tobing (Nagoya University)
+#  Apache 2.0  (http://www.apache.org/licenses/LICENSE-2.0)
+
+from __future__ import division
+
+import inspect
+
+import numpy as np
+from scipy.signal import get_window
+import librosa
+
+
+ENGINES = {}
+
+
+class MelSpEngine(object):
+    """BATCHED MAGNITUDE AND MEL-SPECTROGRAM EXTRACTION AS IN melsp OF feature_extract.py
+
+    The centered STFT and the periodic Hann window zero-padded to fftl follow librosa,
+    with the default padding of librosa.core.stft of the installed version, i.e., reflect before 0.9 and constant after,
+    as melsp of feature_extract.py does not set it. Measured by bench_melsp_engine.py with librosa 0.8.1,
+    the max. relative deviation is 4.6e-8 for the magnitude and 2.4e-7 for the mel-spectrogram.
+    The frames of several utterances are stacked and transformed in chunks of at most max_frames frames,
+    with the window and the mel-filterbank kept for the configuration.
+
+    Args:
+        fs (int): sampling rate
+        fftl (int): FFT length
+        shiftms (float): frame shift in ms
+        winms (float): window length in ms
+        mel_dim (int): number of mel bins
+        max_frames (int): maximum number of frames of one FFT call
+        dtype (type): output dtype, float32 as the complex64 STFT of librosa
+        pad_mode (str): padding mode of the centered frames, that of librosa.core.stft if None
+    """
+
+    def __init__(self, fs, fftl, shiftms, winms, mel_dim, max_frames=2048, dtype=np.float32, pad_mode=None):
+        self.fs = fs
+        self.fftl = fftl
+        self.hop_length = int((fs/1000)*shiftms)
+        self.win_length = int((fs/1000)*winms)
+        self.max_frames = max_frames
+        self.dtype = dtype
+        if pad_mode is None:
+            pad_mode = inspect.signature(librosa.core.stft).parameters["pad_mode"].default
+        self.pad_mode = pad_mode
+        self.window = np.zeros(fftl)
+        lpad = (fftl - self.win_length) // 2
+        self.window[lpad:lpad+self.win_length] = get_window('hann', self.win_length, fftbins=True)
+        self.melfb = librosa.filters.mel(fs, fftl, n_mels=mel_dim)
+
+    def frames(self, x):
+        """FUNCTION TO GET THE FRAMES OF A WAVEFORM AS A STRIDED VIEW OF ITS PADDED COPY
+
+        Args:
+            x (ndarray): waveform (T_wav)
+
+        Return:
+            (ndarray): frames (T_frm x fftl)
+        """
+        x_pad = np.pad(np.asarray(x, dtype=np.float64), self.fftl//2, mode=self.pad_mode)
+        n_frames = 1 + (len(x_pad) - self.fftl) // self.hop_length
+        stride = x_pad.strides[0]
+        return np.lib.stride_tricks.as_strided(x_pad, shape=(n_frames, self.fftl),
+                    strides=(self.hop_length*stride, stride), writeable=False)
+
+    def magsp(self, x_list):
+        """FUNCTION TO COMPUTE THE MAGNITUDE SPECTROGRAMS OF A BATCH OF WAVEFORMS
+
+        Args:
+            x_list (list): waveforms
+
+        Return:
+            (list): magnitude spectrograms (T_frm x (fftl//2+1))
+        """
+        frames_list = [self.frames(x) for x in x_list]
+        offsets = np.cumsum([0] + [frames.shape[0] for frames in frames_list])
+        magspec = np.empty((offsets[-1], self.fftl//2+1), dtype=self.dtype)
+        for start in range(0, offsets[-1], self.max_frames):
+            end = min(start + self.max_frames, offsets[-1])
+            chunk = [frames[max(start-offset, 0):end-offset] \
+                        for frames, offset in zip(frames_list, offsets[:-1]) \
+                            if offset < end and offset + frames.shape[0] > start]
+            magspec[start:end] = np.abs(np.fft.rfft(np.concatenate(chunk) * self.window, axis=-1))
+        return np.split(magspec, offsets[1:-1])
+
+    def melsp(self, magspec):
+        """FUNCTION TO COMPUTE THE MEL-SPECTROGRAM OF A MAGNITUDE SPECTROGRAM"""
+        return np.dot(magspec, self.melfb.T)
+
+    def __call__(self, x_list):
+        """FUNCTION TO COMPUTE THE MEL AND MAGNITUDE SPECTROGRAMS OF A BATCH OF WAVEFORMS
+
+        Return:
+            (list): (mel-spectrogram, magnitude spectrogram) pairs as melsp of feature_extract.py
+        """
+        return [(self.melsp(magspec), magspec) for magspec in self.magsp(x_list)]
+
+
+def get_engine(fs, fftl, shiftms, winms, mel_dim, max_frames=2048):
+    """FUNCTION TO GET THE ENGINE OF A CONFIGURATION, CREATED ONCE PER PROCESS"""
+    key = (fs, fftl, shiftms, winms, mel_dim, max_frames)
+    if key not in ENGINES:
+        ENGINES[key] = MelSpEngine(fs, fftl, shiftms, winms, mel_dim, max_frames=max_frames)
+    return ENGINES[key]
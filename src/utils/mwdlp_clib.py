@@ -0,0 +1,251 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2021 Patrick Lumban Tobing (Nagoya University)
+#  Apache 2.0  (http://www.apache.org/licenses/LICENSE-2.0)
+
+from __future__ import division
+
+import ctypes
+import logging
+import os
+
+import numpy as np
+
+
+_FLOAT_P = np.ctypeslib.ndpointer(dtype=np.float32, flags="C_CONTIGUOUS")
+_SHORT_P = np.ctypeslib.ndpointer(dtype=np.int16, flags="C_CONTIGUOUS")
+_INT_P = np.ctypeslib.ndpointer(dtype=np.int32, flags="C_CONTIGUOUS")
+
+
+class MWDLPCLib(object):
+    """PYTHON BINDINGS OF THE REAL-TIME C ENGINE
+
+    The shared library is built in a demo_realtime directory, after dumping the model, by
+        make shared
+    giving lib/libmwdlp10cycvae.so (conversion and synthesis) or lib/libmwdlp10.so (synthesis only).
+
+    The model weights are static in the library, and each utterance gets its own network state,
+    so that many utterances can be decoded in one process without wav-file I/O.
+    The GIL is released during the C calls, hence utterances can also be decoded in parallel threads.
+
+    Args:
+        lib_path (str): path of the shared library
+    """
+
+    def __init__(self, lib_path):
+        self.lib = ctypes.CDLL(os.path.abspath(lib_path))
+        lib = self.lib
+
+        lib.mwdlp10net_py_get_info.argtypes = [_INT_P]
+        lib.mwdlp10net_py_get_info.restype = ctypes.c_int
+        lib.mwdlp10net_py_get_n_frames.argtypes = [ctypes.c_long]
+        lib.mwdlp10net_py_get_n_frames.restype = ctypes.c_long
+        lib.mwdlp10net_py_melsp_extract.argtypes = [_FLOAT_P, ctypes.c_long, _FLOAT_P]
+        lib.mwdlp10net_py_melsp_extract.restype = ctypes.c_long
+        lib.mwdlp10net_create.argtypes = []
+        lib.mwdlp10net_create.restype = ctypes.c_void_p
+        lib.mwdlp10net_destroy.argtypes = [ctypes.c_void_p]
+        lib.mwdlp10net_destroy.restype = None
+        lib.mwdlp10net_py_synthesize.argtypes = [ctypes.c_void_p, _FLOAT_P, _SHORT_P,
+                                                    ctypes.POINTER(ctypes.c_int), ctypes.c_int]
+        lib.mwdlp10net_py_synthesize.restype = None
+        lib.mwdlp10net_py_set_sampling.argtypes = [ctypes.c_int, ctypes.c_uint]
+        lib.mwdlp10net_py_set_sampling.restype = None
+        lib.mwdlp10net_py_set_pdf_log.argtypes = [ctypes.c_void_p, ctypes.c_long]
+        lib.mwdlp10net_py_set_pdf_log.restype = None
+        lib.mwdlp10net_py_get_pdf_log_count.argtypes = []
+        lib.mwdlp10net_py_get_pdf_log_count.restype = ctypes.c_long
+
+        info = np.zeros(13, dtype=np.int32)
+        lib.mwdlp10net_py_get_info(info)
+        self.features_dim, self.max_n_output, self.frame_shift, self.fs, self.no_dlpc, \
+            self.n_spk, self.spk_dim, self.n_weight_emb, self.conv_vc_delay, \
+            self.cf_dim, self.n_bands, self.upsampling_factor, self.right_samples = [int(x) for x in info]
+        self._pdf_log = None
+
+        self.cv_flag = hasattr(lib, "mwdlp10cyclevaenet_py_synthesize")
+        if self.cv_flag:
+            lib.mwdlp10cyclevaenet_create.argtypes = []
+            lib.mwdlp10cyclevaenet_create.restype = ctypes.c_void_p
+            lib.mwdlp10cyclevaenet_destroy.argtypes = [ctypes.c_void_p]
+            lib.mwdlp10cyclevaenet_destroy.restype = None
+            lib.mwdlp10cyclevaenet_py_spk_code_point.argtypes = [ctypes.c_int, _FLOAT_P, _FLOAT_P]
+            lib.mwdlp10cyclevaenet_py_spk_code_point.restype = None
+            lib.mwdlp10cyclevaenet_py_spk_code_coord.argtypes = [ctypes.c_float, ctypes.c_float, _FLOAT_P, _FLOAT_P]
+            lib.mwdlp10cyclevaenet_py_spk_code_coord.restype = None
+            lib.mwdlp10cyclevaenet_py_synthesize.argtypes = [ctypes.c_void_p, _FLOAT_P, _FLOAT_P, _SHORT_P,
+                                                                ctypes.POINTER(ctypes.c_int), ctypes.c_int]
+            lib.mwdlp10cyclevaenet_py_synthesize.restype = None
+
+    def set_sampling(self, argmax=False, seed=1):
+        """FUNCTION TO SET THE SAMPLING OF THE OUTPUT SAMPLES AND THE CONVERTED MEL-SPECTROGRAM
+
+        Args:
+            argmax (bool): deterministic decoding, argmax of output logits and mean of melsp, if True
+            seed (int): seed of random sampling
+        """
+        self.lib.mwdlp10net_py_set_sampling(int(argmax), seed)
+
+    def start_pdf_log(self, n_max):
+        """FUNCTION TO START LOGGING THE OUTPUT LOGITS OF EVERY BAND SAMPLE
+
+        The log is global in the library, hence it should not be used with parallel decoding.
+
+        Args:
+            n_max (int): maximum number of logged logit vectors, 2 x n_bands per output sample step
+        """
+        self._pdf_log = np.zeros((n_max, self.cf_dim), dtype=np.float32)
+        self.lib.mwdlp10net_py_set_pdf_log(self._pdf_log.ctypes.data, n_max)
+
+    def stop_pdf_log(self):
+        """FUNCTION TO STOP LOGGING THE OUTPUT LOGITS
+
+        Return:
+            (ndarray): logits (n_steps x 2 x n_bands x cf_dim), coarse then fine of each step
+        """
+        n_logged = self.lib.mwdlp10net_py_get_pdf_log_count()
+        self.lib.mwdlp10net_py_set_pdf_log(None, 0)
+        if self._pdf_log is None:
+            return np.zeros((0, 2, self.n_bands, self.cf_dim), dtype=np.float32)
+        n_steps = n_logged // (2*self.n_bands)
+        pdf_log = self._pdf_log[:n_steps*2*self.n_bands].reshape(n_steps, 2, self.n_bands, self.cf_dim)
+        self._pdf_log = None
+        return pdf_log
+
+    def melsp_extract(self, x):
+        """FUNCTION TO EXTRACT THE INPUT MEL-SPECTROGRAM AS IN THE REAL-TIME ANALYSIS
+
+        Args:
+            x (ndarray): waveform, int16 or float in [-1,1)
+
+        Return:
+            (ndarray): log(1+10000*melsp) (T x features_dim)
+        """
+        if x.dtype == np.int16:
+            x = x.astype(np.float32) / 32768
+        x = np.ascontiguousarray(x, dtype=np.float32)
+        # the last frame of the trailing remainder samples is completed with their reflection,
+        # which is folded back at the first remainder sample if they are fewer than half of the frame shift
+        n_remainder = (len(x) - self.right_samples) % self.frame_shift
+        if len(x) >= self.right_samples and 0 < n_remainder < self.frame_shift / 2:
+            logging.warn("%d trailing samples of %d-sample shift, the last frame uses their folded reflection" \
+                            % (n_remainder, self.frame_shift))
+        n_frames = self.lib.mwdlp10net_py_get_n_frames(len(x))
+        melsp = np.zeros((max(n_frames, 0), self.features_dim), dtype=np.float32)
+        if n_frames > 0:
+            n_frames = self.lib.mwdlp10net_py_melsp_extract(x, len(x), melsp)
+        return melsp[:n_frames]
+
+    def spk_code(self, spk_idx=None, spk_coord=None):
+        """FUNCTION TO COMPUTE THE SPEAKER CODE OF A TARGET SPEAKER POINT OR INTERPOLATED COORDINATE
+
+        Args:
+            spk_idx (int): 1-based speaker index, ignored if spk_coord is given
+            spk_coord (list): 2-dim speaker coordinate [x, y]
+
+        Return:
+            (ndarray): speaker code (spk_dim)
+            (ndarray): speaker weight coefficients (n_weight_emb)
+        """
+        assert self.cv_flag, "library is built without conversion"
+        spk_code_aux = np.zeros(self.spk_dim, dtype=np.float32)
+        spk_code_coeff = np.zeros(self.n_weight_emb, dtype=np.float32)
+        if spk_coord is not None:
+            self.lib.mwdlp10cyclevaenet_py_spk_code_coord(spk_coord[0], spk_coord[1], spk_code_aux, spk_code_coeff)
+        else:
+            assert spk_idx is not None and spk_idx >= 1 and spk_idx <= self.n_spk, \
+                "speaker index %s out of 1..%d" % (spk_idx, self.n_spk)
+            self.lib.mwdlp10cyclevaenet_py_spk_code_point(spk_idx, spk_code_aux, spk_code_coeff)
+        return spk_code_aux, spk_code_coeff
+
+    def synthesize(self, melsp):
+        """FUNCTION TO SYNTHESIZE A WAVEFORM FROM A MEL-SPECTROGRAM
+
+        Args:
+            melsp (ndarray): log(1+10000*melsp) (T x features_dim)
+
+        Return:
+            (ndarray): int16 waveform
+        """
+        if len(melsp) == 0:
+            return np.zeros(0, dtype=np.int16)
+        net = self.lib.mwdlp10net_create()
+        pcm = np.zeros(self.max_n_output, dtype=np.int16)
+        n_output = ctypes.c_int(0)
+        out = []
+        try:
+            for t in range(len(melsp)):
+                self.lib.mwdlp10net_py_synthesize(net, np.array(melsp[t], dtype=np.float32), pcm,
+                    ctypes.byref(n_output), 0)
+                if n_output.value > 0:
+                    out.append(pcm[:n_output.value].copy())
+            # last frame flag, synthesize the right padding
+            self.lib.mwdlp10net_py_synthesize(net, np.array(melsp[-1], dtype=np.float32), pcm,
+                ctypes.byref(n_output), 1)
+            if n_output.value > 0:
+                out.append(pcm[:n_output.value].copy())
+        finally:
+            self.lib.mwdlp10net_destroy(net)
+        return np.concatenate(out) if len(out) > 0 else np.zeros(0, dtype=np.int16)
+
+    def convert_synthesize(self, melsp, spk_code_aux, return_melsp=False):
+        """FUNCTION TO CONVERT A MEL-SPECTROGRAM TO A TARGET SPEAKER CODE AND SYNTHESIZE THE WAVEFORM
+
+        Args:
+            melsp (ndarray): log(1+10000*melsp) (T x features_dim)
+            spk_code_aux (ndarray): speaker code (spk_dim), see spk_code
+            return_melsp (bool): also return the converted melsp
+
+        Return:
+            (ndarray): int16 waveform
+            (ndarray): converted log(1+10000*melsp) (T x features_dim), if return_melsp
+        """
+        assert self.cv_flag, "library is built without conversion"
+        if len(melsp) == 0:
+            if return_melsp:
+                return np.zeros(0, dtype=np.int16), np.zeros((0, self.features_dim), dtype=np.float32)
+            return np.zeros(0, dtype=np.int16)
+        net = self.lib.mwdlp10cyclevaenet_create()
+        spk_code_aux = np.ascontiguousarray(spk_code_aux, dtype=np.float32)
+        pcm = np.zeros(self.max_n_output, dtype=np.int16)
+        n_output = ctypes.c_int(0)
+        out = []
+        melsp_cv = []
+        # the last frame is repeated for the conversion delay, then the last frame flag synthesizes the right padding
+        frames = list(range(len(melsp))) + [len(melsp)-1]*self.conv_vc_delay
+        try:
+            for i, t in enumerate(frames):
+                features = np.array(melsp[t], dtype=np.float32)
+                self.lib.mwdlp10cyclevaenet_py_synthesize(net, features, spk_code_aux,
+                    pcm, ctypes.byref(n_output), 0)
+                if n_output.value > 0:
+                    out.append(pcm[:n_output.value].copy())
+                # features is overwritten with the converted melsp of frame i-conv_vc_delay
+                if i >= self.conv_vc_delay:
+                    melsp_cv.append(features)
+            self.lib.mwdlp10cyclevaenet_py_synthesize(net, np.array(melsp[-1], dtype=np.float32), spk_code_aux,
+                pcm, ctypes.byref(n_output), 1)
+            if n_output.value > 0:
+                out.append(pcm[:n_output.value].copy())
+        finally:
+            self.lib.mwdlp10cyclevaenet_destroy(net)
+        out = np.concatenate(out) if len(out) > 0 else np.zeros(0, dtype=np.int16)
+        if return_melsp:
+            return out, np.array(melsp_cv, dtype=np.float32).reshape(-1, self.features_dim)
+        return out
+
+    def decode(self, x, spk_idx=None, spk_coord=None):
+        """FUNCTION TO ANALYZE, OPTIONALLY CONVERT, AND SYNTHESIZE A WAVEFORM
+
+        Args:
+            x (ndarray): input waveform, int16 or float in [-1,1)
+            spk_idx (int): 1-based target speaker index
+            spk_coord (list): 2-dim target speaker coordinate, used instead of spk_idx if given
+
+        Return:
+            (ndarray): int16 waveform
+        """
+        melsp = self.melsp_extract(x)
+        if spk_idx is None and spk_coord is None:
+            return self.synthesize(melsp)
+        return self.convert_synthesize(melsp, self.spk_code(spk_idx=spk_idx, spk_coord=spk_coord)[0])
@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2021 Patrick Lumban Tobing (Nagoya University)
+#  Apache 2.0  (http://www.apache.org/licenses/LICENSE-2.0)
+
+from __future__ import division
+
+import numpy as np
+from scipy.fftpack import dct
+from scipy.spatial.distance import cdist
+
+from dtw_c import dtw_c as dtw
+
+
+def melsp_restore(log_1pmelsp):
+    """FUNCTION TO RESTORE LINEAR MEL-SPECTROGRAM FROM LOG(1+10000*MELSP)
+
+    Args:
+        log_1pmelsp (ndarray): log-compressed mel-spectrogram (T x D)
+
+    Return:
+        (ndarray): linear mel-spectrogram (T x D)
+    """
+    return (np.exp(log_1pmelsp)-1)/10000
+
+
+def dtw_path(dist):
+    """FUNCTION TO COMPUTE DTW PATH FROM A DISTANCE MATRIX
+
+    The accumulation is vectorized over anti-diagonals, i.e., cells (i,j) with the same i+j
+    only depend on the previous two anti-diagonals, so the loop runs N+M times instead of N*M.
+
+    Args:
+        dist (ndarray): local distance matrix (N x M)
+
+    Return:
+        (ndarray): path indices of the 1st sequence (L)
+        (ndarray): path indices of the 2nd sequence (L)
+        (float): accumulated distance at the end of path
+    """
+    N, M = dist.shape
+    acc = np.full((N+1, M+1), np.inf)
+    acc[0,0] = 0
+    for k in range(2, N+M+1):
+        i = np.arange(max(1, k-M), min(N, k-1)+1)
+        j = k - i
+        acc[i,j] = dist[i-1,j-1] + np.minimum(np.minimum(acc[i-1,j-1], acc[i-1,j]), acc[i,j-1])
+
+    i, j = N, M
+    path_x = [i-1]
+    path_y = [j-1]
+    while i > 1 or j > 1:
+        if i == 1:
+            j -= 1
+        elif j == 1:
+            i -= 1
+        else:
+            step = np.argmin([acc[i-1,j-1], acc[i-1,j], acc[i,j-1]])
+            if step == 0:
+                i -= 1
+                j -= 1
+            elif step == 1:
+                i -= 1
+            else:
+                j -= 1
+        path_x.append(i-1)
+        path_y.append(j-1)
+
+    return np.array(path_x[::-1]), np.array(path_y[::-1]), acc[N,M]
+
+
+def dtw_align(x, y, metric="euclidean"):
+    """FUNCTION TO ALIGN TWO FEATURE SEQUENCES WITH DTW
+
+    Args:
+        x (ndarray): 1st feature sequence (N x D)
+        y (ndarray): 2nd feature sequence (M x D)
+        metric (str): distance metric of scipy cdist
+
+    Return:
+        (ndarray): path indices of x (L)
+        (ndarray): path indices of y (L)
+    """
+    path_x, path_y, _ = dtw_path(cdist(x, y, metric=metric))
+    return path_x, path_y
+
+
+def calc_lsd(melsp, melsp_ref):
+    """FUNCTION TO COMPUTE FRAME-WISE LOG-SPECTRAL DISTANCE [dB]
+
+    Args:
+        melsp (ndarray): linear mel-spectrogram (T x D)
+        melsp_ref (ndarray): reference linear mel-spectrogram (T x D)
+
+    Return:
+        (ndarray): log-spectral distance of each frame (T)
+    """
+    return np.sqrt(np.mean((20*(np.log10(np.clip(melsp, a_min=1e-16, a_max=None))\
+                    -np.log10(np.clip(melsp_ref, a_min=1e-16, a_max=None))))**2, axis=-1))
+
+
+def melsp_to_melcep(melsp, dim=None):
+    """FUNCTION TO COMPUTE MEL-CEPSTRUM FROM MEL-SPECTROGRAM WITH DCT
+
+    Args:
+        melsp (ndarray): linear mel-spectrogram (T x D)
+        dim (int): number of kept coefficients, all if None
+
+    Return:
+        (ndarray): mel-cepstrum (T x dim)
+    """
+    melcep = dct(np.log(np.clip(melsp, a_min=1e-16, a_max=None)), type=2, axis=-1, norm='ortho')
+    if dim is not None:
+        melcep = melcep[:,:dim]
+    return melcep
+
+
+def calc_mcd(melcep, melcep_ref):
+    """FUNCTION TO COMPUTE FRAME-WISE MEL-CEPSTRAL DISTORTION [dB] (EXCLUDING 0TH COEFF.)
+
+    Args:
+        melcep (ndarray): mel-cepstrum (T x D)
+        melcep_ref (ndarray): reference mel-cepstrum (T x D)
+
+    Return:
+        (ndarray): mel-cepstral distortion of each frame (T)
+    """
+    return (10/np.log(10))*np.sqrt(2*np.sum((melcep[:,1:]-melcep_ref[:,1:])**2, axis=-1))
+
+
+def calc_lsd_trg(melsp_cv, melsp_src, melsp_trg, spcidx_src, spcidx_trg):
+    """FUNCTION TO COMPUTE FRAME-WISE LOG-SPECTRAL DISTANCE [dB] OF THE INLINE TARGET EVALUATION
+
+    As in decode_gru-cycle-melspxlf0capspkvae-gauss-smpl.py, the speech frames of the converted
+    mel-spectrogram are time-warped to those of the target with dtw_c (log-spectral distance),
+    and the warping indices are taken on the converted and source mel-spectrograms.
+
+    Args:
+        melsp_cv (ndarray): converted linear mel-spectrogram (T x D)
+        melsp_src (ndarray): source linear mel-spectrogram (T x D)
+        melsp_trg (ndarray): target linear mel-spectrogram (T_trg x D)
+        spcidx_src (ndarray): speech frame indices of the source
+        spcidx_trg (ndarray): speech frame indices of the target
+
+    Return:
+        (ndarray): log-spectral distance of each target-warped frame (T_trg_spc)
+    """
+    _, twf, _, _ = dtw.dtw_org_to_trg(np.array(melsp_cv[spcidx_src], dtype=np.float64), \
+                        np.array(melsp_trg[spcidx_trg], dtype=np.float64), mcd=-1)
+    twf = np.array(twf[:,0])
+    return calc_lsd(melsp_cv[twf], melsp_src[twf])
+
+
+def calc_lat_dist(lat_src, lat_trg):
+    """FUNCTION TO COMPUTE DTW-ALIGNED LATENT DISTANCES OF THE INLINE TARGET EVALUATION
+
+    dtw_c warps the 1st sequence to the time axis of the 2nd one, so both directions,
+    source-to-target and target-to-source, are computed and averaged.
+
+    Args:
+        lat_src (ndarray): source latent sequence (N x D)
+        lat_trg (ndarray): target latent sequence (M x D)
+
+    Return:
+        (float): root-mean-square distance over aligned frames
+        (float): cosine similarity over aligned frames
+    """
+    lat_src = np.array(lat_src, dtype=np.float64)
+    lat_trg = np.array(lat_trg, dtype=np.float64)
+    aligned_lat_srctrg, _, _, _ = dtw.dtw_org_to_trg(lat_src, lat_trg)
+    lat_dist_srctrg = np.mean(np.sqrt(np.mean((aligned_lat_srctrg-lat_trg)**2, axis=0)))
+    _, _, lat_cdist_srctrg, _ = dtw.dtw_org_to_trg(lat_trg, lat_src, mcd=0)
+    aligned_lat_trgsrc, _, _, _ = dtw.dtw_org_to_trg(lat_trg, lat_src)
+    lat_dist_trgsrc = np.mean(np.sqrt(np.mean((aligned_lat_trgsrc-lat_src)**2, axis=0)))
+    _, _, lat_cdist_trgsrc, _ = dtw.dtw_org_to_trg(lat_src, lat_trg, mcd=0)
+
+    return (lat_dist_srctrg+lat_dist_trgsrc)/2, (lat_cdist_srctrg+lat_cdist_trgsrc)/2
@@ -0,0 +1,360 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2021 Patrick Lumban Tobing (Nagoya University)
+#  Apache 2.0  (http://www.apache.org/licenses/LICENSE-2.0)
+
+from __future__ import division
+
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+import hashlib
+import json
+import logging
+import os
+import subprocess
+import threading
+import time
+
+
+def file_fingerprint(path, content=False):
+    """FUNCTION TO COMPUTE THE FINGERPRINT OF A FILE OR A DIRECTORY
+
+    Args:
+        path (str): file or directory path
+        content (bool): md5 of the content if True, otherwise size and modification time
+
+    Return:
+        (str): fingerprint, None if the path does not exist
+    """
+    if os.path.isdir(path):
+        md5 = hashlib.md5()
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            for name in sorted(files):
+                file_path = os.path.join(root, name)
+                md5.update((os.path.relpath(file_path, path) + ":" + str(file_fingerprint(file_path, content)) \
+                                + "\n").encode())
+        return md5.hexdigest()
+    if not os.path.exists(path):
+        return None
+    if content:
+        md5 = hashlib.md5()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                md5.update(chunk)
+        return md5.hexdigest()
+    stat = os.stat(path)
+    return "%d:%d" % (stat.st_size, stat.st_mtime_ns)
+
+
+def write_if_changed(path, lines):
+    """FUNCTION TO WRITE A LIST FILE ONLY IF ITS CONTENT CHANGES, KEEPING THE MODIFICATION TIME OTHERWISE
+
+    Args:
+        path (str): list file path
+        lines (list): lines to write
+
+    Return:
+        (bool): True if the file is written
+    """
+    text = "".join([line + "\n" for line in lines])
+    if os.path.exists(path):
+        with open(path) as f:
+            if f.read() == text:
+                return False
+    if os.path.dirname(path) != "" and not os.path.exists(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+    with open(path, "w") as f:
+        f.write(text)
+    return True
+
+
+class Task(object):
+    """PIPELINE TASK, A COMMAND OR A FUNCTION WITH DECLARED INPUTS AND OUTPUTS
+
+    A task is up to date if its command, the fingerprints of its inputs, and its outputs are as of its last run,
+    and no prerequisite task has changed its outputs since.
+    With a file map, the staleness is checked file by file, and the command processes only the stale files,
+    given as an scp list substituted for "{scp}" in the command.
+
+    Args:
+        name (str): unique task name
+        stage (str): stage of the task, e.g., a run.sh stage character
+        cmd (list): command arguments, "{scp}" is replaced by the scp of the stale files of the file map
+        func (function): python function run instead of a command, called with the task
+        inputs (list): input files or directories
+        outputs (list): output files or directories
+        deps (list): names of prerequisite tasks
+        file_map (list or function): (input file, list of output files) pairs processed file by file,
+            or a function returning them, called when the task runs, i.e., after its prerequisites
+        scp (str): path of the scp of the stale files of the file map
+        log (str): log file of the command
+        log_partial (str): log file of the command if only part of the file map is stale
+        cwd (str): working directory of the command
+    """
+
+    def __init__(self, name, stage=None, cmd=None, func=None, inputs=None, outputs=None, deps=None,
+            file_map=None, scp=None, log=None, log_partial=None, cwd=None):
+        self.name = name
+        self.stage = stage
+        self.cmd = cmd
+        self.func = func
+        self.inputs = inputs if inputs is not None else []
+        self.outputs = outputs if outputs is not None else []
+        self.deps = deps if deps is not None else []
+        self.file_map = file_map
+        self.scp = scp
+        self.log = log
+        self.log_partial = log_partial
+        self.cwd = cwd
+
+    def get_file_map(self):
+        """FUNCTION TO GET THE FILE MAP, RESOLVING IT ONCE IF GIVEN AS A FUNCTION"""
+        if callable(self.file_map):
+            self.file_map = self.file_map()
+        return self.file_map
+
+    def signature(self):
+        """FUNCTION TO GET THE SIGNATURE OF THE COMMAND, CHANGES OF WHICH MAKE ALL OUTPUTS STALE"""
+        if self.cmd is not None:
+            return hashlib.md5(json.dumps(self.cmd).encode()).hexdigest()
+        return self.func.__name__ if self.func is not None else ""
+
+
+class Pipeline(object):
+    """MAKE-STYLE PIPELINE OF TASKS
+
+    The task states are kept in a json file per task in state_dir, and the state of each processed file
+    is saved after every run, including failed ones, so that a crashed run resumes with the remaining files.
+    Independent tasks run in parallel.
+
+    Args:
+        state_dir (str): directory of the task states
+        content (bool): content fingerprints if True, otherwise size and modification time
+        n_parallel (int): maximum number of tasks running in parallel
+        dry_run (bool): only report the tasks and files that would run
+    """
+
+    def __init__(self, state_dir, content=False, n_parallel=1, dry_run=False):
+        self.state_dir = state_dir
+        self.content = content
+        self.n_parallel = n_parallel
+        self.dry_run = dry_run
+        self.tasks = {}
+        self.order = []
+        self.lock = threading.Lock()
+        if not os.path.exists(state_dir):
+            os.makedirs(state_dir)
+
+    def add(self, task):
+        """FUNCTION TO ADD A TASK, PREREQUISITES HAVE TO BE ADDED BEFORE"""
+        assert task.name not in self.tasks, "duplicated task %s" % (task.name)
+        for dep in task.deps:
+            assert dep in self.tasks, "unknown prerequisite %s of %s" % (dep, task.name)
+        self.tasks[task.name] = task
+        self.order.append(task.name)
+        return task
+
+    def state_path(self, name):
+        return os.path.join(self.state_dir, name.replace("/", "__") + ".json")
+
+    def load_state(self, name):
+        path = self.state_path(name)
+        if not os.path.exists(path):
+            return None
+        with open(path) as f:
+            return json.load(f)
+
+    def save_state(self, name, state):
+        path = self.state_path(name)
+        with open(path + ".tmp", "w") as f:
+            json.dump(state, f, indent=1)
+        os.replace(path + ".tmp", path)
+
+    def fingerprints(self, paths):
+        return {path: file_fingerprint(path, self.content) for path in paths}
+
+    def file_state(self, in_file, out_files):
+        return [file_fingerprint(in_file, self.content)] + [file_fingerprint(out_file, self.content) \
+                    for out_file in out_files]
+
+    def deps_state(self, task):
+        """FUNCTION TO GET THE LAST CHANGES OF THE OUTPUTS OF THE PREREQUISITES OF A TASK"""
+        return {dep: (self.load_state(dep) or {}).get("changed") for dep in task.deps}
+
+    def valid_files(self, task, state):
+        """FUNCTION TO GET THE RECORDED FILE STATES OF A TASK, NONE VALID IF ITS COMMAND OR PREREQUISITES CHANGED"""
+        if state is None or state["signature"] != task.signature() or state.get("deps", {}) != self.deps_state(task):
+            return {}
+        return state["files"]
+
+    def stale_files(self, task, state):
+        """FUNCTION TO GET THE STALE PAIRS OF THE FILE MAP OF A TASK
+
+        All files are stale if the command or the outputs of a prerequisite task have changed since the last run.
+        Without a recorded state of a file, e.g., processed before by run.sh, the file is adopted as up to date
+        if all its outputs are newer than its input (modification-time fingerprints only).
+
+        Return:
+            (list): stale (input file, output files) pairs
+            (dict): file states of the adopted files
+        """
+        files = self.valid_files(task, state)
+        adopt = not self.content and (state is None or (state["signature"] == task.signature() \
+                    and state.get("deps", {}) == self.deps_state(task)))
+        stale = []
+        adopted = {}
+        for in_file, out_files in task.get_file_map():
+            current = self.file_state(in_file, out_files)
+            if in_file in files and files[in_file] == current:
+                continue
+            if in_file not in files and adopt and None not in current and len(out_files) > 0 \
+                    and all([os.path.getmtime(out_file) >= os.path.getmtime(in_file) for out_file in out_files]):
+                adopted[in_file] = current
+                continue
+            stale.append((in_file, out_files))
+        return stale, adopted
+
+    def is_up_to_date(self, task, state):
+        """FUNCTION TO CHECK WHETHER A TASK WITHOUT FILE MAP IS UP TO DATE"""
+        if state is None or state["signature"] != task.signature() or not state.get("success", False):
+            return False
+        if state["inputs"] != self.fingerprints(task.inputs):
+            return False
+        if state["outputs"] != self.fingerprints(task.outputs) or None in state["outputs"].values():
+            return False
+        for dep in task.deps:
+            dep_state = self.load_state(dep)
+            if dep_state is None or dep_state.get("changed") != state["deps"].get(dep):
+                return False
+        return True
+
+    def run_task(self, task):
+        """FUNCTION TO RUN A TASK IF IT IS NOT UP TO DATE
+
+        Return:
+            (str): "skipped", "done", or "failed"
+        """
+        state = self.load_state(task.name)
+        file_map = task.get_file_map()
+        if file_map is not None:
+            stale, adopted = self.stale_files(task, state)
+            if len(adopted) > 0 and not self.dry_run:
+                if state is None:
+                    state = {"signature": task.signature(), "success": True, "time": time.time(),
+                            "inputs": {}, "outputs": {}, "deps": self.deps_state(task), "files": {},
+                            "changed": time.time()}
+                state["files"].update(adopted)
+                with self.lock:
+                    self.save_state(task.name, state)
+                logging.info("%s: %d files adopted as up to date" % (task.name, len(adopted)))
+            if len(stale) == 0:
+                logging.info("%s: up to date (%d files)" % (task.name, len(file_map)))
+                return "skipped"
+            logging.info("%s: %d/%d files to process" % (task.name, len(stale), len(file_map)))
+        else:
+            if self.is_up_to_date(task, state):
+                logging.info("%s: up to date" % (task.name))
+                return "skipped"
+            stale = None
+            logging.info("%s: to run" % (task.name))
+        if self.dry_run:
+            return "done"
+
+        start = time.time()
+        success = True
+        try:
+            if task.func is not None:
+                task.func(task)
+            else:
+                cmd = task.cmd
+                log = task.log
+                if stale is not None:
+                    write_if_changed(task.scp, [in_file for in_file, _ in stale])
+                    cmd = [arg.replace("{scp}", task.scp) for arg in cmd]
+                    if len(stale) < len(file_map) and task.log_partial is not None:
+                        log = task.log_partial
+                if log is not None:
+                    if os.path.dirname(log) != "" and not os.path.exists(os.path.dirname(log)):
+                        os.makedirs(os.path.dirname(log))
+                    with open(log, "w") as f:
+                        f.write("# " + " ".join(cmd) + "\n# Started at " + time.ctime() + "\n")
+                        f.flush()
+                        ret = subprocess.call(cmd, stdout=f, stderr=subprocess.STDOUT, cwd=task.cwd)
+                        f.write("# Accounting: time=%d threads=1\n# Ended (code %d) at %s\n" % (
+                            time.time() - start, ret, time.ctime()))
+                else:
+                    ret = subprocess.call(cmd, cwd=task.cwd)
+                success = ret == 0
+        except Exception as e:
+            logging.error("%s: %s" % (task.name, e))
+            success = False
+
+        # save the state, also of the files processed before a failure
+        new_state = {"signature": task.signature(), "success": success, "time": time.time(),
+                    "inputs": self.fingerprints(task.inputs), "outputs": self.fingerprints(task.outputs),
+                    "deps": self.deps_state(task)}
+        changed = state is None or state.get("outputs") != new_state["outputs"] or len(task.outputs) == 0
+        if file_map is not None:
+            files = self.valid_files(task, state)
+            n_done = 0
+            for in_file, out_files in stale:
+                current = self.file_state(in_file, out_files)
+                # a file without outputs is only known to be processed by the success of the command
+                if None not in current and (len(out_files) > 0 or success) \
+                        and all([os.path.getmtime(out_file) >= start - 1 for out_file in out_files]):
+                    files[in_file] = current
+                    n_done += 1
+            new_state["files"] = files
+            changed = n_done > 0
+            if n_done < len(stale):
+                logging.warn("%s: %d/%d files are not processed, they are retried in the next run" % (
+                    task.name, len(stale) - n_done, len(stale)))
+        new_state["changed"] = new_state["time"] if changed else (state or {}).get("changed", new_state["time"])
+        with self.lock:
+            self.save_state(task.name, new_state)
+        logging.info("%s: %s in %.1f sec." % (task.name, "done" if success else "FAILED", time.time() - start))
+        return "done" if success else "failed"
+
+    def select(self, stages=None, names=None):
+        """FUNCTION TO SELECT THE TASKS OF GIVEN STAGES OR NAMES WITH ALL THEIR PREREQUISITES"""
+        targets = [name for name in self.order if (stages is None or self.tasks[name].stage in stages) \
+                    and (names is None or name in names)]
+        selected = set()
+        queue = list(targets)
+        while len(queue) > 0:
+            name = queue.pop()
+            if name not in selected:
+                selected.add(name)
+                queue.extend(self.tasks[name].deps)
+        return [name for name in self.order if name in selected]
+
+    def run(self, stages=None, names=None):
+        """FUNCTION TO RUN THE SELECTED TASKS IN DEPENDENCY ORDER, INDEPENDENT TASKS IN PARALLEL
+
+        Return:
+            (dict): result of each task, "blocked" if a prerequisite failed
+        """
+        pending = self.select(stages, names)
+        results = {}
+        running = {}
+        with ThreadPoolExecutor(max_workers=self.n_parallel) as executor:
+            while len(pending) > 0 or len(running) > 0:
+                for name in list(pending):
+                    deps = self.tasks[name].deps
+                    if any([results.get(dep) in ["failed", "blocked"] for dep in deps]):
+                        results[name] = "blocked"
+                        pending.remove(name)
+                        logging.warn("%s: blocked by a failed prerequisite" % (name))
+                    elif all([dep in results for dep in deps]) and len(running) < self.n_parallel:
+                        running[executor.submit(self.run_task, self.tasks[name])] = name
+                        pending.remove(name)
+                if len(running) > 0:
+                    done, _ = wait(list(running.keys()), return_when=FIRST_COMPLETED)
+                    for future in done:
+                        name = running.pop(future)
+                        try:
+                            results[name] = future.result()
+                        except Exception as e:
+                            logging.error("%s: %s" % (name, e))
+                            results[name] = "failed"
+        return results
@@ -0,0 +1,310 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2021 Patrick Lumban Tobing (Nagoya University)
+#  Apache 2.0  (http://www.apache.org/licenses/LICENSE-2.0)
+
+from __future__ import division
+
+import logging
+import os
+
+import h5py
+import numpy as np
+
+from utils import write_hdf5
+
+
+F0_BINS = 500
+F0_RANGE = (50, 550)
+NPOW_BINS = 120
+NPOW_RANGE = (-50, 10)
+
+
+class RunningMoments(object):
+    """RUNNING COUNT, MEAN, VARIANCE, MIN., AND MAX. OF A STREAM OF VALUES, MERGEABLE ACROSS WORKERS
+
+    The partial moments are combined with the parallel update of Chan et al.,
+    so that merging the results of any split of the data gives the moments of the whole data.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = np.inf
+        self.max = -np.inf
+
+    def _combine(self, count, mean, m2, min_, max_):
+        if count == 0:
+            return
+        total = self.count + count
+        delta = mean - self.mean
+        self.mean += delta * count / total
+        self.m2 += m2 + delta**2 * self.count * count / total
+        self.count = total
+        self.min = min(self.min, min_)
+        self.max = max(self.max, max_)
+
+    def add(self, x):
+        """FUNCTION TO ADD AN ARRAY OF VALUES"""
+        if len(x) > 0:
+            mean = np.mean(x)
+            self._combine(len(x), mean, np.sum((x - mean)**2), np.min(x), np.max(x))
+
+    def merge(self, other):
+        """FUNCTION TO ADD THE MOMENTS OF ANOTHER RunningMoments"""
+        self._combine(other.count, other.mean, other.m2, other.min, other.max)
+
+    @property
+    def var(self):
+        return self.m2 / self.count if self.count > 0 else 0.0
+
+    @property
+    def std(self):
+        return np.sqrt(self.var)
+
+    def to_array(self):
+        return np.array([self.count, self.mean, self.m2, self.min, self.max], dtype=np.float64)
+
+    @classmethod
+    def from_array(cls, arr):
+        moments = cls()
+        moments.count = int(arr[0])
+        moments.mean, moments.m2, moments.min, moments.max = [float(x) for x in arr[1:]]
+        return moments
+
+
+class SpkStatAccumulator(object):
+    """STREAMING F0 AND POWER STATISTICS OF A SPEAKER WITH FIXED-BIN HISTOGRAMS AND RUNNING MOMENTS
+
+    The memory is constant in the number of utterances. The bins are those of spk_stat.py,
+    so the histogram counts are the same as those of all of the concatenated values,
+    and the accumulators of disjoint sets of utterances can be merged.
+    The filenames and modification times of the added utterances are kept to update a saved state incrementally.
+    """
+
+    def __init__(self):
+        self.f0_edges = np.histogram_bin_edges(np.empty(0), bins=F0_BINS, range=F0_RANGE)
+        self.npow_edges = np.histogram_bin_edges(np.empty(0), bins=NPOW_BINS, range=NPOW_RANGE)
+        self.f0_counts = np.zeros(F0_BINS, dtype=np.int64)
+        self.npow_counts = np.zeros(NPOW_BINS, dtype=np.int64)
+        self.f0_moments = RunningMoments()
+        self.npow_moments = RunningMoments()
+        self.files = {}
+
+    def add(self, f0, npow, filename=None):
+        """FUNCTION TO ADD THE F0 AND POWER OF AN UTTERANCE
+
+        Args:
+            f0 (ndarray): f0 sequence, unvoiced frames are zero
+            npow (ndarray): frame power sequence [dB]
+            filename (str): feature file of the utterance
+        """
+        # cast as the concatenated float64 values, so the bins of each value are the same
+        f0 = np.asarray(f0, dtype=np.float64).flatten()
+        f0 = f0[np.nonzero(f0)]
+        npow = np.asarray(npow, dtype=np.float64).flatten()
+        self.f0_counts += np.histogram(f0, bins=self.f0_edges)[0]
+        self.npow_counts += np.histogram(npow, bins=self.npow_edges)[0]
+        self.f0_moments.add(f0)
+        self.npow_moments.add(npow)
+        if filename is not None:
+            self.files[filename] = os.path.getmtime(filename)
+
+    def merge(self, other):
+        """FUNCTION TO ADD THE STATISTICS OF ANOTHER SpkStatAccumulator OF DISJOINT UTTERANCES"""
+        self.f0_counts += other.f0_counts
+        self.npow_counts += other.npow_counts
+        self.f0_moments.merge(other.f0_moments)
+        self.npow_moments.merge(other.npow_moments)
+        self.files.update(other.files)
+
+    def is_current(self, filenames):
+        """FUNCTION TO CHECK THAT THE ADDED UTTERANCES ARE STILL IN THE LIST AND UNMODIFIED
+
+        Args:
+            filenames (list): feature files of the speaker
+
+        Return:
+            (bool): True if the state can be updated by adding the new utterances only
+        """
+        filenames = set(filenames)
+        for filename, mtime in self.files.items():
+            if filename not in filenames or not os.path.exists(filename) or os.path.getmtime(filename) != mtime:
+                return False
+        return True
+
+    @staticmethod
+    def density(counts, edges):
+        """FUNCTION TO NORMALIZE HISTOGRAM COUNTS AS np.histogram(density=True)"""
+        if counts.sum() == 0:
+            return np.zeros(len(counts))
+        return counts / np.diff(edges) / counts.sum()
+
+    def f0_histogram(self):
+        """FUNCTION TO GET THE F0 HISTOGRAM
+
+        Return:
+            (ndarray): probability density (F0_BINS)
+            (ndarray): bin edges (F0_BINS+1)
+        """
+        return self.density(self.f0_counts, self.f0_edges), self.f0_edges
+
+    def npow_histogram(self):
+        """FUNCTION TO GET THE POWER HISTOGRAM
+
+        Return:
+            (ndarray): probability density (NPOW_BINS)
+            (ndarray): bin edges (NPOW_BINS+1)
+        """
+        return self.density(self.npow_counts, self.npow_edges), self.npow_edges
+
+    def save(self, path):
+        """FUNCTION TO SAVE THE STATE TO HDF5"""
+        if os.path.exists(path):
+            os.remove(path)
+        write_hdf5(path, "/f0_counts", self.f0_counts)
+        write_hdf5(path, "/npow_counts", self.npow_counts)
+        write_hdf5(path, "/f0_moments", self.f0_moments.to_array())
+        write_hdf5(path, "/npow_moments", self.npow_moments.to_array())
+        filenames = sorted(self.files.keys())
+        write_hdf5(path, "/filenames", np.array([x.encode("utf-8") for x in filenames], dtype=bytes))
+        write_hdf5(path, "/mtimes", np.array([self.files[x] for x in filenames], dtype=np.float64))
+
+    @classmethod
+    def load(cls, path):
+        """FUNCTION TO LOAD A STATE SAVED WITH save"""
+        acc = cls()
+        with h5py.File(path, "r") as f:
+            acc.f0_counts = f["/f0_counts"][()].astype(np.int64)
+            acc.npow_counts = f["/npow_counts"][()].astype(np.int64)
+            acc.f0_moments = RunningMoments.from_array(f["/f0_moments"][()])
+            acc.npow_moments = RunningMoments.from_array(f["/npow_moments"][()])
+            acc.files = {x.decode("utf-8"): float(mtime) for x, mtime in zip(f["/filenames"][()], f["/mtimes"][()])}
+        assert len(acc.f0_counts) == F0_BINS and len(acc.npow_counts) == NPOW_BINS, \
+            "bins of %s are not matched" % (path)
+        return acc
+
+
+def _scan_left_min(density, start):
+    """FUNCTION TO SCAN THE F0 HISTOGRAM DOWNWARD FROM start FOR THE LEFT BOUND OF f0_range.py
+
+    A bin below 0.0006 sets the bound next to it, and a later bin of at least 0.001 resets it,
+    so the result is set by the bins below the lowest bin of at least 0.001.
+    """
+    if start < 0:
+        return -1, 999999999
+    seg = density[:start+1]
+    high = np.where(seg >= 0.001)[0]
+    end = high[0] if len(high) > 0 else start + 1
+    low = np.where(seg[:end] < 0.0006)[0]
+    if len(low) == 0:
+        return -1, 999999999
+    return low[-1] + 1, density[low[-1] + 1]
+
+
+def _scan_right_min(density, peak_idx):
+    """FUNCTION TO SCAN THE F0 HISTOGRAM UPWARD FROM peak_idx FOR THE RIGHT BOUND OF f0_range.py
+
+    The bound is the bin before the 5th bin of at most 0.00013 above the peak.
+    """
+    low = np.where(density[peak_idx+1:] <= 0.00013)[0]
+    if len(low) < 5:
+        return -1, 999999999
+    idx = peak_idx + low[4]
+    return idx, density[idx]
+
+
+def f0_range_from_histogram(arr_data):
+    """FUNCTION TO GET THE F0 RANGE OF A SPEAKER FROM THE F0 HISTOGRAM WITH THE HEURISTICS OF f0_range.py
+
+    Args:
+        arr_data (ndarray): histogram as written by spk_stat.py, bin f0 and density per row (F0_BINS x 2)
+
+    Return:
+        (float): minimum f0
+        (float): maximum f0
+    """
+    freqs = arr_data[:,0]
+    idx_81 = np.where(freqs > 81)[0]
+    peak_idx = idx_81[np.argmax(arr_data[idx_81,1])]
+    peak = arr_data[peak_idx,1]
+
+    # left min
+    if arr_data[peak_idx,0] > 90:
+        left_left_f0 = arr_data[peak_idx,0]//2+40-15+1
+        if left_left_f0 > 150:
+            left_left_f0 = 130
+            left_left_f0_idx = int(left_left_f0)-40+1
+            left_left_max = np.max(arr_data[:left_left_f0_idx,1])
+            left_left_max_idx = np.argmax(arr_data[:left_left_f0_idx,1])
+        else:
+            left_left_f0_idx = int(left_left_f0)-40+1
+            left_left_max = np.max(arr_data[:left_left_f0_idx,1])
+            left_left_max_idx = np.argmax(arr_data[:left_left_f0_idx,1])
+            if left_left_max >= 0.0045:
+                left_left_f0 -= 20
+                left_left_f0_idx = int(left_left_f0)-40+1
+                left_left_max = np.max(arr_data[:left_left_f0_idx,1])
+                left_left_max_idx = np.argmax(arr_data[:left_left_f0_idx,1])
+                while left_left_max < 0.000045:
+                    left_left_max_idx += 1
+                    left_left_max = arr_data[left_left_max_idx,1]
+        left_right_min = np.min(arr_data[left_left_max_idx+1:peak_idx,1])
+        left_right_min_idx = np.argmin(arr_data[left_left_max_idx+1:peak_idx,1])+left_left_max_idx
+        logging.info('%lf %d %d' % (left_left_max, left_left_max_idx, arr_data[left_left_max_idx,0]))
+        logging.info('%lf %d %d' % (left_right_min, left_right_min_idx, arr_data[left_right_min_idx,0]))
+        if left_left_max - left_right_min >= 0.001: #saddle min
+            left_min = left_right_min
+            left_min_idx = left_right_min_idx
+        else:
+            left_min_idx, left_min = _scan_left_min(arr_data[:,1], left_left_max_idx-1)
+    else:
+        left_min_idx, left_min = _scan_left_min(arr_data[:,1], peak_idx-1)
+
+    # right min
+    right_min_idx, right_min = _scan_right_min(arr_data[:,1], peak_idx)
+
+    logging.info('%d %d %lf' % (left_min_idx, arr_data[left_min_idx][0], left_min))
+    logging.info('%d %d %lf' % (peak_idx, arr_data[peak_idx][0], peak))
+    logging.info('%d %d %lf' % (right_min_idx, arr_data[right_min_idx][0], right_min))
+
+    return arr_data[left_min_idx,0], arr_data[right_min_idx,0]
+
+
+def min_pow_from_histogram(arr_data):
+    """FUNCTION TO GET THE MIN. POWER OF A SPEAKER FROM THE POWER HISTOGRAM WITH THE HEURISTICS OF min_pow.py
+
+    The threshold is the mean of the bins of the global minimum between the peak of the lower half
+    and the peak of the upper third of the histogram.
+
+    Args:
+        arr_data (ndarray): histogram as written by spk_stat.py, bin power and density per row (NPOW_BINS x 2)
+
+    Return:
+        (float): minimum power [dB]
+    """
+    length = arr_data.shape[0]
+    density = arr_data[:,1]
+
+    # first maximum of the lower half
+    seg = density[:max(length // 2 - 2, 0)]
+    peak_1_idx = int(np.argmax(seg)) if len(seg) > 0 else 0
+
+    # last maximum of the upper third
+    start = length - length // 3 + 1
+    seg = density[start:]
+    peak_2_idx = start + len(seg) - 1 - int(np.argmax(seg[::-1])) if len(seg) > 0 else length-1
+
+    # all bins of the global minimum between the peaks
+    seg = density[peak_1_idx+1:peak_2_idx]
+    if len(seg) > 0:
+        min_idx = peak_1_idx + 1 + np.where(seg == np.min(seg))[0]
+        list_min_global_idx = arr_data[min_idx,0].tolist()
+        logging.info('%d %d %lf' % (peak_1_idx, arr_data[peak_1_idx][0], density[peak_1_idx]))
+        logging.info('%d %d %lf' % (min_idx[-1], arr_data[min_idx[-1]][0], density[min_idx[-1]]))
+        logging.info('%d %d %lf' % (peak_2_idx, arr_data[peak_2_idx][0], density[peak_2_idx]))
+        logging.info(list_min_global_idx)
+        return np.mean(list_min_global_idx)
+    logging.warn("no bins between the peaks %d and %d" % (peak_1_idx, peak_2_idx))
+    return np.nan
@@ -179,17 +179,24 @@ class BackgroundGenerator(threading.Thread):
             from queue import Queue
         self.queue = Queue(max_prefetch)
         self.generator = generator
+        self.exception = None
         self.daemon = True
         self.start()
 
     def run(self):
-        for item in self.generator:
-            self.queue.put(item)
+        # an exception of the generator is raised in the consumer, after the items before it
+        try:
+            for item in self.generator:
+                self.queue.put(item)
+        except BaseException as e:
+            self.exception = e
         self.queue.put(None)
 
     def next(self):
         next_item = self.queue.get()
         if next_item is None:
+            if self.exception is not None:
+                raise self.exception
             raise StopIteration
         return next_item
 
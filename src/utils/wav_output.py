@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2021 Patrick Lumban Tobing (Nagoya University)
+#  Apache 2.0  (http://www.apache.org/licenses/LICENSE-2.0)
+
+from __future__ import division
+
+import numpy as np
+import soundfile as sf
+from scipy.signal import lfilter
+
+
+MAX_PCM16 = 0.999969482421875
+
+
+class Deemphasis(object):
+    """DE-EMPHASIS 1 / (1 - alpha z^-1) OF CONSECUTIVE CHUNKS, KEEPING THE FILTER STATE ACROSS CHUNKS
+
+    Filtering the chunks of a waveform one by one gives the same output as filtering the whole waveform,
+    as deemphasis of noise_shaping_emph.py.
+
+    Args:
+        alpha (float): pre-emphasis coefficient
+    """
+
+    def __init__(self, alpha):
+        self.b = np.array([1.])
+        self.a = np.array([1., -alpha])
+        self.reset()
+
+    def reset(self):
+        self.zi = np.zeros(1)
+
+    def __call__(self, x):
+        y, self.zi = lfilter(self.b, self.a, x, zi=self.zi)
+        return y
+
+
+class WavWriter(object):
+    """STREAMING WAV OUTPUT OF GENERATED SAMPLES WITH DE-EMPHASIS, GAIN, AND CLIPPING IN ONE PASS
+
+    The input is clipped to the PCM_16 range as the pre-emphasized wav written by the decoding,
+    de-emphasized if alpha is set, scaled by the gain, and clipped again before written,
+    i.e., as the decoding followed by noise_shaping_emph.py --inv true without the intermediate wav file.
+
+    Args:
+        path (str): output wav file
+        fs (int): sampling rate
+        alpha (float): pre-emphasis coefficient, no de-emphasis if None
+        gain (float): output gain
+        subtype (str): soundfile subtype
+    """
+
+    def __init__(self, path, fs, alpha=None, gain=1.0, subtype="PCM_16"):
+        self.path = path
+        self.deemphasis = Deemphasis(alpha) if alpha is not None else None
+        self.gain = gain
+        self.n_clip = 0
+        self.n_samples = 0
+        self.file = sf.SoundFile(path, "w", samplerate=fs, channels=1, subtype=subtype)
+
+    def write(self, x):
+        """FUNCTION TO WRITE A CHUNK OF SAMPLES (T_chunk)"""
+        x = np.clip(np.asarray(x, dtype=np.float64), -1, MAX_PCM16)
+        if self.deemphasis is not None:
+            x = self.deemphasis(x)
+        if self.gain != 1.0:
+            x = x * self.gain
+        self.n_clip += int(np.sum((x < -1) | (x > MAX_PCM16)))
+        self.n_samples += len(x)
+        self.file.write(np.clip(x, -1, MAX_PCM16))
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def write_wav(path, x, fs, alpha=None, gain=1.0, subtype="PCM_16"):
+    """FUNCTION TO WRITE A GENERATED WAVEFORM WITH DE-EMPHASIS, GAIN, AND CLIPPING
+
+    Args:
+        path (str): output wav file
+        x (ndarray): generated samples (T_wav)
+        fs (int): sampling rate
+        alpha (float): pre-emphasis coefficient, no de-emphasis if None
+        gain (float): output gain
+        subtype (str): soundfile subtype
+
+    Return:
+        (int): number of clipped samples
+    """
+    with WavWriter(path, fs, alpha=alpha, gain=gain, subtype=subtype) as writer:
+        writer.write(x)
+    return writer.n_clip